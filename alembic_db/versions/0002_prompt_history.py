@@ -0,0 +1,44 @@
+"""
+Prompt history
+Revision ID: 0002_prompt_history
+Revises: 0001_assets
+Create Date: 2026-10-18 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_prompt_history"
+down_revision = "0001_assets"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "prompt_history",
+        sa.Column("seq", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("prompt_id", sa.String(length=255), nullable=False),
+        sa.Column("client_id", sa.String(length=255), nullable=True),
+        sa.Column("workflow_id", sa.String(length=255), nullable=True),
+        sa.Column("status", sa.String(length=32), nullable=False),
+        sa.Column("create_time", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("execution_duration", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("data", sa.Text(), nullable=False),
+    )
+    op.create_index("uq_prompt_history_prompt_id", "prompt_history", ["prompt_id"], unique=True)
+    op.create_index("ix_prompt_history_create_time", "prompt_history", ["create_time", "prompt_id"])
+    op.create_index("ix_prompt_history_execution_duration", "prompt_history", ["execution_duration", "prompt_id"])
+    op.create_index("ix_prompt_history_status", "prompt_history", ["status"])
+    op.create_index("ix_prompt_history_client_id", "prompt_history", ["client_id"])
+    op.create_index("ix_prompt_history_workflow_id", "prompt_history", ["workflow_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_prompt_history_workflow_id", table_name="prompt_history")
+    op.drop_index("ix_prompt_history_client_id", table_name="prompt_history")
+    op.drop_index("ix_prompt_history_status", table_name="prompt_history")
+    op.drop_index("ix_prompt_history_execution_duration", table_name="prompt_history")
+    op.drop_index("ix_prompt_history_create_time", table_name="prompt_history")
+    op.drop_index("uq_prompt_history_prompt_id", table_name="prompt_history")
+    op.drop_table("prompt_history")
@@ -0,0 +1,121 @@
+"""
+Prompt history kept in the database, see app.history.store for the interface.
+
+Memory use doesn't grow with retention and the history survives restarts. Entries are stored as
+JSON next to the columns /api/jobs filters and sorts on, which are indexed, so job pages and
+cursors are resolved by SQLite rather than by sorting the whole history in Python.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from typing import Callable, Optional
+
+from sqlalchemy import and_, delete, func, or_, select
+
+from app.history.models import PromptHistory
+from app.history.store import summarize_history_item
+
+
+class DatabaseHistoryStore:
+    def __init__(self, session_factory: Callable, max_items: int = 0):
+        self.session_factory = session_factory
+        self.max_items = max_items
+
+    def __len__(self):
+        with self.session_factory() as session:
+            return session.execute(select(func.count()).select_from(PromptHistory)).scalar_one()
+
+    def put(self, prompt_id: str, entry: dict):
+        summary = summarize_history_item(prompt_id, entry)
+        try:
+            data = json.dumps(entry)
+        except TypeError:
+            logging.warning(f"History entry for prompt {prompt_id} is not JSON serializable, storing unsupported values as strings.")
+            data = json.dumps(entry, default=str)
+
+        with self.session_factory() as session:
+            session.execute(delete(PromptHistory).where(PromptHistory.prompt_id == prompt_id))
+            session.add(PromptHistory(prompt_id=prompt_id, data=data, **summary._asdict()))
+            session.flush()
+            if self.max_items > 0:
+                cutoff = session.execute(
+                    select(PromptHistory.seq).order_by(PromptHistory.seq.desc()).offset(self.max_items).limit(1)
+                ).scalar()
+                if cutoff is not None:
+                    session.execute(delete(PromptHistory).where(PromptHistory.seq <= cutoff))
+            session.commit()
+
+    def get(self, prompt_id: str) -> Optional[dict]:
+        with self.session_factory() as session:
+            data = session.execute(select(PromptHistory.data).where(PromptHistory.prompt_id == prompt_id)).scalar()
+        if data is None:
+            return None
+        return json.loads(data)
+
+    def list(self, max_items: Optional[int] = None, offset: int = -1, cursor: Optional[int] = None) -> tuple[dict, Optional[int]]:
+        query = select(PromptHistory.seq, PromptHistory.prompt_id, PromptHistory.data)
+        with self.session_factory() as session:
+            if offset >= 0 and cursor is None:
+                query = query.order_by(PromptHistory.seq.asc()).offset(offset)
+                if max_items is not None:
+                    query = query.limit(max_items)
+                rows = session.execute(query).all()
+                return {row.prompt_id: json.loads(row.data) for row in rows}, None
+
+            if cursor is not None:
+                query = query.where(PromptHistory.seq < cursor)
+            query = query.order_by(PromptHistory.seq.desc())
+            if max_items is not None:
+                query = query.limit(max_items + 1)
+            rows = session.execute(query).all()
+
+        next_cursor = None
+        if max_items is not None and len(rows) > max_items:
+            rows = rows[:max_items]
+            next_cursor = rows[-1].seq
+        return {row.prompt_id: json.loads(row.data) for row in reversed(rows)}, next_cursor
+
+    def _filter(self, query, statuses, workflow_id, client_id):
+        if statuses is not None:
+            query = query.where(PromptHistory.status.in_(list(statuses)))
+        if workflow_id:
+            query = query.where(PromptHistory.workflow_id == workflow_id)
+        if client_id:
+            query = query.where(PromptHistory.client_id == client_id)
+        return query
+
+    def query_jobs(self, statuses=None, workflow_id=None, client_id=None, sort_by="created_at", sort_order="desc",
+                   limit: Optional[int] = None, cursor: Optional[tuple] = None) -> list[tuple[str, dict]]:
+
+        column = PromptHistory.execution_duration if sort_by == "execution_duration" else PromptHistory.create_time
+        query = self._filter(select(PromptHistory.prompt_id, PromptHistory.data), statuses, workflow_id, client_id)
+        if sort_order == "desc":
+            if cursor is not None:
+                query = query.where(or_(column < cursor[0], and_(column == cursor[0], PromptHistory.prompt_id < cursor[1])))
+            query = query.order_by(column.desc(), PromptHistory.prompt_id.desc())
+        else:
+            if cursor is not None:
+                query = query.where(or_(column > cursor[0], and_(column == cursor[0], PromptHistory.prompt_id > cursor[1])))
+            query = query.order_by(column.asc(), PromptHistory.prompt_id.asc())
+        if limit is not None:
+            query = query.limit(limit)
+        with self.session_factory() as session:
+            rows = session.execute(query).all()
+        return [(row.prompt_id, json.loads(row.data)) for row in rows]
+
+    def count_jobs(self, statuses=None, workflow_id=None, client_id=None) -> int:
+        query = self._filter(select(func.count()).select_from(PromptHistory), statuses, workflow_id, client_id)
+        with self.session_factory() as session:
+            return session.execute(query).scalar_one()
+
+    def delete(self, prompt_id: str):
+        with self.session_factory() as session:
+            session.execute(delete(PromptHistory).where(PromptHistory.prompt_id == prompt_id))
+            session.commit()
+
+    def clear(self):
+        with self.session_factory() as session:
+            session.execute(delete(PromptHistory))
+            session.commit()
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from sqlalchemy import BigInteger, Index, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database.models import to_dict, Base
+
+
+class PromptHistory(Base):
+    """
+    One finished prompt. The columns the job list filters and sorts on are copied out of the
+    history entry so queries never have to decode `data`.
+    """
+    __tablename__ = "prompt_history"
+
+    # Insertion order, used for retention and /history cursors.
+    seq: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    prompt_id: Mapped[str] = mapped_column(String(255), nullable=False)
+    client_id: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    workflow_id: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    status: Mapped[str] = mapped_column(String(32), nullable=False)
+    create_time: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    execution_duration: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    # The history entry as returned by /history, JSON encoded.
+    data: Mapped[str] = mapped_column(Text, nullable=False)
+
+    __table_args__ = (
+        Index("uq_prompt_history_prompt_id", "prompt_id", unique=True),
+        Index("ix_prompt_history_create_time", "create_time", "prompt_id"),
+        Index("ix_prompt_history_execution_duration", "execution_duration", "prompt_id"),
+        Index("ix_prompt_history_status", "status"),
+        Index("ix_prompt_history_client_id", "client_id"),
+        Index("ix_prompt_history_workflow_id", "workflow_id"),
+    )
+
+    def to_dict(self, include_none: bool = False) -> dict:
+        return to_dict(self, include_none=include_none)
+
+    def __repr__(self) -> str:
+        return f"<PromptHistory seq={self.seq} prompt_id={self.prompt_id} status={self.status}>"
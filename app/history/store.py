@@ -0,0 +1,120 @@
+"""
+Storage for finished prompts, as served by /history and /api/jobs.
+
+MemoryHistoryStore keeps entries in a dict, as the prompt queue always has, and is used when the
+database isn't available. DatabaseHistoryStore (app.history.db_store) keeps them in the
+prompt_history table instead. The columns the job list filters and sorts on are extracted once
+when a prompt finishes, so listing jobs only sorts summaries and normalizes the requested page.
+
+Both stores are thread safe and share the same interface:
+    put(prompt_id, entry)
+    get(prompt_id) -> entry or None
+    list(max_items, offset, cursor) -> ({prompt_id: entry}, next_cursor)
+    query_jobs(...) -> [(prompt_id, entry)], count_jobs(...) -> int
+    delete(prompt_id), clear()
+"""
+
+from __future__ import annotations
+
+import itertools
+import threading
+from typing import NamedTuple, Optional
+
+from comfy_execution.jobs import get_sort_value, normalize_history_item
+from comfy_execution.utils import copy_unfrozen
+
+
+class HistorySummary(NamedTuple):
+    status: str
+    create_time: int
+    execution_duration: int
+    workflow_id: Optional[str]
+    client_id: Optional[str]
+
+
+def summarize_history_item(prompt_id: str, entry: dict) -> HistorySummary:
+    job = normalize_history_item(prompt_id, entry)
+    extra_data = entry["prompt"][3]
+    return HistorySummary(
+        status=job["status"],
+        create_time=get_sort_value(job, "created_at"),
+        execution_duration=get_sort_value(job, "execution_duration"),
+        workflow_id=job.get("workflow_id"),
+        client_id=extra_data.get("client_id"),
+    )
+
+
+def _matches(summary: HistorySummary, statuses, workflow_id, client_id) -> bool:
+    if statuses is not None and summary.status not in statuses:
+        return False
+    if workflow_id and summary.workflow_id != workflow_id:
+        return False
+    if client_id and summary.client_id != client_id:
+        return False
+    return True
+
+
+class MemoryHistoryStore:
+    def __init__(self, max_items: int = 0):
+        self.max_items = max_items
+        self.lock = threading.Lock()
+        self.entries: dict[str, tuple[int, dict, HistorySummary]] = {}
+        self.counter = itertools.count(1)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def put(self, prompt_id: str, entry: dict):
+        summary = summarize_history_item(prompt_id, entry)
+        with self.lock:
+            self.entries.pop(prompt_id, None)
+            if self.max_items > 0:
+                while len(self.entries) >= self.max_items:
+                    self.entries.pop(next(iter(self.entries)))
+            self.entries[prompt_id] = (next(self.counter), entry, summary)
+
+    def get(self, prompt_id: str) -> Optional[dict]:
+        with self.lock:
+            record = self.entries.get(prompt_id)
+        if record is None:
+            return None
+        # The queue item in the entry is frozen and shared, the rest is copied.
+        return copy_unfrozen(record[1])
+
+    def list(self, max_items: Optional[int] = None, offset: int = -1, cursor: Optional[int] = None) -> tuple[dict, Optional[int]]:
+        with self.lock:
+            records = list(self.entries.items())
+        if offset >= 0 and cursor is None:
+            end = None if max_items is None else offset + max_items
+            return {k: v[1] for k, v in records[offset:end]}, None
+
+        if cursor is not None:
+            records = [r for r in records if r[1][0] < cursor]
+        start = 0 if max_items is None else max(len(records) - max_items, 0)
+        next_cursor = records[start][1][0] if start > 0 else None
+        return {k: v[1] for k, v in records[start:]}, next_cursor
+
+    def query_jobs(self, statuses=None, workflow_id=None, client_id=None, sort_by="created_at", sort_order="desc",
+                   limit: Optional[int] = None, cursor: Optional[tuple] = None) -> list[tuple[str, dict]]:
+        field = "execution_duration" if sort_by == "execution_duration" else "create_time"
+        with self.lock:
+            records = [(getattr(s, field), k, e) for k, (_, e, s) in self.entries.items() if _matches(s, statuses, workflow_id, client_id)]
+        reverse = sort_order == "desc"
+        if cursor is not None:
+            records = [r for r in records if ((r[0], r[1]) < cursor if reverse else (r[0], r[1]) > cursor)]
+        records.sort(key=lambda r: (r[0], r[1]), reverse=reverse)
+        if limit is not None:
+            records = records[:limit]
+        return [(k, e) for _, k, e in records]
+
+    def count_jobs(self, statuses=None, workflow_id=None, client_id=None) -> int:
+        with self.lock:
+            return sum(1 for _, _, s in self.entries.values() if _matches(s, statuses, workflow_id, client_id))
+
+    def delete(self, prompt_id: str):
+        with self.lock:
+            self.entries.pop(prompt_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,123 @@
+"""
+Cache of the node definitions served by /object_info.
+
+Building the info of a node calls INPUT_TYPES(), which lists model folders and input files, and
+doing that for every node on every request made /object_info one of the slowest endpoints. Each
+node's info is now kept together with the folder_paths state it read while being built (filename
+lists, folder paths and directory mtimes, see folder_paths.record_dependency) and only rebuilt when
+one of those changes, or when the node class or its display name is replaced, like when custom nodes
+are reloaded. Folder paths and directory mtimes miss files added to subfolders, and custom nodes may
+list files without going through folder_paths, so the info of those nodes is also rebuilt once it's
+older than UNTRACKED_TTL. The full response is kept serialized and gzip compressed with an ETag until any node
+changes.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import time
+import traceback
+from typing import Any, Callable, NamedTuple, Optional
+
+import folder_paths
+
+GZIP_LEVEL = 6
+UNTRACKED_TTL = 5.0  # seconds
+
+
+class NodeInfoEntry(NamedTuple):
+    node_class: type
+    display_name: Optional[str]
+    dependencies: dict  # (kind, name) -> folder_paths.dependency_value() when the info was built
+    expires: Optional[float]  # time.monotonic() after which the info is rebuilt, None if its dependencies see every change
+    info: dict
+    encoded: str
+
+
+class EncodedResponse(NamedTuple):
+    body: bytes
+    gzip_body: bytes
+    etag: str
+
+
+def fully_tracked(node_class: type, dependencies) -> bool:
+    """Whether every change to the files a node lists shows up in its recorded dependencies."""
+    if len(dependencies) > 0:
+        return all(kind == "filenames" for kind, _ in dependencies)
+    return not getattr(node_class, "RELATIVE_PYTHON_MODULE", "nodes").startswith("custom_nodes.")
+
+
+class NodeInfoCache:
+    def __init__(self, build: Callable[[str], dict], node_class_mappings: dict, display_name_mappings: dict):
+        """build(name) returns the info of the node registered as name in node_class_mappings."""
+        self.build = build
+        self.node_class_mappings = node_class_mappings
+        self.display_name_mappings = display_name_mappings
+        self.entries: dict[str, NodeInfoEntry] = {}
+        self.response: Optional[tuple[list, EncodedResponse]] = None  # entries it was built from and the response
+        self.builds = 0
+
+    def clear(self):
+        self.entries.clear()
+        self.response = None
+
+    def get(self, name: str, values: Optional[dict] = None) -> NodeInfoEntry:
+        """
+        Returns the cached entry of a node, rebuilding it if anything it depends on changed.
+        values memoizes dependency values across the nodes of one request, the caller should
+        hold folder_paths.cache_helper so filename lists are only computed once too.
+        """
+        if values is None:
+            values = {}
+        node_class = self.node_class_mappings[name]
+        display_name = self.display_name_mappings.get(name)
+        entry = self.entries.get(name)
+        if entry is not None and entry.node_class is node_class and entry.display_name == display_name:
+            if (entry.expires is None or time.monotonic() < entry.expires) and all(self._value(dependency, values) == value for dependency, value in entry.dependencies.items()):
+                return entry
+
+        recorded = set()
+        token = folder_paths.recorded_dependencies.set(recorded)
+        try:
+            info = self.build(name)
+        finally:
+            folder_paths.recorded_dependencies.reset(token)
+        self.builds += 1
+        dependencies = {dependency: self._value(dependency, values) for dependency in recorded}
+        expires = None if fully_tracked(node_class, recorded) else time.monotonic() + UNTRACKED_TTL
+        encoded = json.dumps(info)
+        if entry is not None and entry.encoded == encoded:
+            encoded = entry.encoded  # Unchanged, keeps the response cached
+        entry = NodeInfoEntry(node_class, display_name, dependencies, expires, info, encoded)
+        self.entries[name] = entry
+        return entry
+
+    def _value(self, dependency, values: dict) -> Any:
+        if dependency not in values:
+            values[dependency] = folder_paths.dependency_value(dependency)
+        return values[dependency]
+
+    def get_all(self) -> EncodedResponse:
+        """The /object_info response for every node that isn't internal, serialized and compressed."""
+        values = {}
+        entries = []
+        for name in list(self.node_class_mappings):
+            if getattr(self.node_class_mappings[name], "INTERNAL", False):
+                continue
+            try:
+                entries.append((name, self.get(name, values)))
+            except Exception:
+                self.entries.pop(name, None)
+                logging.error(f"[ERROR] An error occurred while retrieving information for the '{name}' node.")
+                logging.error(traceback.format_exc())
+
+        if self.response is not None and len(self.response[0]) == len(entries):
+            if all(a[0] == b[0] and a[1].encoded is b[1].encoded for a, b in zip(self.response[0], entries)):
+                return self.response[1]
+
+        body = ("{" + ", ".join(f"{json.dumps(name)}: {entry.encoded}" for name, entry in entries) + "}").encode("utf-8")
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        response = EncodedResponse(body, gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), etag)
+        self.response = (entries, response)
+        return response
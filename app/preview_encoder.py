@@ -0,0 +1,132 @@
+"""
+Preview image encoding for PromptServer.
+
+Resizing and encoding previews used to run inside the publish loop, so a large preview stalled
+every other request and websocket message. PreviewEncoder runs them on a small thread pool
+instead (PIL releases the GIL while encoding). Previews are keyed by client and node: while one
+is being encoded, newer frames for the same key replace each other and only the latest one is
+encoded next, and each client gets at most `rate` previews per second.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import time
+from io import BytesIO
+from typing import Awaitable, Callable, Optional
+
+from PIL import Image, ImageOps
+
+PREVIEW_ENCODE_WORKERS = 2
+
+# Format name as used by PIL / previewers -> mimetype sent in the preview metadata.
+PREVIEW_MIMETYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "RAW": "image/x-raw-rgb8",
+}
+
+# Image type numbers of the legacy PREVIEW_IMAGE message, which has no mimetype.
+LEGACY_PREVIEW_TYPES = {
+    "JPEG": 1,
+    "PNG": 2,
+}
+
+
+def resize_preview(image: Image.Image, max_size: Optional[int]) -> Image.Image:
+    if max_size is None:
+        return image
+    if hasattr(Image, 'Resampling'):
+        resampling = Image.Resampling.BILINEAR
+    else:
+        resampling = Image.Resampling.LANCZOS
+    return ImageOps.contain(image, (max_size, max_size), resampling)
+
+
+def encode_preview(image_type: str, image: Image.Image, max_size: Optional[int]) -> tuple[bytes, dict]:
+    """
+    Resizes and encodes a preview. Returns the encoded bytes and the metadata describing them
+    ("image_type" and, for raw previews, "width" and "height").
+    """
+    image = resize_preview(image, max_size)
+    if image_type == "RAW":
+        image = image.convert("RGB")
+        return image.tobytes(), {"image_type": PREVIEW_MIMETYPES["RAW"], "width": image.width, "height": image.height}
+
+    bytesIO = BytesIO()
+    if image_type == "WEBP":
+        image.save(bytesIO, format=image_type, quality=80, method=0)
+    else:
+        image.save(bytesIO, format=image_type, quality=95, compress_level=1)
+    return bytesIO.getvalue(), {"image_type": PREVIEW_MIMETYPES.get(image_type, "image/jpeg")}
+
+
+def choose_preview_format(requested: str, preferred: Optional[str], with_metadata: bool, supports_raw: bool) -> str:
+    """
+    The format a preview is encoded in: the --preview-format override if the client can display
+    it, otherwise the format the node requested, falling back to JPEG.
+    """
+    image_type = requested
+    if preferred is not None:
+        image_type = preferred.upper()
+    if image_type == "RAW" and not supports_raw:
+        image_type = requested
+    if with_metadata:
+        return image_type if image_type in PREVIEW_MIMETYPES else "JPEG"
+    return image_type if image_type in LEGACY_PREVIEW_TYPES else "JPEG"
+
+
+class PreviewEncoder:
+    def __init__(self, send: Callable[..., Awaitable], rate: float = 0.0, max_workers: int = PREVIEW_ENCODE_WORKERS):
+        """
+        send(sid, image_type, data, metadata) is awaited on the event loop with each encoded
+        preview; metadata is None for legacy previews.
+        """
+        self.send = send
+        self.rate = rate
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="preview")
+        self.pending = {}  # (sid, node_id) -> (image_type, image, max_size, metadata)
+        self.tasks = {}  # (sid, node_id) -> task encoding previews for that key
+        self.last_sent = {}  # sid -> time.monotonic() of the last preview sent to it
+        self.dropped = 0
+
+    def submit(self, sid, image_type: str, image: Image.Image, max_size: Optional[int], metadata: Optional[dict] = None):
+        """Queues a preview, replacing any preview for the same client and node that hasn't been encoded yet."""
+        key = (sid, None if metadata is None else metadata.get("node_id"))
+        if key in self.pending:
+            self.dropped += 1
+        self.pending[key] = (image_type, image, max_size, metadata)
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.create_task(self._run(key))
+
+    async def encode(self, image_type: str, image: Image.Image, max_size: Optional[int]) -> tuple[bytes, dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, encode_preview, image_type, image, max_size)
+
+    def forget(self, sid):
+        self.last_sent.pop(sid, None)
+        for key in [k for k in self.pending if k[0] == sid]:
+            del self.pending[key]
+
+    async def _run(self, key):
+        sid = key[0]
+        try:
+            while key in self.pending:
+                if self.rate > 0:
+                    wait = self.last_sent.get(sid, 0.0) + 1.0 / self.rate - time.monotonic()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    if key not in self.pending:
+                        break
+                image_type, image, max_size, metadata = self.pending.pop(key)
+                self.last_sent[sid] = time.monotonic()
+                try:
+                    data, encoded_metadata = await self.encode(image_type, image, max_size)
+                    if metadata is not None:
+                        metadata = {**metadata, **encoded_metadata}
+                    await self.send(sid, image_type, data, metadata)
+                except Exception:
+                    logging.exception("Error sending preview image")
+        finally:
+            del self.tasks[key]
@@ -0,0 +1,233 @@
+"""
+Cache of derived images served by /view (previews, channel extracts and resized thumbnails).
+
+Derivatives are content addressed: the key hashes the source path, its size and mtime and every
+parameter of the conversion, so a changed source file simply misses and stale entries age out of
+the LRU. The key doubles as the ETag of the response. Files live under the temp directory, which
+is cleared on startup, and the least recently used ones are deleted once the cache grows past
+its size limit.
+"""
+
+import asyncio
+import collections
+import hashlib
+import logging
+import os
+import threading
+from io import BytesIO
+from typing import NamedTuple, Optional
+
+from PIL import Image
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+
+class DerivativeSpec(NamedTuple):
+    kind: str  # preview, preview_rgb, rgb, a or resize
+    format: str  # png, jpeg or webp
+    quality: int
+    width: Optional[int]
+    height: Optional[int]
+
+    @property
+    def content_type(self) -> str:
+        return CONTENT_TYPES[self.format]
+
+
+def get_derivative_spec(query, source_format: Optional[str] = None) -> Optional[DerivativeSpec]:
+    """
+    Parses the /view query parameters that ask for a converted image, or returns None if the file
+    should be served as is. Raises ValueError for invalid width or height values.
+    """
+    channel = query.get("channel", "")
+    width = _parse_size(query.get("width"))
+    height = _parse_size(query.get("height"))
+    if "preview" in query:
+        preview_info = query["preview"].split(';')
+        image_format = preview_info[0]
+        if image_format not in ['webp', 'jpeg'] or 'a' in channel:
+            image_format = 'webp'
+        quality = 90
+        if preview_info[-1].isdigit():
+            quality = int(preview_info[-1])
+        kind = "preview_rgb" if image_format == "jpeg" or channel == "rgb" else "preview"
+        return DerivativeSpec(kind, image_format, quality, width, height)
+    if channel in ("rgb", "a"):
+        return DerivativeSpec(channel, "png", 0, width, height)
+    if width is not None or height is not None:
+        image_format = (source_format or "").lower()
+        if image_format not in CONTENT_TYPES:
+            image_format = "png"
+        return DerivativeSpec("resize", image_format, 90, width, height)
+    return None
+
+
+def get_source_format(filename: str) -> Optional[str]:
+    ext = os.path.splitext(filename)[1].lower()
+    return {".png": "png", ".jpg": "jpeg", ".jpeg": "jpeg", ".webp": "webp"}.get(ext)
+
+
+def _parse_size(value) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    size = int(value)
+    if size <= 0:
+        raise ValueError(f"invalid size: {value}")
+    return size
+
+
+def render_derivative(file: str, spec: DerivativeSpec) -> bytes:
+    """Converts the image at file as described by spec, producing what /view always returned."""
+    with Image.open(file) as img:
+        if spec.width is not None or spec.height is not None:
+            # Fit inside the requested box, never upscale.
+            img.thumbnail((spec.width or img.width, spec.height or img.height), Image.Resampling.LANCZOS)
+
+        if spec.kind == "preview_rgb":
+            img = img.convert("RGB")
+        elif spec.kind == "rgb":
+            if img.mode == "RGBA":
+                r, g, b, a = img.split()
+                img = Image.merge('RGB', (r, g, b))
+            else:
+                img = img.convert("RGB")
+        elif spec.kind == "a":
+            if img.mode == "RGBA":
+                _, _, _, a = img.split()
+            else:
+                a = Image.new('L', img.size, 255)
+            img = Image.new('RGBA', img.size)
+            img.putalpha(a)
+        elif spec.format == "jpeg" and img.mode not in ("RGB", "L", "CMYK"):
+            img = img.convert("RGB")
+
+        buffer = BytesIO()
+        if spec.format == "png":
+            img.save(buffer, format="PNG")
+        else:
+            img.save(buffer, format=spec.format, quality=spec.quality)
+        return buffer.getvalue()
+
+
+def derivative_key(file: str, stat: os.stat_result, spec: DerivativeSpec) -> str:
+    raw = f"{os.path.abspath(file)}\0{stat.st_size}\0{stat.st_mtime_ns}\0{'|'.join(str(x) for x in spec)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DerivativeCache:
+    """Thread safe LRU of derivative files under root, bounded to max_bytes on disk."""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()  # file name -> size, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.in_flight = {}  # key -> future of a derivative being rendered
+        self._scan()
+
+    def _scan(self):
+        if not os.path.isdir(self.root):
+            return
+        files = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                files.append((stat.st_atime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+
+    def get(self, key: str, image_format: str) -> Optional[str]:
+        """Returns the path of the cached derivative, or None."""
+        name = f"{key}.{image_format}"
+        with self.lock:
+            if name not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(name)
+            self.hits += 1
+        path = os.path.join(self.root, name)
+        if not os.path.isfile(path):
+            with self.lock:
+                size = self.entries.pop(name, None)
+                if size is not None:
+                    self.total_bytes -= size
+            return None
+        return path
+
+    def put(self, key: str, image_format: str, data: bytes) -> Optional[str]:
+        """Stores a derivative and returns its path, or None if it couldn't be written."""
+        if len(data) > self.max_bytes:
+            return None
+        name = f"{key}.{image_format}"
+        path = os.path.join(self.root, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not write view cache entry {path}: {e}")
+            return None
+
+        with self.lock:
+            previous = self.entries.pop(name, None)
+            if previous is not None:
+                self.total_bytes -= previous
+            self.entries[name] = len(data)
+            self.total_bytes += len(data)
+            evicted = []
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_name, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.remove(os.path.join(self.root, old_name))
+            except OSError:
+                pass
+        return path
+
+    async def get_or_render(self, file: str, key: str, spec: DerivativeSpec) -> bytes:
+        """
+        Returns the derivative, from the cache if possible. Rendering and disk access run in the
+        default executor and concurrent requests for the same key share one render.
+        """
+        loop = asyncio.get_running_loop()
+        future = self.in_flight.get(key)
+        if future is None:
+            future = loop.run_in_executor(None, self._get_or_render, file, key, spec)
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def _get_or_render(self, file: str, key: str, spec: DerivativeSpec) -> bytes:
+        path = self.get(key, spec.format)
+        if path is not None:
+            try:
+                with open(path, "rb") as f:
+                    return f.read()
+            except OSError:
+                pass
+        data = render_derivative(file, spec)
+        if self.max_bytes > 0:
+            self.put(key, spec.format, data)
+        return data
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
@@ -0,0 +1,132 @@
+"""
+Per-socket outboxes for PromptServer websocket messages.
+
+Messages are encoded once by the server and appended to the outbox of every socket they go to.
+Each outbox is drained by its own task, so a slow client only delays its own messages instead of
+everything the publish loop sends after them.
+
+Outboxes are bounded. Messages with a coalesce key (progress updates, queue status, previews)
+replace the pending message with the same key, since only the latest one is worth showing,
+and are dropped once the outbox holds MAX_PENDING_MESSAGES. A client that falls
+MAX_PENDING_MESSAGES_HARD behind on messages that can't be dropped is disconnected; the frontend
+reconnects and gets the current status again.
+"""
+
+import asyncio
+import collections
+import logging
+from typing import Optional, Union
+
+import aiohttp
+
+from protocol import BinaryEventTypes
+
+MAX_PENDING_MESSAGES = 256
+MAX_PENDING_MESSAGES_HARD = 4096
+
+SEND_ERRORS = (aiohttp.ClientError, aiohttp.ClientPayloadError, ConnectionResetError, BrokenPipeError, ConnectionError)
+
+
+def get_coalesce_key(event, data) -> Optional[tuple]:
+    """
+    Key under which only the latest pending message is kept, or None if every message of this
+    kind must be delivered.
+    """
+    if event == "progress":
+        return (event, data.get("prompt_id"), data.get("node"))
+    if event == "progress_state":
+        return (event, data.get("prompt_id"))
+    if event == "status" and "sid" not in data:
+        # The status sent on connect carries the client's sid and is never replaced.
+        return (event,)
+    if event == BinaryEventTypes.PREVIEW_IMAGE:
+        return (event,)
+    return None
+
+
+class _Entry:
+    __slots__ = ("payload", "key")
+
+    def __init__(self, payload, key):
+        self.payload = payload
+        self.key = key
+
+
+class SocketSender:
+    def __init__(self, ws, sid=None):
+        self.ws = ws
+        self.sid = sid
+        self.pending = collections.deque()  # _Entry, payload is None once replaced
+        self.size = 0
+        self.by_key = {}
+        self.dropped = 0
+        self.overflowed = False
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    def __len__(self):
+        return self.size
+
+    def put(self, payload: Union[str, bytes, bytearray], key: Optional[tuple] = None) -> bool:
+        """
+        Queues an encoded message: str is sent as a text frame, bytes as a binary frame.
+        Returns False if the message was dropped.
+        """
+        if self.overflowed:
+            return False
+        if key is not None:
+            previous = self.by_key.get(key)
+            if previous is not None:
+                previous.payload = None
+                self.size -= 1
+                if len(self.pending) > 2 * self.size + 64:
+                    self.pending = collections.deque(e for e in self.pending if e.payload is not None)
+            elif self.size >= MAX_PENDING_MESSAGES:
+                self.dropped += 1
+                return False
+        elif self.size >= MAX_PENDING_MESSAGES_HARD:
+            logging.warning(f"Websocket client {self.sid} is too slow, {self.size} messages pending, disconnecting it.")
+            self.overflowed = True
+            self.pending.clear()
+            self.by_key.clear()
+            self.size = 0
+            self.wakeup.set()
+            return False
+
+        entry = _Entry(payload, key)
+        self.pending.append(entry)
+        self.size += 1
+        if key is not None:
+            self.by_key[key] = entry
+        self.wakeup.set()
+        return True
+
+    async def run(self):
+        while True:
+            while not self.pending and not self.overflowed:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            if self.overflowed:
+                await self.ws.close(code=aiohttp.WSCloseCode.POLICY_VIOLATION, message=b"send buffer overflow")
+                return
+
+            entry = self.pending.popleft()
+            if entry.payload is None:
+                continue
+            self.size -= 1
+            if entry.key is not None and self.by_key.get(entry.key) is entry:
+                del self.by_key[entry.key]
+            try:
+                if isinstance(entry.payload, str):
+                    await self.ws.send_str(entry.payload)
+                else:
+                    await self.ws.send_bytes(entry.payload)
+            except SEND_ERRORS as err:
+                logging.warning("send error: {}".format(err))
+
+    async def close(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
@@ -44,6 +44,7 @@ parser.add_argument("--max-upload-size", type=float, default=100, help="Set the
 
 parser.add_argument("--base-directory", type=str, default=None, help="Set the ComfyUI base directory for models, custom_nodes, input, output, temp, and user directories.")
 parser.add_argument("--extra-model-paths-config", type=str, default=None, metavar="PATH", nargs='+', action='append', help="Load one or more extra_model_paths.yaml files.")
+parser.add_argument("--filename-index", type=str, default="none", choices=["none", "auto", "inotify", "poll"], help="Keep a live index of the files in the model folders instead of checking every directory mtime and rescanning on changes when listing them. auto uses inotify on Linux and polling elsewhere; polling is needed to see changes made by other machines on network filesystems.")
 parser.add_argument("--output-directory", type=str, default=None, help="Set the ComfyUI output directory. Overrides --base-directory.")
 parser.add_argument("--temp-directory", type=str, default=None, help="Set the ComfyUI temp directory (default is in the ComfyUI directory). Overrides --base-directory.")
 parser.add_argument("--input-directory", type=str, default=None, help="Set the ComfyUI input directory. Overrides --base-directory.")
@@ -107,12 +108,25 @@ class LatentPreviewMethod(enum.Enum):
 parser.add_argument("--preview-method", type=LatentPreviewMethod, default=LatentPreviewMethod.NoPreviews, help="Default preview method for sampler nodes.", action=EnumAction)
 
 parser.add_argument("--preview-size", type=int, default=512, help="Sets the maximum preview size for sampler nodes.")
+parser.add_argument("--preview-format", type=str, default=None, choices=["jpeg", "png", "webp", "raw"], help="Encode previews sent to the frontend in this format instead of the one the node asked for. webp is only sent to clients that support preview metadata and raw (uncompressed RGB8) only to clients with the supports_raw_preview feature flag, other clients get JPEG.")
+parser.add_argument("--view-cache-size", type=int, default=512, help="Size in MB of the cache of previews and thumbnails generated by /view, kept in the temp directory. 0 disables it.")
+parser.add_argument("--preview-rate", type=float, default=15.0, help="Maximum number of previews per second sent to each client, 0 for no limit. Previews are encoded off the event loop and only the latest pending preview of each node is encoded.")
 
 cache_group = parser.add_mutually_exclusive_group()
 cache_group.add_argument("--cache-classic", action="store_true", help="Use the old style (aggressive) caching.")
 cache_group.add_argument("--cache-lru", type=int, default=0, help="Use LRU caching with a maximum of N node results cached. May use more RAM/VRAM.")
 cache_group.add_argument("--cache-none", action="store_true", help="Reduced RAM/VRAM usage at the expense of executing every node for each run.")
 cache_group.add_argument("--cache-ram", nargs='?', const=4.0, type=float, default=0, help="Use RAM pressure caching with the specified headroom threshold. If available RAM drops below the threhold the cache remove large items to free RAM. Default 4GB")
+parser.add_argument("--cache-disk", type=str, default=None, metavar="PATH", help="Also store node outputs containing tensors in this directory so they survive cache evictions and restarts. Used on a RAM cache miss before executing the node.")
+parser.add_argument("--cache-disk-size", type=float, default=16.0, help="Maximum size of the --cache-disk directory in GB. The least recently used entries are removed first.")
+parser.add_argument("--model-pool-size", type=float, default=0, help="Keep up to this many GB of checkpoints, diffusion models, text encoders and VAEs loaded in RAM after no node uses them anymore, so loading the same file again is instant. Models are also evicted when free RAM drops below the --cache-ram headroom (4GB by default).")
+parser.add_argument("--conditioning-cache-size", type=float, default=256, help="Keep up to this many MB of text encoder outputs in memory so encoding the same prompt with the same text encoder and LoRAs again, in any workflow, skips the text encoder. 0 disables it.")
+parser.add_argument("--conditioning-cache-disk-size", type=float, default=0, help="Also save text encoder outputs of models loaded from files in the user directory, keeping up to this many GB, so they survive restarts. 0 disables it.")
+parser.add_argument("--disable-model-prefetch", action="store_true", help="Don't read the model files of the loader nodes of the running and next queued prompts into the page cache in the background.")
+
+parser.add_argument("--prompt-workers", type=int, default=1, metavar="N", help="Execute up to N prompts from the queue at the same time. Worker i runs on GPU i with its own node cache, so N is capped at the number of GPUs (CPU workers share the models). The queue, history and websocket status are shared.")
+parser.add_argument("--coalesce-prompts", type=int, default=0, metavar="N", help="Run up to N queued prompts that only differ in their KSampler seeds and CLIPTextEncode texts as a single batched sampler run. Only deterministic samplers are coalesced. Disabled by default.")
+parser.add_argument("--parallel-cpu-nodes", type=int, default=0, metavar="THREADS", help="Run nodes flagged as THREAD_SAFE (image loading, mask math, etc) on this many worker threads so they overlap with other nodes like sampling. Other nodes still run one at a time. Disabled by default.")
 
 attn_group = parser.add_mutually_exclusive_group()
 attn_group.add_argument("--use-split-cross-attention", action="store_true", help="Use the split cross attention optimization. Ignored when xformers is used.")
@@ -143,6 +157,7 @@ vram_group.add_argument("--novram", action="store_true", help="When lowvram isn'
 vram_group.add_argument("--cpu", action="store_true", help="To use the CPU for everything (slow).")
 
 parser.add_argument("--reserve-vram", type=float, default=None, help="Set the amount of vram in GB you want to reserve for use by your OS/other software. By default some amount is reserved depending on your OS.")
+parser.add_argument("--eviction-policy", type=str, default="cost_lru", choices=["cost_lru", "lru", "legacy"], help="Order in which models are unloaded from vram when memory is needed. cost_lru unloads the least recently used ones first, keeping models that take longer to load back and are used more often loaded for longer. legacy is the old order.")
 
 parser.add_argument("--async-offload", nargs='?', const=2, type=int, default=None, metavar="NUM_STREAMS", help="Use async weight offloading. An optional argument controls the amount of offload streams. Default is 2. Enabled by default on Nvidia.")
 parser.add_argument("--disable-async-offload", action="store_true", help="Disable async weight offloading.")
@@ -166,6 +181,9 @@ parser.add_argument("--disable-pinned-memory", action="store_true", help="Disabl
 
 parser.add_argument("--mmap-torch-files", action="store_true", help="Use mmap when loading ckpt/pt files.")
 parser.add_argument("--disable-mmap", action="store_true", help="Don't use mmap when loading safetensors.")
+parser.add_argument("--load-threads", type=int, default=8, help="Number of threads reading safetensors files in parallel when they aren't memory mapped (with --disable-mmap or when loading straight to a GPU). 1 reads them one tensor at a time.")
+parser.add_argument("--disable-detection-cache", action="store_true", help="Always run model detection on load instead of reusing the results cached in the user directory.")
+parser.add_argument("--warm-detection-cache", action="store_true", help="Run model detection on the checkpoints and diffusion models in a background thread at startup so the first load of each one can skip it.")
 
 parser.add_argument("--dont-print-server", action="store_true", help="Don't print server output.")
 parser.add_argument("--quick-test-for-ci", action="store_true", help="Quick test for CI.")
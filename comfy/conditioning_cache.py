@@ -0,0 +1,297 @@
+"""
+Cache of text encoder outputs shared by all prompts.
+
+CLIP.encode_from_tokens() runs the text encoder whenever a node producing conditioning runs, even
+when the same text was encoded with the same model in an earlier prompt. Its outputs are kept
+here keyed by a digest of the tokens, the clip options, the text encoder and the patches (LoRAs,
+merges) applied to it, and the least recently used ones are evicted past max_size bytes.
+
+Text encoders loaded from files are identified by the files, everything else (patches, models
+built in memory) by the identity of the objects, which only holds in this process. main.py can
+point the cache to a directory, entries keyed only by file contents are saved there so they
+survive restarts.
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+import weakref
+
+import safetensors
+import safetensors.torch
+import torch
+
+import comfy.model_pool
+from comfy.cli_args import args
+
+VERSION = 1
+DISK_EXTENSION = ".safetensors"
+METADATA_KEY = "comfy_conditioning"
+
+
+class Uncacheable(Exception):
+    pass
+
+
+_identities = weakref.WeakKeyDictionary()
+
+
+def identity(obj):
+    """A token for obj that's unique in this process for as long as obj is alive."""
+    try:
+        token = _identities.get(obj)
+        if token is None:
+            token = _identities[obj] = uuid.uuid4().hex
+    except TypeError:
+        raise Uncacheable("{} can't be identified".format(type(obj).__name__))
+    return token
+
+
+class Digest:
+    def __init__(self):
+        self.hash = hashlib.sha256()
+        self.persistent = True
+
+    def add(self, value):
+        h = self.hash
+        if value is None or isinstance(value, (bool, int, float, str, bytes)):
+            h.update(repr(value).encode("utf-8"))
+        elif isinstance(value, (list, tuple)):
+            h.update(b"[" if isinstance(value, list) else b"(")
+            for v in value:
+                self.add(v)
+                h.update(b",")
+            h.update(b"]")
+        elif isinstance(value, dict):
+            h.update(b"{")
+            for k in sorted(value, key=repr):
+                self.add(k)
+                h.update(b":")
+                self.add(value[k])
+                h.update(b",")
+            h.update(b"}")
+        elif isinstance(value, torch.Tensor) and value.numel() <= 65536:
+            # Small tensors like embeddings in the tokens are hashed by content.
+            h.update("T{}{}".format(tuple(value.shape), value.dtype).encode("utf-8"))
+            h.update(value.detach().to("cpu").contiguous().view(torch.uint8).numpy().tobytes())
+        elif isinstance(value, (torch.dtype, torch.device)):
+            h.update(str(value).encode("utf-8"))
+        else:
+            self.persistent = False
+            h.update("I{}".format(identity(value)).encode("utf-8"))
+        return self
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+def set_source(clip, paths, options):
+    """Records that the text encoder of clip was loaded from the files at paths with options."""
+    digest = Digest().add([comfy.model_pool.file_identity(p) for p in paths]).add(comfy.model_pool.freeze(options))
+    clip.cond_stage_model.conditioning_cache_source = digest.hexdigest()
+
+
+def cache_key(clip, tokens, unprojected=False):
+    """
+    Returns (digest, persistent) for encoding tokens with clip, or None when the output can't be
+    cached: the clip has hooks, which change the weights during the encode, or object patches.
+    """
+    patcher = clip.patcher
+    if patcher.forced_hooks is not None or len(patcher.hook_patches) > 0 or len(patcher.object_patches) > 0:
+        return None
+    model = clip.cond_stage_model
+    digest = Digest()
+    try:
+        digest.add(VERSION)
+        source = getattr(model, "conditioning_cache_source", None)
+        if source is None:
+            digest.add(model)
+        else:
+            digest.add(source)
+        digest.add(patcher.patches)
+        digest.add(patcher.weight_wrapper_patches)
+        digest.add(patcher.model_options)
+        digest.add(clip.layer_idx)
+        digest.add(unprojected)
+        digest.add(tokens)
+    except (Uncacheable, RecursionError):
+        return None
+    return digest.hexdigest(), digest.persistent
+
+
+def output_size(value):
+    if isinstance(value, torch.Tensor):
+        return value.nelement() * value.element_size()
+    if isinstance(value, (list, tuple)):
+        return sum(output_size(v) for v in value)
+    if isinstance(value, dict):
+        return sum(output_size(v) for v in value.values())
+    return 0
+
+
+def flatten(value, tensors):
+    if isinstance(value, torch.Tensor):
+        name = str(len(tensors))
+        tensors[name] = value.detach().to("cpu").contiguous()
+        return {"t": name}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, list):
+        return [flatten(v, tensors) for v in value]
+    if isinstance(value, tuple):
+        return {"u": [flatten(v, tensors) for v in value]}
+    if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+        return {"d": {k: flatten(v, tensors) for k, v in value.items()}}
+    raise Uncacheable("can't save values of type {}".format(type(value).__name__))
+
+
+def unflatten(value, tensors):
+    if isinstance(value, list):
+        return [unflatten(v, tensors) for v in value]
+    if isinstance(value, dict):
+        if "t" in value:
+            return tensors[value["t"]]
+        if "u" in value:
+            return tuple(unflatten(v, tensors) for v in value["u"])
+        return {k: unflatten(v, tensors) for k, v in value["d"].items()}
+    return value
+
+
+class ConditioningCache:
+    def __init__(self, max_size=0, directory=None, max_disk_size=0):
+        """max_size and max_disk_size are in bytes, a max_size of 0 disables the cache."""
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()  # digest -> (output, size), least recently used first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.directory = None
+        self.max_disk_size = max_disk_size
+        self.disk_index = collections.OrderedDict()  # digest -> file size
+        self.disk_size = 0
+        if directory is not None:
+            self.set_directory(directory, max_disk_size)
+
+    def set_directory(self, directory, max_disk_size):
+        """Saves persistent entries as files in directory, keeping at most max_disk_size bytes of them."""
+        with self.lock:
+            self.directory = directory
+            self.max_disk_size = max_disk_size
+            self.disk_index.clear()
+            self.disk_size = 0
+            try:
+                os.makedirs(directory, exist_ok=True)
+                files = [e for e in os.scandir(directory) if e.is_file() and e.name.endswith(DISK_EXTENSION)]
+            except OSError as e:
+                logging.warning("Could not use the conditioning cache directory {}: {}".format(directory, e))
+                self.directory = None
+                return
+            for entry in sorted(files, key=lambda e: e.stat().st_mtime):
+                self.disk_index[entry.name[:-len(DISK_EXTENSION)]] = entry.stat().st_size
+                self.disk_size += entry.stat().st_size
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest + DISK_EXTENSION)
+
+    def get(self, key):
+        """Returns the output stored for key, from cache_key(), or None."""
+        if self.max_size <= 0 or key is None:
+            return None
+        digest, persistent = key
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is not None:
+                self.entries.move_to_end(digest)
+                self.hits += 1
+                return entry[0]
+        output = self._load(digest) if persistent else None
+        with self.lock:
+            if output is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._add(digest, output)
+        return output
+
+    def put(self, key, output):
+        if self.max_size <= 0 or key is None:
+            return
+        digest, persistent = key
+        with self.lock:
+            self._add(digest, output)
+        if persistent:
+            self._save(digest, output)
+
+    def _add(self, digest, output):
+        size = output_size(output)
+        if size > self.max_size:
+            return
+        old = self.entries.pop(digest, None)
+        if old is not None:
+            self.size -= old[1]
+        self.entries[digest] = (output, size)
+        self.size += size
+        while self.size > self.max_size:
+            self.size -= self.entries.popitem(last=False)[1][1]
+
+    def _load(self, digest):
+        with self.lock:
+            if self.directory is None or digest not in self.disk_index:
+                return None
+            self.disk_index.move_to_end(digest)
+            path = self._path(digest)
+        try:
+            with safetensors.safe_open(path, framework="pt", device="cpu") as f:
+                structure = json.loads(f.metadata()[METADATA_KEY])
+                tensors = {k: f.get_tensor(k) for k in f.keys()}
+            os.utime(path)
+        except Exception as e:
+            logging.warning("Could not read the cached conditioning {}: {}".format(path, e))
+            with self.lock:
+                self.disk_size -= self.disk_index.pop(digest, 0)
+            return None
+        return unflatten(structure, tensors)
+
+    def _save(self, digest, output):
+        with self.lock:
+            if self.directory is None or digest in self.disk_index:
+                return
+            path = self._path(digest)
+        tensors = {}
+        try:
+            structure = json.dumps(flatten(output, tensors))
+        except Uncacheable as e:
+            logging.debug("Not saving conditioning: {}".format(e))
+            return
+        tmp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        try:
+            safetensors.torch.save_file(tensors, tmp_path, metadata={METADATA_KEY: structure})
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning("Could not save the conditioning cache entry {}: {}".format(path, e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self.lock:
+            self.disk_index[digest] = os.path.getsize(path)
+            self.disk_size += self.disk_index[digest]
+            while self.disk_size > self.max_disk_size and len(self.disk_index) > 0:
+                old, size = self.disk_index.popitem(last=False)
+                self.disk_size -= size
+                try:
+                    os.remove(self._path(old))
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+conditioning_cache = ConditioningCache(int(args.conditioning_cache_size * 1024 * 1024))
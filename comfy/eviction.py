@@ -0,0 +1,123 @@
+"""
+Policies choosing which loaded models free_memory() unloads first.
+
+model_management tracks a ModelUsage for every model it loads: when it was last used, how often,
+and how long moving its weights to the device took, which is what unloading it will cost when
+it's needed again. free_memory() turns each model it could unload into an EvictionCandidate and
+tries them in the order of the policy's key(), lowest first.
+
+simulate() replays a synthetic trace of model requests against a device of a given size so
+policies can be compared without a GPU.
+"""
+
+import math
+from typing import NamedTuple
+
+DEFAULT_BANDWIDTH = 4 * 1024 ** 3  # Bytes per second assumed before any load was measured
+MIN_MEASURED_BYTES = 16 * 1024 * 1024  # Smaller loads are dominated by overhead
+
+
+class ModelUsage:
+    def __init__(self):
+        self.uses = 0
+        self.last_used = 0.0
+        self.loads = 0
+        self.unloads = 0
+        self.load_bytes = 0
+        self.load_seconds = 0.0
+
+    def touch(self, now):
+        self.uses += 1
+        self.last_used = now
+
+    def record_load(self, nbytes, seconds):
+        self.loads += 1
+        if nbytes >= MIN_MEASURED_BYTES:
+            self.load_bytes += nbytes
+            self.load_seconds += seconds
+
+    def reload_cost(self, nbytes, default_bandwidth=DEFAULT_BANDWIDTH):
+        """Estimated seconds to load nbytes of the model back."""
+        if self.load_bytes > 0:
+            return nbytes * self.load_seconds / self.load_bytes
+        return nbytes / default_bandwidth
+
+
+class EvictionCandidate(NamedTuple):
+    usage: ModelUsage
+    loaded_memory: int
+    offloaded_memory: int
+    memory: int
+    refcount: int = 0
+
+
+class EvictionPolicy:
+    name = None
+
+    def key(self, candidate: EvictionCandidate, now: float):
+        raise NotImplementedError()
+
+
+class LegacyPolicy(EvictionPolicy):
+    """The original order: partially offloaded models, then the least referenced and smallest."""
+    name = "legacy"
+
+    def key(self, candidate, now):
+        return (-candidate.offloaded_memory, candidate.refcount, candidate.memory)
+
+
+class LRUPolicy(EvictionPolicy):
+    name = "lru"
+
+    def key(self, candidate, now):
+        return (candidate.usage.last_used, candidate.memory)
+
+
+class CostAwareLRUPolicy(EvictionPolicy):
+    """
+    Least recently used weighted by reload cost and use count: a model that's expensive to bring
+    back and used often stays loaded longer than a cheap one used just as recently.
+    """
+    name = "cost_lru"
+
+    def key(self, candidate, now):
+        usage = candidate.usage
+        cost = usage.reload_cost(candidate.loaded_memory)
+        value = cost * (1 + math.log2(max(usage.uses, 1))) / (max(now - usage.last_used, 0.0) + 1.0)
+        return (value, usage.last_used)
+
+
+POLICIES = {policy.name: policy for policy in (CostAwareLRUPolicy, LRUPolicy, LegacyPolicy)}
+
+
+def simulate(policy: EvictionPolicy, trace, models: dict, capacity: int):
+    """
+    Replays trace, the sequence of model names requested, on a device with capacity bytes.
+    models maps names to (size in bytes, seconds to load). Requested models are fully loaded,
+    unloading others in policy order until they fit. The clock advances one second per request
+    plus the load times. Returns the number of loads, unloads, and the total load time.
+    """
+    usage = {name: ModelUsage() for name in models}
+    loaded = []
+    stats = {"requests": 0, "loads": 0, "unloads": 0, "load_seconds": 0.0}
+    now = 0.0
+    for name in trace:
+        now += 1.0
+        stats["requests"] += 1
+        size, seconds = models[name]
+        if name not in loaded:
+            used = sum(models[n][0] for n in loaded)
+            candidates = sorted(loaded, key=lambda n: policy.key(EvictionCandidate(usage[n], models[n][0], 0, models[n][0]), now))
+            while used + size > capacity and candidates:
+                victim = candidates.pop(0)
+                loaded.remove(victim)
+                usage[victim].unloads += 1
+                used -= models[victim][0]
+                stats["unloads"] += 1
+            loaded.append(name)
+            usage[name].record_load(size, seconds)
+            stats["loads"] += 1
+            stats["load_seconds"] += seconds
+            now += seconds
+        usage[name].touch(now)
+    return stats
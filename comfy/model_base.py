@@ -301,6 +301,8 @@ class BaseModel(torch.nn.Module):
     def load_model_weights(self, sd, unet_prefix=""):
         to_load = {}
         keys = list(sd.keys())
+        if isinstance(sd, utils.LazyStateDict):
+            sd.load([k for k in keys if k.startswith(unet_prefix)])
         for k in keys:
             if k.startswith(unet_prefix):
                 to_load[k[len(unet_prefix):]] = sd.pop(k)
@@ -1,6 +1,7 @@
 import json
 import comfy.supported_models
 import comfy.supported_models_base
+import comfy.model_detection_cache
 import comfy.utils
 import math
 import logging
@@ -781,10 +782,25 @@ def model_config_from_unet_config(unet_config, state_dict=None):
     return None
 
 def model_config_from_unet(state_dict, unet_key_prefix, use_base_if_no_match=False, metadata=None):
-    unet_config = detect_unet_config(state_dict, unet_key_prefix, metadata=metadata)
+    fingerprint = comfy.model_detection_cache.state_dict_fingerprint(state_dict, unet_key_prefix, metadata)
+    models = comfy.supported_models.models
+    cached = comfy.model_detection_cache.detection_cache.get(fingerprint)
+    if cached is not None:
+        unet_config, index = cached["unet_config"], cached["model_config"]
+    else:
+        unet_config = detect_unet_config(state_dict, unet_key_prefix, metadata=metadata)
+        index = None
+        if unet_config is not None:
+            index = next((i for i, m in enumerate(models) if m.matches(unet_config, state_dict)), None)
+        comfy.model_detection_cache.detection_cache.put(fingerprint, {"unet_config": unet_config, "model_config": index})
+
     if unet_config is None:
         return None
-    model_config = model_config_from_unet_config(unet_config, state_dict)
+    if index is not None:
+        model_config = models[index](unet_config)
+    else:
+        logging.error("no match {}".format(unet_config))
+        model_config = None
     if model_config is None and use_base_if_no_match:
         model_config = comfy.supported_models_base.BASE(unet_config)
 
@@ -0,0 +1,187 @@
+"""
+Persistent cache of model detection results.
+
+detect_unet_config runs hundreds of key pattern checks and count_blocks scans over the state dict
+keys every time a model is loaded. It only looks at key names, tensor shapes and the file
+metadata, so its result (the unet_config and which supported model it matched) is cached under a
+fingerprint of those, together with a hash of the detection code so that updates invalidate old
+results. main.py points the cache to a file in the user directory, without a path it's only kept
+in memory.
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import torch
+
+import comfy.supported_models
+import comfy.utils
+
+MAX_ENTRIES = 4096
+
+
+def _code_fingerprint():
+    h = hashlib.sha256()
+    base = os.path.dirname(os.path.abspath(__file__))
+    for name in ("model_detection.py", "supported_models.py", "supported_models_base.py", "model_detection_cache.py"):
+        try:
+            with open(os.path.join(base, name), "rb") as f:
+                h.update(f.read())
+        except OSError:
+            h.update(name.encode("utf-8"))
+    return h.hexdigest()
+
+
+CODE_FINGERPRINT = _code_fingerprint()
+
+
+def state_dict_fingerprint(state_dict, prefix="", metadata=None):
+    """
+    Hash of everything detection reads: the prefix, key names, shapes, dtypes and the metadata, and
+    the list of supported models which custom nodes can extend.
+    """
+    h = hashlib.sha256()
+    h.update(CODE_FINGERPRINT.encode("utf-8"))
+    h.update(",".join("{}.{}".format(m.__module__, m.__qualname__) for m in comfy.supported_models.models).encode("utf-8"))
+    h.update(prefix.encode("utf-8"))
+    h.update(json.dumps(metadata, sort_keys=True, default=str).encode("utf-8"))
+    lazy = isinstance(state_dict, comfy.utils.LazyStateDict)
+    parts = []
+    for k in state_dict.keys():
+        w = state_dict.peek(k) if lazy else state_dict[k]
+        shape = getattr(w, "shape", None)
+        parts.append("{}\0{}\0{}".format(k, None if shape is None else tuple(shape), getattr(w, "dtype", type(w).__name__)))
+    h.update("\n".join(parts).encode("utf-8"))
+    return h.hexdigest()
+
+
+def encode_value(value):
+    """Converts a detected config to JSON, keeping tuples and torch dtypes. Raises TypeError for anything else."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, list):
+        return [encode_value(v) for v in value]
+    if isinstance(value, tuple):
+        return {"__tuple__": [encode_value(v) for v in value]}
+    if isinstance(value, torch.dtype):
+        return {"__dtype__": str(value).removeprefix("torch.")}
+    if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+        return {"__dict__": {k: encode_value(v) for k, v in value.items()}}
+    raise TypeError("can't cache values of type {}".format(type(value).__name__))
+
+
+def decode_value(value):
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    if isinstance(value, dict):
+        if "__tuple__" in value:
+            return tuple(decode_value(v) for v in value["__tuple__"])
+        if "__dtype__" in value:
+            return getattr(torch, value["__dtype__"])
+        return {k: decode_value(v) for k, v in value["__dict__"].items()}
+    return value
+
+
+class DetectionCache:
+    def __init__(self, path=None, max_entries=MAX_ENTRIES):
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()  # fingerprint -> encoded result, least recently used first
+        self.max_entries = max_entries
+        self.path = None
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            self.set_path(path)
+
+    def set_path(self, path):
+        """Loads the entries persisted at path and saves new ones there."""
+        with self.lock:
+            self.path = path
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == CODE_FINGERPRINT:
+                    for fingerprint, entry in data.get("entries", {}).items():
+                        self.entries[fingerprint] = entry
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, AttributeError) as e:
+                logging.warning("Could not load the model detection cache {}: {}".format(path, e))
+
+    def get(self, fingerprint):
+        """Returns the decoded result stored for fingerprint, or None."""
+        with self.lock:
+            entry = self.entries.get(fingerprint)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(fingerprint)
+            self.hits += 1
+        return decode_value(entry)
+
+    def put(self, fingerprint, value):
+        try:
+            entry = encode_value(value)
+        except TypeError as e:
+            logging.debug("Not caching model detection result: {}".format(e))
+            return
+        with self.lock:
+            self.entries[fingerprint] = entry
+            self.entries.move_to_end(fingerprint)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            if self.path is not None:
+                self._save()
+
+    def _save(self):
+        tmp_path = "{}.{}.tmp".format(self.path, threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": CODE_FINGERPRINT, "entries": self.entries}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning("Could not save the model detection cache {}: {}".format(self.path, e))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if self.path is not None:
+                self._save()
+
+
+detection_cache = DetectionCache()
+
+
+def warm(checkpoint_paths=(), diffusion_model_paths=()):
+    """
+    Runs detection on safetensors files so later loads hit the cache. The state dicts are prepared
+    the same way load_state_dict_guess_config and load_diffusion_model_state_dict do it, reading
+    only the headers and the few tensors detection inspects. Returns the number of files detected.
+    """
+    import comfy.model_detection
+
+    detected = 0
+    for path, checkpoint in [(p, True) for p in checkpoint_paths] + [(p, False) for p in diffusion_model_paths]:
+        if not path.lower().endswith((".safetensors", ".sft")):
+            continue
+        try:
+            sd, metadata = comfy.utils.load_torch_file(path, return_metadata=True, lazy=True)
+            prefix = comfy.model_detection.unet_prefix_from_state_dict(sd)
+            if checkpoint:
+                sd, metadata = comfy.utils.convert_old_quants(sd, prefix, metadata=metadata)
+            else:
+                temp_sd = comfy.utils.state_dict_prefix_replace(sd, {prefix: ""}, filter_keys=True)
+                if len(temp_sd) > 0:
+                    sd = temp_sd
+                prefix = ""
+                sd, metadata = comfy.utils.convert_old_quants(sd, prefix, metadata=metadata)
+            comfy.model_detection.model_config_from_unet(sd, prefix, metadata=metadata)
+            detected += 1
+        except Exception as e:
+            logging.debug("Could not detect the model type of {}: {}".format(path, e))
+    return detected
@@ -26,6 +26,10 @@ import platform
 import weakref
 import gc
 import os
+import threading
+import functools
+import time
+import comfy.eviction
 
 class VRAMState(Enum):
     DISABLED = 0    #No vram present: no need to move models to vram
@@ -187,6 +191,33 @@ def get_torch_device():
         else:
             return torch.device(torch.cuda.current_device())
 
+def get_device_count():
+    if directml_enabled or cpu_state != CPUState.GPU:
+        return 1
+    if is_intel_xpu():
+        return torch.xpu.device_count()
+    elif is_ascend_npu():
+        return torch.npu.device_count()
+    elif is_mlu():
+        return torch.mlu.device_count()
+    else:
+        return torch.cuda.device_count()
+
+def set_thread_torch_device(index):
+    """Makes get_torch_device() return device number index (modulo the device count) on the calling thread."""
+    if directml_enabled or cpu_state != CPUState.GPU:
+        return get_torch_device()
+    index = index % max(get_device_count(), 1)
+    if is_intel_xpu():
+        torch.xpu.set_device(index)
+    elif is_ascend_npu():
+        torch.npu.set_device(index)
+    elif is_mlu():
+        torch.mlu.set_device(index)
+    else:
+        torch.cuda.set_device(index)
+    return get_torch_device()
+
 def get_total_memory(dev=None, torch_total_too=False):
     global directml_enabled
     if dev is None:
@@ -462,6 +493,35 @@ except:
 
 current_loaded_models = []
 
+# Prompt workers on different devices share current_loaded_models, so anything that
+# reads or reorders it holds this lock.
+loaded_models_lock = threading.RLock()
+# Notified when a thread stops using models, see use_models().
+loaded_models_released = threading.Condition(loaded_models_lock)
+
+def with_loaded_models_lock(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with loaded_models_lock:
+            return func(*args, **kwargs)
+    return wrapper
+
+model_usage = weakref.WeakKeyDictionary()  # model weights (ModelPatcher.model) -> comfy.eviction.ModelUsage
+eviction_policy = comfy.eviction.POLICIES[args.eviction_policy]()
+model_churn = {"loads": 0, "reloads": 0, "unloads": 0, "partial_unloads": 0, "bytes_loaded": 0}
+
+def get_model_usage(model):
+    """The usage stats of the weights of a ModelPatcher, shared by its clones."""
+    usage = model_usage.get(model.model)
+    if usage is None:
+        usage = comfy.eviction.ModelUsage()
+        model_usage[model.model] = usage
+    return usage
+
+@with_loaded_models_lock
+def eviction_stats():
+    return {"eviction_policy": eviction_policy.name, "loaded_models": len(current_loaded_models), **model_churn}
+
 def module_size(module):
     module_mem = 0
     sd = module.state_dict()
@@ -478,6 +538,7 @@ class LoadedModel:
         self.currently_used = True
         self.model_finalizer = None
         self._patcher_finalizer = None
+        self.users = {}  # thread ident -> number of use_models() calls
 
     def _set_model(self, model):
         self._model = weakref.ref(model)
@@ -559,6 +620,9 @@ class LoadedModel:
     def is_dead(self):
         return self.real_model() is not None and self.model is None
 
+    def used_by_other_threads(self):
+        return any(t != threading.get_ident() for t in self.users)
+
 
 def use_more_memory(extra_memory, loaded_models, device):
     for m in loaded_models:
@@ -592,17 +656,20 @@ def extra_reserved_memory():
 def minimum_inference_memory():
     return (1024 * 1024 * 1024) * 0.8 + extra_reserved_memory()
 
+@with_loaded_models_lock
 def free_memory(memory_required, device, keep_loaded=[]):
     cleanup_models_gc()
     unloaded_model = []
     can_unload = []
     unloaded_models = []
 
+    now = time.monotonic()
     for i in range(len(current_loaded_models) -1, -1, -1):
         shift_model = current_loaded_models[i]
         if shift_model.device == device:
-            if shift_model not in keep_loaded and not shift_model.is_dead():
-                can_unload.append((-shift_model.model_offloaded_memory(), sys.getrefcount(shift_model.model), shift_model.model_memory(), i))
+            if shift_model not in keep_loaded and not shift_model.is_dead() and not shift_model.used_by_other_threads():
+                candidate = comfy.eviction.EvictionCandidate(get_model_usage(shift_model.model), shift_model.model_loaded_memory(), shift_model.model_offloaded_memory(), shift_model.model_memory(), sys.getrefcount(shift_model.model))
+                can_unload.append((eviction_policy.key(candidate, now), i))
                 shift_model.currently_used = False
 
     for x in sorted(can_unload):
@@ -616,6 +683,10 @@ def free_memory(memory_required, device, keep_loaded=[]):
         logging.debug(f"Unloading {current_loaded_models[i].model.model.__class__.__name__}")
         if current_loaded_models[i].model_unload(memory_to_free):
             unloaded_model.append(i)
+            get_model_usage(current_loaded_models[i].model).unloads += 1
+            model_churn["unloads"] += 1
+        else:
+            model_churn["partial_unloads"] += 1
 
     for i in sorted(unloaded_model, reverse=True):
         unloaded_models.append(current_loaded_models.pop(i))
@@ -629,6 +700,7 @@ def free_memory(memory_required, device, keep_loaded=[]):
                 soft_empty_cache()
     return unloaded_models
 
+@with_loaded_models_lock
 def load_models_gpu(models, memory_required=0, force_patch_weights=False, minimum_memory_required=None, force_full_load=False):
     cleanup_models_gc()
     global vram_state
@@ -647,6 +719,9 @@ def load_models_gpu(models, memory_required=0, force_patch_weights=False, minimu
             models_temp.add(mm)
 
     models = models_temp
+    now = time.monotonic()
+    for x in models:
+        get_model_usage(x).touch(now)
 
     models_to_load = []
 
@@ -667,10 +742,15 @@ def load_models_gpu(models, memory_required=0, force_patch_weights=False, minimu
             models_to_load.append(loaded_model)
 
     for loaded_model in models_to_load:
-        to_unload = []
-        for i in range(len(current_loaded_models)):
-            if loaded_model.model.is_clone(current_loaded_models[i].model):
-                to_unload = [i] + to_unload
+        while True:
+            to_unload = []
+            for i in range(len(current_loaded_models)):
+                if loaded_model.model.is_clone(current_loaded_models[i].model):
+                    to_unload = [i] + to_unload
+            if not any(current_loaded_models[i].used_by_other_threads() for i in to_unload):
+                break
+            # Another prompt worker is sampling with these weights, loading this model would patch them under it.
+            loaded_models_released.wait()
         for i in to_unload:
             model_to_unload = current_loaded_models.pop(i)
             model_to_unload.model.detach(unpatch_all=False)
@@ -712,13 +792,53 @@ def load_models_gpu(models, memory_required=0, force_patch_weights=False, minimu
         if vram_set_state == VRAMState.NO_VRAM:
             lowvram_model_memory = 0.1
 
+        loaded_before = loaded_model.model_loaded_memory()
+        start = time.perf_counter()
         loaded_model.model_load(lowvram_model_memory, force_patch_weights=force_patch_weights)
+        loaded_bytes = loaded_model.model_loaded_memory() - loaded_before
+        if loaded_bytes > 0:
+            usage = get_model_usage(model)
+            usage.record_load(loaded_bytes, time.perf_counter() - start)
+            model_churn["loads"] += 1
+            model_churn["bytes_loaded"] += loaded_bytes
+            if usage.unloads > 0:
+                model_churn["reloads"] += 1
         current_loaded_models.insert(0, loaded_model)
     return
 
 def load_model_gpu(model):
     return load_models_gpu([model])
 
+@with_loaded_models_lock
+def use_models(models):
+    """
+    Marks the loaded models of models, and the models they patch in, as used by the calling thread until
+    release_models(). Other threads don't unload them or load clones sharing their weights meanwhile.
+    """
+    patchers = set()
+    for m in models:
+        patchers.add(m)
+        patchers.update(m.model_patches_models())
+    thread_id = threading.get_ident()
+    for loaded_model in current_loaded_models:
+        if loaded_model.model in patchers:
+            loaded_model.users[thread_id] = loaded_model.users.get(thread_id, 0) + 1
+
+@with_loaded_models_lock
+def release_models(models):
+    patchers = set()
+    for m in models:
+        patchers.add(m)
+        patchers.update(m.model_patches_models())
+    thread_id = threading.get_ident()
+    for loaded_model in current_loaded_models:
+        if loaded_model.model in patchers and thread_id in loaded_model.users:
+            loaded_model.users[thread_id] -= 1
+            if loaded_model.users[thread_id] <= 0:
+                loaded_model.users.pop(thread_id)
+    loaded_models_released.notify_all()
+
+@with_loaded_models_lock
 def loaded_models(only_currently_used=False):
     output = []
     for m in current_loaded_models:
@@ -730,6 +850,7 @@ def loaded_models(only_currently_used=False):
     return output
 
 
+@with_loaded_models_lock
 def cleanup_models_gc():
     do_gc = False
     for i in range(len(current_loaded_models)):
@@ -750,6 +871,7 @@ def cleanup_models_gc():
 
 
 
+@with_loaded_models_lock
 def cleanup_models():
     to_delete = []
     for i in range(len(current_loaded_models)):
@@ -1560,8 +1682,13 @@ def soft_empty_cache(force=False):
         torch.cuda.empty_cache()
         torch.cuda.ipc_collect()
 
+@with_loaded_models_lock
 def unload_all_models():
-    free_memory(1e30, get_torch_device())
+    # Devices another prompt worker is sampling on are skipped, every worker calls this once it is idle.
+    busy = set(m.device for m in current_loaded_models if m.used_by_other_threads())
+    devices = set([get_torch_device()] + [m.device for m in current_loaded_models])
+    for device in devices - busy:
+        free_memory(1e30, device)
 
 def debug_memory_summary():
     if is_amd() or is_nvidia():
@@ -1569,30 +1696,50 @@ def debug_memory_summary():
     return ""
 
 #TODO: might be cleaner to put this somewhere else
-import threading
-
 class InterruptProcessingException(Exception):
     pass
 
 interrupt_processing_mutex = threading.RLock()
 
 interrupt_processing = False
-def interrupt_current_processing(value=True):
+# Prompt worker threads each get their own interrupt flag, keyed by thread ident, so
+# interrupting one prompt doesn't stop the others. Calls made from a worker thread only
+# touch that worker's flag, calls from anywhere else apply to every worker.
+worker_interrupt_processing = {}
+
+def register_worker_thread():
+    with interrupt_processing_mutex:
+        worker_interrupt_processing[threading.get_ident()] = False
+
+def interrupt_current_processing(value=True, thread_id=None):
     global interrupt_processing
     global interrupt_processing_mutex
     with interrupt_processing_mutex:
-        interrupt_processing = value
+        if thread_id is None and threading.get_ident() in worker_interrupt_processing:
+            thread_id = threading.get_ident()
+        if thread_id in worker_interrupt_processing:
+            worker_interrupt_processing[thread_id] = value
+        elif thread_id is None and len(worker_interrupt_processing) > 0:
+            for k in worker_interrupt_processing:
+                worker_interrupt_processing[k] = value
+        else:
+            interrupt_processing = value
 
 def processing_interrupted():
     global interrupt_processing
     global interrupt_processing_mutex
     with interrupt_processing_mutex:
-        return interrupt_processing
+        return worker_interrupt_processing.get(threading.get_ident(), interrupt_processing)
 
 def throw_exception_if_processing_interrupted():
     global interrupt_processing
     global interrupt_processing_mutex
     with interrupt_processing_mutex:
-        if interrupt_processing:
+        thread_id = threading.get_ident()
+        if thread_id in worker_interrupt_processing:
+            if worker_interrupt_processing[thread_id]:
+                worker_interrupt_processing[thread_id] = False
+                raise InterruptProcessingException()
+        elif interrupt_processing:
             interrupt_processing = False
             raise InterruptProcessingException()
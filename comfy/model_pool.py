@@ -0,0 +1,160 @@
+"""
+Pool of loaded models shared by the loader nodes.
+
+The loaders load from disk whenever their node output is evicted from the execution cache, even
+when another node or prompt just loaded the same file. The pool keeps the base objects they
+return keyed by file identity (path, size, mtime), load options and load device, and hands out
+clones so patches applied downstream never reach the pooled copy. Entries whose clones are still alive
+cost no extra memory, so only idle ones count towards the size limit and get evicted, least
+recently used first, when it's exceeded or when free RAM drops below the headroom.
+"""
+
+import copy
+import gc
+import logging
+import os
+import threading
+import time
+import weakref
+
+import psutil
+import torch
+
+from comfy.cli_args import args
+import comfy.model_management
+
+RAM_HEADROOM = 4.0  # GB, used when --cache-ram doesn't set one
+RAM_HYSTERESIS = 1.1
+
+
+def file_identity(path):
+    st = os.stat(path)
+    return (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+
+
+def freeze(value):
+    """Hashable version of load options."""
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, (torch.device, torch.dtype)):
+        return str(value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def share(obj):
+    if obj is None:
+        return None
+    if hasattr(obj, "clone"):
+        return obj.clone()
+    return copy.copy(obj)
+
+
+def anchors(obj, base):
+    """
+    The objects that stay alive as long as obj or anything cloned from it is alive. Clones of a
+    ModelPatcher keep their parent, but clones of a CLIP only keep the clone of its patcher.
+    """
+    out = [obj]
+    patcher = getattr(obj, "patcher", None)
+    if patcher is not None and patcher is not getattr(base, "patcher", None):
+        out.append(patcher)
+    return out
+
+
+class PoolEntry:
+    def __init__(self, objects, size):
+        self.objects = objects
+        self.size = size
+        self.last_used = time.monotonic()
+        self.shared = []  # weakrefs to the anchors() of the clones handed out
+
+    def in_use(self):
+        self.shared = [r for r in self.shared if r() is not None]
+        return len(self.shared) > 0
+
+
+class ModelPool:
+    def __init__(self, max_size=0, ram_headroom=RAM_HEADROOM):
+        """max_size is the size in bytes of the idle models kept, 0 disables the pool."""
+        self.max_size = max_size
+        self.ram_headroom = ram_headroom
+        self.entries: dict[tuple, PoolEntry] = {}
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, kind, paths, options, load_fn):
+        """
+        Returns the tuple of models load_fn() loads from paths, reusing the pooled ones if the files
+        and options are the same.
+        """
+        if self.max_size <= 0:
+            return load_fn()
+        key = (kind, tuple(file_identity(p) for p in paths), freeze(options), str(comfy.model_management.get_torch_device()))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                entry.last_used = time.monotonic()
+                return self._share(entry)
+            self.misses += 1
+
+        objects = tuple(load_fn())
+        size = sum(o.get_ram_usage() for o in objects if hasattr(o, "get_ram_usage"))
+        with self.lock:
+            entry = self.entries.setdefault(key, PoolEntry(objects, size))
+            out = self._share(entry)
+            self.trim()
+        return out
+
+    def _share(self, entry):
+        out = tuple(share(o) for o in entry.objects)
+        for o, base in zip(out, entry.objects):
+            if o is not None:
+                entry.shared.extend(weakref.ref(a) for a in anchors(o, base))
+        return out
+
+    def holds_file(self, identity):
+        """Whether a pooled model was loaded from the file with this file_identity()."""
+        with self.lock:
+            return any(identity in key[1] for key in self.entries)
+
+    def idle_size(self):
+        with self.lock:
+            return sum(e.size for e in self.entries.values() if not e.in_use())
+
+    def trim(self, ram_headroom=None):
+        """Evicts idle entries until they fit in max_size and at least ram_headroom GB of RAM is free."""
+        if ram_headroom is None:
+            ram_headroom = self.ram_headroom
+        with self.lock:
+            if len(self.entries) == 0:
+                return
+            idle = sorted(((e.last_used, k) for k, e in self.entries.items() if not e.in_use()), reverse=True)
+            idle_size = sum(self.entries[k].size for _, k in idle)
+            while idle and idle_size > self.max_size:
+                key = idle.pop()[1]
+                idle_size -= self._evict(key)
+
+            if idle and psutil.virtual_memory().available / (1024 ** 3) < ram_headroom:
+                while idle and psutil.virtual_memory().available / (1024 ** 3) < ram_headroom * RAM_HYSTERESIS:
+                    self._evict(idle.pop()[1])
+                gc.collect()
+
+    def _evict(self, key):
+        entry = self.entries.pop(key)
+        logging.debug("Evicting {} {} from the model pool".format(key[0], [f[0] for f in key[1]]))
+        return entry.size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+model_pool = ModelPool(int(args.model_pool_size * (1024 ** 3)), args.cache_ram if args.cache_ram > 0 else RAM_HEADROOM)
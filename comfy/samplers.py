@@ -12,6 +12,7 @@ import collections
 from comfy import model_management
 import math
 import logging
+import time
 import comfy.sampler_helpers
 import comfy.model_patcher
 import comfy.patcher_extension
@@ -27,6 +28,8 @@ def add_area_dims(area, num_dims):
         area = [2147483648] + area[:len(area) // 2] + [0] + area[len(area) // 2:]
     return area
 
+cond_obj = collections.namedtuple('cond_obj', ['input_x', 'mult', 'conditioning', 'area', 'control', 'patches', 'uuid', 'hooks'])
+
 def get_area_and_mult(conds, x_in, timestep_in):
     dims = tuple(x_in.shape[2:])
     area = None
@@ -109,7 +112,6 @@ def get_area_and_mult(conds, x_in, timestep_in):
 
         patches['middle_patch'] = [gligen_patch]
 
-    cond_obj = collections.namedtuple('cond_obj', ['input_x', 'mult', 'conditioning', 'area', 'control', 'patches', 'uuid', 'hooks'])
     return cond_obj(input_x, mult, conditioning, area, control, patches, conds['uuid'], hooks)
 
 def cond_equal_size(c1, c2):
@@ -206,6 +208,106 @@ def calc_cond_batch(model: BaseModel, conds: list[list[dict]], x_in: torch.Tenso
         return _calc_cond_batch_outer(model, conds, x_in, timestep, model_options)
     return handler.execute(_calc_cond_batch_outer, model, conds, x_in, timestep, model_options)
 
+def make_cond_batch_plan(model: BaseModel, hooked_to_run: dict[comfy.hooks.HookGroup,list[tuple[tuple,int]]], free_memory):
+    """
+    Splits the conds of each hook group into batches of conds that can be concatenated and fit in free_memory.
+    Returns ([(hooks, [[index in to_run, ...], ...]), ...], memory needed by the largest batch, whether free_memory forced smaller batches).
+    """
+    groups = []
+    required = 0
+    limited = False
+    for hooks, to_run in hooked_to_run.items():
+        batches = []
+        remaining = list(range(len(to_run)))
+        while len(remaining) > 0:
+            first = to_run[remaining[0]]
+            first_shape = first[0][0].shape
+            to_batch_temp = []
+            for x in remaining:
+                if can_concat_cond(to_run[x][0], first[0]):
+                    to_batch_temp += [x]
+
+            to_batch_temp.reverse()
+            to_batch = to_batch_temp[:1]
+
+            fits = False
+            for i in range(1, len(to_batch_temp) + 1):
+                batch_amount = to_batch_temp[:len(to_batch_temp)//i]
+                input_shape = [len(batch_amount) * first_shape[0]] + list(first_shape)[1:]
+                cond_shapes = collections.defaultdict(list)
+                for tt in batch_amount:
+                    for k, v in to_run[tt][0].conditioning.items():
+                        cond_shapes[k].append(v.size())
+
+                memory = model.memory_required(input_shape, cond_shapes=cond_shapes) * 1.5
+                if memory < free_memory:
+                    to_batch = batch_amount
+                    required = max(required, memory)
+                    limited = limited or i > 1
+                    fits = True
+                    break
+            limited = limited or not fits
+
+            batches.append(to_batch)
+            remaining = [x for x in remaining if x not in to_batch]
+        groups.append((hooks, batches))
+    return groups, required, limited
+
+class CondBatchPlanner:
+    """
+    Keeps the batches _calc_cond_batch() splits the conds into during a sampling run: they only change when
+    the conds that apply, their hooks or hook keyframes or the input shape change, or when the free memory
+    no longer fits them. Also measures the time _calc_cond_batch() spends outside of the model.
+    """
+    MAX_PLANS = 16
+
+    def __init__(self):
+        self.plans = {}
+        self.calls = 0
+        self.planned = 0
+        self.overhead = 0.0
+
+    def get(self, model: BaseModel, conds: list[list[dict]], hooked_to_run: dict[comfy.hooks.HookGroup,list[tuple[tuple,int]]], x_in: torch.Tensor):
+        key = (tuple(x_in.shape), x_in.device, tuple((hooks, tuple(h.strength for h in hooks.hooks) if hooks is not None else None,
+                                                     tuple((p.uuid, i) for p, i in to_run)) for hooks, to_run in hooked_to_run.items()))
+        entries = [x for cond in conds if cond is not None for x in cond]
+        free_memory = model_management.get_free_memory(x_in.device)
+        plan = self.plans.get(key, None)
+        if plan is not None:
+            plan_entries, groups, required, limited = plan
+            # The entries are compared by identity, they are the same dicts every step of a sampling run.
+            if not limited and required < free_memory and len(plan_entries) == len(entries) and all(a is b for a, b in zip(plan_entries, entries)):
+                return groups
+
+        groups, required, limited = make_cond_batch_plan(model, hooked_to_run, free_memory)
+        self.planned += 1
+        if len(self.plans) >= self.MAX_PLANS:
+            self.plans.clear()
+        self.plans[key] = (entries, groups, required, limited)
+        return groups
+
+    def record(self, overhead):
+        self.calls += 1
+        self.overhead += overhead
+
+    def log(self):
+        if self.calls > 0:
+            logging.debug("Cond batching: {} calls, {} plans, {:.3f} ms per call outside of the model".format(self.calls, self.planned, self.overhead * 1000 / self.calls))
+
+def plan_cond_batches(model: BaseModel, conds: list[list[dict]], hooked_to_run: dict[comfy.hooks.HookGroup,list[tuple[tuple,int]]], x_in: torch.Tensor, model_options: dict[str]):
+    """Returns [(hooks, [(cond_obj, cond index), ...]), ...], the batches to run the model on, reusing the plan of previous steps when there is a CondBatchPlanner in model_options."""
+    planner: CondBatchPlanner = model_options.get("cond_batch_planner", None)
+    if planner is None:
+        groups = make_cond_batch_plan(model, hooked_to_run, model_management.get_free_memory(x_in.device))[0]
+    else:
+        groups = planner.get(model, conds, hooked_to_run, x_in)
+    out = []
+    for hooks, batches in groups:
+        to_run = hooked_to_run[hooks]
+        for to_batch in batches:
+            out.append((hooks, [to_run[x] for x in to_batch]))
+    return out
+
 def _calc_cond_batch_outer(model: BaseModel, conds: list[list[dict]], x_in: torch.Tensor, timestep, model_options):
     executor = comfy.patcher_extension.WrapperExecutor.new_executor(
         _calc_cond_batch,
@@ -214,6 +316,8 @@ def _calc_cond_batch_outer(model: BaseModel, conds: list[list[dict]], x_in: torc
     return executor.execute(model, conds, x_in, timestep, model_options)
 
 def _calc_cond_batch(model: BaseModel, conds: list[list[dict]], x_in: torch.Tensor, timestep, model_options):
+    start = time.perf_counter()
+    model_time = 0.0
     out_conds = []
     out_counts = []
     # separate conds by matching hooks
@@ -248,102 +352,81 @@ def _calc_cond_batch(model: BaseModel, conds: list[list[dict]], x_in: torch.Tens
     model.current_patcher.prepare_state(timestep)
 
     # run every hooked_to_run separately
-    for hooks, to_run in hooked_to_run.items():
-        while len(to_run) > 0:
-            first = to_run[0]
-            first_shape = first[0][0].shape
-            to_batch_temp = []
-            for x in range(len(to_run)):
-                if can_concat_cond(to_run[x][0], first[0]):
-                    to_batch_temp += [x]
+    for hooks, to_batch in plan_cond_batches(model, conds, hooked_to_run, x_in, model_options):
+        input_x = []
+        mult = []
+        c = []
+        cond_or_uncond = []
+        uuids = []
+        area = []
+        control = None
+        patches = None
+        for o in to_batch:
+            p = o[0]
+            input_x.append(p.input_x)
+            mult.append(p.mult)
+            c.append(p.conditioning)
+            area.append(p.area)
+            cond_or_uncond.append(o[1])
+            uuids.append(p.uuid)
+            control = p.control
+            patches = p.patches
+
+        batch_chunks = len(cond_or_uncond)
+        input_x = torch.cat(input_x)
+        c = cond_cat(c)
+        timestep_ = torch.cat([timestep] * batch_chunks)
+
+        transformer_options = model.current_patcher.apply_hooks(hooks=hooks)
+        if 'transformer_options' in model_options:
+            transformer_options = comfy.patcher_extension.merge_nested_dicts(transformer_options,
+                                                                             model_options['transformer_options'],
+                                                                             copy_dict1=False)
+
+        if patches is not None:
+            transformer_options["patches"] = comfy.patcher_extension.merge_nested_dicts(
+                transformer_options.get("patches", {}),
+                patches
+            )
 
-            to_batch_temp.reverse()
-            to_batch = to_batch_temp[:1]
+        transformer_options["cond_or_uncond"] = cond_or_uncond[:]
+        transformer_options["uuids"] = uuids[:]
+        transformer_options["sigmas"] = timestep
 
-            free_memory = model_management.get_free_memory(x_in.device)
-            for i in range(1, len(to_batch_temp) + 1):
-                batch_amount = to_batch_temp[:len(to_batch_temp)//i]
-                input_shape = [len(batch_amount) * first_shape[0]] + list(first_shape)[1:]
-                cond_shapes = collections.defaultdict(list)
-                for tt in batch_amount:
-                    cond = {k: v.size() for k, v in to_run[tt][0].conditioning.items()}
-                    for k, v in to_run[tt][0].conditioning.items():
-                        cond_shapes[k].append(v.size())
+        c['transformer_options'] = transformer_options
 
-                if model.memory_required(input_shape, cond_shapes=cond_shapes) * 1.5 < free_memory:
-                    to_batch = batch_amount
-                    break
+        if control is not None:
+            c['control'] = control.get_control(input_x, timestep_, c, len(cond_or_uncond), transformer_options)
 
-            input_x = []
-            mult = []
-            c = []
-            cond_or_uncond = []
-            uuids = []
-            area = []
-            control = None
-            patches = None
-            for x in to_batch:
-                o = to_run.pop(x)
-                p = o[0]
-                input_x.append(p.input_x)
-                mult.append(p.mult)
-                c.append(p.conditioning)
-                area.append(p.area)
-                cond_or_uncond.append(o[1])
-                uuids.append(p.uuid)
-                control = p.control
-                patches = p.patches
-
-            batch_chunks = len(cond_or_uncond)
-            input_x = torch.cat(input_x)
-            c = cond_cat(c)
-            timestep_ = torch.cat([timestep] * batch_chunks)
-
-            transformer_options = model.current_patcher.apply_hooks(hooks=hooks)
-            if 'transformer_options' in model_options:
-                transformer_options = comfy.patcher_extension.merge_nested_dicts(transformer_options,
-                                                                                 model_options['transformer_options'],
-                                                                                 copy_dict1=False)
-
-            if patches is not None:
-                transformer_options["patches"] = comfy.patcher_extension.merge_nested_dicts(
-                    transformer_options.get("patches", {}),
-                    patches
-                )
-
-            transformer_options["cond_or_uncond"] = cond_or_uncond[:]
-            transformer_options["uuids"] = uuids[:]
-            transformer_options["sigmas"] = timestep
-
-            c['transformer_options'] = transformer_options
-
-            if control is not None:
-                c['control'] = control.get_control(input_x, timestep_, c, len(cond_or_uncond), transformer_options)
-
-            if 'model_function_wrapper' in model_options:
-                output = model_options['model_function_wrapper'](model.apply_model, {"input": input_x, "timestep": timestep_, "c": c, "cond_or_uncond": cond_or_uncond}).chunk(batch_chunks)
+        model_start = time.perf_counter()
+        if 'model_function_wrapper' in model_options:
+            output = model_options['model_function_wrapper'](model.apply_model, {"input": input_x, "timestep": timestep_, "c": c, "cond_or_uncond": cond_or_uncond}).chunk(batch_chunks)
+        else:
+            output = model.apply_model(input_x, timestep_, **c).chunk(batch_chunks)
+        model_time += time.perf_counter() - model_start
+
+        for o in range(batch_chunks):
+            cond_index = cond_or_uncond[o]
+            a = area[o]
+            if a is None:
+                out_conds[cond_index] += output[o] * mult[o]
+                out_counts[cond_index] += mult[o]
             else:
-                output = model.apply_model(input_x, timestep_, **c).chunk(batch_chunks)
-
-            for o in range(batch_chunks):
-                cond_index = cond_or_uncond[o]
-                a = area[o]
-                if a is None:
-                    out_conds[cond_index] += output[o] * mult[o]
-                    out_counts[cond_index] += mult[o]
-                else:
-                    out_c = out_conds[cond_index]
-                    out_cts = out_counts[cond_index]
-                    dims = len(a) // 2
-                    for i in range(dims):
-                        out_c = out_c.narrow(i + 2, a[i + dims], a[i])
-                        out_cts = out_cts.narrow(i + 2, a[i + dims], a[i])
-                    out_c += output[o] * mult[o]
-                    out_cts += mult[o]
+                out_c = out_conds[cond_index]
+                out_cts = out_counts[cond_index]
+                dims = len(a) // 2
+                for i in range(dims):
+                    out_c = out_c.narrow(i + 2, a[i + dims], a[i])
+                    out_cts = out_cts.narrow(i + 2, a[i + dims], a[i])
+                out_c += output[o] * mult[o]
+                out_cts += mult[o]
 
     for i in range(len(out_conds)):
         out_conds[i] /= out_counts[i]
 
+    planner: CondBatchPlanner = model_options.get("cond_batch_planner", None)
+    if planner is not None:
+        planner.record(time.perf_counter() - start - model_time)
     return out_conds
 
 def calc_cond_uncond_batch(model, cond, uncond, x_in, timestep, model_options): #TODO: remove
@@ -970,6 +1053,7 @@ class CFGGuider:
 
         extra_model_options = comfy.model_patcher.create_model_options_clone(self.model_options)
         extra_model_options.setdefault("transformer_options", {})["sample_sigmas"] = sigmas
+        extra_model_options["cond_batch_planner"] = CondBatchPlanner()
         extra_args = {"model_options": extra_model_options, "seed": seed}
 
         executor = comfy.patcher_extension.WrapperExecutor.new_class_executor(
@@ -978,21 +1062,26 @@ class CFGGuider:
             comfy.patcher_extension.get_all_wrappers(comfy.patcher_extension.WrappersMP.SAMPLER_SAMPLE, extra_args["model_options"], is_model_options=True)
         )
         samples = executor.execute(self, sigmas, extra_args, callback, noise, latent_image, denoise_mask, disable_pbar)
+        extra_model_options["cond_batch_planner"].log()
         return self.inner_model.process_latent_out(samples.to(torch.float32))
 
     def outer_sample(self, noise, latent_image, sampler, sigmas, denoise_mask=None, callback=None, disable_pbar=False, seed=None, latent_shapes=None):
-        self.inner_model, self.conds, self.loaded_models = comfy.sampler_helpers.prepare_sampling(self.model_patcher, noise.shape, self.conds, self.model_options)
-        device = self.model_patcher.load_device
-
-        noise = noise.to(device)
-        latent_image = latent_image.to(device)
-        sigmas = sigmas.to(device)
-        cast_to_load_options(self.model_options, device=device, dtype=self.model_patcher.model_dtype())
+        with comfy.model_management.loaded_models_lock:
+            self.inner_model, self.conds, self.loaded_models = comfy.sampler_helpers.prepare_sampling(self.model_patcher, noise.shape, self.conds, self.model_options)
+            comfy.model_management.use_models([self.model_patcher] + self.loaded_models)
 
         try:
+            device = self.model_patcher.load_device
+
+            noise = noise.to(device)
+            latent_image = latent_image.to(device)
+            sigmas = sigmas.to(device)
+            cast_to_load_options(self.model_options, device=device, dtype=self.model_patcher.model_dtype())
+
             self.model_patcher.pre_run()
             output = self.inner_sample(noise, latent_image, device, sampler, sigmas, denoise_mask, callback, disable_pbar, seed, latent_shapes=latent_shapes)
         finally:
+            comfy.model_management.release_models([self.model_patcher] + self.loaded_models)
             self.model_patcher.cleanup()
 
         comfy.sampler_helpers.cleanup_models(self.conds, self.loaded_models)
@@ -25,6 +25,7 @@ import math
 import os
 
 import comfy.utils
+import comfy.conditioning_cache
 
 from . import clip_vision
 from . import gligen
@@ -193,6 +194,17 @@ class CLIP:
             kwargs["tokenizer_options"] = tokenizer_options
         return self.tokenizer.tokenize_with_weights(text, return_word_ids, **kwargs)
 
+    def tokenize_batch(self, texts, return_word_ids=False, **kwargs):
+        """Tokenizes each of texts like tokenize(), passing the ones not tokenized recently to the text tokenizers in a few large calls."""
+        chunk_size = max(1, sd1_clip.TOKEN_CACHE_SIZE // 4)
+        out = []
+        for i in range(0, len(texts), chunk_size):
+            chunk = texts[i:i + chunk_size]
+            for tokenizer in sd1_clip.sd_tokenizers(self.tokenizer):
+                tokenizer.warm(chunk, kwargs.get("disable_weights", None))
+            out += [self.tokenize(text, return_word_ids, **kwargs) for text in chunk]
+        return out
+
     def add_hooks_to_dict(self, pooled_dict: dict[str]):
         if self.apply_hooks_to_conds:
             pooled_dict["hooks"] = self.apply_hooks_to_conds
@@ -266,9 +278,13 @@ class CLIP:
         if return_pooled == "unprojected":
             self.cond_stage_model.set_clip_options({"projected_pooled": False})
 
-        self.load_model(tokens)
-        self.cond_stage_model.set_clip_options({"execution_device": self.patcher.load_device})
-        o = self.cond_stage_model.encode_token_weights(tokens)
+        cache_key = comfy.conditioning_cache.cache_key(self, tokens, unprojected=return_pooled == "unprojected")
+        o = comfy.conditioning_cache.conditioning_cache.get(cache_key)
+        if o is None:
+            self.load_model(tokens)
+            self.cond_stage_model.set_clip_options({"execution_device": self.patcher.load_device})
+            o = self.cond_stage_model.encode_token_weights(tokens)
+            comfy.conditioning_cache.conditioning_cache.put(cache_key, o)
         cond, pooled = o[:2]
         if return_dict:
             out = {"cond": cond, "pooled_output": pooled}
@@ -309,6 +325,8 @@ class CLIP:
     def get_key_patches(self):
         return self.patcher.get_key_patches()
 
+MAX_TILE_BATCH = 8  # Tiles decoded or encoded together by the 2D tiled VAE paths
+
 class VAE:
     def __init__(self, sd=None, device=None, config=None, dtype=None, metadata=None):
         if 'decoder.up_blocks.0.resnets.0.norm1.weight' in sd.keys(): #diffusers format
@@ -724,17 +742,23 @@ class VAE:
                 pixels = torch.nn.functional.pad(pixels, (0, self.output_channels - pixels.shape[-1]), mode=mode, value=value)
         return pixels
 
+    def tile_batch_size(self, memory_used, tile_shape):
+        """How many tiles of tile_shape fit in free device memory at once, for the 2D tiled paths."""
+        free_memory = model_management.get_free_memory(self.device)
+        return max(1, min(MAX_TILE_BATCH, int(free_memory / memory_used(tile_shape, self.vae_dtype))))
+
     def decode_tiled_(self, samples, tile_x=64, tile_y=64, overlap = 16):
         steps = samples.shape[0] * comfy.utils.get_tiled_scale_steps(samples.shape[3], samples.shape[2], tile_x, tile_y, overlap)
         steps += samples.shape[0] * comfy.utils.get_tiled_scale_steps(samples.shape[3], samples.shape[2], tile_x // 2, tile_y * 2, overlap)
         steps += samples.shape[0] * comfy.utils.get_tiled_scale_steps(samples.shape[3], samples.shape[2], tile_x * 2, tile_y // 2, overlap)
         pbar = comfy.utils.ProgressBar(steps)
+        max_batch = self.tile_batch_size(self.memory_used_decode, (1, samples.shape[1], tile_y, tile_x))
 
         decode_fn = lambda a: self.first_stage_model.decode(a.to(self.vae_dtype).to(self.device)).float()
         output = self.process_output(
-            (comfy.utils.tiled_scale(samples, decode_fn, tile_x // 2, tile_y * 2, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar) +
-            comfy.utils.tiled_scale(samples, decode_fn, tile_x * 2, tile_y // 2, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar) +
-             comfy.utils.tiled_scale(samples, decode_fn, tile_x, tile_y, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar))
+            (comfy.utils.tiled_scale(samples, decode_fn, tile_x // 2, tile_y * 2, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar, max_batch=max_batch) +
+            comfy.utils.tiled_scale(samples, decode_fn, tile_x * 2, tile_y // 2, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar, max_batch=max_batch) +
+             comfy.utils.tiled_scale(samples, decode_fn, tile_x, tile_y, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar, max_batch=max_batch))
             / 3.0)
         return output
 
@@ -757,11 +781,12 @@ class VAE:
         steps += pixel_samples.shape[0] * comfy.utils.get_tiled_scale_steps(pixel_samples.shape[3], pixel_samples.shape[2], tile_x // 2, tile_y * 2, overlap)
         steps += pixel_samples.shape[0] * comfy.utils.get_tiled_scale_steps(pixel_samples.shape[3], pixel_samples.shape[2], tile_x * 2, tile_y // 2, overlap)
         pbar = comfy.utils.ProgressBar(steps)
+        max_batch = self.tile_batch_size(self.memory_used_encode, (1, pixel_samples.shape[1], tile_y, tile_x))
 
         encode_fn = lambda a: self.first_stage_model.encode((self.process_input(a)).to(self.vae_dtype).to(self.device)).float()
-        samples = comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x, tile_y, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar)
-        samples += comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x * 2, tile_y // 2, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar)
-        samples += comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x // 2, tile_y * 2, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar)
+        samples = comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x, tile_y, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar, max_batch=max_batch)
+        samples += comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x * 2, tile_y // 2, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar, max_batch=max_batch)
+        samples += comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x // 2, tile_y * 2, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar, max_batch=max_batch)
         samples /= 3.0
         return samples
 
@@ -858,6 +883,46 @@ class VAE:
             output = self.decode_tiled_3d(samples, **args)
         return output.movedim(1, -1)
 
+    def is_video_latent(self, samples):
+        return self.latent_dim == 3 and samples.ndim == 5
+
+    def decoded_shape(self, samples):
+        """Shape of the frames decode_stream() yields, all chunks together: (frames, height, width, channels)."""
+        def scale(amount, val):
+            return round(amount(val) if callable(amount) else amount * val)
+
+        ratio = self.upscale_ratio if isinstance(self.upscale_ratio, (tuple, list)) else (self.upscale_ratio,) * 3
+        if self.is_video_latent(samples):
+            frames = samples.shape[0] * scale(ratio[0], samples.shape[2])
+        else:
+            frames = samples.shape[0]
+        return (frames, scale(ratio[-2], samples.shape[-2]), scale(ratio[-1], samples.shape[-1]), self.output_channels)
+
+    def decode_stream(self, samples, tile_t=16, overlap_t=2, tile_x=None, tile_y=None, overlap=None):
+        """
+        Generator decoding samples a few frames at a time, yielding [frames, height, width, channels]
+        chunks that together are the decoded images with the batches combined. Video latents are
+        decoded tile_t latent frames at a time with overlap_t frames blended between them, other
+        latents tile_t batch elements at a time. Frames are decoded spatially tiled when tile_x and
+        tile_y are set.
+        """
+        self.throw_exception_if_invalid()
+        if tile_x is None:
+            decode_fn = lambda a: self.decode(a)
+        else:
+            decode_fn = lambda a: self.decode_tiled(a, tile_x=tile_x, tile_y=tile_y, overlap=overlap, tile_t=a.shape[2] if a.ndim == 5 else None)
+
+        if not self.is_video_latent(samples):
+            for x in range(0, samples.shape[0], tile_t):
+                images = decode_fn(samples[x:x+tile_t])
+                yield images.reshape(-1, *images.shape[-3:])
+            return
+
+        upscale_index = self.upscale_index_formula[0] if self.upscale_index_formula is not None else None
+        for b in range(samples.shape[0]):
+            for chunk in comfy.utils.tiled_scale_stream(samples[b:b+1], lambda a: decode_fn(a).movedim(-1, 1), tile=tile_t, overlap=overlap_t, upscale_amount=self.upscale_ratio[0], index_formula=upscale_index):
+                yield chunk[0].movedim(0, -1)
+
     def encode(self, pixel_samples):
         self.throw_exception_if_invalid()
         pixel_samples = self.vae_encode_crop_pixels(pixel_samples)
@@ -1024,7 +1089,9 @@ def load_clip(ckpt_paths, embedding_directory=None, clip_type=CLIPType.STABLE_DI
         if model_options.get("custom_operations", None) is None:
             sd, metadata = comfy.utils.convert_old_quants(sd, model_prefix="", metadata=metadata)
         clip_data.append(sd)
-    return load_text_encoder_state_dicts(clip_data, embedding_directory=embedding_directory, clip_type=clip_type, model_options=model_options)
+    clip = load_text_encoder_state_dicts(clip_data, embedding_directory=embedding_directory, clip_type=clip_type, model_options=model_options)
+    comfy.conditioning_cache.set_source(clip, ckpt_paths, {"clip_type": clip_type.name, "model_options": model_options})
+    return clip
 
 
 class TEModel(Enum):
@@ -1359,10 +1426,12 @@ def load_checkpoint(config_path=None, ckpt_path=None, output_vae=True, output_cl
     return (model, clip, vae)
 
 def load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, output_clipvision=False, embedding_directory=None, output_model=True, model_options={}, te_model_options={}):
-    sd, metadata = comfy.utils.load_torch_file(ckpt_path, return_metadata=True)
+    sd, metadata = comfy.utils.load_torch_file(ckpt_path, return_metadata=True, lazy=True)
     out = load_state_dict_guess_config(sd, output_vae, output_clip, output_clipvision, embedding_directory, output_model, model_options, te_model_options=te_model_options, metadata=metadata)
     if out is None:
         raise RuntimeError("ERROR: Could not detect model type of: {}\n{}".format(ckpt_path, model_detection_error_hint(ckpt_path, sd)))
+    if out[1] is not None:
+        comfy.conditioning_cache.set_source(out[1], [ckpt_path], {"te_model_options": te_model_options})
     return out
 
 def load_state_dict_guess_config(sd, output_vae=True, output_clip=True, output_clipvision=False, embedding_directory=None, output_model=True, model_options={}, te_model_options={}, metadata=None):
@@ -1429,13 +1498,13 @@ def load_state_dict_guess_config(sd, output_vae=True, output_clip=True, output_c
                     scaled_fp8_list.append(k[:-len("scaled_fp8")])
 
             if len(scaled_fp8_list) > 0:
-                out_sd = {}
-                for k in sd:
+                out_sd = sd.copy()  # Keeps lazy state dicts lazy
+                for k in list(out_sd.keys()):
                     skip = False
                     for pref in scaled_fp8_list:
                         skip = skip or k.startswith(pref)
-                    if not skip:
-                        out_sd[k] = sd[k]
+                    if skip:
+                        del out_sd[k]
 
                 for pref in scaled_fp8_list:
                     quant_sd, qmetadata = comfy.utils.convert_old_quants(sd, pref, metadata={})
@@ -1558,7 +1627,7 @@ def load_diffusion_model_state_dict(sd, model_options={}, metadata=None):
 
 
 def load_diffusion_model(unet_path, model_options={}):
-    sd, metadata = comfy.utils.load_torch_file(unet_path, return_metadata=True)
+    sd, metadata = comfy.utils.load_torch_file(unet_path, return_metadata=True, lazy=True)
     model = load_diffusion_model_state_dict(sd, model_options=model_options, metadata=metadata)
     if model is None:
         logging.error("ERROR UNSUPPORTED DIFFUSION MODEL {}".format(unet_path))
@@ -1,16 +1,19 @@
 import os
 
-from transformers import CLIPTokenizer
+from transformers import CLIPTokenizer, PreTrainedTokenizerBase
 import comfy.ops
 import torch
 import traceback
 import zipfile
 from . import model_management
 import comfy.clip_model
+import comfy.text_encoders.spiece_tokenizer
 import json
 import logging
 import numbers
 import re
+import collections
+import threading
 
 def gen_empty_tokens(special_tokens, length):
     start_token = special_tokens.get("start", None)
@@ -394,38 +397,106 @@ def bundled_embed(embed, prefix, suffix): #bundled embedding in lora format
 
     return torch.cat(out_list, dim=0)
 
-def load_embed(embedding_name, embedding_directory, embedding_size, embed_key=None):
+EMBEDDING_EXTENSIONS = ['.safetensors', '.pt', '.bin']
+LOADED_EMBEDS_SIZE = 64
+
+class EmbeddingIndex:
+    """
+    Maps the names prompts refer to embeddings by to their files: paths relative to the embedding
+    directories or any of their subdirectories, with or without the extension. Built by walking
+    the directories once, looking up embeddings that exist doesn't touch the disk. When a name
+    isn't found the directories walked are only checked for changes, and walked again if any
+    of them was modified.
+    """
+    def __init__(self, directories):
+        self.directories = directories
+        self.names = None
+        self.mtimes = {}  # directory -> st_mtime_ns when it was walked, None if it didn't exist
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def mtime(directory):
+        try:
+            return os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+
+    def changed(self):
+        return any(self.mtime(directory) != mtime for directory, mtime in self.mtimes.items())
+
+    def scan(self):
+        exact = {}
+        stripped = {}
+        mtimes = {}
+        for directory in self.directories:
+            directory = os.path.abspath(directory)
+            mtimes[directory] = self.mtime(directory)
+            for root, subdir, files in os.walk(directory, followlinks=True):
+                mtimes.setdefault(root, self.mtime(root))
+                bases = [root]
+                while bases[-1] != directory and os.path.dirname(bases[-1]) != bases[-1]:
+                    bases.append(os.path.dirname(bases[-1]))
+                for f in files:
+                    path = os.path.join(root, f)
+                    name, ext = os.path.splitext(f)
+                    for base in bases:
+                        rel_root = os.path.relpath(root, base)
+                        exact.setdefault(os.path.normpath(os.path.join(rel_root, f)), path)
+                        if ext in EMBEDDING_EXTENSIONS:
+                            key = os.path.normpath(os.path.join(rel_root, name))
+                            priority = EMBEDDING_EXTENSIONS.index(ext)
+                            if key not in stripped or stripped[key][0] > priority:
+                                stripped[key] = (priority, path)
+        names = {k: v for k, (_, v) in stripped.items()}
+        names.update(exact)
+        self.names = names
+        self.mtimes = mtimes
+
+    def find(self, name):
+        name = os.path.normpath(name)
+        with self.lock:
+            if self.names is None or (name not in self.names and self.changed()):
+                self.scan()
+            return self.names.get(name, None)
+
+_embedding_indexes = {}
+_loaded_embeds = collections.OrderedDict()
+_embeds_lock = threading.Lock()
+
+def embedding_index(embedding_directory):
     if isinstance(embedding_directory, str):
         embedding_directory = [embedding_directory]
+    key = tuple(embedding_directory)
+    with _embeds_lock:
+        index = _embedding_indexes.get(key, None)
+        if index is None:
+            index = _embedding_indexes[key] = EmbeddingIndex(key)
+    return index
 
-    embedding_directory = expand_directory_list(embedding_directory)
-
-    valid_file = None
-    for embed_dir in embedding_directory:
-        embed_path = os.path.abspath(os.path.join(embed_dir, embedding_name))
-        embed_dir = os.path.abspath(embed_dir)
-        try:
-            if os.path.commonpath((embed_dir, embed_path)) != embed_dir:
-                continue
-        except:
-            continue
-        if not os.path.isfile(embed_path):
-            extensions = ['.safetensors', '.pt', '.bin']
-            for x in extensions:
-                t = embed_path + x
-                if os.path.isfile(t):
-                    valid_file = t
-                    break
-        else:
-            valid_file = embed_path
-        if valid_file is not None:
-            break
-
-    if valid_file is None:
+def load_embed(embedding_name, embedding_directory, embedding_size, embed_key=None):
+    embed_path = embedding_index(embedding_directory).find(embedding_name)
+    if embed_path is None:
         return None
 
-    embed_path = valid_file
+    try:
+        st = os.stat(embed_path)
+    except OSError:
+        return None
+    key = (embed_path, st.st_mtime_ns, st.st_size, embedding_size, embed_key)
+    with _embeds_lock:
+        if key in _loaded_embeds:
+            _loaded_embeds.move_to_end(key)
+            return _loaded_embeds[key]
+
+    embed_out = load_embed_file(embed_path, embedding_name, embedding_size, embed_key)
+    if embed_out is not None:
+        with _embeds_lock:
+            _loaded_embeds[key] = embed_out
+            while len(_loaded_embeds) > LOADED_EMBEDS_SIZE:
+                _loaded_embeds.popitem(last=False)
+    return embed_out
 
+def load_embed_file(embed_path, embedding_name, embedding_size, embed_key=None):
     embed_out = None
 
     try:
@@ -465,6 +536,14 @@ def load_embed(embedding_name, embedding_directory, embedding_size, embed_key=No
                 embed_out = next(iter(values))
     return embed_out
 
+TOKEN_CACHE_SIZE = 8192
+
+def sd_tokenizers(tokenizer):
+    """The SDTokenizers a model's tokenizer is made of."""
+    if isinstance(tokenizer, SDTokenizer):
+        return [tokenizer]
+    return [t for t in vars(tokenizer).values() if isinstance(t, SDTokenizer)]
+
 class SDTokenizer:
     def __init__(self, tokenizer_path=None, max_length=77, pad_with_end=True, embedding_directory=None, embedding_size=768, embedding_key='clip_l', tokenizer_class=CLIPTokenizer, has_start_token=True, has_end_token=True, pad_to_max_length=True, min_length=None, pad_token=None, end_token=None, min_padding=None, pad_left=False, disable_weights=False, tokenizer_data={}, tokenizer_args={}):
         if tokenizer_path is None:
@@ -514,6 +593,10 @@ class SDTokenizer:
         self.embedding_key = embedding_key
 
         self.disable_weights = disable_weights
+        self.token_cache = collections.OrderedDict()
+        self.token_cache_size = TOKEN_CACHE_SIZE
+        self.token_cache_lock = threading.Lock()
+        self.batch_tokenize = isinstance(self.tokenizer, (PreTrainedTokenizerBase, comfy.text_encoders.spiece_tokenizer.SPieceTokenizer))
 
     def _try_get_embedding(self, embedding_name:str):
         '''
@@ -538,24 +621,19 @@ class SDTokenizer:
         else:
             tokens.extend([(self.pad_token, 1.0, 0)] * amount)
 
-    def tokenize_with_weights(self, text:str, return_word_ids=False, tokenizer_options={}, **kwargs):
+    def parse_text(self, text:str, disable_weights=False):
         '''
-        Takes a prompt and converts it to a list of (token, weight, word id) elements.
-        Tokens can both be integer tokens and pre computed CLIP tensors.
-        Word id values are unique per word and embedding, where the id 0 is reserved for non word tokens.
-        Returned list has the dimensions NxM where M is the input size of CLIP
+        Splits a prompt into (text, weight) tuples to tokenize and lists of (embedding, weight) for the embeddings.
+        Also returns whether the prompt names any embedding, found or not.
         '''
-        min_length = tokenizer_options.get("{}_min_length".format(self.embedding_key), self.min_length)
-        min_padding = tokenizer_options.get("{}_min_padding".format(self.embedding_key), self.min_padding)
-
         text = escape_important(text)
-        if kwargs.get("disable_weights", self.disable_weights):
+        if disable_weights:
             parsed_weights = [(text, 1.0)]
         else:
             parsed_weights = token_weights(text, 1.0)
 
-        # tokenize words
-        tokens = []
+        parts = []
+        has_embeddings = False
         for weighted_segment, weight in parsed_weights:
             to_tokenize = unescape_important(weighted_segment)
             split = re.split(' {0}|\n{0}'.format(self.embedding_identifier), to_tokenize)
@@ -568,24 +646,110 @@ class SDTokenizer:
                 # if we find an embedding, deal with the embedding
                 if word.startswith(self.embedding_identifier) and self.embedding_directory is not None:
                     embedding_name = word[len(self.embedding_identifier):].strip('\n')
+                    has_embeddings = True
                     embed, leftover = self._try_get_embedding(embedding_name)
                     if embed is None:
                         logging.warning(f"warning, embedding:{embedding_name} does not exist, ignoring")
                     else:
                         if len(embed.shape) == 1:
-                            tokens.append([(embed, weight)])
+                            parts.append([(embed, weight)])
                         else:
-                            tokens.append([(embed[x], weight) for x in range(embed.shape[0])])
+                            parts.append([(embed[x], weight) for x in range(embed.shape[0])])
                     #if we accidentally have leftover text, continue parsing using leftover, else move on to next word
                     if leftover != "":
                         word = leftover
                     else:
                         continue
-                end = 999999999999
-                if self.tokenizer_adds_end_token:
-                    end = -1
-                #parse word
-                tokens.append([(t, weight) for t in self.tokenizer(word)["input_ids"][self.tokens_start:end]])
+                parts.append((word, weight))
+        return parts, has_embeddings
+
+    def tokenize_words(self, words):
+        '''
+        Returns the token ids of each text in words without the start and end tokens. Results are
+        memoized and the texts not seen recently are passed to the tokenizer in a single call when it
+        supports batches.
+        '''
+        end = 999999999999
+        if self.tokenizer_adds_end_token:
+            end = -1
+
+        with self.token_cache_lock:
+            out = [self.token_cache.get(w, None) for w in words]
+        missing = list(dict.fromkeys(w for w, t in zip(words, out) if t is None))
+        found = {}
+        if len(missing) > 0:
+            if self.batch_tokenize and len(missing) > 1:
+                ids = self.tokenizer(missing)["input_ids"]
+            else:
+                ids = [self.tokenizer(w)["input_ids"] for w in missing]
+            found = {w: tuple(i[self.tokens_start:end]) for w, i in zip(missing, ids)}
+            out = [found[w] if t is None else t for w, t in zip(words, out)]
+
+        if self.token_cache_size > 0:
+            with self.token_cache_lock:
+                for w, t in zip(words, out):
+                    self.token_cache[w] = t
+                    self.token_cache.move_to_end(w)
+                while len(self.token_cache) > self.token_cache_size:
+                    self.token_cache.popitem(last=False)
+        return out
+
+    def tokenize_texts(self, texts, disable_weights=False):
+        '''
+        Returns the (token, weight) groups of each text: one per weighted segment or embedding. The
+        groups of texts without embeddings are memoized too and the segments of all the texts that
+        aren't are tokenized at once.
+        '''
+        keys = [(text, disable_weights) for text in texts]  # Tuple keys can't collide with the str keys of tokenize_words()
+        with self.token_cache_lock:
+            out = [self.token_cache.get(k, None) for k in keys]
+            for k, t in zip(keys, out):
+                if t is not None:
+                    self.token_cache.move_to_end(k)
+        missing = list(dict.fromkeys(k for k, t in zip(keys, out) if t is None))
+        if len(missing) == 0:
+            return out
+
+        parsed = {k: self.parse_text(k[0], disable_weights) for k in missing}
+        word_tokens = iter(self.tokenize_words([p[0] for k in missing for p in parsed[k][0] if isinstance(p, tuple)]))
+        found = {}
+        for k in missing:
+            tokens = []
+            for p in parsed[k][0]:
+                if isinstance(p, tuple):
+                    tokens.append([(t, p[1]) for t in next(word_tokens)])
+                else:
+                    tokens.append(p)
+            found[k] = tokens
+
+        if self.token_cache_size > 0:
+            with self.token_cache_lock:
+                for k in missing:
+                    if not parsed[k][1]:  # Embedding files can be added, removed or changed
+                        self.token_cache[k] = found[k]
+                while len(self.token_cache) > self.token_cache_size:
+                    self.token_cache.popitem(last=False)
+        return [found[k] if t is None else t for k, t in zip(keys, out)]
+
+    def warm(self, texts, disable_weights=None):
+        '''Tokenizes all texts at once so tokenizing each of them afterwards is memoized.'''
+        if self.token_cache_size <= 0:
+            return
+        if disable_weights is None:
+            disable_weights = self.disable_weights
+        self.tokenize_texts(texts[-self.token_cache_size // 2:], disable_weights)
+
+    def tokenize_with_weights(self, text:str, return_word_ids=False, tokenizer_options={}, **kwargs):
+        '''
+        Takes a prompt and converts it to a list of (token, weight, word id) elements.
+        Tokens can both be integer tokens and pre computed CLIP tensors.
+        Word id values are unique per word and embedding, where the id 0 is reserved for non word tokens.
+        Returned list has the dimensions NxM where M is the input size of CLIP
+        '''
+        min_length = tokenizer_options.get("{}_min_length".format(self.embedding_key), self.min_length)
+        min_padding = tokenizer_options.get("{}_min_padding".format(self.embedding_key), self.min_padding)
+
+        tokens = self.tokenize_texts([text], kwargs.get("disable_weights", self.disable_weights))[0]
 
         #reshape token array to CLIP input size
         batched_tokens = []
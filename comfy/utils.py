@@ -26,14 +26,20 @@ import numpy as np
 from PIL import Image
 import logging
 import itertools
+import functools
 from torch.nn.functional import interpolate
 from einops import rearrange
 from comfy.cli_args import args
 import json
+import os
 import time
+import threading
+import collections.abc
+from concurrent.futures import ThreadPoolExecutor
 
 MMAP_TORCH_FILES = args.mmap_torch_files
 DISABLE_MMAP = args.disable_mmap
+LOAD_THREADS = args.load_threads
 
 ALWAYS_SAFE_LOAD = False
 if hasattr(torch.serialization, "add_safe_globals"):  # TODO: this was added in pytorch 2.4, the unsafe path should be removed once earlier versions are deprecated
@@ -56,11 +62,262 @@ if hasattr(torch.serialization, "add_safe_globals"):  # TODO: this was added in
 else:
     logging.warning("Warning, you are using an old pytorch version and some ckpt/pt files might be loaded unsafely. Upgrading to 2.4 or above is recommended as older versions of pytorch are no longer supported.")
 
-def load_torch_file(ckpt, safe_load=False, device=None, return_metadata=False):
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+    "F8_E4M3": torch.float8_e4m3fn,
+    "F8_E5M2": torch.float8_e5m2,
+}
+for dtype_name, torch_dtype_name in [("U16", "uint16"), ("U32", "uint32"), ("U64", "uint64"), ("F8_E8M0", "float8_e8m0fnu")]:
+    if hasattr(torch, torch_dtype_name):
+        SAFETENSORS_DTYPES[dtype_name] = getattr(torch, torch_dtype_name)
+
+LOAD_CHUNK_SIZE = 16 * 1024 * 1024
+
+def parse_safetensors_header(safetensors_path):
+    """
+    Returns (tensors, metadata, data_start) where tensors maps each name in file order to
+    (dtype, shape, start, end), start and end being absolute byte offsets in the file. Returns
+    None if the header can't be parsed or uses a dtype torch doesn't have, safetensors.safe_open
+    gives a better error for those.
+    """
+    try:
+        header = safetensors_header(safetensors_path)
+        if header is None:
+            return None
+        data_start = 8 + len(header)
+        header = json.loads(header)
+        file_size = os.path.getsize(safetensors_path)
+        metadata = header.pop("__metadata__", None)
+        tensors = {}
+        for name, info in header.items():
+            dtype = SAFETENSORS_DTYPES[info["dtype"]]
+            shape = list(info["shape"])
+            start, end = info["data_offsets"]
+            if end - start != math.prod(shape) * dtype.itemsize or data_start + end > file_size or start > end:
+                return None
+            tensors[name] = (dtype, shape, data_start + start, data_start + end)
+        return tensors, metadata, data_start
+    except (OSError, ValueError, KeyError, TypeError, struct.error):
+        return None
+
+def _read_into(f, offset, out):
+    f.seek(offset)
+    view = memoryview(out.numpy()).cast("B")
+    while len(view) > 0:
+        n = f.readinto(view)
+        if not n:
+            raise ValueError("MetadataIncompleteBuffer: the file ended before the end of a tensor")
+        view = view[n:]
+
+def read_safetensors_tensors(ckpt, tensors, device=None, threads=LOAD_THREADS, pin_memory=None):
+    """
+    Reads tensors of a safetensors file, given as name -> (dtype, shape, start, end) like
+    parse_safetensors_header returns them. The byte ranges are read from several threads (file
+    reads release the GIL) straight into preallocated tensors. Tensors for other devices go
+    through a pinned staging buffer per thread when pin_memory is set, which it is by default for
+    cuda. Returns the tensors by name, in the order they were given.
+    """
+    if device is None:
+        device = torch.device("cpu")
+    if pin_memory is None:
+        pin_memory = device.type == "cuda"
+
+    sd = {}
+    chunks = []
+    for name, (dtype, shape, start, end) in tensors.items():
+        tensor = torch.empty(shape, dtype=dtype, device=device)
+        sd[name] = tensor
+        flat = tensor.reshape(-1).view(torch.uint8)
+        for pos in range(0, end - start, LOAD_CHUNK_SIZE):
+            chunks.append((flat, pos, start + pos, min(LOAD_CHUNK_SIZE, end - start - pos)))
+    if len(chunks) == 0:
+        return sd
+
+    # Largest first onto the least loaded thread.
+    threads = max(1, min(threads, len(chunks)))
+    buckets = [[] for _ in range(threads)]
+    loads = [0] * threads
+    for chunk in sorted(chunks, key=lambda c: c[3], reverse=True):
+        i = loads.index(min(loads))
+        buckets[i].append(chunk)
+        loads[i] += chunk[3]
+
+    def read_bucket(bucket):
+        staging = None
+        if device.type != "cpu":
+            staging = torch.empty(LOAD_CHUNK_SIZE, dtype=torch.uint8, pin_memory=pin_memory)
+        with open(ckpt, "rb", buffering=0) as f:
+            for flat, pos, offset, length in bucket:
+                if staging is None:
+                    _read_into(f, offset, flat[pos:pos + length])
+                else:
+                    _read_into(f, offset, staging[:length])
+                    flat[pos:pos + length].copy_(staging[:length])
+
+    if threads == 1:
+        read_bucket(buckets[0])
+    else:
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="load_safetensors") as executor:
+            for _ in executor.map(read_bucket, buckets):
+                pass
+    return sd
+
+def load_safetensors_parallel(ckpt, device=None, threads=LOAD_THREADS, pin_memory=None):
+    """
+    Loads a whole safetensors file with read_safetensors_tensors, instead of copying tensor after
+    tensor out of an mmap. Returns (sd, metadata) with the keys in the order
+    safetensors.safe_open lists them, or None if the file should be loaded the regular way.
+    """
+    parsed = parse_safetensors_header(ckpt)
+    if parsed is None:
+        return None
+    tensors, metadata, _ = parsed
+    sd = read_safetensors_tensors(ckpt, {name: tensors[name] for name in sorted(tensors)}, device, threads, pin_memory)
+    return sd, metadata
+
+class SafetensorsSource:
+    """A safetensors file that LazyTensors are read from."""
+    def __init__(self, path, tensors):
+        self.path = path
+        self.tensors = tensors  # name -> (dtype, shape, start, end)
+        self.handle = None
+        self.lock = threading.Lock()
+        self.bytes_read = 0
+
+    def read(self, names):
+        """Returns the named tensors, memory mapped unless --disable-mmap is set."""
+        with self.lock:
+            self.bytes_read += sum(self.tensors[name][3] - self.tensors[name][2] for name in names)
+            if not DISABLE_MMAP:
+                if self.handle is None:
+                    self.handle = safetensors.safe_open(self.path, framework="pt", device="cpu")
+                return {name: self.handle.get_tensor(name) for name in names}
+        return read_safetensors_tensors(self.path, {name: self.tensors[name] for name in names})
+
+class LazyTensor:
+    """Placeholder for a tensor of a safetensors file that hasn't been read yet, see LazyStateDict."""
+    __slots__ = ("source", "name")
+
+    def __init__(self, source, name):
+        self.source = source
+        self.name = name
+
+    @property
+    def dtype(self):
+        return self.source.tensors[self.name][0]
+
+    @property
+    def shape(self):
+        return torch.Size(self.source.tensors[self.name][1])
+
+    def nelement(self):
+        return math.prod(self.source.tensors[self.name][1])
+
+    numel = nelement
+
+    def load(self):
+        return self.source.read([self.name])[self.name]
+
+class LazyStateDict(collections.abc.MutableMapping):
+    """
+    State dict of a safetensors file that only reads tensors when they are accessed, so
+    detecting the model type, renaming prefixes and splitting a checkpoint into its model, text
+    encoder and VAE parts don't read anything that gets discarded. Tensors stay cached once read.
+    state_dict_prefix_replace, state_dict_key_replace, calculate_parameters and weight_dtype
+    handle it without reading any tensor, other code sees a regular mapping of tensors.
+    """
+    def __init__(self, data=None):
+        self.data = {} if data is None else data  # key -> tensor or LazyTensor
+
+    @classmethod
+    def from_safetensors(cls, path, tensors):
+        source = SafetensorsSource(path, tensors)
+        return cls({name: LazyTensor(source, name) for name in sorted(tensors)})
+
+    def __getitem__(self, key):
+        value = self.data[key]
+        if isinstance(value, LazyTensor):
+            value = value.load()
+            self.data[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __repr__(self):
+        return "LazyStateDict({} tensors, {} read)".format(len(self.data), sum(1 for v in self.data.values() if not isinstance(v, LazyTensor)))
+
+    def keys(self):
+        return self.data.keys()
+
+    def pop(self, key, *default):
+        if key not in self.data and len(default) > 0:
+            return default[0]
+        value = self[key]
+        del self.data[key]
+        return value
+
+    def copy(self):
+        return LazyStateDict(dict(self.data))
+
+    def peek(self, key):
+        """The tensor if it was read already, else its LazyTensor which has the shape and dtype."""
+        return self.data[key]
+
+    def load(self, keys=None):
+        """Reads the given keys (all by default) at once, in parallel with --disable-mmap."""
+        if keys is None:
+            keys = list(self.data.keys())
+        pending = {}
+        for key in keys:
+            value = self.data.get(key)
+            if isinstance(value, LazyTensor):
+                pending.setdefault(value.source, []).append((key, value.name))
+        for source, names in pending.items():
+            tensors = source.read([name for _, name in names])
+            for key, name in names:
+                self.data[key] = tensors[name]
+
+def load_torch_file(ckpt, safe_load=False, device=None, return_metadata=False, lazy=False):
+    """lazy returns a LazyStateDict for valid safetensors files loaded on the cpu."""
     if device is None:
         device = torch.device("cpu")
     metadata = None
+    if lazy and device.type == "cpu" and (ckpt.lower().endswith(".safetensors") or ckpt.lower().endswith(".sft")):
+        parsed = parse_safetensors_header(ckpt)
+        if parsed is not None:
+            tensors, metadata, _ = parsed
+            sd = LazyStateDict.from_safetensors(ckpt, tensors)
+            return (sd, metadata) if return_metadata else sd
     if ckpt.lower().endswith(".safetensors") or ckpt.lower().endswith(".sft"):
+        loaded = None
+        if LOAD_THREADS > 1 and (DISABLE_MMAP or device.type != "cpu"):
+            # Without mmap every tensor gets copied anyway, read them in parallel instead.
+            loaded = load_safetensors_parallel(ckpt, device, LOAD_THREADS)
+        if loaded is not None:
+            sd, metadata = loaded
+            return (sd, metadata) if return_metadata else sd
         try:
             with safetensors.safe_open(ckpt, framework="pt", device=device.type) as f:
                 sd = {}
@@ -109,17 +366,19 @@ def save_torch_file(sd, ckpt, metadata=None):
 
 def calculate_parameters(sd, prefix=""):
     params = 0
+    lazy = isinstance(sd, LazyStateDict)
     for k in sd.keys():
         if k.startswith(prefix):
-            w = sd[k]
+            w = sd.peek(k) if lazy else sd[k]
             params += w.nelement()
     return params
 
 def weight_dtype(sd, prefix=""):
     dtypes = {}
+    lazy = isinstance(sd, LazyStateDict)
     for k in sd.keys():
         if k.startswith(prefix):
-            w = sd[k]
+            w = sd.peek(k) if lazy else sd[k]
             dtypes[w.dtype] = dtypes.get(w.dtype, 0) + w.numel()
 
     if len(dtypes) == 0:
@@ -128,21 +387,26 @@ def weight_dtype(sd, prefix=""):
     return max(dtypes, key=dtypes.get)
 
 def state_dict_key_replace(state_dict, keys_to_replace):
+    # Lazy state dicts move their LazyTensors around without reading them.
+    data = state_dict.data if isinstance(state_dict, LazyStateDict) else state_dict
     for x in keys_to_replace:
-        if x in state_dict:
-            state_dict[keys_to_replace[x]] = state_dict.pop(x)
+        if x in data:
+            data[keys_to_replace[x]] = data.pop(x)
     return state_dict
 
 def state_dict_prefix_replace(state_dict, replace_prefix, filter_keys=False):
+    lazy = isinstance(state_dict, LazyStateDict)
     if filter_keys:
-        out = {}
+        out = LazyStateDict() if lazy else {}
     else:
         out = state_dict
+    data = state_dict.data if lazy else state_dict
+    out_data = out.data if lazy else out
     for rp in replace_prefix:
         replace = list(map(lambda a: (a, "{}{}".format(replace_prefix[rp], a[len(rp):])), filter(lambda a: a.startswith(rp), state_dict.keys())))
         for x in replace:
-            w = state_dict.pop(x[0])
-            out[x[1]] = w
+            w = data.pop(x[0])
+            out_data[x[1]] = w
     return out
 
 
@@ -976,8 +1240,32 @@ def get_tiled_scale_steps(width, height, tile_x, tile_y, overlap):
     cols = 1 if width <= tile_x else math.ceil((width - overlap) / (tile_x - overlap))
     return rows * cols
 
+@functools.lru_cache(maxsize=64)
+def tile_blend_mask(shape, feathers, device, dtype):
+    """
+    Blend weights of a tile output with the given spatial shape: linear ramps over feathers[d]
+    values at both ends of each dimension, built from one cached 1D window per dimension.
+    """
+    mask = None
+    for d, (length, feather) in enumerate(zip(shape, feathers)):
+        window = torch.ones(length, dtype=dtype, device=device)
+        if feather < length:
+            ramp = torch.tensor([(t + 1) / feather for t in range(feather)], dtype=dtype, device=device)
+            window[:feather] *= ramp
+            window[length - feather:] *= ramp.flip(0)
+        view = [1] * len(shape)
+        view[d] = length
+        mask = window.view(view) if mask is None else mask * window.view(view)
+    return mask.view([1, 1] + list(shape))
+
 @torch.inference_mode()
-def tiled_scale_multidim(samples, function, tile=(64, 64), overlap=8, upscale_amount=4, out_channels=3, output_device="cpu", downscale=False, index_formulas=None, pbar=None):
+def tiled_scale_multidim(samples, function, tile=(64, 64), overlap=8, upscale_amount=4, out_channels=3, output_device="cpu", downscale=False, index_formulas=None, pbar=None, max_batch=1):
+    """
+    Runs function on overlapping tiles of samples and blends the outputs with feathered edges.
+    Tiles of the same shape, across positions and batch elements, are passed to function up to
+    max_batch at a time, so function must handle any batch size when it's more than 1. The batch
+    size is halved whenever function runs out of memory.
+    """
     dims = len(tile)
 
     if not (isinstance(upscale_amount, (tuple, list))):
@@ -1033,62 +1321,128 @@ def tiled_scale_multidim(samples, function, tile=(64, 64), overlap=8, upscale_am
             out.append(round(get_scale(i, a[i])))
         return out
 
-    output = torch.empty([samples.shape[0], out_channels] + mult_list_upscale(samples.shape[2:]), device=output_device)
-
-    for b in range(samples.shape[0]):
-        s = samples[b:b+1]
+    output_shape = [samples.shape[0], out_channels] + mult_list_upscale(samples.shape[2:])
 
-        # handle entire input fitting in a single tile
-        if all(s.shape[d+2] <= tile[d] for d in range(dims)):
-            output[b:b+1] = function(s).to(output_device)
+    # handle entire input fitting in a single tile
+    if all(samples.shape[d+2] <= tile[d] for d in range(dims)):
+        output = torch.empty(output_shape, device=output_device)
+        for b in range(0, samples.shape[0], max_batch):
+            output[b:b+max_batch] = function(samples[b:b+max_batch]).to(output_device)
             if pbar is not None:
-                pbar.update(1)
-            continue
-
-        out = torch.zeros([s.shape[0], out_channels] + mult_list_upscale(s.shape[2:]), device=output_device)
-        out_div = torch.zeros([s.shape[0], out_channels] + mult_list_upscale(s.shape[2:]), device=output_device)
-
-        positions = [range(0, s.shape[d+2] - overlap[d], tile[d] - overlap[d]) if s.shape[d+2] > tile[d] else [0] for d in range(dims)]
-
-        for it in itertools.product(*positions):
-            s_in = s
-            upscaled = []
+                pbar.update(min(max_batch, samples.shape[0] - b))
+        return output
+
+    # Tiles are accumulated in the output directly, weighted by their blend mask. The sum of the
+    # weights is the same for every channel and batch element.
+    output = torch.zeros(output_shape, device=output_device)
+    out_div = torch.zeros([1, 1] + output_shape[2:], device=output_device)
+    feathers = tuple(round(get_scale(d, overlap[d])) for d in range(dims))
+
+    positions = [range(0, samples.shape[d+2] - overlap[d], tile[d] - overlap[d]) if samples.shape[d+2] > tile[d] else [0] for d in range(dims)]
+    tiles = []
+    for it in itertools.product(*positions):
+        pos = [max(0, min(samples.shape[d + 2] - overlap[d], it[d])) for d in range(dims)]
+        lengths = tuple(min(tile[d], samples.shape[d + 2] - pos[d]) for d in range(dims))
+        tiles.append((pos, lengths, [round(get_pos(d, pos[d])) for d in range(dims)]))
+    jobs = [(b, t) for b in range(samples.shape[0]) for t in tiles]
 
+    i = 0
+    while i < len(jobs):
+        lengths = jobs[i][1][1]
+        chunk = [jobs[i]]
+        while len(chunk) < max_batch and i + len(chunk) < len(jobs) and jobs[i + len(chunk)][1][1] == lengths:
+            chunk.append(jobs[i + len(chunk)])
+
+        inputs = []
+        for b, (pos, _, _) in chunk:
+            s_in = samples[b:b+1]
             for d in range(dims):
-                pos = max(0, min(s.shape[d + 2] - overlap[d], it[d]))
-                l = min(tile[d], s.shape[d + 2] - pos)
-                s_in = s_in.narrow(d + 2, pos, l)
-                upscaled.append(round(get_pos(d, pos)))
-
-            ps = function(s_in).to(output_device)
-            mask = torch.ones_like(ps)
-
-            for d in range(2, dims + 2):
-                feather = round(get_scale(d - 2, overlap[d - 2]))
-                if feather >= mask.shape[d]:
-                    continue
-                for t in range(feather):
-                    a = (t + 1) / feather
-                    mask.narrow(d, t, 1).mul_(a)
-                    mask.narrow(d, mask.shape[d] - 1 - t, 1).mul_(a)
+                s_in = s_in.narrow(d + 2, pos[d], lengths[d])
+            inputs.append(s_in)
+        try:
+            ps = function(inputs[0] if len(inputs) == 1 else torch.cat(inputs)).to(output_device)
+        except torch.cuda.OutOfMemoryError:
+            if len(chunk) == 1:
+                raise
+            max_batch = len(chunk) // 2
+            continue
 
-            o = out
+        mask = tile_blend_mask(tuple(ps.shape[2:]), feathers, ps.device, ps.dtype)
+        for n, (b, (_, _, upscaled)) in enumerate(chunk):
+            o = output[b:b+1]
             o_d = out_div
             for d in range(dims):
                 o = o.narrow(d + 2, upscaled[d], mask.shape[d + 2])
                 o_d = o_d.narrow(d + 2, upscaled[d], mask.shape[d + 2])
+            o.add_(ps[n:n+1] * mask)
+            if b == 0:
+                o_d.add_(mask)
 
-            o.add_(ps * mask)
-            o_d.add_(mask)
-
-            if pbar is not None:
-                pbar.update(1)
+        if pbar is not None:
+            pbar.update(len(chunk))
+        i += len(chunk)
 
-        output[b:b+1] = out/out_div
+    output /= out_div
     return output
 
-def tiled_scale(samples, function, tile_x=64, tile_y=64, overlap = 8, upscale_amount = 4, out_channels = 3, output_device="cpu", pbar = None):
-    return tiled_scale_multidim(samples, function, (tile_y, tile_x), overlap=overlap, upscale_amount=upscale_amount, out_channels=out_channels, output_device=output_device, pbar=pbar)
+@torch.inference_mode()
+def tiled_scale_stream(samples, function, tile=16, overlap=4, upscale_amount=4, index_formula=None, pbar=None):
+    """
+    Streaming version of tiled_scale_multidim along dimension 2 only (time for video latents).
+    function processes a whole slice of samples, doing any tiling of the other dimensions itself.
+    Yields the blended output in chunks along dimension 2 as soon as no later tile overlaps them,
+    so only about one tile of output is held at once. The chunks concatenated are the output
+    tiled_scale_multidim would have returned with the same tile and overlap along that dimension.
+    """
+    def scale(amount, val):
+        if callable(amount):
+            return amount(val)
+        return amount * val
+
+    if index_formula is None:
+        index_formula = upscale_amount
+
+    length = samples.shape[2]
+    out_length = round(scale(upscale_amount, length))
+    feather = round(scale(upscale_amount, overlap))
+    if length > tile:
+        positions = [max(0, min(length - overlap, p)) for p in range(0, length - overlap, tile - overlap)]
+    else:
+        positions = [0]
+
+    acc = None  # Blended output not yielded yet, starting at output index start
+    acc_div = None
+    start = 0
+    for i, pos in enumerate(positions):
+        ps = function(samples.narrow(2, pos, min(tile, length - pos)))
+        mask = tile_blend_mask((ps.shape[2],), (feather,), ps.device, ps.dtype)
+        mask = mask.view(list(mask.shape) + [1] * (ps.ndim - 3))
+        offset = round(scale(index_formula, pos)) - start
+        end = offset + ps.shape[2]
+        if acc is None:
+            acc = torch.zeros(list(ps.shape[:2]) + [end] + list(ps.shape[3:]), dtype=ps.dtype, device=ps.device)
+            acc_div = torch.zeros([1, 1, end] + [1] * (ps.ndim - 3), dtype=ps.dtype, device=ps.device)
+        elif end > acc.shape[2]:
+            acc = torch.cat((acc, acc.new_zeros(list(acc.shape[:2]) + [end - acc.shape[2]] + list(acc.shape[3:]))), dim=2)
+            acc_div = torch.cat((acc_div, acc_div.new_zeros([1, 1, end - acc_div.shape[2]] + list(acc_div.shape[3:]))), dim=2)
+        acc.narrow(2, offset, ps.shape[2]).add_(ps * mask)
+        acc_div.narrow(2, offset, ps.shape[2]).add_(mask)
+        del ps
+
+        if i + 1 < len(positions):
+            done = min(round(scale(index_formula, positions[i + 1])) - start, acc.shape[2])
+        else:
+            done = min(out_length - start, acc.shape[2])
+        if done > 0:
+            yield acc[:, :, :done] / acc_div[:, :, :done]
+            acc = acc[:, :, done:]
+            acc_div = acc_div[:, :, done:]
+            start += done
+        if pbar is not None:
+            pbar.update(1)
+
+def tiled_scale(samples, function, tile_x=64, tile_y=64, overlap = 8, upscale_amount = 4, out_channels = 3, output_device="cpu", pbar = None, max_batch=1):
+    return tiled_scale_multidim(samples, function, (tile_y, tile_x), overlap=overlap, upscale_amount=upscale_amount, out_channels=out_channels, output_device=output_device, pbar=pbar, max_batch=max_batch)
 
 PROGRESS_BAR_ENABLED = True
 def set_progress_bar_enabled(enabled):
@@ -1258,16 +1612,20 @@ def convert_old_quants(state_dict, model_prefix="", metadata={}):
             else:
                 full_precision_matrix_mult = False
 
-            out_sd = {}
+            # Lazy state dicts move their LazyTensors without reading them.
+            lazy = isinstance(state_dict, LazyStateDict)
+            data = state_dict.data if lazy else state_dict
+            out_sd = LazyStateDict() if lazy else {}
+            out_data = out_sd.data if lazy else out_sd
             layers = {}
             for k in list(state_dict.keys()):
                 if k == scaled_fp8_key:
                     continue
                 if not k.startswith(model_prefix):
-                    out_sd[k] = state_dict[k]
+                    out_data[k] = data[k]
                     continue
                 k_out = k
-                w = state_dict.pop(k)
+                w = data.pop(k)
                 layer = None
                 if k_out.endswith(".scale_weight"):
                     layer = k_out[:-len(".scale_weight")]
@@ -1282,10 +1640,12 @@ def convert_old_quants(state_dict, model_prefix="", metadata={}):
                 if k_out.endswith(".scale_input"):
                     layer = k_out[:-len(".scale_input")]
                     k_out = "{}.input_scale".format(layer)
+                    if isinstance(w, LazyTensor):
+                        w = w.load()
                     if w.item() == 1.0:
                         continue
 
-                out_sd[k_out] = w
+                out_data[k_out] = w
 
             state_dict = out_sd
             quant_metadata = {"layers": layers}
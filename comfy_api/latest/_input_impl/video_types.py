@@ -10,7 +10,7 @@ import json
 import numpy as np
 import math
 import torch
-from .._util import VideoContainer, VideoCodec, VideoComponents
+from .._util import VideoContainer, VideoCodec, VideoComponents, ImageStream
 
 
 def container_to_output_format(container_format: str | None) -> str | None:
@@ -319,12 +319,27 @@ class VideoFromComponents(VideoInput):
         self.__components = components
 
     def get_components(self) -> VideoComponents:
+        images = self.__components.images
+        if isinstance(images, ImageStream):
+            images = images.materialize()
         return VideoComponents(
-            images=self.__components.images,
+            images=images,
             audio=self.__components.audio,
             frame_rate=self.__components.frame_rate
         )
 
+    def get_dimensions(self) -> tuple[int, int]:
+        return self.__components.images.shape[2], self.__components.images.shape[1]
+
+    def get_duration(self) -> float:
+        return float(self.__components.images.shape[0] / self.__components.frame_rate)
+
+    def get_frame_count(self) -> int:
+        return int(self.__components.images.shape[0])
+
+    def get_frame_rate(self) -> Fraction:
+        return self.__components.frame_rate
+
     def save_to(
         self,
         path: str,
@@ -1357,6 +1357,8 @@ class Schema:
     """Flags a node as not idempotent; when True, the node will run and not reuse the cached outputs when identical inputs are provided on a different node in the graph."""
     enable_expand: bool=False
     """Flags a node as expandable, allowing NodeOutput to include 'expand' property."""
+    thread_safe: bool=False
+    """Flags a node as safe to run on a worker thread alongside other nodes (CPU-only work, no shared state, no expansion). Only used when parallel node execution is enabled."""
 
     def validate(self):
         '''Validate the schema:
@@ -1811,6 +1813,14 @@ class _ComfyNodeBaseInternal(_ComfyNodeInternal):
             cls.GET_SCHEMA()
         return cls._NOT_IDEMPOTENT
 
+    _THREAD_SAFE = None
+    @final
+    @classproperty
+    def THREAD_SAFE(cls):  # noqa
+        if cls._THREAD_SAFE is None:
+            cls.GET_SCHEMA()
+        return cls._THREAD_SAFE
+
     @final
     @classmethod
     def INPUT_TYPES(cls) -> dict[str, dict]:
@@ -1849,6 +1859,8 @@ class _ComfyNodeBaseInternal(_ComfyNodeInternal):
             cls._INPUT_IS_LIST = schema.is_input_list
         if cls._NOT_IDEMPOTENT is None:
             cls._NOT_IDEMPOTENT = schema.not_idempotent
+        if cls._THREAD_SAFE is None:
+            cls._THREAD_SAFE = schema.thread_safe
 
         if cls._RETURN_TYPES is None:
             output = []
@@ -1,6 +1,6 @@
 from .video_types import VideoContainer, VideoCodec, VideoComponents
 from .geometry_types import VOXEL, MESH
-from .image_types import SVG
+from .image_types import SVG, ImageStream
 
 __all__ = [
     # Utility Types
@@ -10,4 +10,5 @@ __all__ = [
     "VOXEL",
     "MESH",
     "SVG",
+    "ImageStream",
 ]
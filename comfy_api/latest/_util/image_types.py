@@ -1,4 +1,7 @@
 from io import BytesIO
+from typing import Callable, Iterator
+
+import torch
 
 
 class SVG:
@@ -16,3 +19,26 @@ class SVG:
         for svg_item in svgs:
             all_svgs_list.extend(svg_item.data)
         return SVG(all_svgs_list)
+
+
+class ImageStream:
+    """
+    IMAGE frames produced a chunk at a time instead of held in one tensor, for video that would
+    take too much memory decoded at once. chunks is a callable returning a new iterator of
+    [frames, height, width, channels] tensors, so every read produces the frames again.
+    Iterating yields single frames, like iterating an IMAGE tensor does.
+    """
+
+    def __init__(self, chunks: Callable[[], Iterator[torch.Tensor]], shape):
+        self.chunks = chunks
+        self.shape = torch.Size(shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            yield from chunk
+
+    def materialize(self) -> torch.Tensor:
+        return torch.cat(list(self.chunks()))
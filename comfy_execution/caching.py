@@ -1,13 +1,25 @@
 import bisect
+import collections
+import concurrent.futures
 import gc
+import hashlib
 import itertools
+import json
+import logging
+import os
 import psutil
+import threading
 import time
+import safetensors
+import safetensors.torch
 import torch
 from typing import Sequence, Mapping, Dict
 from comfy_execution.graph import DynamicPrompt
 from abc import ABC, abstractmethod
 
+import comfyui_version
+import comfy.model_pool
+import folder_paths
 import nodes
 
 from comfy_execution.graph_utils import is_link
@@ -63,6 +75,53 @@ def to_hashable(obj):
         # TODO - Support other objects like tensors?
         return Unhashable()
 
+class Unpersistable(Exception):
+    pass
+
+def stable_cache_key(obj):
+    # Hashable signatures are built from frozensets whose iteration order (and hash)
+    # changes between processes, so they are serialized canonically before digesting.
+    # Returns None for signatures that can never match (NaN or Unhashable inside).
+    def encode(obj):
+        if isinstance(obj, float) and obj != obj:
+            raise Unpersistable()
+        if isinstance(obj, (int, float, str, bool, type(None))):
+            return obj
+        if isinstance(obj, bytes):
+            return {"b": obj.hex()}
+        if isinstance(obj, (tuple, list)):
+            return [encode(i) for i in obj]
+        if isinstance(obj, frozenset):
+            return {"s": sorted(json.dumps(encode(i), sort_keys=True) for i in obj)}
+        raise Unpersistable()
+
+    try:
+        encoded = json.dumps(encode(obj), sort_keys=True)
+    except Unpersistable:
+        return None
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+SIGNATURE_DIGESTS_SIZE = 65536
+
+# Digests of the node signatures seen in recent prompts. Keys only change for the nodes that
+# were edited (and their descendants), so the digests of everything else are reused between
+# prompts instead of serializing and hashing the same inputs again.
+_signature_digests = collections.OrderedDict()
+_signature_digests_lock = threading.Lock()
+
+def signature_memo_key(obj):
+    # Equal keys must have equal JSON encodings: 1, 1.0 and True compare equal in Python
+    # so numbers are tagged with their type. Dicts and other objects aren't memoized.
+    if obj is None or isinstance(obj, (str, bytes)):
+        return obj
+    if isinstance(obj, (bool, int)):
+        return (type(obj), obj)
+    if isinstance(obj, float):
+        return (float, repr(obj))
+    if isinstance(obj, (tuple, list)):
+        return tuple(signature_memo_key(i) for i in obj)
+    raise TypeError()
+
 class CacheKeySetID(CacheKeySet):
     def __init__(self, dynprompt, node_ids, is_changed_cache):
         super().__init__(dynprompt, node_ids, is_changed_cache)
@@ -83,6 +142,13 @@ class CacheKeySetInputSignature(CacheKeySet):
         super().__init__(dynprompt, node_ids, is_changed_cache)
         self.dynprompt = dynprompt
         self.is_changed_cache = is_changed_cache
+        # Memoized signatures of every node visited so far, including ancestors that
+        # don't have keys of their own. A signature is the digest of the node's own inputs
+        # plus the digests of the nodes it links to (Merkle style), so each node is signed
+        # once per prompt, only hashed when its signature wasn't seen in a recent prompt,
+        # and keys stay small no matter how deep the ancestry is.
+        self.node_signatures = {}
+        self.node_digests = {}
 
     def include_node_id_in_input(self) -> bool:
         return False
@@ -98,14 +164,45 @@ class CacheKeySetInputSignature(CacheKeySet):
             self.subcache_keys[node_id] = (node_id, node["class_type"])
 
     async def get_node_signature(self, dynprompt, node_id):
-        signature = []
-        ancestors, order_mapping = self.get_ordered_ancestry(dynprompt, node_id)
-        signature.append(await self.get_immediate_node_signature(dynprompt, node_id, order_mapping))
-        for ancestor_id in ancestors:
-            signature.append(await self.get_immediate_node_signature(dynprompt, ancestor_id, order_mapping))
-        return to_hashable(signature)
-
-    async def get_immediate_node_signature(self, dynprompt, node_id, ancestor_order_mapping):
+        if node_id not in self.node_signatures:
+            for ancestor_id in self.get_unsigned_ancestry(dynprompt, node_id):
+                signature = await self.get_immediate_node_signature(dynprompt, ancestor_id, self.node_digests)
+                digest = self.get_signature_digest(signature)
+                self.node_digests[ancestor_id] = digest
+                # Signatures that can't be digested contain a NaN or Unhashable and never match.
+                self.node_signatures[ancestor_id] = digest if digest is not None else to_hashable(signature)
+        return self.node_signatures[node_id]
+
+    def get_signature_digest(self, signature):
+        try:
+            memo_key = signature_memo_key(signature)
+        except TypeError:
+            return self.compute_signature_digest(signature)
+        with _signature_digests_lock:
+            digest = _signature_digests.get(memo_key)
+            if digest is not None:
+                _signature_digests.move_to_end(memo_key)
+                return digest
+        digest = self.compute_signature_digest(signature)
+        if digest is not None:
+            with _signature_digests_lock:
+                _signature_digests[memo_key] = digest
+                while len(_signature_digests) > SIGNATURE_DIGESTS_SIZE:
+                    _signature_digests.popitem(last=False)
+        return digest
+
+    def compute_signature_digest(self, signature):
+        def encode_default(obj):
+            if isinstance(obj, bytes):
+                return {"bytes": obj.hex()}
+            raise TypeError()
+        try:
+            encoded = json.dumps(signature, sort_keys=True, allow_nan=False, default=encode_default)
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    async def get_immediate_node_signature(self, dynprompt, node_id, ancestor_digests):
         if not dynprompt.has_node(node_id):
             # This node doesn't exist -- we can't cache it.
             return [float("NaN")]
@@ -119,32 +216,40 @@ class CacheKeySetInputSignature(CacheKeySet):
         for key in sorted(inputs.keys()):
             if is_link(inputs[key]):
                 (ancestor_id, ancestor_socket) = inputs[key]
-                ancestor_index = ancestor_order_mapping[ancestor_id]
-                signature.append((key,("ANCESTOR", ancestor_index, ancestor_socket)))
+                # No digest means the ancestor can't be cached (or the link forms a cycle),
+                # so neither can this node.
+                ancestor_digest = ancestor_digests.get(ancestor_id)
+                if ancestor_digest is None:
+                    ancestor_digest = float("NaN")
+                signature.append((key,("ANCESTOR", ancestor_digest, ancestor_socket)))
             else:
                 signature.append((key, inputs[key]))
         return signature
 
-    # This function returns a list of all ancestors of the given node. The order of the list is
-    # deterministic based on which specific inputs the ancestor is connected by.
-    def get_ordered_ancestry(self, dynprompt, node_id):
-        ancestors = []
-        order_mapping = {}
-        self.get_ordered_ancestry_internal(dynprompt, node_id, ancestors, order_mapping)
-        return ancestors, order_mapping
-
-    def get_ordered_ancestry_internal(self, dynprompt, node_id, ancestors, order_mapping):
-        if not dynprompt.has_node(node_id):
-            return
-        inputs = dynprompt.get_node(node_id)["inputs"]
-        input_keys = sorted(inputs.keys())
-        for key in input_keys:
-            if is_link(inputs[key]):
-                ancestor_id = inputs[key][0]
-                if ancestor_id not in order_mapping:
-                    ancestors.append(ancestor_id)
-                    order_mapping[ancestor_id] = len(ancestors) - 1
-                    self.get_ordered_ancestry_internal(dynprompt, ancestor_id, ancestors, order_mapping)
+    # This function returns the given node and all of its ancestors that don't have a memoized
+    # signature yet, ordered so that every node comes after the ancestors it links to.
+    def get_unsigned_ancestry(self, dynprompt, node_id):
+        ordered = []
+        expanded = set()
+        stack = [(node_id, False)]
+        while stack:
+            current_id, finished = stack.pop()
+            if finished:
+                ordered.append(current_id)
+                continue
+            if current_id in expanded:
+                continue
+            expanded.add(current_id)
+            stack.append((current_id, True))
+            if not dynprompt.has_node(current_id):
+                continue
+            inputs = dynprompt.get_node(current_id)["inputs"]
+            for key in sorted(inputs.keys(), reverse=True):
+                if is_link(inputs[key]):
+                    ancestor_id = inputs[key][0]
+                    if ancestor_id not in expanded and ancestor_id not in self.node_signatures:
+                        stack.append((ancestor_id, False))
+        return ordered
 
 class BasicCache:
     def __init__(self, key_class):
@@ -201,6 +306,11 @@ class BasicCache:
         cache_key = self.cache_key_set.get_data_key(node_id)
         self.cache[cache_key] = value
 
+    def _get_data_key(self, node_id):
+        if not self.initialized:
+            return None
+        return self.cache_key_set.get_data_key(node_id)
+
     def _get_immediate(self, node_id):
         if not self.initialized:
             return None
@@ -268,6 +378,14 @@ class HierarchicalCache(BasicCache):
         assert cache is not None
         cache._set_immediate(node_id, value)
 
+    def _get_data_key(self, node_id):
+        cache = self._get_cache_for(node_id)
+        if cache is None:
+            return None
+        if cache is self:
+            return super()._get_data_key(node_id)
+        return cache._get_data_key(node_id)
+
     async def ensure_subcache_for(self, node_id, children_ids):
         cache = self._get_cache_for(node_id)
         assert cache is not None
@@ -421,3 +539,244 @@ class RAMPressureCache(LRUCache):
             _, _, key = clean_list.pop()
             del self.cache[key]
             gc.collect()
+
+
+def flatten_cache_value(value, tensors):
+    if isinstance(value, torch.Tensor):
+        name = str(id(value))
+        tensors[name] = value
+        return {"t": name}
+    if isinstance(value, (int, float, str, bool, type(None))):
+        return value
+    if isinstance(value, list):
+        return [flatten_cache_value(v, tensors) for v in value]
+    if isinstance(value, tuple):
+        return {"u": [flatten_cache_value(v, tensors) for v in value]}
+    if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+        return {"d": {k: flatten_cache_value(v, tensors) for k, v in value.items()}}
+    raise Unpersistable()
+
+def unflatten_cache_value(value, tensors):
+    if isinstance(value, list):
+        return [unflatten_cache_value(v, tensors) for v in value]
+    if isinstance(value, dict):
+        if "t" in value:
+            return tensors[value["t"]]
+        if "u" in value:
+            return tuple(unflatten_cache_value(v, tensors) for v in value["u"])
+        return {k: unflatten_cache_value(v, tensors) for k, v in value["d"].items()}
+    return value
+
+DISK_CACHE_EXTENSION = ".safetensors"
+DISK_CACHE_METADATA_KEY = "comfy_cache"
+
+def input_file_identities(value) -> tuple:
+    """
+    The file_identity() of the files a string input could name: a file with that name in any model
+    folder or the annotated input file. Only strings with an extension are looked up.
+    """
+    if not isinstance(value, str) or os.path.splitext(value)[1] == "":
+        return ()
+    paths = [folder_paths.get_full_path(folder_name, value) for folder_name in list(folder_paths.folder_names_and_paths)]
+    paths.append(folder_paths.get_annotated_filepath(value))
+    identities = set()
+    for path in paths:
+        if path is not None and os.path.isfile(path):
+            try:
+                identities.add(comfy.model_pool.file_identity(path))
+            except OSError:
+                pass
+    return tuple(sorted(identities))
+
+class DiskCache:
+    """
+    Second cache tier for node outputs. Wraps one of the RAM caches above and spills
+    outputs containing tensors to safetensors files named by a digest of the node's
+    input signature, so they survive RAM evictions and restarts. Signatures only name the
+    model and input files a node reads, so the digest also covers the identity (path, size,
+    mtime) of the files named by the inputs of the node and its ancestors, and outputs computed
+    from a file replaced under the same name are never loaded. The directory is bounded to
+    max_size bytes and evicted least recently used first.
+    """
+    def __init__(self, cache, directory, max_size, entry_type=tuple):
+        self.cache = cache
+        self.directory = directory
+        self.max_size = max_size
+        self.entry_type = entry_type
+        self.lock = threading.Lock()
+        self.index = collections.OrderedDict()
+        self.pending = set()
+        self.digests = {}
+        self.dynprompt = None
+        self.file_digests = {}  # node_id -> digest of the files named by its inputs and ancestors
+        self.file_identities = {}  # input value -> input_file_identities()
+        self.total_size = 0
+        self.writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="comfy_disk_cache")
+        os.makedirs(self.directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(DISK_CACHE_EXTENSION):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(DISK_CACHE_EXTENSION)], stat.st_size))
+        for _, digest, size in sorted(entries):
+            self.index[digest] = size
+            self.total_size += size
+        logging.info("Disk cache: {} entries, {:.2f} GB in {}".format(len(self.index), self.total_size / (1024**3), self.directory))
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest + DISK_CACHE_EXTENSION)
+
+    def _get_digest(self, node_id):
+        data_key = self.cache._get_data_key(node_id)
+        if data_key is None:
+            return None
+        if data_key not in self.digests:
+            self.digests[data_key] = stable_cache_key((comfyui_version.__version__, data_key, self._get_file_digest(node_id)))
+        return self.digests[data_key]
+
+    def _get_file_identities(self, value):
+        key = to_hashable(value)
+        if key not in self.file_identities:
+            self.file_identities[key] = input_file_identities(value)
+        return self.file_identities[key]
+
+    def _get_file_digest(self, node_id):
+        if self.dynprompt is None:
+            return None
+        stack = [node_id]
+        visiting = set()
+        while stack:
+            current_id = stack[-1]
+            if current_id in self.file_digests:
+                stack.pop()
+                continue
+            if not self.dynprompt.has_node(current_id):
+                self.file_digests[current_id] = None
+                stack.pop()
+                continue
+            inputs = self.dynprompt.get_node(current_id)["inputs"]
+            if current_id not in visiting:
+                visiting.add(current_id)
+                stack.extend(v[0] for v in inputs.values() if is_link(v) and v[0] not in self.file_digests and v[0] not in visiting)
+                continue
+            stack.pop()
+            parts = []
+            for key in sorted(inputs.keys()):
+                if is_link(inputs[key]):
+                    parts.append(self.file_digests.get(inputs[key][0]))
+                else:
+                    parts.append(self._get_file_identities(inputs[key]))
+            self.file_digests[current_id] = hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+        return self.file_digests[node_id]
+
+    def _evict(self):
+        while self.total_size > self.max_size and self.index:
+            digest, size = self.index.popitem(last=False)
+            self.total_size -= size
+            try:
+                os.remove(self._path(digest))
+            except OSError:
+                pass
+
+    def _write(self, digest, tensors, metadata):
+        path = self._path(digest)
+        tmp_path = path + ".tmp"
+        try:
+            tensors = {k: v.detach().to("cpu").contiguous() for k, v in tensors.items()}
+            safetensors.torch.save_file(tensors, tmp_path, metadata={DISK_CACHE_METADATA_KEY: metadata})
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning("Disk cache: failed to write {}: {}".format(path, e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            with self.lock:
+                self.pending.discard(digest)
+            return
+        with self.lock:
+            self.pending.discard(digest)
+            if digest not in self.index:
+                self.index[digest] = os.path.getsize(path)
+                self.total_size += self.index[digest]
+            self._evict()
+
+    def _load(self, digest):
+        with self.lock:
+            if digest not in self.index:
+                return None
+            self.index.move_to_end(digest)
+        path = self._path(digest)
+        try:
+            with safetensors.safe_open(path, framework="pt", device="cpu") as f:
+                metadata = json.loads(f.metadata()[DISK_CACHE_METADATA_KEY])
+                tensors = {k: f.get_tensor(k) for k in f.keys()}
+            os.utime(path)
+        except Exception as e:
+            logging.warning("Disk cache: failed to read {}: {}".format(path, e))
+            with self.lock:
+                if digest in self.index:
+                    self.total_size -= self.index.pop(digest)
+            return None
+        return self.entry_type(metadata["ui"], unflatten_cache_value(metadata["outputs"], tensors))
+
+    def _store(self, digest, value):
+        with self.lock:
+            if digest in self.index:
+                self.index.move_to_end(digest)
+                return
+            if digest in self.pending:
+                return
+        tensors = {}
+        try:
+            ui, outputs = value
+            metadata = json.dumps({"ui": ui, "outputs": flatten_cache_value(outputs, tensors)})
+        except (Unpersistable, TypeError, ValueError):
+            return
+        if len(tensors) == 0:
+            # Nothing expensive to save, these are cheaper to recompute.
+            return
+        with self.lock:
+            self.pending.add(digest)
+        self.writer.submit(self._write, digest, tensors, metadata)
+
+    async def set_prompt(self, dynprompt, node_ids, is_changed_cache):
+        self.digests = {}
+        self.dynprompt = dynprompt
+        self.file_digests = {}
+        self.file_identities = {}
+        await self.cache.set_prompt(dynprompt, node_ids, is_changed_cache)
+
+    def all_node_ids(self):
+        return self.cache.all_node_ids()
+
+    def clean_unused(self):
+        self.cache.clean_unused()
+
+    def poll(self, **kwargs):
+        self.cache.poll(**kwargs)
+
+    def get(self, node_id):
+        value = self.cache.get(node_id)
+        if value is not None:
+            return value
+        digest = self._get_digest(node_id)
+        if digest is None:
+            return None
+        value = self._load(digest)
+        if value is not None:
+            self.cache.set(node_id, value)
+        return value
+
+    def set(self, node_id, value):
+        self.cache.set(node_id, value)
+        digest = self._get_digest(node_id)
+        if digest is not None:
+            self._store(digest, value)
+
+    async def ensure_subcache_for(self, node_id, children_ids):
+        return await self.cache.ensure_subcache_for(node_id, children_ids)
+
+    def recursive_debug_dump(self):
+        return self.cache.recursive_debug_dump()
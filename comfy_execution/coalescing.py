@@ -0,0 +1,503 @@
+"""
+Coalescing of compatible queued prompts into one batched execution.
+
+API traffic often queues many copies of the same workflow that only differ in their seed or
+prompt text, and each of them samples at batch size 1. With --coalesce-prompts, the prompt
+worker takes queued prompts that share the leader's graph apart from those widget values and
+runs them as a single merged prompt:
+
+* nodes that don't depend on any differing value are shared and run once,
+* nodes whose values differ, and everything downstream of them that can't take a batch,
+  are copied once per prompt,
+* samplers and nodes that work on each batch element independently (VAE decode/encode,
+  upscales) run once on the whole batch; per-prompt copies read their slice of the batch
+  through a CoalescedBatchSplit node.
+
+The leader's nodes keep their ids so its client sees normal progress. The other prompts'
+copies get an "@<member index>" suffix and their outputs are mapped back to their own
+history entries once the merged prompt finishes.
+"""
+
+import json
+import math
+import re
+from typing import NamedTuple, Optional
+
+import torch
+
+import comfy.sample
+import comfy.samplers
+import comfy.utils
+import latent_preview
+import nodes
+from comfy_execution.graph_utils import is_link
+
+# Widget values that may differ between coalesced prompts.
+VARIANT_INPUTS = {
+    "CLIPTextEncode": ("text",),
+    "KSampler": ("seed",),
+    "KSamplerAdvanced": ("noise_seed",),
+}
+
+SAMPLER_CLASSES = ("KSampler", "KSamplerAdvanced")
+
+# Nodes that process every element of a batch independently, so they can run once on the
+# merged batch.
+BATCH_TRANSPARENT_CLASSES = frozenset({
+    "VAEDecode",
+    "VAEEncode",
+    "LatentUpscale",
+    "LatentUpscaleBy",
+    "ImageScale",
+    "ImageScaleBy",
+})
+
+# Samplers that don't draw noise after the initial latent noise. Every prompt gets its own
+# initial noise from its seed, so these give each prompt the same result as running it alone.
+DETERMINISTIC_SAMPLERS = frozenset({
+    "euler", "euler_cfg_pp", "heun", "heunpp2", "exp_heun_2_x0", "dpm_2", "lms",
+    "dpmpp_2m", "dpmpp_2m_cfg_pp", "ipndm", "ipndm_v", "deis", "res_multistep",
+    "res_multistep_cfg_pp", "gradient_estimation", "gradient_estimation_cfg_pp",
+    "ddim", "uni_pc", "uni_pc_bh2",
+})
+
+# extra_data keys that may differ between coalesced prompts; everything else must match.
+MEMBER_EXTRA_DATA_KEYS = frozenset({"client_id", "create_time", "extra_pnginfo", "priority"})
+
+COALESCED_MEMBERS_KEY = "coalesced_members"
+
+# Upper bound of --coalesce-prompts, the number of per-prompt inputs of CoalescedKSampler.
+MAX_COALESCED_PROMPTS = 64
+
+MEMBER_ID_PATTERN = re.compile(r"^(.*?)@(\d+)((?:\..*)?)$")
+
+
+def member_node_id(node_id: str, index: int) -> str:
+    return node_id if index == 0 else f"{node_id}@{index}"
+
+
+def split_member_node_id(node_id: str) -> tuple[str, int]:
+    """Maps a (possibly ephemeral) node id of the merged prompt to (original id, member index)."""
+    match = MEMBER_ID_PATTERN.match(node_id)
+    if match is None:
+        return node_id, 0
+    return match.group(1) + match.group(3), int(match.group(2))
+
+
+def coalesce_key(item) -> Optional[str]:
+    """
+    Returns a key that is equal for queue items that can be coalesced with each other, or None
+    if the item can't be coalesced at all.
+    """
+    prompt = item[2]
+    has_sampler = False
+    template = {}
+    for node_id, node in prompt.items():
+        class_type = node.get("class_type")
+        inputs = dict(node.get("inputs", {}))
+        if class_type in SAMPLER_CLASSES:
+            sampler_name = inputs.get("sampler_name")
+            if sampler_name not in DETERMINISTIC_SAMPLERS:
+                return None
+            has_sampler = True
+        for name in VARIANT_INPUTS.get(class_type, ()):
+            if name in inputs and not is_link(inputs[name]):
+                inputs[name] = None
+        template[node_id] = [class_type, inputs]
+    if not has_sampler:
+        return None
+
+    extra_data = {k: v for k, v in item[3].items() if k not in MEMBER_EXTRA_DATA_KEYS}
+    try:
+        return json.dumps([template, sorted(item[4]), extra_data, item[5]], sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+
+
+class MergedPrompt(NamedTuple):
+    prompt: dict
+    outputs: list
+    extra_data: dict
+    # Per member, the node ids of its own prompt that are output nodes
+    member_outputs: list
+
+
+def merge_prompts(items, extra_data) -> Optional[MergedPrompt]:
+    """
+    Builds a single prompt that executes all of the coalesced queue items. items[0] is the
+    leader. Returns None if the graphs can't be merged.
+    """
+    prompts = [item[2] for item in items]
+    count = len(prompts)
+    leader = prompts[0]
+
+    variant = set()
+    for node_id, node in leader.items():
+        for name in VARIANT_INPUTS.get(node["class_type"], ()):
+            if any(p[node_id]["inputs"].get(name) != node["inputs"].get(name) for p in prompts[1:]):
+                variant.add(node_id)
+
+    # Nodes depending on a differing value, in dependency order.
+    order = _topological_order(leader)
+    if order is None:
+        return None
+    tainted = set()
+    for node_id in order:
+        inputs = leader[node_id]["inputs"].values()
+        if node_id in variant or any(is_link(v) and v[0] in tainted for v in inputs):
+            tainted.add(node_id)
+
+    batched = set()
+    per_member = set()
+    for node_id in order:
+        if node_id not in tainted:
+            continue
+        class_type = leader[node_id]["class_type"]
+        if class_type in SAMPLER_CLASSES or class_type in BATCH_TRANSPARENT_CLASSES:
+            batched.add(node_id)
+        else:
+            per_member.add(node_id)
+    if not any(leader[node_id]["class_type"] in SAMPLER_CLASSES for node_id in batched):
+        return None
+
+    merged = {}
+    for node_id in order:
+        node = leader[node_id]
+        if node_id not in tainted:
+            merged[node_id] = node
+        elif node_id in per_member:
+            for i, p in enumerate(prompts):
+                inputs = {}
+                for name, value in p[node_id]["inputs"].items():
+                    if is_link(value) and value[0] in tainted:
+                        if value[0] in batched:
+                            value = [_add_split(merged, value[0], value[1], i, count), 0]
+                        else:
+                            value = [member_node_id(value[0], i), value[1]]
+                    inputs[name] = value
+                merged[member_node_id(node_id, i)] = {**p[node_id], "inputs": inputs}
+        elif node["class_type"] in SAMPLER_CLASSES:
+            sampler = _merge_sampler(node_id, prompts, tainted, batched)
+            if sampler is None:
+                return None
+            merged[node_id] = sampler
+        else:
+            for name, value in node["inputs"].items():
+                if is_link(value) and value[0] in tainted and value[0] not in batched:
+                    return None
+            merged[node_id] = node
+
+    outputs = []
+    member_outputs = []
+    for i, item in enumerate(items):
+        member_outputs.append(list(item[4]))
+        for node_id in item[4]:
+            merged_id = member_node_id(node_id, i) if node_id in per_member else node_id
+            if merged_id not in outputs:
+                outputs.append(merged_id)
+        # Output nodes fed by the batch directly would see every member's results.
+        if any(node_id in batched for node_id in item[4]):
+            return None
+
+    extra_data = extra_data.copy()
+    extra_data[COALESCED_MEMBERS_KEY] = [
+        {"prompt": item[2], "extra_pnginfo": item[3].get("extra_pnginfo", None)} for item in items
+    ]
+    return MergedPrompt(merged, outputs, extra_data, member_outputs)
+
+
+def _topological_order(prompt) -> Optional[list]:
+    order = []
+    state = {}
+    for root in prompt:
+        if root in state:
+            continue
+        stack = [(root, False)]
+        while stack:
+            node_id, expanded = stack.pop()
+            if expanded:
+                state[node_id] = True
+                order.append(node_id)
+                continue
+            if state.get(node_id) is True:
+                continue
+            if state.get(node_id) is False:
+                return None  # Cycle
+            if node_id not in prompt:
+                return None
+            state[node_id] = False
+            stack.append((node_id, True))
+            for value in prompt[node_id]["inputs"].values():
+                if is_link(value) and state.get(value[0]) is not True:
+                    stack.append((value[0], False))
+    return order
+
+
+def _add_split(merged, source_id, socket, index, count) -> str:
+    split_id = f"{source_id}@split{socket}.{index}"
+    if split_id not in merged:
+        merged[split_id] = {
+            "class_type": "CoalescedBatchSplit",
+            "inputs": {"value": [source_id, socket], "index": index, "count": count},
+        }
+    return split_id
+
+
+def _merge_sampler(node_id, prompts, tainted, batched) -> Optional[dict]:
+    leader = prompts[0][node_id]
+    inputs = leader["inputs"]
+    if is_link(inputs["model"]) and inputs["model"][0] in tainted:
+        return None
+
+    latent = inputs["latent_image"]
+    latent_batched = is_link(latent) and latent[0] in tainted
+    if latent_batched and latent[0] not in batched:
+        return None
+
+    merged_inputs = {
+        "model": inputs["model"],
+        "count": len(prompts),
+        "latent_batched": latent_batched,
+        "steps": inputs["steps"],
+        "cfg": inputs["cfg"],
+        "sampler_name": inputs["sampler_name"],
+        "scheduler": inputs["scheduler"],
+        "latent_image": latent,
+    }
+    if leader["class_type"] == "KSamplerAdvanced":
+        merged_inputs.update({
+            "disable_noise": inputs["add_noise"] == "disable",
+            "start_step": inputs["start_at_step"],
+            "last_step": inputs["end_at_step"],
+            "force_full_denoise": inputs["return_with_leftover_noise"] != "enable",
+        })
+        seed_name = "noise_seed"
+    else:
+        merged_inputs["denoise"] = inputs.get("denoise", 1.0)
+        seed_name = "seed"
+
+    for i, p in enumerate(prompts):
+        member_inputs = p[node_id]["inputs"]
+        merged_inputs[f"seed_{i}"] = member_inputs[seed_name]
+        for name in ("positive", "negative"):
+            value = member_inputs[name]
+            if is_link(value) and value[0] in tainted:
+                if value[0] in batched:
+                    return None
+                value = [member_node_id(value[0], i), value[1]]
+            merged_inputs[f"{name}_{i}"] = value
+    return {**leader, "class_type": "CoalescedKSampler", "inputs": merged_inputs}
+
+
+def get_member_hidden_inputs(unique_id, dynprompt, extra_data) -> tuple[dict, Optional[dict]]:
+    """Returns the PROMPT and EXTRA_PNGINFO hidden values for a node of a possibly merged prompt."""
+    members = extra_data.get(COALESCED_MEMBERS_KEY)
+    if members is None:
+        prompt = dynprompt.get_original_prompt() if dynprompt is not None else {}
+        return prompt, extra_data.get("extra_pnginfo", None)
+    real_node_id = dynprompt.get_real_node_id(unique_id) if dynprompt is not None else unique_id
+    _, index = split_member_node_id(real_node_id)
+    member = members[index]
+    return member["prompt"], member["extra_pnginfo"]
+
+
+def split_history_result(history_result, member_outputs, index) -> dict:
+    """Picks the outputs of one member out of the merged prompt's history result."""
+    outputs = {}
+    meta = {}
+    for node_id in member_outputs:
+        for merged_id in (member_node_id(node_id, index), node_id):
+            if merged_id in history_result["outputs"]:
+                outputs[node_id] = history_result["outputs"][merged_id]
+                if merged_id in history_result["meta"]:
+                    meta[node_id] = {
+                        **history_result["meta"][merged_id],
+                        "node_id": node_id,
+                        "display_node": node_id,
+                        "real_node_id": node_id,
+                    }
+                break
+    return {"outputs": outputs, "meta": meta}
+
+
+def split_status_messages(messages, prompt_id) -> list:
+    """Rewrites the merged prompt's status messages for one of its members."""
+    out = []
+    for event, data in messages:
+        data = {**data, "prompt_id": prompt_id}
+        if "nodes" in data:
+            data["nodes"] = [n for n in data["nodes"] if split_member_node_id(n)[1] == 0]
+        out.append((event, data))
+    return out
+
+
+def batch_conditioning(conditionings, repeats):
+    """
+    Concatenates one conditioning per member along the batch dimension, each repeated for
+    every latent of the member's batch. Cross attention conds of different lengths are padded
+    by repeating them to a common length, which doesn't change the attention result.
+    """
+    first = conditionings[0]
+    if any(len(c) != len(first) for c in conditionings):
+        raise ValueError("Coalesced prompts have conditionings with different numbers of entries")
+
+    out = []
+    for entries in zip(*conditionings):
+        conds = [e[0] for e in entries]
+        if any(c.shape[0] != 1 or c.shape[2:] != conds[0].shape[2:] for c in conds):
+            raise ValueError("Coalesced prompts have conditionings with incompatible shapes")
+        length = math.lcm(*[c.shape[1] for c in conds])
+        if length != conds[0].shape[1] or any(c.shape[1] != length for c in conds):
+            if any("mask" in key for key in entries[0][1]):
+                raise ValueError("Coalesced prompts have masked conditionings of different lengths")
+        cond = torch.cat([c.repeat(repeats, length // c.shape[1], 1) for c in conds])
+
+        options = {}
+        for key in entries[0][1]:
+            values = [e[1].get(key) for e in entries]
+            if any(key not in e[1] for e in entries):
+                raise ValueError("Coalesced prompts have conditionings with different options")
+            if all(torch.is_tensor(v) for v in values):
+                if all(v.shape == values[0].shape and v.shape[0] == 1 for v in values):
+                    options[key] = torch.cat([v.repeat_interleave(repeats, dim=0) for v in values])
+                elif all(torch.equal(v, values[0]) for v in values):
+                    options[key] = values[0]
+                else:
+                    raise ValueError(f"Coalesced prompts have incompatible conditioning option {key}")
+            elif all(v is values[0] or v == values[0] for v in values):
+                options[key] = values[0]
+            else:
+                raise ValueError(f"Coalesced prompts have different conditioning option {key}")
+        out.append([cond, options])
+    return out
+
+
+class CoalescedKSampler:
+    """KSampler/KSamplerAdvanced over the batch of every coalesced prompt, with one seed and conditioning per prompt."""
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "model": ("MODEL",),
+                "count": ("INT", {"min": 1}),
+                "latent_batched": ("BOOLEAN",),
+                "steps": ("INT", {"min": 1}),
+                "cfg": ("FLOAT",),
+                "sampler_name": (comfy.samplers.KSampler.SAMPLERS,),
+                "scheduler": (comfy.samplers.KSampler.SCHEDULERS,),
+                "latent_image": ("LATENT",),
+            },
+            "optional": {
+                "denoise": ("FLOAT",),
+                "disable_noise": ("BOOLEAN",),
+                "start_step": ("INT",),
+                "last_step": ("INT",),
+                "force_full_denoise": ("BOOLEAN",),
+                **{f"seed_{i}": ("INT",) for i in range(MAX_COALESCED_PROMPTS)},
+                **{f"positive_{i}": ("CONDITIONING",) for i in range(MAX_COALESCED_PROMPTS)},
+                **{f"negative_{i}": ("CONDITIONING",) for i in range(MAX_COALESCED_PROMPTS)},
+            },
+        }
+
+    RETURN_TYPES = ("LATENT",)
+    FUNCTION = "sample"
+    CATEGORY = "_internal"
+    INTERNAL = True
+
+    def sample(self, model, count, latent_batched, steps, cfg, sampler_name, scheduler, latent_image,
+               denoise=1.0, disable_noise=False, start_step=None, last_step=None, force_full_denoise=False, **kwargs):
+        latent = latent_image
+        samples = comfy.sample.fix_empty_latent_channels(model, latent["samples"])
+        if samples.is_nested:
+            raise ValueError("Nested latents can't be coalesced")
+        batch_inds = latent.get("batch_index")
+        if latent_batched:
+            per_member = samples.shape[0] // count
+        else:
+            per_member = samples.shape[0]
+            samples = samples.repeat((count,) + (1,) * (samples.ndim - 1))
+
+        seeds = [kwargs[f"seed_{i}"] for i in range(count)]
+        if disable_noise:
+            noise = torch.zeros(samples.size(), dtype=samples.dtype, layout=samples.layout, device="cpu")
+        else:
+            noise = []
+            for i, seed in enumerate(seeds):
+                member_samples = samples[i * per_member:(i + 1) * per_member]
+                member_inds = batch_inds
+                if latent_batched and batch_inds is not None:
+                    member_inds = batch_inds[i * per_member:(i + 1) * per_member]
+                noise.append(comfy.sample.prepare_noise(member_samples, seed, member_inds))
+            noise = torch.cat(noise)
+
+        noise_mask = latent.get("noise_mask")
+        if noise_mask is not None and not latent_batched and noise_mask.shape[0] == per_member:
+            noise_mask = noise_mask.repeat((count,) + (1,) * (noise_mask.ndim - 1))
+
+        positive = batch_conditioning([kwargs[f"positive_{i}"] for i in range(count)], per_member)
+        negative = batch_conditioning([kwargs[f"negative_{i}"] for i in range(count)], per_member)
+
+        callback = latent_preview.prepare_callback(model, steps)
+        disable_pbar = not comfy.utils.PROGRESS_BAR_ENABLED
+        samples = comfy.sample.sample(model, noise, steps, cfg, sampler_name, scheduler, positive, negative, samples,
+                                      denoise=denoise, disable_noise=disable_noise, start_step=start_step, last_step=last_step,
+                                      force_full_denoise=force_full_denoise, noise_mask=noise_mask, callback=callback, disable_pbar=disable_pbar, seed=seeds[0])
+        out = latent.copy()
+        out["samples"] = samples
+        if not latent_batched:
+            if batch_inds is not None:
+                out["batch_index"] = list(batch_inds) * count
+            if noise_mask is not None:
+                out["noise_mask"] = noise_mask
+        return (out, )
+
+
+class CoalescedBatchSplit:
+    """Returns one coalesced prompt's part of a batched IMAGE, MASK or LATENT."""
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "value": ("*",),
+                "index": ("INT", {"min": 0}),
+                "count": ("INT", {"min": 1}),
+            },
+        }
+
+    RETURN_TYPES = ("*",)
+    FUNCTION = "split"
+    CATEGORY = "_internal"
+    INTERNAL = True
+
+    def split(self, value, index, count):
+        if torch.is_tensor(value):
+            return (self._slice(value, index, count), )
+        if isinstance(value, dict) and "samples" in value:
+            samples = value["samples"]
+            out = value.copy()
+            out["samples"] = self._slice(samples, index, count)
+            if "batch_index" in value:
+                per_member = len(value["batch_index"]) // count
+                out["batch_index"] = value["batch_index"][index * per_member:(index + 1) * per_member]
+            noise_mask = value.get("noise_mask")
+            if noise_mask is not None and noise_mask.shape[0] == samples.shape[0]:
+                out["noise_mask"] = self._slice(noise_mask, index, count)
+            return (out, )
+        raise ValueError(f"Can't split a coalesced batch of type {type(value).__name__}")
+
+    @staticmethod
+    def _slice(tensor, index, count):
+        per_member = tensor.shape[0] // count
+        return tensor[index * per_member:(index + 1) * per_member]
+
+
+NODE_CLASS_MAPPINGS = {
+    "CoalescedKSampler": CoalescedKSampler,
+    "CoalescedBatchSplit": CoalescedBatchSplit,
+}
+
+
+def register_nodes():
+    nodes.NODE_CLASS_MAPPINGS.update(NODE_CLASS_MAPPINGS)
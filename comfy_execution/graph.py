@@ -196,9 +196,10 @@ class ExecutionList(TopologicalSort):
     ExecutionList implements a topological dissolve of the graph. After a node is staged for execution,
     it can still be returned to the graph after having further dependencies added.
     """
-    def __init__(self, dynprompt, output_cache):
+    def __init__(self, dynprompt, output_cache, prefer_thread_safe=False):
         super().__init__(dynprompt)
         self.output_cache = output_cache
+        self.prefer_thread_safe = prefer_thread_safe
         self.staged_node_id = None
         self.execution_cache = {}
         self.execution_cache_listeners = {}
@@ -281,9 +282,12 @@ class ExecutionList(TopologicalSort):
 
         # If an available node is async, do that first.
         # This will execute the asynchronous function earlier, reducing the overall time.
+        # Thread safe nodes count as async when they are sent to the worker threads.
         def is_async(node_id):
             class_type = self.dynprompt.get_node(node_id)["class_type"]
             class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
+            if self.prefer_thread_safe and getattr(class_def, "THREAD_SAFE", False) == True:
+                return True
             return inspect.iscoroutinefunction(getattr(class_def, class_def.FUNCTION))
 
         for node_id in node_list:
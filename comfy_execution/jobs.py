@@ -3,9 +3,12 @@ Job utilities for the /api/jobs endpoint.
 Provides normalization and helper functions for job status tracking.
 """
 
+import base64
+import json
 from typing import Optional
 
 from comfy_api.internal import prune_dict
+from comfy_execution.scheduling import get_priority_class
 
 
 class JobStatus:
@@ -66,10 +69,11 @@ def is_previewable(media_type: str, item: dict) -> bool:
     return False
 
 
-def normalize_queue_item(item: tuple, status: str) -> dict:
+def normalize_queue_item(item: tuple, status: str, queue_position: Optional[int] = None) -> dict:
     """Convert queue item tuple to unified job dict.
 
     Expects item with sensitive data already removed (5 elements).
+    queue_position is the estimated number of pending jobs that will run first.
     """
     priority, prompt_id, _, extra_data, _ = item
     create_time, workflow_id = _extract_job_metadata(extra_data)
@@ -78,6 +82,8 @@ def normalize_queue_item(item: tuple, status: str) -> dict:
         'id': prompt_id,
         'status': status,
         'priority': priority,
+        'priority_class': get_priority_class(item),
+        'queue_position': queue_position,
         'create_time': create_time,
         'outputs_count': 0,
         'workflow_id': workflow_id,
@@ -189,20 +195,36 @@ def get_outputs_summary(outputs: dict) -> tuple[int, Optional[dict]]:
     return count, preview_output or fallback_preview
 
 
+def get_sort_value(job: dict, sort_by: str) -> int:
+    """Value a job is ordered by for sort_by ('created_at' or 'execution_duration')."""
+    if sort_by == 'execution_duration':
+        start = job.get('execution_start_time', 0)
+        end = job.get('execution_end_time', 0)
+        return end - start if end and start else 0
+    return job.get('create_time', 0)
+
+
 def apply_sorting(jobs: list[dict], sort_by: str, sort_order: str) -> list[dict]:
-    """Sort jobs list by specified field and order."""
+    """Sort jobs list by specified field and order, breaking ties by id so cursors are stable."""
     reverse = (sort_order == 'desc')
+    return sorted(jobs, key=lambda job: (get_sort_value(job, sort_by), job['id']), reverse=reverse)
 
-    if sort_by == 'execution_duration':
-        def get_sort_key(job):
-            start = job.get('execution_start_time', 0)
-            end = job.get('execution_end_time', 0)
-            return end - start if end and start else 0
-    else:
-        def get_sort_key(job):
-            return job.get('create_time', 0)
 
-    return sorted(jobs, key=get_sort_key, reverse=reverse)
+def encode_job_cursor(job: dict, sort_by: str) -> str:
+    """Opaque cursor that continues a job listing after job."""
+    raw = json.dumps([get_sort_value(job, sort_by), job['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_job_cursor(cursor: str) -> tuple[int, str]:
+    """Inverse of encode_job_cursor, raises ValueError for malformed cursors."""
+    try:
+        value, job_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+    if not isinstance(value, (int, float)) or not isinstance(job_id, str):
+        raise ValueError(f"invalid cursor: {cursor}")
+    return (value, job_id)
 
 
 def get_job(prompt_id: str, running: list, queued: list, history: dict) -> Optional[dict]:
@@ -212,7 +234,7 @@ def get_job(prompt_id: str, running: list, queued: list, history: dict) -> Optio
     Args:
         prompt_id: The prompt ID to look up
         running: List of currently running queue items
-        queued: List of pending queue items
+        queued: List of pending queue items in estimated execution order
         history: Dict of history items keyed by prompt_id
 
     Returns:
@@ -225,9 +247,9 @@ def get_job(prompt_id: str, running: list, queued: list, history: dict) -> Optio
         if item[1] == prompt_id:
             return normalize_queue_item(item, JobStatus.IN_PROGRESS)
 
-    for item in queued:
+    for i, item in enumerate(queued):
         if item[1] == prompt_id:
-            return normalize_queue_item(item, JobStatus.PENDING)
+            return normalize_queue_item(item, JobStatus.PENDING, queue_position=i)
 
     return None
 
@@ -235,48 +257,74 @@ def get_job(prompt_id: str, running: list, queued: list, history: dict) -> Optio
 def get_all_jobs(
     running: list,
     queued: list,
-    history: dict,
+    history,
     status_filter: Optional[list[str]] = None,
     workflow_id: Optional[str] = None,
     sort_by: str = "created_at",
     sort_order: str = "desc",
     limit: Optional[int] = None,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    client_id: Optional[str] = None,
 ) -> tuple[list[dict], int]:
     """
     Get all jobs (running, pending, completed) with filtering and sorting.
 
     Args:
         running: List of currently running queue items
-        queued: List of pending queue items
-        history: Dict of history items keyed by prompt_id
+        queued: List of pending queue items in estimated execution order
+        history: Dict of history items keyed by prompt_id, or a history store
+            (app.history.store), which filters, sorts and pages finished jobs itself
         status_filter: List of statuses to include (from JobStatus.ALL)
         workflow_id: Filter by workflow ID
         sort_by: Field to sort by ('created_at', 'execution_duration')
         sort_order: 'asc' or 'desc'
         limit: Maximum number of items to return
         offset: Number of items to skip
+        cursor: encode_job_cursor() of the last job of the previous page, replaces offset
+        client_id: Filter by the client that queued the job
 
     Returns:
-        tuple: (jobs_list, total_count)
+        tuple: (jobs_list, total_count), total_count ignores offset and cursor
     """
     jobs = []
 
     if status_filter is None:
         status_filter = JobStatus.ALL
 
+    after = None
+    if cursor is not None:
+        after = decode_job_cursor(cursor)
+        offset = 0
+    reverse = (sort_order == 'desc')
+
+    def is_after(job):
+        key = (get_sort_value(job, sort_by), job['id'])
+        return key < after if reverse else key > after
+
+    def include_queue_item(item):
+        if client_id and item[3].get('client_id') != client_id:
+            return False
+        return True
+
     if JobStatus.IN_PROGRESS in status_filter:
         for item in running:
-            jobs.append(normalize_queue_item(item, JobStatus.IN_PROGRESS))
+            if include_queue_item(item):
+                jobs.append(normalize_queue_item(item, JobStatus.IN_PROGRESS))
 
     if JobStatus.PENDING in status_filter:
-        for item in queued:
-            jobs.append(normalize_queue_item(item, JobStatus.PENDING))
+        for i, item in enumerate(queued):
+            if include_queue_item(item):
+                jobs.append(normalize_queue_item(item, JobStatus.PENDING, queue_position=i))
 
     history_statuses = {JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED}
     requested_history_statuses = history_statuses & set(status_filter)
-    if requested_history_statuses:
+
+    history_is_store = not isinstance(history, dict)
+    if requested_history_statuses and not history_is_store:
         for prompt_id, history_item in history.items():
+            if client_id and history_item['prompt'][3].get('client_id') != client_id:
+                continue
             job = normalize_history_item(prompt_id, history_item)
             if job.get('status') in requested_history_statuses:
                 jobs.append(job)
@@ -284,9 +332,23 @@ def get_all_jobs(
     if workflow_id:
         jobs = [j for j in jobs if j.get('workflow_id') == workflow_id]
 
-    jobs = apply_sorting(jobs, sort_by, sort_order)
-
     total_count = len(jobs)
+    if after is not None:
+        jobs = [j for j in jobs if is_after(j)]
+
+    if requested_history_statuses and history_is_store:
+        # The store filters and sorts finished jobs itself, only the ones that can land on
+        # this page are loaded and normalized.
+        statuses = None if requested_history_statuses == history_statuses else requested_history_statuses
+        query = dict(statuses=statuses, workflow_id=workflow_id, client_id=client_id)
+        rows = history.query_jobs(
+            sort_by=sort_by, sort_order=sort_order, cursor=after,
+            limit=None if limit is None else offset + limit, **query
+        )
+        jobs.extend(normalize_history_item(prompt_id, history_item) for prompt_id, history_item in rows)
+        total_count += history.count_jobs(**query)
+
+    jobs = apply_sorting(jobs, sort_by, sort_order)
 
     if offset > 0:
         jobs = jobs[offset:]
@@ -0,0 +1,145 @@
+"""
+Prefetching of the model files upcoming loader nodes will read.
+
+Loader nodes read their files synchronously on the executor thread, so disk I/O only starts once
+the previous node finished. Both the graph being executed and the queued prompts are known in
+advance, so when a prompt starts the executor hands the files of its loader nodes that aren't
+cached, followed by the ones of the next queued prompts, to a background thread that reads them
+into the page cache while the current nodes run. Files the model pool holds, files the prompt's
+cached loaders use and files read recently are skipped, and a plan stops once the files it read
+would no longer fit in the available RAM.
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+
+import psutil
+
+import comfy.model_pool
+import folder_paths
+from comfy.cli_args import args
+
+# Inputs of loader nodes that name a file, and the folder it's in.
+LOADER_INPUTS = {
+    "CheckpointLoaderSimple": {"ckpt_name": "checkpoints"},
+    "CheckpointLoader": {"ckpt_name": "checkpoints"},
+    "unCLIPCheckpointLoader": {"ckpt_name": "checkpoints"},
+    "ImageOnlyCheckpointLoader": {"ckpt_name": "checkpoints"},
+    "UNETLoader": {"unet_name": "diffusion_models"},
+    "CLIPLoader": {"clip_name": "text_encoders"},
+    "DualCLIPLoader": {"clip_name1": "text_encoders", "clip_name2": "text_encoders"},
+    "TripleCLIPLoader": {"clip_name1": "text_encoders", "clip_name2": "text_encoders", "clip_name3": "text_encoders"},
+    "QuadrupleCLIPLoader": {"clip_name1": "text_encoders", "clip_name2": "text_encoders", "clip_name3": "text_encoders", "clip_name4": "text_encoders"},
+    "VAELoader": {"vae_name": "vae"},
+    "LoraLoader": {"lora_name": "loras"},
+    "LoraLoaderModelOnly": {"lora_name": "loras"},
+    "ControlNetLoader": {"control_net_name": "controlnet"},
+    "DiffControlNetLoader": {"control_net_name": "controlnet"},
+    "CLIPVisionLoader": {"clip_name": "clip_vision"},
+    "StyleModelLoader": {"style_model_name": "style_models"},
+    "GLIGENLoader": {"gligen_name": "gligen"},
+    "UpscaleModelLoader": {"model_name": "upscale_models"},
+}
+
+ENABLED = not args.disable_model_prefetch
+QUEUE_ITEMS = 2  # Queued prompts to prefetch for after the running one
+READ_SIZE = 16 * 1024 * 1024
+RECENT_TTL = 600.0  # Seconds a prefetched file is assumed to stay in the page cache
+MAX_RECENT = 256
+
+
+def prompt_files(prompt, node_ids=None):
+    """Full paths of the files read by the loader nodes of a prompt, in node order."""
+    files = []
+    for node_id, node in prompt.items():
+        if node_ids is not None and node_id not in node_ids:
+            continue
+        inputs = LOADER_INPUTS.get(node.get("class_type"))
+        if inputs is None:
+            continue
+        for name, folder_name in inputs.items():
+            value = node.get("inputs", {}).get(name)
+            if not isinstance(value, str):
+                continue  # A link, only known once the graph runs
+            path = folder_paths.get_full_path(folder_name, value)
+            if path is not None and path not in files:
+                files.append(path)
+    return files
+
+
+class Prefetcher:
+    def __init__(self, ram_headroom=comfy.model_pool.RAM_HEADROOM):
+        self.ram_headroom = ram_headroom
+        self.condition = threading.Condition()
+        self.pending = []
+        self.recent = collections.OrderedDict()  # file identity -> time it was read
+        self.thread = None
+        self.plan = 0
+        self.bytes_read = 0
+
+    def prefetch(self, paths):
+        """Replaces the files waiting to be read, the file being read is finished first."""
+        with self.condition:
+            self.pending = list(paths)
+            self.plan += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="model-prefetch", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def _run(self):
+        plan = None
+        budget = 0
+        while True:
+            with self.condition:
+                while len(self.pending) == 0:
+                    self.condition.wait()
+                if plan != self.plan:
+                    plan = self.plan
+                    budget = psutil.virtual_memory().available - self.ram_headroom * (1024 ** 3)
+                path = self.pending.pop(0)
+            try:
+                budget -= self._prefetch_file(path, budget)
+            except OSError as e:
+                logging.debug("Could not prefetch {}: {}".format(path, e))
+
+    def _prefetch_file(self, path, budget):
+        identity = comfy.model_pool.file_identity(path)
+        now = time.monotonic()
+        if now - self.recent.get(identity, -RECENT_TTL) < RECENT_TTL:
+            return 0
+        if comfy.model_pool.model_pool.holds_file(identity):
+            return 0
+        size = identity[1]
+        if size > budget:
+            return 0
+
+        start = time.perf_counter()
+        with open(path, "rb", buffering=0) as f:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            buffer = bytearray(READ_SIZE)
+            while (n := f.readinto(buffer)) > 0:
+                self.bytes_read += n
+        self.recent[identity] = time.monotonic()
+        self.recent.move_to_end(identity)
+        while len(self.recent) > MAX_RECENT:
+            self.recent.popitem(last=False)
+        logging.debug("Prefetched {} ({:.0f} MB) in {:.2f} seconds".format(path, size / (1024 * 1024), time.perf_counter() - start))
+        return size
+
+
+prefetcher = Prefetcher(comfy.model_pool.model_pool.ram_headroom)
+
+
+def prefetch_prompts(prompt, cached_node_ids, upcoming_prompts):
+    """Prefetches the files of the loaders of prompt that aren't cached, then those of the upcoming prompts."""
+    skip = set(prompt_files(prompt, set(cached_node_ids)))
+    files = [p for p in prompt_files(prompt) if p not in skip]
+    for other in upcoming_prompts:
+        files += [p for p in prompt_files(other) if p not in skip and p not in files]
+    if len(files) > 0:
+        prefetcher.prefetch(files)
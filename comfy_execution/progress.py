@@ -11,6 +11,8 @@ if TYPE_CHECKING:
     from comfy_execution.graph import DynamicPrompt
 from protocol import BinaryEventTypes
 from comfy_api import feature_flags
+from comfy_execution.utils import get_executing_context
+import threading
 
 PreviewImageTuple = Tuple[str, Image.Image, Optional[int]]
 
@@ -245,6 +247,10 @@ class ProgressRegistry:
         self.dynprompt = dynprompt
         self.nodes: Dict[str, NodeProgressState] = {}
         self.handlers: Dict[str, ProgressHandler] = {}
+        # Number of nodes currently in the Running state and the highest it reached,
+        # which shows how much async and thread safe nodes overlapped.
+        self.concurrency = 0
+        self.max_concurrency = 0
 
     def register_handler(self, handler: ProgressHandler) -> None:
         """Register a progress handler"""
@@ -278,6 +284,9 @@ class ProgressRegistry:
     def start_progress(self, node_id: str) -> None:
         """Start progress tracking for a node"""
         entry = self.ensure_entry(node_id)
+        if entry["state"] != NodeState.Running:
+            self.concurrency += 1
+            self.max_concurrency = max(self.max_concurrency, self.concurrency)
         entry["state"] = NodeState.Running
         entry["value"] = 0.0
         entry["max"] = 1.0
@@ -292,6 +301,9 @@ class ProgressRegistry:
     ) -> None:
         """Update progress for a node"""
         entry = self.ensure_entry(node_id)
+        if entry["state"] != NodeState.Running:
+            self.concurrency += 1
+            self.max_concurrency = max(self.max_concurrency, self.concurrency)
         entry["state"] = NodeState.Running
         entry["value"] = value
         entry["max"] = max_value
@@ -306,6 +318,8 @@ class ProgressRegistry:
     def finish_progress(self, node_id: str) -> None:
         """Finish progress tracking for a node"""
         entry = self.ensure_entry(node_id)
+        if entry["state"] == NodeState.Running:
+            self.concurrency -= 1
         entry["state"] = NodeState.Finished
         entry["value"] = entry["max"]
 
@@ -322,15 +336,28 @@ class ProgressRegistry:
 # Global registry instance
 global_progress_registry: ProgressRegistry | None = None
 
+# Registries of the prompts currently running, one per prompt worker thread, so several
+# workers can report progress at once. Looked up by the executing context's prompt_id first
+# so nodes running on helper threads still report to the right prompt.
+running_progress_registries: Dict[str, ProgressRegistry] = {}
+thread_progress_registry = threading.local()
+
 def reset_progress_state(prompt_id: str, dynprompt: "DynamicPrompt") -> None:
     global global_progress_registry
 
     # Reset existing handlers if registry exists
-    if global_progress_registry is not None:
-        global_progress_registry.reset_handlers()
+    previous = getattr(thread_progress_registry, "registry", None)
+    if previous is None and len(running_progress_registries) == 0:
+        previous = global_progress_registry
+    if previous is not None:
+        previous.reset_handlers()
+        if running_progress_registries.get(previous.prompt_id) is previous:
+            del running_progress_registries[previous.prompt_id]
 
     # Create new registry
     global_progress_registry = ProgressRegistry(prompt_id, dynprompt)
+    thread_progress_registry.registry = global_progress_registry
+    running_progress_registries[prompt_id] = global_progress_registry
 
 
 def add_progress_handler(handler: ProgressHandler) -> None:
@@ -341,6 +368,12 @@ def add_progress_handler(handler: ProgressHandler) -> None:
 
 def get_progress_state() -> ProgressRegistry:
     global global_progress_registry
+    context = get_executing_context()
+    if context is not None and context.prompt_id in running_progress_registries:
+        return running_progress_registries[context.prompt_id]
+    registry = getattr(thread_progress_registry, "registry", None)
+    if registry is not None:
+        return registry
     if global_progress_registry is None:
         from comfy_execution.graph import DynamicPrompt
 
@@ -0,0 +1,208 @@
+"""
+Fair-share scheduling for the prompt queue.
+
+Queued prompts are grouped into flows by (priority class, client_id). Flows are served with
+start-time fair queuing: every flow carries a virtual start tag and the flow with the lowest
+tag runs next, after which its tag advances by 1 / weight of its priority class. A client
+that queues hundreds of prompts only advances its own tag, so prompts from other clients
+interleave with it instead of waiting behind the whole batch, and a "high" flow gets served
+about twice as often as a "normal" one when both are backlogged.
+
+Within a flow prompts keep running in queue number order. Prompts queued with a negative
+number (``front`` on ``POST /prompt``) bypass fair sharing and run before everything else,
+as they did with the single heap.
+"""
+
+import heapq
+import itertools
+from typing import Optional
+
+# Relative share of the workers each priority class gets while several are backlogged.
+PRIORITY_CLASSES = {
+    "high": 4.0,
+    "normal": 2.0,
+    "low": 1.0,
+}
+DEFAULT_PRIORITY_CLASS = "normal"
+
+# Idle flows remember their finish tag so a client can't regain a head start by letting its
+# flow drain and refilling it; once there are this many they are pruned.
+MAX_IDLE_FLOWS = 1024
+
+
+def get_priority_class(item) -> str:
+    priority_class = item[3].get("priority", DEFAULT_PRIORITY_CLASS)
+    if not isinstance(priority_class, str) or priority_class not in PRIORITY_CLASSES:
+        return DEFAULT_PRIORITY_CLASS
+    return priority_class
+
+
+def get_flow_key(item) -> tuple:
+    return (get_priority_class(item), item[3].get("client_id"))
+
+
+class _Flow:
+    __slots__ = ("weight", "heap", "size", "start", "finish")
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.heap = []  # (number, seq) of queued items, may contain removed seqs
+        self.size = 0
+        self.start: Optional[float] = None  # virtual start tag while backlogged
+        self.finish = 0.0
+
+
+class FairShareQueue:
+    """
+    Priority queue of prompt queue items with weighted fair sharing between flows.
+    Not thread safe; PromptQueue serializes access with its mutex.
+    """
+
+    def __init__(self):
+        self.flows: dict[tuple, _Flow] = {}
+        self.ready = []  # (start, number, seq, flow_key), may contain stale entries
+        self.front = []  # (number, seq) of items queued to the front
+        self.entries = {}  # seq -> (item, flow_key or None for front items)
+        self.ids = {}  # prompt_id -> seq
+        self.virtual_time = 0.0
+        self.counter = itertools.count()
+        self.ordered_cache = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def items(self):
+        return [item for item, _ in self.entries.values()]
+
+    def put(self, item):
+        number = item[0]
+        key = None
+        if number >= 0:
+            key = get_flow_key(item)
+            hash(key)  # An unhashable client_id raises here, before anything is queued.
+        seq = next(self.counter)
+        self.ordered_cache = None
+        self.ids[item[1]] = seq
+        self.entries[seq] = (item, key)
+        if key is None:
+            heapq.heappush(self.front, (number, seq))
+            return
+
+        flow = self.flows.get(key)
+        if flow is None:
+            if len(self.flows) > MAX_IDLE_FLOWS:
+                self._prune_idle_flows()
+            flow = self.flows[key] = _Flow(PRIORITY_CLASSES[key[0]])
+        heapq.heappush(flow.heap, (number, seq))
+        flow.size += 1
+        if flow.start is None:
+            flow.start = max(self.virtual_time, flow.finish)
+            heapq.heappush(self.ready, (flow.start, number, seq, key))
+        elif flow.heap[0][1] == seq:
+            # New head of an already backlogged flow; the old ready entry goes stale.
+            heapq.heappush(self.ready, (flow.start, number, seq, key))
+
+    def pop(self):
+        """Removes and returns the next item to run, or None if the queue is empty."""
+        while self.front:
+            _, seq = heapq.heappop(self.front)
+            if seq in self.entries:
+                return self._take(seq)
+
+        while self.ready:
+            start, number, seq, key = heapq.heappop(self.ready)
+            flow = self.flows.get(key)
+            if flow is None or flow.start != start:
+                continue
+            self._drop_removed(flow)
+            head = flow.heap[0]
+            if head != (number, seq):
+                heapq.heappush(self.ready, (start, head[0], head[1], key))
+                continue
+
+            heapq.heappop(flow.heap)
+            flow.size -= 1
+            self.virtual_time = start
+            flow.finish = start + 1.0 / flow.weight
+            if flow.size > 0:
+                flow.start = flow.finish
+                self._drop_removed(flow)
+                heapq.heappush(self.ready, (flow.start, flow.heap[0][0], flow.heap[0][1], key))
+            else:
+                flow.start = None
+            return self._take(seq)
+        return None
+
+    def remove(self, prompt_id) -> bool:
+        """Removes the queued item with prompt_id without rebuilding any heap."""
+        seq = self.ids.get(prompt_id)
+        if seq is None:
+            return False
+        item, key = self.entries[seq]
+        self._take(seq)
+        self.ordered_cache = None
+        if key is not None:
+            flow = self.flows[key]
+            flow.size -= 1
+            if flow.size == 0:
+                flow.heap.clear()
+                flow.start = None
+            elif len(flow.heap) > 2 * flow.size + 64:
+                flow.heap = [x for x in flow.heap if x[1] in self.entries]
+                heapq.heapify(flow.heap)
+        return True
+
+    def clear(self):
+        self.flows.clear()
+        self.ready.clear()
+        self.front.clear()
+        self.entries.clear()
+        self.ids.clear()
+        self.virtual_time = 0.0
+        self.ordered_cache = None
+
+    def ordered(self) -> tuple:
+        """
+        Returns the queued items in the order they are expected to run if nothing else is
+        queued. The result is cached until the queue changes.
+        """
+        if self.ordered_cache is not None:
+            return self.ordered_cache
+
+        out = [self.entries[seq][0] for _, seq in sorted(self.front) if seq in self.entries]
+        pending = []
+        for key, flow in self.flows.items():
+            if flow.size == 0:
+                continue
+            heads = sorted(x for x in flow.heap if x[1] in self.entries)
+            pending.append((flow.start, heads[0][0], heads[0][1], key, 0, heads))
+        heapq.heapify(pending)
+        while pending:
+            start, _, seq, key, index, heads = heapq.heappop(pending)
+            out.append(self.entries[seq][0])
+            index += 1
+            if index < len(heads):
+                start += 1.0 / self.flows[key].weight
+                heapq.heappush(pending, (start, heads[index][0], heads[index][1], key, index, heads))
+
+        self.ordered_cache = tuple(out)
+        return self.ordered_cache
+
+    def _take(self, seq):
+        item, _ = self.entries.pop(seq)
+        if self.ordered_cache and self.ordered_cache[0] is item:
+            # Taking the next item leaves the estimated order of the others unchanged.
+            self.ordered_cache = self.ordered_cache[1:]
+        else:
+            self.ordered_cache = None
+        if self.ids.get(item[1]) == seq:
+            del self.ids[item[1]]
+        return item
+
+    def _drop_removed(self, flow: _Flow):
+        while flow.heap[0][1] not in self.entries:
+            heapq.heappop(flow.heap)
+
+    def _prune_idle_flows(self):
+        for key in [k for k, f in self.flows.items() if f.size == 0 and f.finish <= self.virtual_time]:
+            del self.flows[key]
@@ -1,4 +1,5 @@
 import contextvars
+import copy
 from typing import Optional, NamedTuple
 
 class ExecutionContext(NamedTuple):
@@ -44,3 +45,75 @@ class CurrentNodeContext:
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.token is not None:
             current_executing_context.reset(self.token)
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError(f"{type(self).__name__} is read-only, copy it before modifying")
+
+
+class FrozenDict(dict):
+    """
+    A dict that can't be modified. Queued prompts are frozen so every snapshot of the queue,
+    the running prompts and the history can share them instead of deep copying.
+    Copies made with .copy(), dict(), copy.copy() or copy.deepcopy() are regular dicts, so
+    nodes can still copy the hidden PROMPT or EXTRA_PNGINFO and edit the copy.
+    """
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __deepcopy__(self, memo):
+        return {copy.deepcopy(k, memo): copy.deepcopy(v, memo) for k, v in self.items()}
+
+    def __copy__(self):
+        return dict(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    """A list that can't be modified, see FrozenDict."""
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = clear = extend = insert = pop = remove = reverse = sort = _read_only
+
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(v, memo) for v in self]
+
+    def __copy__(self):
+        return list(self)
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+def copy_unfrozen(obj):
+    """Deep copies obj like copy.deepcopy() but shares its frozen parts instead of copying them."""
+    if isinstance(obj, (FrozenDict, FrozenList)):
+        return obj
+    if isinstance(obj, dict):
+        return {k: copy_unfrozen(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [copy_unfrozen(v) for v in obj]
+    if isinstance(obj, tuple):
+        return tuple(copy_unfrozen(v) for v in obj)
+    return copy.deepcopy(obj)
+
+
+def unfreeze(obj):
+    """Returns a deep copy of JSON-like data where frozen dicts and lists are regular ones again."""
+    if isinstance(obj, dict):
+        return {k: unfreeze(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [unfreeze(v) for v in obj]
+    return obj
+
+
+def freeze(obj):
+    """Returns a deeply read-only version of JSON-like data made of dicts and lists."""
+    if isinstance(obj, (FrozenDict, FrozenList)):
+        return obj
+    if isinstance(obj, dict):
+        return FrozenDict((k, freeze(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return FrozenList(freeze(v) for v in obj)
+    return obj
@@ -1293,12 +1293,8 @@ class MakeTrainingDataset(io.ComfyNode):
         # Encode texts with CLIP
         logging.info(f"Encoding {len(texts)} texts with CLIP...")
         conditioning_list = []  # list[list[cond]]
-        for text in texts:
-            if text == "":
-                cond = clip.encode_from_tokens_scheduled(clip.tokenize(""))
-            else:
-                tokens = clip.tokenize(text)
-                cond = clip.encode_from_tokens_scheduled(tokens)
+        for tokens in clip.tokenize_batch(texts):
+            cond = clip.encode_from_tokens_scheduled(tokens)
             conditioning_list.append(cond)
 
         logging.info(
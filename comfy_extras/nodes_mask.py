@@ -155,6 +155,7 @@ class ImageColorToMask(IO.ComfyNode):
                 IO.Int.Input("color", default=0, min=0, max=0xFFFFFF, step=1, display_mode=IO.NumberDisplay.number),
             ],
             outputs=[IO.Mask.Output()],
+            thread_safe=True,
         )
 
     @classmethod
@@ -296,6 +297,7 @@ class FeatherMask(IO.ComfyNode):
                 IO.Int.Input("bottom", default=0, min=0, max=nodes.MAX_RESOLUTION, step=1),
             ],
             outputs=[IO.Mask.Output()],
+            thread_safe=True,
         )
 
     @classmethod
@@ -341,6 +343,7 @@ class GrowMask(IO.ComfyNode):
                 IO.Boolean.Input("tapered_corners", default=True),
             ],
             outputs=[IO.Mask.Output()],
+            thread_safe=True,
         )
 
     @classmethod
@@ -76,6 +76,8 @@ class ImageUpscaleWithModel(io.ComfyNode):
 
         tile = 512
         overlap = 32
+        tile_memory = (tile * tile * 3) * image.element_size() * max(upscale_model.scale, 1.0) * 384.0
+        max_batch = max(1, min(8, int(model_management.get_free_memory(device) / tile_memory)))
 
         oom = True
         try:
@@ -83,10 +85,11 @@ class ImageUpscaleWithModel(io.ComfyNode):
                 try:
                     steps = in_img.shape[0] * comfy.utils.get_tiled_scale_steps(in_img.shape[3], in_img.shape[2], tile_x=tile, tile_y=tile, overlap=overlap)
                     pbar = comfy.utils.ProgressBar(steps)
-                    s = comfy.utils.tiled_scale(in_img, lambda a: upscale_model(a), tile_x=tile, tile_y=tile, overlap=overlap, upscale_amount=upscale_model.scale, pbar=pbar)
+                    s = comfy.utils.tiled_scale(in_img, lambda a: upscale_model(a), tile_x=tile, tile_y=tile, overlap=overlap, upscale_amount=upscale_model.scale, pbar=pbar, max_batch=max_batch)
                     oom = False
                 except model_management.OOM_EXCEPTION as e:
                     tile //= 2
+                    max_batch = 1
                     if tile < 128:
                         raise e
         finally:
@@ -135,6 +135,48 @@ class CreateVideo(io.ComfyNode):
             InputImpl.VideoFromComponents(Types.VideoComponents(images=images, audio=audio, frame_rate=Fraction(fps)))
         )
 
+class VAEDecodeToVideo(io.ComfyNode):
+    @classmethod
+    def define_schema(cls):
+        return io.Schema(
+            node_id="VAEDecodeToVideo",
+            display_name="VAE Decode to Video (Streaming)",
+            category="image/video",
+            description="Creates a video that is decoded a few frames at a time while it's saved, so the memory used doesn't grow with the length of the video.",
+            inputs=[
+                io.Latent.Input("samples"),
+                io.Vae.Input("vae"),
+                io.Float.Input("fps", default=30.0, min=1.0, max=120.0, step=1.0),
+                io.Int.Input("temporal_size", default=64, min=8, max=4096, step=4, tooltip="Amount of frames to decode at a time."),
+                io.Int.Input("temporal_overlap", default=8, min=4, max=4096, step=4, tooltip="Only used for video VAEs: Amount of frames to overlap."),
+                io.Int.Input("tile_size", default=0, min=0, max=4096, step=32, tooltip="Decode frames in spatial tiles of this size, 0 decodes whole frames."),
+                io.Int.Input("overlap", default=64, min=0, max=4096, step=32),
+                io.Audio.Input("audio", optional=True, tooltip="The audio to add to the video."),
+            ],
+            outputs=[
+                io.Video.Output(),
+            ],
+        )
+
+    @classmethod
+    def execute(cls, samples, vae, fps: float, temporal_size: int, temporal_overlap: int, tile_size: int, overlap: int, audio: Optional[Input.Audio] = None) -> io.NodeOutput:
+        temporal_compression = vae.temporal_compression_decode()
+        if temporal_compression is not None:
+            if temporal_size < temporal_overlap * 2:
+                temporal_overlap = temporal_overlap // 2
+            temporal_size = max(2, temporal_size // temporal_compression)
+            temporal_overlap = max(1, min(temporal_size // 2, temporal_overlap // temporal_compression))
+        options = {"tile_t": temporal_size, "overlap_t": temporal_overlap}
+        if tile_size > 0:
+            compression = vae.spacial_compression_decode()
+            options.update(tile_x=tile_size // compression, tile_y=tile_size // compression, overlap=min(overlap, tile_size // 4) // compression)
+
+        latent = samples["samples"]
+        images = Types.ImageStream(lambda: vae.decode_stream(latent, **options), vae.decoded_shape(latent))
+        return io.NodeOutput(
+            InputImpl.VideoFromComponents(Types.VideoComponents(images=images, audio=audio, frame_rate=Fraction(fps)))
+        )
+
 class GetVideoComponents(io.ComfyNode):
     @classmethod
     def define_schema(cls):
@@ -205,6 +247,7 @@ class VideoExtension(ComfyExtension):
             SaveWEBM,
             SaveVideo,
             CreateVideo,
+            VAEDecodeToVideo,
             GetVideoComponents,
             LoadVideo,
         ]
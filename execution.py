@@ -1,5 +1,5 @@
+import concurrent.futures
 import copy
-import heapq
 import inspect
 import logging
 import sys
@@ -13,12 +13,14 @@ import asyncio
 import torch
 
 import comfy.model_management
+import comfy.model_pool
 from latent_preview import set_preview_method
 import nodes
 from comfy_execution.caching import (
     BasicCache,
     CacheKeySetID,
     CacheKeySetInputSignature,
+    DiskCache,
     NullCache,
     HierarchicalCache,
     LRUCache,
@@ -33,9 +35,13 @@ from comfy_execution.graph import (
 from comfy_execution.graph_utils import GraphBuilder, is_link
 from comfy_execution.validation import validate_node_input
 from comfy_execution.progress import get_progress_state, reset_progress_state, add_progress_handler, WebUIProgressHandler
-from comfy_execution.utils import CurrentNodeContext
+from comfy_execution.scheduling import FairShareQueue
+from comfy_execution.coalescing import COALESCED_MEMBERS_KEY, get_member_hidden_inputs
+from comfy_execution import prefetch
+from comfy_execution.utils import CurrentNodeContext, freeze
 from comfy_api.internal import _ComfyNodeInternal, _NodeOutputInternal, first_real_override, is_class, make_locked_method_func
 from comfy_api.latest import io, _io
+from app.history.store import MemoryHistoryStore
 
 
 class ExecutionResult(Enum):
@@ -78,15 +84,14 @@ class IsChangedCache:
 
         # Intentionally do not use cached outputs here. We only want constants in IS_CHANGED
         input_data_all, _, v3_data = get_input_data(node["inputs"], class_def, node_id, None)
+        # Queued prompts are read-only, so the result is only kept in this cache.
         try:
             is_changed = await _async_map_node_over_list(self.prompt_id, node_id, class_def, input_data_all, is_changed_name, v3_data=v3_data)
             is_changed = await resolve_map_node_over_list_results(is_changed)
-            node["is_changed"] = [None if isinstance(x, ExecutionBlocker) else x for x in is_changed]
+            self.is_changed[node_id] = [None if isinstance(x, ExecutionBlocker) else x for x in is_changed]
         except Exception as e:
             logging.warning("WARNING: {}".format(e))
-            node["is_changed"] = float("NaN")
-        finally:
-            self.is_changed[node_id] = node["is_changed"]
+            self.is_changed[node_id] = float("NaN")
         return self.is_changed[node_id]
 
 
@@ -118,6 +123,10 @@ class CacheSet:
         else:
             self.init_classic_cache()
 
+        if cache_type != CacheType.NONE and cache_args and cache_args.get("disk"):
+            self.init_disk_cache(cache_args["disk"], cache_args.get("disk_size", 16.0))
+            logging.info("Using disk cache.")
+
         self.all = [self.outputs, self.objects]
 
     # Performs like the old cache -- dump data ASAP
@@ -137,6 +146,10 @@ class CacheSet:
         self.outputs = NullCache()
         self.objects = NullCache()
 
+    # Spills outputs to disk so they survive RAM evictions and restarts
+    def init_disk_cache(self, directory, max_size_gb):
+        self.outputs = DiskCache(self.outputs, directory, int(max_size_gb * (1024**3)), entry_type=CacheEntry)
+
     def recursive_debug_dump(self):
         result = {
             "outputs": self.outputs.recursive_debug_dump(),
@@ -178,14 +191,21 @@ def get_input_data(inputs, class_def, unique_id, execution_list=None, dynprompt=
         elif input_category is not None:
             input_data_all[x] = [input_data]
 
+    if COALESCED_MEMBERS_KEY in extra_data:
+        # Nodes of a coalesced prompt save the metadata of the prompt they were copied from.
+        hidden_prompt, hidden_extra_pnginfo = get_member_hidden_inputs(unique_id, dynprompt, extra_data)
+    else:
+        hidden_prompt = dynprompt.get_original_prompt() if dynprompt is not None else {}
+        hidden_extra_pnginfo = extra_data.get('extra_pnginfo', None)
+
     if is_v3:
         if hidden is not None:
             if io.Hidden.prompt.name in hidden:
-                hidden_inputs_v3[io.Hidden.prompt] = dynprompt.get_original_prompt() if dynprompt is not None else {}
+                hidden_inputs_v3[io.Hidden.prompt] = hidden_prompt
             if io.Hidden.dynprompt.name in hidden:
                 hidden_inputs_v3[io.Hidden.dynprompt] = dynprompt
             if io.Hidden.extra_pnginfo.name in hidden:
-                hidden_inputs_v3[io.Hidden.extra_pnginfo] = extra_data.get('extra_pnginfo', None)
+                hidden_inputs_v3[io.Hidden.extra_pnginfo] = hidden_extra_pnginfo
             if io.Hidden.unique_id.name in hidden:
                 hidden_inputs_v3[io.Hidden.unique_id] = unique_id
             if io.Hidden.auth_token_comfy_org.name in hidden:
@@ -197,11 +217,11 @@ def get_input_data(inputs, class_def, unique_id, execution_list=None, dynprompt=
             h = valid_inputs["hidden"]
             for x in h:
                 if h[x] == "PROMPT":
-                    input_data_all[x] = [dynprompt.get_original_prompt() if dynprompt is not None else {}]
+                    input_data_all[x] = [hidden_prompt]
                 if h[x] == "DYNPROMPT":
                     input_data_all[x] = [dynprompt]
                 if h[x] == "EXTRA_PNGINFO":
-                    input_data_all[x] = [extra_data.get('extra_pnginfo', None)]
+                    input_data_all[x] = [hidden_extra_pnginfo]
                 if h[x] == "UNIQUE_ID":
                     input_data_all[x] = [unique_id]
                 if h[x] == "AUTH_TOKEN_COMFY_ORG":
@@ -225,7 +245,7 @@ async def resolve_map_node_over_list_results(results):
                 raise exc
         return [x.result() if isinstance(x, asyncio.Task) else x for x in results]
 
-async def _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, func, allow_interrupt=False, execution_block_cb=None, pre_execute_cb=None, v3_data=None):
+async def _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, func, allow_interrupt=False, execution_block_cb=None, pre_execute_cb=None, v3_data=None, thread_pool=None):
     # check if node wants the lists
     input_is_list = getattr(obj, "INPUT_IS_LIST", False)
 
@@ -286,6 +306,15 @@ async def _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, f
                     results.append(result)
                 else:
                     results.append(task)
+            elif thread_pool is not None:
+                def thread_wrapper(f, prompt_id, unique_id, list_index, args):
+                    # inference_mode is thread local so it has to be entered again on the worker
+                    with torch.inference_mode(), CurrentNodeContext(prompt_id, unique_id, list_index):
+                        return f(**args)
+                async def thread_task(f, prompt_id, unique_id, list_index, args):
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(thread_pool, thread_wrapper, f, prompt_id, unique_id, list_index, args)
+                results.append(asyncio.create_task(thread_task(f, prompt_id, unique_id, index, args=inputs)))
             else:
                 with CurrentNodeContext(prompt_id, unique_id, index):
                     result = f(**inputs)
@@ -325,8 +354,8 @@ def merge_result_data(results, obj):
             output.append([o[i] for o in results])
     return output
 
-async def get_output_data(prompt_id, unique_id, obj, input_data_all, execution_block_cb=None, pre_execute_cb=None, v3_data=None):
-    return_values = await _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, obj.FUNCTION, allow_interrupt=True, execution_block_cb=execution_block_cb, pre_execute_cb=pre_execute_cb, v3_data=v3_data)
+async def get_output_data(prompt_id, unique_id, obj, input_data_all, execution_block_cb=None, pre_execute_cb=None, v3_data=None, thread_pool=None):
+    return_values = await _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, obj.FUNCTION, allow_interrupt=True, execution_block_cb=execution_block_cb, pre_execute_cb=pre_execute_cb, v3_data=v3_data, thread_pool=thread_pool)
     has_pending_task = any(isinstance(r, asyncio.Task) and not r.done() for r in return_values)
     if has_pending_task:
         return return_values, {}, False, has_pending_task
@@ -406,7 +435,10 @@ def format_value(x):
     else:
         return str(x)
 
-async def execute(server, dynprompt, caches, current_item, extra_data, executed, prompt_id, execution_list, pending_subgraph_results, pending_async_nodes, ui_outputs):
+def is_thread_safe(class_def):
+    return getattr(class_def, "THREAD_SAFE", False) == True
+
+async def execute(server, dynprompt, caches, current_item, extra_data, executed, prompt_id, execution_list, pending_subgraph_results, pending_async_nodes, ui_outputs, thread_pool=None):
     unique_id = current_item
     real_node_id = dynprompt.get_real_node_id(unique_id)
     display_node_id = dynprompt.get_display_node_id(unique_id)
@@ -515,7 +547,11 @@ async def execute(server, dynprompt, caches, current_item, extra_data, executed,
             def pre_execute_cb(call_index):
                 # TODO - How to handle this with async functions without contextvars (which requires Python 3.12)?
                 GraphBuilder.set_default_prefix(unique_id, call_index, 0)
-            output_data, output_ui, has_subgraph, has_pending_tasks = await get_output_data(prompt_id, unique_id, obj, input_data_all, execution_block_cb=execution_block_cb, pre_execute_cb=pre_execute_cb, v3_data=v3_data)
+            # Thread safe nodes go through the same pending_async_nodes path as async ones,
+            # so the executor keeps running other ready nodes while they are on the pool.
+            if thread_pool is not None and not is_thread_safe(class_def):
+                thread_pool = None
+            output_data, output_ui, has_subgraph, has_pending_tasks = await get_output_data(prompt_id, unique_id, obj, input_data_all, execution_block_cb=execution_block_cb, pre_execute_cb=pre_execute_cb, v3_data=v3_data, thread_pool=thread_pool)
             if has_pending_tasks:
                 pending_async_nodes[unique_id] = output_data
                 unblock = execution_list.add_external_block(unique_id)
@@ -621,10 +657,14 @@ async def execute(server, dynprompt, caches, current_item, extra_data, executed,
     return (ExecutionResult.SUCCESS, None, None)
 
 class PromptExecutor:
-    def __init__(self, server, cache_type=False, cache_args=None):
+    def __init__(self, server, cache_type=False, cache_args=None, parallel_nodes=0):
         self.cache_args = cache_args
         self.cache_type = cache_type
         self.server = server
+        self.thread_pool = None
+        if parallel_nodes > 0:
+            self.thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=parallel_nodes, thread_name_prefix="comfy_node")
+            logging.info("Running thread safe nodes on {} worker threads.".format(parallel_nodes))
         self.reset()
 
     def reset(self):
@@ -699,6 +739,11 @@ class PromptExecutor:
                 if self.caches.outputs.get(node_id) is not None:
                     cached_nodes.append(node_id)
 
+            if prefetch.ENABLED:
+                queue = getattr(self.server, "prompt_queue", None)
+                upcoming = [item[2] for item in queue.peek(prefetch.QUEUE_ITEMS)] if queue is not None else []
+                prefetch.prefetch_prompts(prompt, cached_nodes, upcoming)
+
             comfy.model_management.cleanup_models_gc()
             self.add_message("execution_cached",
                           { "nodes": cached_nodes, "prompt_id": prompt_id},
@@ -707,7 +752,7 @@ class PromptExecutor:
             pending_async_nodes = {} # TODO - Unify this with pending_subgraph_results
             ui_node_outputs = {}
             executed = set()
-            execution_list = ExecutionList(dynamic_prompt, self.caches.outputs)
+            execution_list = ExecutionList(dynamic_prompt, self.caches.outputs, prefer_thread_safe=self.thread_pool is not None)
             current_outputs = self.caches.outputs.all_node_ids()
             for node_id in list(execute_outputs):
                 execution_list.add_node(node_id)
@@ -719,7 +764,7 @@ class PromptExecutor:
                     break
 
                 assert node_id is not None, "Node ID should not be None at this point"
-                result, error, ex = await execute(self.server, dynamic_prompt, self.caches, node_id, extra_data, executed, prompt_id, execution_list, pending_subgraph_results, pending_async_nodes, ui_node_outputs)
+                result, error, ex = await execute(self.server, dynamic_prompt, self.caches, node_id, extra_data, executed, prompt_id, execution_list, pending_subgraph_results, pending_async_nodes, ui_node_outputs, thread_pool=self.thread_pool)
                 self.success = result != ExecutionResult.FAILURE
                 if result == ExecutionResult.FAILURE:
                     self.handle_execution_error(prompt_id, dynamic_prompt.original_prompt, current_outputs, executed, error, ex)
@@ -729,10 +774,15 @@ class PromptExecutor:
                 else: # result == ExecutionResult.SUCCESS:
                     execution_list.complete_node_execution()
                 self.caches.outputs.poll(ram_headroom=self.cache_args["ram"])
+                comfy.model_pool.model_pool.trim()
             else:
                 # Only execute when the while-loop ends without break
                 self.add_message("execution_success", { "prompt_id": prompt_id }, broadcast=False)
 
+            max_concurrency = get_progress_state().max_concurrency
+            if max_concurrency > 1:
+                logging.info("Up to {} nodes were running concurrently.".format(max_concurrency))
+
             ui_outputs = {}
             meta_outputs = {}
             for node_id, ui_info in ui_node_outputs.items():
@@ -1107,36 +1157,93 @@ async def validate_prompt(prompt_id, prompt, partial_execution_list: Union[list[
 
 MAXIMUM_HISTORY_SIZE = 10000
 
+def freeze_queue_item(item):
+    number, prompt_id, prompt, extra_data, outputs_to_execute, *rest = item
+    return (number, prompt_id, freeze(prompt), freeze(extra_data), freeze(outputs_to_execute), *[freeze(x) for x in rest])
+
+
 class PromptQueue:
     def __init__(self, server):
         self.server = server
         self.mutex = threading.RLock()
         self.not_empty = threading.Condition(self.mutex)
         self.task_counter = 0
-        self.queue = []
+        self.scheduler = FairShareQueue()
+        self.coalesce_keys = {}
+        self.interrupted_prompts = set()
         self.currently_running = {}
-        self.history = {}
+        self.currently_running_threads = {}
+        self.history_store = MemoryHistoryStore(max_items=MAXIMUM_HISTORY_SIZE)
         self.flags = {}
+        self.worker_flags = {}
+
+    def register_worker(self, worker_id):
+        """Gives worker_id its own copy of the flags: set_flag() then applies to every registered worker."""
+        with self.mutex:
+            self.worker_flags[worker_id] = {}
 
     def put(self, item):
+        # Queue items are frozen once so the queue, running and history snapshots can share
+        # them instead of deep copying prompts under the mutex.
+        item = freeze_queue_item(item)
         with self.mutex:
-            heapq.heappush(self.queue, item)
+            self.scheduler.put(item)
             self.server.queue_updated()
             self.not_empty.notify()
 
+    def peek(self, count):
+        """The next count queued items in their estimated execution order."""
+        with self.mutex:
+            return list(self.scheduler.ordered()[:count])
+
     def get(self, timeout=None):
         with self.not_empty:
-            while len(self.queue) == 0:
+            while len(self.scheduler) == 0:
                 self.not_empty.wait(timeout=timeout)
-                if timeout is not None and len(self.queue) == 0:
+                if timeout is not None and len(self.scheduler) == 0:
                     return None
-            item = heapq.heappop(self.queue)
+            item = self.scheduler.pop()
             i = self.task_counter
-            self.currently_running[i] = copy.deepcopy(item)
+            self.currently_running[i] = item
+            self.currently_running_threads[i] = threading.get_ident()
             self.task_counter += 1
             self.server.queue_updated()
             return (item, i)
 
+    def get_coalesced(self, item, max_items, key_function):
+        """
+        Takes up to max_items more queued items with the same key_function(item) as item, in
+        their estimated execution order, and marks them as running like get() does.
+        """
+        key = key_function(item)
+        if key is None or max_items <= 0:
+            return []
+        with self.mutex:
+            taken = []
+            for other in self.scheduler.ordered():
+                if len(taken) >= max_items:
+                    break
+                memo = self.coalesce_keys.get(other[1])
+                if memo is None or memo[0] is not other:  # Queue items are frozen, a new item means the prompt id was reused.
+                    memo = self.coalesce_keys[other[1]] = (other, key_function(other))
+                if memo[1] != key:
+                    continue
+                if other[2] == item[2] or any(other[2] == t[2] for t, _ in taken):
+                    continue  # Identical prompts are served by the cache instead.
+                i = self.task_counter
+                self.currently_running[i] = other
+                self.currently_running_threads[i] = threading.get_ident()
+                self.task_counter += 1
+                taken.append((other, i))
+            for other, _ in taken:
+                self.scheduler.remove(other[1])
+            if len(self.coalesce_keys) > 2 * len(self.scheduler) + 64:
+                queued = set(x[1] for x in self.scheduler.items())
+                self.coalesce_keys = {k: v for k, v in self.coalesce_keys.items() if k in queued}
+            if len(taken) > 0:
+                self.server.queue_updated()
+            return taken
+
     class ExecutionStatus(NamedTuple):
         status_str: Literal['success', 'error']
         completed: bool
@@ -1145,104 +1252,167 @@ class PromptQueue:
     def task_done(self, item_id, history_result,
                   status: Optional['PromptQueue.ExecutionStatus'], process_item=None):
         with self.mutex:
-            prompt = self.currently_running.pop(item_id)
-            if len(self.history) > MAXIMUM_HISTORY_SIZE:
-                self.history.pop(next(iter(self.history)))
+            prompt = self.currently_running[item_id]
+            store = self.history_store
 
-            status_dict: Optional[dict] = None
-            if status is not None:
-                status_dict = copy.deepcopy(status._asdict())
+        status_dict: Optional[dict] = None
+        if status is not None:
+            status_dict = copy.deepcopy(status._asdict())
 
-            if process_item is not None:
-                prompt = process_item(prompt)
+        if process_item is not None:
+            prompt = process_item(prompt)
 
-            self.history[prompt[1]] = {
-                "prompt": prompt,
-                "outputs": {},
-                'status': status_dict,
-            }
-            self.history[prompt[1]].update(history_result)
+        entry = {
+            "prompt": prompt,
+            "outputs": {},
+            'status': status_dict,
+        }
+        entry.update(history_result)
+        # Written before the job stops running so it's always either running or in the history,
+        # but outside of the mutex so the queue doesn't wait on the database.
+        try:
+            store.put(prompt[1], entry)
+        except Exception:
+            logging.exception("Could not store the history of prompt {}, keeping the history in memory from now on".format(prompt[1]))
+            with self.mutex:
+                if self.history_store is store:
+                    self.history_store = MemoryHistoryStore(max_items=MAXIMUM_HISTORY_SIZE)
+                self.history_store.put(prompt[1], entry)
+
+        with self.mutex:
+            self.currently_running.pop(item_id)
+            self.currently_running_threads.pop(item_id, None)
+            self.interrupted_prompts.discard(prompt[1])
             self.server.queue_updated()
 
-    # Note: slow
+    def set_history_store(self, store):
+        """Replaces the history store, moving over anything already in the history."""
+        with self.mutex:
+            entries, _ = self.history_store.list()
+            for prompt_id, entry in entries.items():
+                store.put(prompt_id, entry)
+            self.history_store = store
+
+    @property
+    def queue(self):
+        """The queued items in their estimated execution order."""
+        with self.mutex:
+            return list(self.scheduler.ordered())
+
     def get_current_queue(self):
+        """
+        Returns (running, queued), queued is a tuple. Queue items are frozen and the queued tuple is
+        the scheduler's cached order, so they are shared rather than copied.
+        """
         with self.mutex:
-            out = []
-            for x in self.currently_running.values():
-                out += [x]
-            return (out, copy.deepcopy(self.queue))
+            running = list(self.currently_running.values())
+            queued = self.scheduler.ordered()
+        return (running, queued)
 
-    # read-safe as long as queue items are immutable
+    # Kept for compatibility, queue items are always immutable now.
     def get_current_queue_volatile(self):
+        return self.get_current_queue()
+
+    def get_queue_position(self, prompt_id):
+        """Returns the estimated number of queued prompts that will run before prompt_id, or None if it isn't queued."""
+        with self.mutex:
+            for i, item in enumerate(self.scheduler.ordered()):
+                if item[1] == prompt_id:
+                    return i
+            return None
+
+    def get_running_thread(self, prompt_id):
+        """Returns the ident of the worker thread running prompt_id, or None if it isn't running."""
+        with self.mutex:
+            for i, item in self.currently_running.items():
+                if item[1] == prompt_id:
+                    return self.currently_running_threads.get(i)
+            return None
+
+    def interrupt_running(self, prompt_id):
+        """
+        Records that prompt_id was interrupted and returns the ident of the worker thread running
+        it, or None if it isn't running.
+        """
+        with self.mutex:
+            thread_id = self.get_running_thread(prompt_id)
+            if thread_id is not None:
+                self.interrupted_prompts.add(prompt_id)
+            return thread_id
+
+    def take_interrupted(self, prompt_ids):
+        """Returns which of prompt_ids were interrupted with interrupt_running() and forgets them."""
         with self.mutex:
-            running = [x for x in self.currently_running.values()]
-            queued = copy.copy(self.queue)
-            return (running, queued)
+            out = self.interrupted_prompts.intersection(prompt_ids)
+            self.interrupted_prompts -= out
+            return out
 
     def get_tasks_remaining(self):
         with self.mutex:
-            return len(self.queue) + len(self.currently_running)
+            return len(self.scheduler) + len(self.currently_running)
 
     def wipe_queue(self):
         with self.mutex:
-            self.queue = []
+            self.scheduler.clear()
             self.server.queue_updated()
 
     def delete_queue_item(self, function):
         with self.mutex:
-            for x in range(len(self.queue)):
-                if function(self.queue[x]):
-                    if len(self.queue) == 1:
-                        self.wipe_queue()
-                    else:
-                        self.queue.pop(x)
-                        heapq.heapify(self.queue)
-                    self.server.queue_updated()
-                    return True
+            for item in self.scheduler.items():
+                if function(item):
+                    return self.delete_queue_item_by_id(item[1])
         return False
 
-    def get_history(self, prompt_id=None, max_items=None, offset=-1, map_function=None):
+    def delete_queue_item_by_id(self, prompt_id):
         with self.mutex:
-            if prompt_id is None:
-                out = {}
-                i = 0
-                if offset < 0 and max_items is not None:
-                    offset = len(self.history) - max_items
-                for k in self.history:
-                    if i >= offset:
-                        p = self.history[k]
-                        if map_function is not None:
-                            p = map_function(p)
-                        out[k] = p
-                        if max_items is not None and len(out) >= max_items:
-                            break
-                    i += 1
-                return out
-            elif prompt_id in self.history:
-                p = self.history[prompt_id]
-                if map_function is None:
-                    p = copy.deepcopy(p)
-                else:
-                    p = map_function(p)
-                return {prompt_id: p}
-            else:
+            if self.scheduler.remove(prompt_id):
+                self.server.queue_updated()
+                return True
+        return False
+
+    def get_history(self, prompt_id=None, max_items=None, offset=-1, map_function=None):
+        if prompt_id is not None:
+            p = self.history_store.get(prompt_id)
+            if p is None:
                 return {}
+            if map_function is not None:
+                p = map_function(p)
+            return {prompt_id: p}
+        out, _ = self.get_history_page(max_items=max_items, offset=offset, map_function=map_function)
+        return out
+
+    def get_history_page(self, max_items=None, offset=-1, cursor=None, map_function=None):
+        """
+        Returns (history, next_cursor). Without an offset the newest max_items entries before
+        cursor are returned, and next_cursor continues with older ones or is None at the end.
+        """
+        out, next_cursor = self.history_store.list(max_items=max_items, offset=offset, cursor=cursor)
+        if map_function is not None:
+            out = {k: map_function(v) for k, v in out.items()}
+        return out, next_cursor
 
     def wipe_history(self):
-        with self.mutex:
-            self.history = {}
+        self.history_store.clear()
 
     def delete_history_item(self, id_to_delete):
-        with self.mutex:
-            self.history.pop(id_to_delete, None)
+        self.history_store.delete(id_to_delete)
 
     def set_flag(self, name, data):
         with self.mutex:
-            self.flags[name] = data
-            self.not_empty.notify()
+            if len(self.worker_flags) == 0:
+                self.flags[name] = data
+            for flags in self.worker_flags.values():
+                flags[name] = data
+            self.not_empty.notify_all()
 
-    def get_flags(self, reset=True):
+    def get_flags(self, reset=True, worker_id=None):
         with self.mutex:
+            if worker_id in self.worker_flags:
+                ret = self.worker_flags[worker_id]
+                if reset:
+                    self.worker_flags[worker_id] = {}
+                    return ret
+                return ret.copy()
             if reset:
                 ret = self.flags
                 self.flags = {}
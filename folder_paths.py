@@ -2,8 +2,10 @@ from __future__ import annotations
 
 import os
 import time
+import threading
 import mimetypes
 import logging
+from contextvars import ContextVar
 from typing import Literal, List
 from collections.abc import Collection
 
@@ -58,6 +60,8 @@ input_directory = os.path.join(base_path, "input")
 user_directory = os.path.join(base_path, "user")
 
 filename_list_cache: dict[str, tuple[list[str], dict[str, float], float]] = {}
+indexed_filename_list_cache: dict[str, tuple[tuple, tuple[list[str], dict[str, float], float]]] = {}
+filename_index = None  # utils.filename_index.FilenameIndex, created on first use when --filename-index is enabled
 
 class CacheHelper:
     """
@@ -89,6 +93,32 @@ class CacheHelper:
 
 cache_helper = CacheHelper()
 
+# Set while something derived from folder_paths is computed (like node info, see
+# app/node_info_cache.py) to collect the filename lists, folder paths and directories it read.
+# Folder paths and directories only change value when their top level does.
+recorded_dependencies: ContextVar[set[tuple[str, str]] | None] = ContextVar("recorded_dependencies", default=None)
+
+def record_dependency(kind: str, name: str) -> None:
+    recorded = recorded_dependencies.get()
+    if recorded is not None:
+        recorded.add((kind, name))
+
+def dependency_value(dependency: tuple[str, str]):
+    """The current value of a recorded dependency, which changes whenever what was read from it does."""
+    kind, name = dependency
+    if kind == "filenames":
+        if map_legacy(name) not in folder_names_and_paths:
+            return None
+        return tuple(get_filename_list(name))
+    if kind == "folder_paths":
+        if map_legacy(name) not in folder_names_and_paths:
+            return None
+        return tuple((x, dependency_value(("directory", x))) for x in folder_names_and_paths[map_legacy(name)][0])
+    try:
+        return os.stat(name).st_mtime_ns
+    except OSError:
+        return None
+
 extension_mimetypes_cache = {
     "webp" : "image",
     "fbx" : "model",
@@ -119,14 +149,17 @@ def set_input_directory(input_dir: str) -> None:
 
 def get_output_directory() -> str:
     global output_directory
+    record_dependency("directory", output_directory)
     return output_directory
 
 def get_temp_directory() -> str:
     global temp_directory
+    record_dependency("directory", temp_directory)
     return temp_directory
 
 def get_input_directory() -> str:
     global input_directory
+    record_dependency("directory", input_directory)
     return input_directory
 
 def get_user_directory() -> str:
@@ -298,6 +331,7 @@ def add_model_folder_path(folder_name: str, full_folder_path: str, is_default: b
 
 def get_folder_paths(folder_name: str) -> list[str]:
     folder_name = map_legacy(folder_name)
+    record_dependency("folder_paths", folder_name)
     return folder_names_and_paths[folder_name][0][:]
 
 def recursive_search(directory: str, excluded_dir_names: list[str] | None=None) -> tuple[list[str], dict[str, float]]:
@@ -415,9 +449,40 @@ def cached_filename_list_(folder_name: str) -> tuple[list[str], dict[str, float]
 
     return out
 
+def get_filename_index():
+    global filename_index
+    if filename_index is None and args.filename_index != "none":
+        from utils.filename_index import FilenameIndex
+        filename_index = FilenameIndex(args.filename_index)
+    return filename_index
+
+def indexed_filename_list_(folder_name: str) -> tuple[list[str], dict[str, float], float] | None:
+    """Same as get_filename_list_ but reads the live filename index, None if it isn't enabled."""
+    index = get_filename_index()
+    if index is None:
+        return None
+    folder_name = map_legacy(folder_name)
+    folders = folder_names_and_paths[folder_name]
+    listings = [index.get_files(x) for x in folders[0]]
+    key = (tuple(folders[0]), tuple(sorted(folders[1])), tuple(None if x is None else x[0] for x in listings))
+    cached = indexed_filename_list_cache.get(folder_name)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    output_list = set()
+    for listing in listings:
+        if listing is not None:
+            output_list.update(filter_files_extensions(listing[1], folders[1]))
+    out = (sorted(list(output_list)), {}, time.perf_counter())
+    indexed_filename_list_cache[folder_name] = (key, out)
+    return out
+
 def get_filename_list(folder_name: str) -> list[str]:
     folder_name = map_legacy(folder_name)
-    out = cached_filename_list_(folder_name)
+    record_dependency("filenames", folder_name)
+    out = indexed_filename_list_(folder_name)
+    if out is None:
+        out = cached_filename_list_(folder_name)
     if out is None:
         out = get_filename_list_(folder_name)
         global filename_list_cache
@@ -425,16 +490,76 @@ def get_filename_list(folder_name: str) -> list[str]:
     cache_helper.set(folder_name, out)
     return list(out[0])
 
-def get_save_image_path(filename_prefix: str, output_dir: str, image_width=0, image_height=0) -> tuple[str, str, int, str, str]:
-    def map_filename(filename: str) -> tuple[int, str]:
-        prefix_len = len(os.path.basename(filename_prefix))
-        prefix = filename[:prefix_len + 1]
+class SaveCounter:
+    """Where the counter of one output prefix is: the last counter handed out and the file name suffixes seen after it."""
+    def __init__(self, last: int, suffixes: set[str]):
+        self.last = last
+        self.suffixes = suffixes
+
+save_counter_cache: dict[tuple[str, str], SaveCounter] = {}
+save_counter_lock = threading.Lock()
+MAX_SAVE_COUNTER_SUFFIXES = 8
+
+def scan_save_counter(full_output_folder: str, filename: str) -> tuple[int, set[str]]:
+    """Lists the folder, returns the highest counter used by filename and the suffixes that follow the counters."""
+    prefix_len = len(filename)
+    normcase_filename = os.path.normcase(filename)
+    counter = 0
+    suffixes = set()
+    for name in os.listdir(full_output_folder):
+        if name[prefix_len:prefix_len + 1] != "_" or os.path.normcase(name[:prefix_len]) != normcase_filename:
+            continue
+        digits_str = name[prefix_len + 1:].split('_')[0]
         try:
-            digits = int(filename[prefix_len + 1:].split('_')[0])
+            digits = int(digits_str)
         except:
             digits = 0
-        return digits, prefix
+        counter = max(counter, digits)
+        if digits > 0 and len(suffixes) < MAX_SAVE_COUNTER_SUFFIXES:
+            suffixes.add(name[prefix_len + 1 + len(digits_str):])
+    return counter, suffixes
+
+def next_save_counter(full_output_folder: str, filename: str, count: int = 1) -> int:
+    """
+    Reserves count consecutive counters of filename in the folder and returns the first one,
+    without listing the folder on every save. Counters handed out by this process are never handed
+    out again, even before their files are written, so concurrent saves with the same prefix get
+    distinct counters. Callers write "{filename}_{counter:05}_..." for the counters they reserved,
+    so once the files of the last reservation are found on disk, the files after them are probed
+    with the suffixes seen so far. Anything unexpected, like a save still being written, deleted
+    files or another process saving with a new extension, lists the folder, which only ever moves
+    the counter forward.
+    """
+    key = (os.path.normcase(os.path.abspath(full_output_folder)), os.path.normcase(filename))
+
+    def exists(counter: int, suffixes: set[str]) -> bool:
+        return any(os.path.lexists(os.path.join(full_output_folder, f"{filename}_{counter:05}{suffix}")) for suffix in suffixes)
 
+    with save_counter_lock:
+        cached = save_counter_cache.get(key)
+        if cached is not None and exists(cached.last, cached.suffixes):
+            counter = cached.last + 1
+            while exists(counter, cached.suffixes):
+                counter += 1
+        else:
+            try:
+                counter, suffixes = scan_save_counter(full_output_folder, filename)
+            except FileNotFoundError:
+                os.makedirs(full_output_folder, exist_ok=True)
+                counter, suffixes = 0, set()
+            counter += 1
+            if cached is None:
+                cached = SaveCounter(counter, suffixes)
+                save_counter_cache[key] = cached
+            else:
+                counter = max(counter, cached.last + 1)
+                for suffix in suffixes:
+                    if len(cached.suffixes) < MAX_SAVE_COUNTER_SUFFIXES:
+                        cached.suffixes.add(suffix)
+        cached.last = counter + max(count, 1) - 1
+        return counter
+
+def get_save_image_path(filename_prefix: str, output_dir: str, image_width=0, image_height=0, count: int = 1) -> tuple[str, str, int, str, str]:
     def compute_vars(input: str, image_width: int, image_height: int) -> str:
         input = input.replace("%width%", str(image_width))
         input = input.replace("%height%", str(image_height))
@@ -463,13 +588,7 @@ def get_save_image_path(filename_prefix: str, output_dir: str, image_width=0, im
         logging.error(err)
         raise Exception(err)
 
-    try:
-        counter = max(filter(lambda a: os.path.normcase(a[1][:-1]) == os.path.normcase(filename) and a[1][-1] == "_", map(map_filename, os.listdir(full_output_folder))))[0] + 1
-    except ValueError:
-        counter = 1
-    except FileNotFoundError:
-        os.makedirs(full_output_folder, exist_ok=True)
-        counter = 1
+    counter = next_save_counter(full_output_folder, filename, count)
     return full_output_folder, filename, counter, subfolder, filename_prefix
 
 def get_input_subfolders() -> list[str]:
@@ -13,7 +13,7 @@ import utils.extra_config
 import logging
 import sys
 from comfy_execution.progress import get_progress_state
-from comfy_execution.utils import get_executing_context
+from comfy_execution.utils import get_executing_context, unfreeze
 from comfy_api import feature_flags
 
 
@@ -177,9 +177,11 @@ import comfy.utils
 
 import execution
 import server
+from comfy_execution import coalescing
 from protocol import BinaryEventTypes
 import nodes
 import comfy.model_management
+import comfy.model_pool
 import comfyui_version
 import app.logger
 import hook_breaker_ac10a0
@@ -196,8 +198,98 @@ def cuda_malloc_warning():
             logging.warning("\nWARNING: this card most likely does not support cuda-malloc, if you get \"CUDA error\" please run ComfyUI with: --disable-cuda-malloc\n")
 
 
-def prompt_worker(q, server_instance):
+def remove_sensitive(prompt):
+    return prompt[:5] + prompt[6:]
+
+
+def get_execution_extra_data(item):
+    sensitive = item[5]
+    extra_data = unfreeze(item[3])
+    for k in sensitive:
+        extra_data[k] = sensitive[k]
+    return extra_data
+
+
+def execute_prompt(q, server_instance, e, item, item_id):
+    prompt_id = item[1]
+    server_instance.last_prompt_id = prompt_id
+
+    # Queued items stay frozen for the queue and history, nodes get a copy they can edit.
+    e.execute(unfreeze(item[2]), prompt_id, get_execution_extra_data(item), list(item[4]))
+
+    q.task_done(item_id,
+                e.history_result,
+                status=execution.PromptQueue.ExecutionStatus(
+                    status_str='success' if e.success else 'error',
+                    completed=e.success,
+                    messages=e.status_messages), process_item=remove_sensitive)
+    if server_instance.client_id is not None:
+        server_instance.send_sync("executing", {"node": None, "prompt_id": prompt_id}, server_instance.client_id)
+
+
+def finish_coalesced_prompt(q, server_instance, e, merged, i, item, item_id):
+    prompt_id = item[1]
+    history_result = coalescing.split_history_result(e.history_result, merged.member_outputs[i], i)
+    messages = coalescing.split_status_messages(e.status_messages, prompt_id)
+    q.task_done(item_id,
+                history_result,
+                status=execution.PromptQueue.ExecutionStatus(
+                    status_str='success' if e.success else 'error',
+                    completed=e.success,
+                    messages=messages), process_item=remove_sensitive)
+
+    client_id = item[3].get("client_id")
+    if client_id is None:
+        return
+    if i > 0:
+        # The leader's client followed the merged prompt live, replay the rest.
+        for event, data in messages[:-1]:
+            server_instance.send_sync(event, data, client_id)
+        for node_id, output in history_result["outputs"].items():
+            server_instance.send_sync("executed", {"node": node_id, "display_node": node_id, "output": output, "prompt_id": prompt_id}, client_id)
+        server_instance.send_sync(*messages[-1], client_id)
+    server_instance.send_sync("executing", {"node": None, "prompt_id": prompt_id}, client_id)
+
+
+def execute_coalesced_prompts(q, server_instance, e, queue_items):
+    items = [item for item, _ in queue_items]
+    merged = coalescing.merge_prompts(items, get_execution_extra_data(items[0]))
+    if merged is not None:
+        leader_id = items[0][1]
+        server_instance.last_prompt_id = leader_id
+        e.execute(unfreeze(merged.prompt), leader_id, unfreeze(merged.extra_data), merged.outputs)
+
+        interrupted = any(event == "execution_interrupted" for event, _ in e.status_messages)
+        targeted = q.take_interrupted([item[1] for item in items])
+        if interrupted and 0 < len(targeted) < len(items):
+            # Only some of the prompts were interrupted, the others run again on their own.
+            for i, (item, item_id) in enumerate(queue_items):
+                if item[1] in targeted:
+                    finish_coalesced_prompt(q, server_instance, e, merged, i, item, item_id)
+            for item, item_id in queue_items:
+                if item[1] not in targeted:
+                    execute_prompt(q, server_instance, e, item, item_id)
+            return
+        if e.success or interrupted:
+            for i, (item, item_id) in enumerate(queue_items):
+                finish_coalesced_prompt(q, server_instance, e, merged, i, item, item_id)
+            logging.info("Ran {} coalesced prompts as one batch".format(len(queue_items)))
+            return
+        logging.warning("Coalesced prompts failed to run as one batch, running them one at a time")
+
+    for item, item_id in queue_items:
+        execute_prompt(q, server_instance, e, item, item_id)
+
+
+def prompt_worker(q, server_instance, worker_index=0, worker_count=1):
     current_time: float = 0.0
+    if worker_count > 1:
+        # Each worker runs on its own device with its own cache, the queue and history are shared.
+        comfy.model_management.register_worker_thread()
+        q.register_worker(worker_index)
+        device = comfy.model_management.set_thread_torch_device(worker_index)
+        logging.info("Prompt worker {} using device: {}".format(worker_index, comfy.model_management.get_torch_device_name(device)))
+
     cache_type = execution.CacheType.CLASSIC
     if args.cache_lru > 0:
         cache_type = execution.CacheType.LRU
@@ -206,7 +298,7 @@ def prompt_worker(q, server_instance):
     elif args.cache_none:
         cache_type = execution.CacheType.NONE
 
-    e = execution.PromptExecutor(server_instance, cache_type=cache_type, cache_args={ "lru" : args.cache_lru, "ram" : args.cache_ram } )
+    e = execution.PromptExecutor(server_instance, cache_type=cache_type, cache_args={ "lru" : args.cache_lru, "ram" : args.cache_ram, "disk" : args.cache_disk, "disk_size" : args.cache_disk_size }, parallel_nodes=args.parallel_cpu_nodes)
     last_gc_collect = 0
     need_gc = False
     gc_collect_interval = 10.0
@@ -220,27 +312,17 @@ def prompt_worker(q, server_instance):
         if queue_item is not None:
             item, item_id = queue_item
             execution_start_time = time.perf_counter()
-            prompt_id = item[1]
-            server_instance.last_prompt_id = prompt_id
-
-            sensitive = item[5]
-            extra_data = item[3].copy()
-            for k in sensitive:
-                extra_data[k] = sensitive[k]
 
-            e.execute(item[2], prompt_id, extra_data, item[4])
+            coalesced = []
+            if args.coalesce_prompts > 1:
+                max_items = min(args.coalesce_prompts, coalescing.MAX_COALESCED_PROMPTS) - 1
+                coalesced = q.get_coalesced(item, max_items, coalescing.coalesce_key)
+            if len(coalesced) > 0:
+                execute_coalesced_prompts(q, server_instance, e, [queue_item] + coalesced)
+            else:
+                execute_prompt(q, server_instance, e, item, item_id)
             need_gc = True
 
-            remove_sensitive = lambda prompt: prompt[:5] + prompt[6:]
-            q.task_done(item_id,
-                        e.history_result,
-                        status=execution.PromptQueue.ExecutionStatus(
-                            status_str='success' if e.success else 'error',
-                            completed=e.success,
-                            messages=e.status_messages), process_item=remove_sensitive)
-            if server_instance.client_id is not None:
-                server_instance.send_sync("executing", {"node": None, "prompt_id": prompt_id}, server_instance.client_id)
-
             current_time = time.perf_counter()
             execution_time = current_time - execution_start_time
 
@@ -251,11 +333,12 @@ def prompt_worker(q, server_instance):
             else:
                 logging.info("Prompt executed in {:.2f} seconds".format(execution_time))
 
-        flags = q.get_flags()
+        flags = q.get_flags(worker_id=worker_index if worker_count > 1 else None)
         free_memory = flags.get("free_memory", False)
 
         if flags.get("unload_models", free_memory):
             comfy.model_management.unload_all_models()
+            comfy.model_pool.model_pool.clear()
             need_gc = True
             last_gc_collect = 0
 
@@ -320,17 +403,46 @@ def cleanup_temp():
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 
-def setup_database():
+def setup_database(prompt_queue=None):
     try:
-        from app.database.db import init_db, dependencies_available
+        from app.database.db import init_db, dependencies_available, create_session
         if dependencies_available():
             init_db()
+            # An in-memory sqlite database is per connection, so worker threads wouldn't see the tables.
+            if prompt_queue is not None and ":memory:" not in args.database_url:
+                from app.history.db_store import DatabaseHistoryStore
+                prompt_queue.set_history_store(DatabaseHistoryStore(create_session, max_items=execution.MAXIMUM_HISTORY_SIZE))
             if not args.disable_assets_autoscan:
                 seed_assets(["models"], enable_logging=True)
     except Exception as e:
         logging.error(f"Failed to initialize database. Please ensure you have installed the latest requirements. If the error persists, please report this as in future the database will be required: {e}")
 
 
+def setup_detection_cache():
+    import comfy.model_detection_cache
+    cache = comfy.model_detection_cache.detection_cache
+    if args.disable_detection_cache:
+        cache.max_entries = 0
+        return
+    cache.set_path(os.path.join(folder_paths.get_system_user_directory("cache"), "model_detection.json"))
+    if args.warm_detection_cache:
+        def warm():
+            paths = {}
+            for folder_name in ("checkpoints", "diffusion_models"):
+                paths[folder_name] = [p for p in (folder_paths.get_full_path(folder_name, f) for f in folder_paths.get_filename_list(folder_name)) if p is not None]
+            start = time.perf_counter()
+            detected = comfy.model_detection_cache.warm(paths["checkpoints"], paths["diffusion_models"])
+            logging.info("Detected the type of {} models in {:.1f} seconds.".format(detected, time.perf_counter() - start))
+        threading.Thread(target=warm, daemon=True).start()
+
+
+def setup_conditioning_cache():
+    if args.conditioning_cache_disk_size > 0:
+        import comfy.conditioning_cache
+        directory = os.path.join(folder_paths.get_system_user_directory("cache"), "conditioning")
+        comfy.conditioning_cache.conditioning_cache.set_directory(directory, int(args.conditioning_cache_disk_size * (1024 ** 3)))
+
+
 def start_comfyui(asyncio_loop=None):
     """
     Starts the ComfyUI server using the provided asyncio event loop or creates a new one.
@@ -365,12 +477,24 @@ def start_comfyui(asyncio_loop=None):
     hook_breaker_ac10a0.restore_functions()
 
     cuda_malloc_warning()
-    setup_database()
+    setup_database(prompt_server.prompt_queue)
+    setup_detection_cache()
+    setup_conditioning_cache()
 
     prompt_server.add_routes()
     hijack_progress(prompt_server)
 
-    threading.Thread(target=prompt_worker, daemon=True, args=(prompt_server.prompt_queue, prompt_server,)).start()
+    if args.coalesce_prompts > 1:
+        coalescing.register_nodes()
+
+    prompt_workers = max(args.prompt_workers, 1)
+    device_count = comfy.model_management.get_device_count()
+    if prompt_workers > device_count and not comfy.model_management.is_device_cpu(comfy.model_management.get_torch_device()):
+        # Workers sharing a GPU would fight over its memory, each one owns a device.
+        logging.warning("--prompt-workers {} is more than the {} available devices, using {} prompt workers.".format(prompt_workers, device_count, device_count))
+        prompt_workers = device_count
+    for i in range(prompt_workers):
+        threading.Thread(target=prompt_worker, daemon=True, args=(prompt_server.prompt_queue, prompt_server, i, prompt_workers)).start()
 
     if args.quick_test_for_ci:
         exit(0)
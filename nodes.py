@@ -35,6 +35,7 @@ from comfy_api.latest import io, ComfyExtension
 import comfy.clip_vision
 
 import comfy.model_management
+import comfy.model_pool
 from comfy.cli_args import args
 
 import importlib
@@ -49,8 +50,8 @@ if args.enable_manager:
 def before_node_execution():
     comfy.model_management.throw_exception_if_processing_interrupted()
 
-def interrupt_processing(value=True):
-    comfy.model_management.interrupt_current_processing(value)
+def interrupt_processing(value=True, thread_id=None):
+    comfy.model_management.interrupt_current_processing(value, thread_id=thread_id)
 
 MAX_RESOLUTION=16384
 
@@ -583,8 +584,10 @@ class CheckpointLoaderSimple:
 
     def load_checkpoint(self, ckpt_name):
         ckpt_path = folder_paths.get_full_path_or_raise("checkpoints", ckpt_name)
-        out = comfy.sd.load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, embedding_directory=folder_paths.get_folder_paths("embeddings"))
-        return out[:3]
+        embedding_directory = folder_paths.get_folder_paths("embeddings")
+        out = comfy.model_pool.model_pool.load("checkpoint", [ckpt_path], {"embedding_directory": embedding_directory},
+                                               lambda: comfy.sd.load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, embedding_directory=embedding_directory)[:3])
+        return out
 
 class DiffusersLoader:
     @classmethod
@@ -788,7 +791,6 @@ class VAELoader:
 
     #TODO: scale factor?
     def load_vae(self, vae_name):
-        metadata = None
         if vae_name == "pixel_space":
             sd = {}
             sd["pixel_space_vae"] = torch.tensor(1.0)
@@ -799,7 +801,14 @@ class VAELoader:
                 vae_path = folder_paths.get_full_path_or_raise("vae_approx", vae_name)
             else:
                 vae_path = folder_paths.get_full_path_or_raise("vae", vae_name)
-            sd, metadata = comfy.utils.load_torch_file(vae_path, return_metadata=True)
+            return comfy.model_pool.model_pool.load("vae", [vae_path], {}, lambda: self.load_vae_file(vae_path))
+        vae = comfy.sd.VAE(sd=sd)
+        vae.throw_exception_if_invalid()
+        return (vae,)
+
+    @staticmethod
+    def load_vae_file(vae_path):
+        sd, metadata = comfy.utils.load_torch_file(vae_path, return_metadata=True)
         vae = comfy.sd.VAE(sd=sd, metadata=metadata)
         vae.throw_exception_if_invalid()
         return (vae,)
@@ -941,8 +950,7 @@ class UNETLoader:
             model_options["dtype"] = torch.float8_e5m2
 
         unet_path = folder_paths.get_full_path_or_raise("diffusion_models", unet_name)
-        model = comfy.sd.load_diffusion_model(unet_path, model_options=model_options)
-        return (model,)
+        return comfy.model_pool.model_pool.load("diffusion_model", [unet_path], model_options, lambda: (comfy.sd.load_diffusion_model(unet_path, model_options=model_options),))
 
 class CLIPLoader:
     @classmethod
@@ -968,8 +976,9 @@ class CLIPLoader:
             model_options["load_device"] = model_options["offload_device"] = torch.device("cpu")
 
         clip_path = folder_paths.get_full_path_or_raise("text_encoders", clip_name)
-        clip = comfy.sd.load_clip(ckpt_paths=[clip_path], embedding_directory=folder_paths.get_folder_paths("embeddings"), clip_type=clip_type, model_options=model_options)
-        return (clip,)
+        embedding_directory = folder_paths.get_folder_paths("embeddings")
+        return comfy.model_pool.model_pool.load("clip", [clip_path], {"clip_type": clip_type, "model_options": model_options, "embedding_directory": embedding_directory},
+                                                lambda: (comfy.sd.load_clip(ckpt_paths=[clip_path], embedding_directory=embedding_directory, clip_type=clip_type, model_options=model_options),))
 
 class DualCLIPLoader:
     @classmethod
@@ -998,8 +1007,9 @@ class DualCLIPLoader:
         if device == "cpu":
             model_options["load_device"] = model_options["offload_device"] = torch.device("cpu")
 
-        clip = comfy.sd.load_clip(ckpt_paths=[clip_path1, clip_path2], embedding_directory=folder_paths.get_folder_paths("embeddings"), clip_type=clip_type, model_options=model_options)
-        return (clip,)
+        embedding_directory = folder_paths.get_folder_paths("embeddings")
+        return comfy.model_pool.model_pool.load("clip", [clip_path1, clip_path2], {"clip_type": clip_type, "model_options": model_options, "embedding_directory": embedding_directory},
+                                                lambda: (comfy.sd.load_clip(ckpt_paths=[clip_path1, clip_path2], embedding_directory=embedding_directory, clip_type=clip_type, model_options=model_options),))
 
 class CLIPVisionLoader:
     @classmethod
@@ -1606,7 +1616,7 @@ class SaveImage:
 
     def save_images(self, images, filename_prefix="ComfyUI", prompt=None, extra_pnginfo=None):
         filename_prefix += self.prefix_append
-        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0])
+        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0], count=len(images))
         results = list()
         for (batch_number, image) in enumerate(images):
             i = 255. * image.cpu().numpy()
@@ -1660,6 +1670,7 @@ class LoadImage:
 
     RETURN_TYPES = ("IMAGE", "MASK")
     FUNCTION = "load_image"
+    THREAD_SAFE = True
     def load_image(self, image):
         image_path = folder_paths.get_annotated_filepath(image)
 
@@ -1738,6 +1749,7 @@ class LoadImageMask:
 
     RETURN_TYPES = ("MASK",)
     FUNCTION = "load_image"
+    THREAD_SAFE = True
     def load_image(self, image, channel):
         image_path = folder_paths.get_annotated_filepath(image)
         i = node_helpers.pillow(Image.open, image_path)
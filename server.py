@@ -3,11 +3,13 @@ import sys
 import asyncio
 import traceback
 import time
+import threading
 
 import nodes
 import folder_paths
 import execution
-from comfy_execution.jobs import JobStatus, get_job, get_all_jobs
+from comfy_execution.jobs import JobStatus, get_job, get_all_jobs, encode_job_cursor, decode_job_cursor
+from comfy_execution.scheduling import DEFAULT_PRIORITY_CLASS, PRIORITY_CLASSES
 import uuid
 import urllib
 import json
@@ -16,9 +18,8 @@ import struct
 import ssl
 import socket
 import ipaddress
-from PIL import Image, ImageOps
+from PIL import Image
 from PIL.PngImagePlugin import PngInfo
-from io import BytesIO
 
 import aiohttp
 from aiohttp import web
@@ -43,6 +44,10 @@ from app.subgraph_manager import SubgraphManager
 from typing import Optional, Union
 from api_server.routes.internal.internal_routes import InternalRoutes
 from protocol import BinaryEventTypes
+from app.websocket_sender import SocketSender, get_coalesce_key
+from app.preview_encoder import PreviewEncoder, LEGACY_PREVIEW_TYPES, choose_preview_format
+from app.view_cache import DerivativeCache, derivative_key, etag_matches, get_derivative_spec, get_source_format
+from app.node_info_cache import NodeInfoCache
 
 # Import cache control middleware
 from middleware.cache_middleware import cache_control
@@ -92,7 +97,7 @@ async def compress_body(request: web.Request, handler):
         return response
     if response.content_type not in ["application/json", "text/plain"]:
         return response
-    if response.body and "gzip" in accept_encoding:
+    if response.body and "gzip" in accept_encoding and "Content-Encoding" not in response.headers:
         response.enable_compression()
     return response
 
@@ -193,6 +198,40 @@ def create_block_external_middleware():
 
 
 class PromptServer():
+    # The executing client/prompt/node are tracked per prompt worker thread so several
+    # workers can run at once. Other threads (like the event loop) see the latest value set.
+    worker_state = threading.local()
+    _client_id = None
+    _last_node_id = None
+    _last_prompt_id = None
+
+    @property
+    def client_id(self):
+        return getattr(self.worker_state, "client_id", self._client_id)
+
+    @client_id.setter
+    def client_id(self, value):
+        self.worker_state.client_id = value
+        self._client_id = value
+
+    @property
+    def last_node_id(self):
+        return getattr(self.worker_state, "last_node_id", self._last_node_id)
+
+    @last_node_id.setter
+    def last_node_id(self, value):
+        self.worker_state.last_node_id = value
+        self._last_node_id = value
+
+    @property
+    def last_prompt_id(self):
+        return getattr(self.worker_state, "last_prompt_id", self._last_prompt_id)
+
+    @last_prompt_id.setter
+    def last_prompt_id(self, value):
+        self.worker_state.last_prompt_id = value
+        self._last_prompt_id = value
+
     def __init__(self, loop):
         PromptServer.instance = self
 
@@ -209,6 +248,8 @@ class PromptServer():
         self.prompt_queue = execution.PromptQueue(self)
         self.loop = loop
         self.messages = asyncio.Queue()
+        self.preview_encoder = PreviewEncoder(self.send_encoded_preview, rate=args.preview_rate)
+        self.view_cache = DerivativeCache(os.path.join(folder_paths.get_temp_directory(), "view_cache"), args.view_cache_size * 1024 * 1024)
         self.client_session:Optional[aiohttp.ClientSession] = None
         self.number = 0
 
@@ -231,6 +272,7 @@ class PromptServer():
         self.app = web.Application(client_max_size=max_upload_size, middlewares=middlewares)
         self.sockets = dict()
         self.sockets_metadata = dict()
+        self.socket_senders = dict()
         self.web_root = (
             FrontendManager.init_frontend(args.front_end_version)
             if args.front_end_root is None
@@ -253,11 +295,16 @@ class PromptServer():
             if sid:
                 # Reusing existing session, remove old
                 self.sockets.pop(sid, None)
+                old_sender = self.socket_senders.pop(sid, None)
+                if old_sender is not None:
+                    await old_sender.close()
             else:
                 sid = uuid.uuid4().hex
 
             # Store WebSocket for backward compatibility
             self.sockets[sid] = ws
+            sender = SocketSender(ws, sid)
+            self.socket_senders[sid] = sender
             # Store metadata separately
             self.sockets_metadata[sid] = {"feature_flags": {}}
 
@@ -303,6 +350,10 @@ class PromptServer():
             finally:
                 self.sockets.pop(sid, None)
                 self.sockets_metadata.pop(sid, None)
+                self.preview_encoder.forget(sid)
+                if self.socket_senders.get(sid) is sender:
+                    del self.socket_senders[sid]
+                await sender.close()
             return ws
 
         @routes.get("/")
@@ -503,82 +554,42 @@ class PromptServer():
                 file = os.path.join(output_dir, filename)
 
                 if os.path.isfile(file):
-                    if 'preview' in request.rel_url.query:
-                        with Image.open(file) as img:
-                            preview_info = request.rel_url.query['preview'].split(';')
-                            image_format = preview_info[0]
-                            if image_format not in ['webp', 'jpeg'] or 'a' in request.rel_url.query.get('channel', ''):
-                                image_format = 'webp'
-
-                            quality = 90
-                            if preview_info[-1].isdigit():
-                                quality = int(preview_info[-1])
-
-                            buffer = BytesIO()
-                            if image_format in ['jpeg'] or request.rel_url.query.get('channel', '') == 'rgb':
-                                img = img.convert("RGB")
-                            img.save(buffer, format=image_format, quality=quality)
-                            buffer.seek(0)
-
-                            return web.Response(body=buffer.read(), content_type=f'image/{image_format}',
-                                                headers={"Content-Disposition": f"filename=\"{filename}\""})
-
-                    if 'channel' not in request.rel_url.query:
-                        channel = 'rgba'
-                    else:
-                        channel = request.rel_url.query["channel"]
-
-                    if channel == 'rgb':
-                        with Image.open(file) as img:
-                            if img.mode == "RGBA":
-                                r, g, b, a = img.split()
-                                new_img = Image.merge('RGB', (r, g, b))
-                            else:
-                                new_img = img.convert("RGB")
-
-                            buffer = BytesIO()
-                            new_img.save(buffer, format='PNG')
-                            buffer.seek(0)
-
-                            return web.Response(body=buffer.read(), content_type='image/png',
-                                                headers={"Content-Disposition": f"filename=\"{filename}\""})
-
-                    elif channel == 'a':
-                        with Image.open(file) as img:
-                            if img.mode == "RGBA":
-                                _, _, _, a = img.split()
-                            else:
-                                a = Image.new('L', img.size, 255)
-
-                            # alpha img
-                            alpha_img = Image.new('RGBA', img.size)
-                            alpha_img.putalpha(a)
-                            alpha_buffer = BytesIO()
-                            alpha_img.save(alpha_buffer, format='PNG')
-                            alpha_buffer.seek(0)
-
-                            return web.Response(body=alpha_buffer.read(), content_type='image/png',
-                                                headers={"Content-Disposition": f"filename=\"{filename}\""})
-                    else:
-                        # Get content type from mimetype, defaulting to 'application/octet-stream'
-                        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
-
-                        # For security, force certain mimetypes to download instead of display
-                        if content_type in {'text/html', 'text/html-sandboxed', 'application/xhtml+xml', 'text/javascript', 'text/css'}:
-                            allow_html = request.rel_url.query.get("allow_html", "") == "1"
-                            ui_preview_root = os.path.abspath(os.path.join(folder_paths.get_output_directory(), "ui_previews"))
-                            file_real_path = os.path.abspath(file)
-                            is_ui_preview = os.path.commonpath((file_real_path, ui_preview_root)) == ui_preview_root
-                            if not (allow_html and is_ui_preview):
-                                content_type = 'application/octet-stream'  # Forces download
-
-                        return web.FileResponse(
-                            file,
-                            headers={
-                                "Content-Disposition": f"filename=\"{filename}\"",
-                                "Content-Type": content_type
-                            }
-                        )
+                    try:
+                        spec = get_derivative_spec(request.rel_url.query, source_format=get_source_format(filename))
+                    except ValueError:
+                        return web.Response(status=400)
+
+                    if spec is not None:
+                        etag = f'"{derivative_key(file, os.stat(file), spec)}"'
+                        headers = {"Content-Disposition": f"filename=\"{filename}\"", "ETag": etag}
+                        if etag_matches(request.headers.get("If-None-Match"), etag):
+                            return web.Response(status=304, headers=headers)
+                        try:
+                            body = await self.view_cache.get_or_render(file, etag.strip('"'), spec)
+                            return web.Response(body=body, content_type=spec.content_type, headers=headers)
+                        except OSError as e:
+                            # Not an image PIL can read, serve the file itself.
+                            logging.debug(f"Could not convert {file} for /view: {e}")
+
+                    # Get content type from mimetype, defaulting to 'application/octet-stream'
+                    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+                    # For security, force certain mimetypes to download instead of display
+                    if content_type in {'text/html', 'text/html-sandboxed', 'application/xhtml+xml', 'text/javascript', 'text/css'}:
+                        allow_html = request.rel_url.query.get("allow_html", "") == "1"
+                        ui_preview_root = os.path.abspath(os.path.join(folder_paths.get_output_directory(), "ui_previews"))
+                        file_real_path = os.path.abspath(file)
+                        is_ui_preview = os.path.commonpath((file_real_path, ui_preview_root)) == ui_preview_root
+                        if not (allow_html and is_ui_preview):
+                            content_type = 'application/octet-stream'  # Forces download
+
+                    return web.FileResponse(
+                        file,
+                        headers={
+                            "Content-Disposition": f"filename=\"{filename}\"",
+                            "Content-Type": content_type
+                        }
+                    )
 
             return web.Response(status=404)
 
@@ -642,7 +653,8 @@ class PromptServer():
                         "torch_vram_total": torch_vram_total,
                         "torch_vram_free": torch_vram_free,
                     }
-                ]
+                ],
+                "model_management": comfy.model_management.eviction_stats(),
             }
             return web.json_response(system_stats)
 
@@ -689,25 +701,28 @@ class PromptServer():
                 info['api_node'] = obj_class.API_NODE
             return info
 
+        self.node_info_cache = NodeInfoCache(node_info, nodes.NODE_CLASS_MAPPINGS, nodes.NODE_DISPLAY_NAME_MAPPINGS)
+
         @routes.get("/object_info")
         async def get_object_info(request):
             seed_assets(["models"])
             with folder_paths.cache_helper:
-                out = {}
-                for x in nodes.NODE_CLASS_MAPPINGS:
-                    try:
-                        out[x] = node_info(x)
-                    except Exception:
-                        logging.error(f"[ERROR] An error occurred while retrieving information for the '{x}' node.")
-                        logging.error(traceback.format_exc())
-                return web.json_response(out)
+                encoded = self.node_info_cache.get_all()
+            headers = {"ETag": encoded.etag, "Vary": "Accept-Encoding"}
+            if etag_matches(request.headers.get("If-None-Match"), encoded.etag):
+                return web.Response(status=304, headers=headers)
+            if "gzip" in request.headers.get("Accept-Encoding", ""):
+                headers["Content-Encoding"] = "gzip"
+                return web.Response(body=encoded.gzip_body, content_type="application/json", headers=headers)
+            return web.Response(body=encoded.body, content_type="application/json", headers=headers)
 
         @routes.get("/object_info/{node_class}")
         async def get_object_info_node(request):
             node_class = request.match_info.get("node_class", None)
             out = {}
             if (node_class is not None) and (node_class in nodes.NODE_CLASS_MAPPINGS):
-                out[node_class] = node_info(node_class)
+                with folder_paths.cache_helper:
+                    out[node_class] = self.node_info_cache.get(node_class).info
             return web.json_response(out)
 
         @routes.get("/api/jobs")
@@ -721,11 +736,14 @@ class PromptServer():
                 sort_order: Sort direction: asc, desc (default)
                 limit: Max items to return (positive integer)
                 offset: Items to skip (non-negative integer, default 0)
+                cursor: pagination.next_cursor of the previous page, replaces offset
+                client_id: Filter by the client that queued the job
             """
             query = request.rel_url.query
 
             status_param = query.get('status')
             workflow_id = query.get('workflow_id')
+            client_id = query.get('client_id')
             sort_by = query.get('sort_by', 'created_at').lower()
             sort_order = query.get('sort_order', 'desc').lower()
 
@@ -780,23 +798,38 @@ class PromptServer():
                         status=400
                     )
 
+            cursor = query.get('cursor')
+            if cursor is not None:
+                try:
+                    decode_job_cursor(cursor)
+                except ValueError:
+                    return web.json_response(
+                        {"error": "cursor is invalid"},
+                        status=400
+                    )
+                offset = 0
+
             running, queued = self.prompt_queue.get_current_queue_volatile()
-            history = self.prompt_queue.get_history()
 
             running = _remove_sensitive_from_queue(running)
             queued = _remove_sensitive_from_queue(queued)
 
+            # One extra job is fetched to tell whether there is another page.
             jobs, total = get_all_jobs(
-                running, queued, history,
+                running, queued, self.prompt_queue.history_store,
                 status_filter=status_filter,
                 workflow_id=workflow_id,
                 sort_by=sort_by,
                 sort_order=sort_order,
-                limit=limit,
-                offset=offset
+                limit=None if limit is None else limit + 1,
+                offset=offset,
+                cursor=cursor,
+                client_id=client_id,
             )
 
-            has_more = (offset + len(jobs)) < total
+            has_more = limit is not None and len(jobs) > limit
+            if has_more:
+                jobs = jobs[:limit]
 
             return web.json_response({
                 'jobs': jobs,
@@ -804,7 +837,8 @@ class PromptServer():
                     'offset': offset,
                     'limit': limit,
                     'total': total,
-                    'has_more': has_more
+                    'has_more': has_more,
+                    'next_cursor': encode_job_cursor(jobs[-1], sort_by) if has_more else None,
                 }
             })
 
@@ -845,7 +879,18 @@ class PromptServer():
             else:
                 offset = -1
 
-            return web.json_response(self.prompt_queue.get_history(max_items=max_items, offset=offset))
+            # Paging backwards from the newest entries, the cursor for the next page is returned
+            # in a header so the response body stays a plain prompt_id -> entry mapping.
+            cursor = request.rel_url.query.get("cursor", None)
+            if cursor is not None:
+                try:
+                    cursor = int(cursor)
+                except ValueError:
+                    return web.json_response({"error": "cursor is invalid"}, status=400)
+
+            history, next_cursor = self.prompt_queue.get_history_page(max_items=max_items, offset=offset, cursor=cursor)
+            headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else None
+            return web.json_response(history, headers=headers)
 
         @routes.get("/history/{prompt_id}")
         async def get_history_prompt_id(request):
@@ -891,6 +936,25 @@ class PromptServer():
 
                 if "client_id" in json_data:
                     extra_data["client_id"] = json_data["client_id"]
+                if "priority" in json_data:
+                    extra_data["priority"] = json_data["priority"]
+                if not isinstance(extra_data.get("client_id", ""), (str, type(None))):
+                    error = {
+                        "type": "invalid_client_id",
+                        "message": "Invalid client_id",
+                        "details": "client_id must be a string",
+                        "extra_info": {}
+                    }
+                    return web.json_response({"error": error, "node_errors": {}}, status=400)
+                priority = extra_data.get("priority", DEFAULT_PRIORITY_CLASS)
+                if not isinstance(priority, str) or priority not in PRIORITY_CLASSES:
+                    error = {
+                        "type": "invalid_priority",
+                        "message": "Invalid priority",
+                        "details": "priority must be one of: {}".format(", ".join(PRIORITY_CLASSES)),
+                        "extra_info": {}
+                    }
+                    return web.json_response({"error": error, "node_errors": {}}, status=400)
                 if valid[0]:
                     outputs_to_execute = valid[2]
                     sensitive = {}
@@ -922,8 +986,7 @@ class PromptServer():
             if "delete" in json_data:
                 to_delete = json_data['delete']
                 for id_to_delete in to_delete:
-                    delete_func = lambda a: a[1] == id_to_delete
-                    self.prompt_queue.delete_queue_item(delete_func)
+                    self.prompt_queue.delete_queue_item_by_id(id_to_delete)
 
             return web.Response(status=200)
 
@@ -937,19 +1000,11 @@ class PromptServer():
             # Check if a specific prompt_id was provided for targeted interruption
             prompt_id = json_data.get('prompt_id')
             if prompt_id:
-                currently_running, _ = self.prompt_queue.get_current_queue()
-
-                # Check if the prompt_id matches any currently running prompt
-                should_interrupt = False
-                for item in currently_running:
-                    # item structure: (number, prompt_id, prompt, extra_data, outputs_to_execute)
-                    if item[1] == prompt_id:
-                        logging.info(f"Interrupting prompt {prompt_id}")
-                        should_interrupt = True
-                        break
-
-                if should_interrupt:
-                    nodes.interrupt_processing()
+                # Only interrupt the worker that is running this prompt
+                thread_id = self.prompt_queue.interrupt_running(prompt_id)
+                if thread_id is not None:
+                    logging.info(f"Interrupting prompt {prompt_id}")
+                    nodes.interrupt_processing(thread_id=thread_id)
                 else:
                     logging.info(f"Prompt {prompt_id} is not currently running, skipping interrupt")
             else:
@@ -1058,11 +1113,15 @@ class PromptServer():
 
     async def send(self, event, data, sid=None):
         if event == BinaryEventTypes.UNENCODED_PREVIEW_IMAGE:
-            await self.send_image(data, sid=sid)
+            image_type, image, max_size = data
+            image_type = choose_preview_format(image_type, args.preview_format, with_metadata=False, supports_raw=False)
+            self.preview_encoder.submit(sid, image_type, image, max_size)
         elif event == BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA:
             # data is (preview_image, metadata)
-            preview_image, metadata = data
-            await self.send_image_with_metadata(preview_image, metadata, sid=sid)
+            (image_type, image, max_size), metadata = data
+            supports_raw = feature_flags.supports_feature(self.sockets_metadata, sid, "supports_raw_preview")
+            image_type = choose_preview_format(image_type, args.preview_format, with_metadata=True, supports_raw=supports_raw)
+            self.preview_encoder.submit(sid, image_type, image, max_size, dict(metadata or {}))
         elif isinstance(data, (bytes, bytearray)):
             await self.send_bytes(event, data, sid)
         else:
@@ -1078,85 +1137,68 @@ class PromptServer():
         return message
 
     async def send_image(self, image_data, sid=None):
-        image_type = image_data[0]
-        image = image_data[1]
-        max_size = image_data[2]
-        if max_size is not None:
-            if hasattr(Image, 'Resampling'):
-                resampling = Image.Resampling.BILINEAR
-            else:
-                resampling = Image.Resampling.LANCZOS
-
-            image = ImageOps.contain(image, (max_size, max_size), resampling)
-        type_num = 1
-        if image_type == "JPEG":
-            type_num = 1
-        elif image_type == "PNG":
-            type_num = 2
-
-        bytesIO = BytesIO()
-        header = struct.pack(">I", type_num)
-        bytesIO.write(header)
-        image.save(bytesIO, format=image_type, quality=95, compress_level=1)
-        preview_bytes = bytesIO.getvalue()
-        await self.send_bytes(BinaryEventTypes.PREVIEW_IMAGE, preview_bytes, sid=sid)
+        image_type = choose_preview_format(image_data[0], args.preview_format, with_metadata=False, supports_raw=False)
+        image_bytes, _ = await self.preview_encoder.encode(image_type, image_data[1], image_data[2])
+        await self.send_encoded_preview(sid, image_type, image_bytes, None)
 
     async def send_image_with_metadata(self, image_data, metadata=None, sid=None):
-        image_type = image_data[0]
-        image = image_data[1]
-        max_size = image_data[2]
-        if max_size is not None:
-            if hasattr(Image, 'Resampling'):
-                resampling = Image.Resampling.BILINEAR
-            else:
-                resampling = Image.Resampling.LANCZOS
-
-            image = ImageOps.contain(image, (max_size, max_size), resampling)
+        supports_raw = feature_flags.supports_feature(self.sockets_metadata, sid, "supports_raw_preview")
+        image_type = choose_preview_format(image_data[0], args.preview_format, with_metadata=True, supports_raw=supports_raw)
+        image_bytes, encoded_metadata = await self.preview_encoder.encode(image_type, image_data[1], image_data[2])
+        await self.send_encoded_preview(sid, image_type, image_bytes, {**(metadata or {}), **encoded_metadata})
 
-        mimetype = "image/png" if image_type == "PNG" else "image/jpeg"
-
-        # Prepare metadata
+    async def send_encoded_preview(self, sid, image_type, image_bytes, metadata):
+        """Sends a preview encoded by the PreviewEncoder, without metadata as a legacy PREVIEW_IMAGE."""
         if metadata is None:
-            metadata = {}
-        metadata["image_type"] = mimetype
+            preview_bytes = bytearray(struct.pack(">I", LEGACY_PREVIEW_TYPES[image_type]))
+            preview_bytes.extend(image_bytes)
+            await self.send_bytes(BinaryEventTypes.PREVIEW_IMAGE, preview_bytes, sid=sid)
+            return
 
         # Serialize metadata as JSON
-        import json
         metadata_json = json.dumps(metadata).encode('utf-8')
         metadata_length = len(metadata_json)
 
-        # Prepare image data
-        bytesIO = BytesIO()
-        image.save(bytesIO, format=image_type, quality=95, compress_level=1)
-        image_bytes = bytesIO.getvalue()
-
         # Combine metadata and image
         combined_data = bytearray()
         combined_data.extend(struct.pack(">I", metadata_length))
         combined_data.extend(metadata_json)
         combined_data.extend(image_bytes)
 
-        await self.send_bytes(BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA, combined_data, sid=sid)
+        # Only the latest pending preview of each node is worth sending to a client that lags behind.
+        coalesce_key = (BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA, metadata.get("prompt_id"), metadata.get("node_id"))
+        await self.send_bytes(BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA, combined_data, sid=sid, coalesce_key=coalesce_key)
 
-    async def send_bytes(self, event, data, sid=None):
+    async def send_bytes(self, event, data, sid=None, coalesce_key=None):
         message = self.encode_bytes(event, data)
-
-        if sid is None:
-            sockets = list(self.sockets.values())
-            for ws in sockets:
-                await send_socket_catch_exception(ws.send_bytes, message)
-        elif sid in self.sockets:
-            await send_socket_catch_exception(self.sockets[sid].send_bytes, message)
+        if coalesce_key is None:
+            coalesce_key = get_coalesce_key(event, data)
+        await self.send_encoded(message, coalesce_key, sid)
 
     async def send_json(self, event, data, sid=None):
-        message = {"type": event, "data": data}
-
+        message = json.dumps({"type": event, "data": data})
+        await self.send_encoded(message, get_coalesce_key(event, data), sid)
+
+    async def send_encoded(self, message, coalesce_key=None, sid=None):
+        """
+        Sends an encoded message (str for text frames, bytes for binary ones) to one socket or
+        all of them. Messages are queued on each socket's SocketSender rather than awaited.
+        """
         if sid is None:
-            sockets = list(self.sockets.values())
-            for ws in sockets:
-                await send_socket_catch_exception(ws.send_json, message)
+            targets = list(self.sockets.items())
         elif sid in self.sockets:
-            await send_socket_catch_exception(self.sockets[sid].send_json, message)
+            targets = [(sid, self.sockets[sid])]
+        else:
+            return
+
+        for socket_id, ws in targets:
+            sender = self.socket_senders.get(socket_id)
+            if sender is not None and sender.ws is ws:
+                sender.put(message, coalesce_key)
+            else:
+                # Sockets registered by extensions without going through websocket_handler.
+                send = ws.send_str if isinstance(message, str) else ws.send_bytes
+                await send_socket_catch_exception(send, message)
 
     def send_sync(self, event, data, sid=None):
         self.loop.call_soon_threadsafe(
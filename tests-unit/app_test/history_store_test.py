@@ -0,0 +1,236 @@
+import os
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database.models import Base
+from app.history.db_store import DatabaseHistoryStore
+from app.history.store import MemoryHistoryStore
+from comfy_execution.jobs import JobStatus, encode_job_cursor, get_all_jobs
+
+
+def make_entry(prompt_id, create_time, status_str="success", duration=1000, client_id="client", workflow_id="wf"):
+    extra_data = {"create_time": create_time, "client_id": client_id, "extra_pnginfo": {"workflow": {"id": workflow_id}}}
+    return {
+        "prompt": (0, prompt_id, {"1": {"class_type": "Node", "inputs": {}}}, extra_data, ["1"]),
+        "outputs": {"1": {"images": [{"filename": f"{prompt_id}.png", "subfolder": "", "type": "output"}]}},
+        "status": {
+            "status_str": status_str,
+            "completed": status_str == "success",
+            "messages": [
+                ["execution_start", {"prompt_id": prompt_id, "timestamp": create_time}],
+                ["execution_success" if status_str == "success" else "execution_error", {"prompt_id": prompt_id, "timestamp": create_time + duration}],
+            ],
+        },
+        "meta": {},
+    }
+
+
+def make_engine(url="sqlite://"):
+    engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture(params=["memory", "database"])
+def make_store(request):
+    def make(max_items=0):
+        if request.param == "memory":
+            return MemoryHistoryStore(max_items=max_items)
+        return DatabaseHistoryStore(sessionmaker(bind=make_engine()), max_items=max_items)
+    return make
+
+
+def test_put_get_delete(make_store):
+    store = make_store()
+    store.put("a", make_entry("a", 100))
+    store.put("b", make_entry("b", 200))
+    assert len(store) == 2
+    assert store.get("a")["outputs"]["1"]["images"][0]["filename"] == "a.png"
+    assert store.get("missing") is None
+
+    store.delete("a")
+    assert store.get("a") is None
+    store.clear()
+    assert len(store) == 0
+
+
+def test_list_matches_legacy_offsets(make_store):
+    store = make_store()
+    for i in range(10):
+        store.put(f"p{i}", make_entry(f"p{i}", i))
+
+    assert list(store.list()[0]) == [f"p{i}" for i in range(10)]
+    assert list(store.list(max_items=3)[0]) == ["p7", "p8", "p9"]
+    assert list(store.list(max_items=3, offset=2)[0]) == ["p2", "p3", "p4"]
+    assert list(store.list(offset=8)[0]) == ["p8", "p9"]
+
+
+def test_list_cursor_pages_back_to_the_oldest(make_store):
+    store = make_store()
+    for i in range(10):
+        store.put(f"p{i}", make_entry(f"p{i}", i))
+
+    pages = []
+    cursor = None
+    while True:
+        page, cursor = store.list(max_items=4, cursor=cursor)
+        pages.append(list(page))
+        if cursor is None:
+            break
+    assert pages == [["p6", "p7", "p8", "p9"], ["p2", "p3", "p4", "p5"], ["p0", "p1"]]
+
+
+def test_retention_drops_oldest(make_store):
+    store = make_store(max_items=5)
+    for i in range(12):
+        store.put(f"p{i}", make_entry(f"p{i}", i))
+    assert list(store.list()[0]) == [f"p{i}" for i in range(7, 12)]
+
+
+def test_replacing_entry_moves_it_to_the_end(make_store):
+    store = make_store()
+    store.put("a", make_entry("a", 100))
+    store.put("b", make_entry("b", 200))
+    store.put("a", make_entry("a", 300, status_str="error"))
+    assert list(store.list()[0]) == ["b", "a"]
+    assert store.count_jobs(statuses={JobStatus.FAILED}) == 1
+
+
+def test_query_jobs_filters_sorts_and_continues_after_cursor(make_store):
+    store = make_store()
+    for i in range(20):
+        store.put(f"p{i:02}", make_entry(f"p{i:02}", 1000 + (i % 5), status_str="error" if i % 4 == 0 else "success",
+                                         duration=i * 10, client_id=f"c{i % 2}"))
+
+    jobs = [k for k, _ in store.query_jobs(sort_by="created_at", sort_order="desc")]
+    assert jobs[:4] == ["p19", "p14", "p09", "p04"]
+    assert store.count_jobs() == 20
+    assert store.count_jobs(statuses={JobStatus.FAILED}) == 5
+    assert store.count_jobs(client_id="c1") == 10
+    assert store.count_jobs(workflow_id="other") == 0
+
+    after = [k for k, _ in store.query_jobs(sort_by="created_at", sort_order="desc", cursor=(1004, "p09"))]
+    assert after == jobs[3:]
+
+    by_duration = [k for k, _ in store.query_jobs(sort_by="execution_duration", sort_order="asc", limit=3, statuses={JobStatus.COMPLETED})]
+    assert by_duration == ["p01", "p02", "p03"]
+
+
+def test_get_all_jobs_store_matches_dict(make_store):
+    store = make_store()
+    history = {}
+    for i in range(30):
+        entry = make_entry(f"p{i:02}", 1000 + (i % 7), status_str="error" if i % 3 == 0 else "success", duration=i)
+        store.put(f"p{i:02}", entry)
+        history[f"p{i:02}"] = entry
+    running = [(0, "r0", {}, {"create_time": 1003, "client_id": "client"}, [])]
+    queued = [(1, f"q{i}", {}, {"create_time": 1010 + i, "client_id": "client"}, []) for i in range(3)]
+
+    for sort_by in ["created_at", "execution_duration"]:
+        for sort_order in ["asc", "desc"]:
+            for status_filter in [None, [JobStatus.COMPLETED, JobStatus.PENDING]]:
+                kwargs = dict(status_filter=status_filter, sort_by=sort_by, sort_order=sort_order)
+                expected, expected_total = get_all_jobs(running, queued, history, **kwargs)
+                actual, total = get_all_jobs(running, queued, store, **kwargs)
+                assert [j["id"] for j in actual] == [j["id"] for j in expected]
+                assert total == expected_total
+
+                page, _ = get_all_jobs(running, queued, store, limit=5, offset=7, **kwargs)
+                assert [j["id"] for j in page] == [j["id"] for j in expected[7:12]]
+
+                paged = []
+                cursor = None
+                while True:
+                    page, total = get_all_jobs(running, queued, store, limit=4, cursor=cursor, **kwargs)
+                    assert total == expected_total
+                    paged.extend(j["id"] for j in page)
+                    if len(page) < 4:
+                        break
+                    cursor = encode_job_cursor(page[-1], sort_by)
+                assert paged == [j["id"] for j in expected]
+
+
+def test_database_history_survives_restart(tmp_path):
+    url = f"sqlite:///{tmp_path / 'history.db'}"
+    store = DatabaseHistoryStore(sessionmaker(bind=make_engine(url)))
+    store.put("a", make_entry("a", 100))
+
+    restarted = DatabaseHistoryStore(sessionmaker(bind=create_engine(url)))
+    entry = restarted.get("a")
+    assert entry["prompt"][1] == "a"
+    assert entry["status"]["status_str"] == "success"
+
+
+def test_migration_creates_history_table(tmp_path, monkeypatch):
+    from alembic import command
+    from app.database import db
+    from comfy.cli_args import args
+
+    monkeypatch.setattr(args, "database_url", f"sqlite:///{tmp_path / 'migrated.db'}")
+    command.upgrade(db.get_alembic_config(), "head")
+
+    store = DatabaseHistoryStore(sessionmaker(bind=create_engine(args.database_url)), max_items=2)
+    for i in range(3):
+        store.put(f"p{i}", make_entry(f"p{i}", i))
+    assert list(store.list()[0]) == ["p1", "p2"]
+
+
+@pytest.mark.skipif(os.environ.get("HISTORY_BENCHMARK") is None, reason="set HISTORY_BENCHMARK=1 to run")
+def test_benchmark_job_page(tmp_path):
+    n = 20000
+    history = {f"p{i:05}": make_entry(f"p{i:05}", 1000 + i, duration=i % 1000) for i in range(n)}
+    store = DatabaseHistoryStore(sessionmaker(bind=make_engine(f"sqlite:///{tmp_path / 'bench.db'}")))
+    for prompt_id, entry in history.items():
+        store.put(prompt_id, entry)
+
+    for name, source in [("dict", history), ("database", store)]:
+        start = time.perf_counter()
+        for _ in range(10):
+            get_all_jobs([], [], source, limit=50, sort_by="execution_duration")
+        print(f"{name}: {(time.perf_counter() - start) * 100:.2f} ms per page of {n} jobs")  # noqa: T201
+
+
+class BrokenStore(MemoryHistoryStore):
+    def __init__(self, queue):
+        super().__init__()
+        self.queue = queue
+        self.mutex_free = None
+
+    def put(self, prompt_id, entry):
+        # The queue mutex is reentrant, so probe it from another thread.
+        def probe():
+            if self.queue.mutex.acquire(blocking=False):
+                self.queue.mutex.release()
+                self.mutex_free = True
+        thread = threading.Thread(target=probe)
+        thread.start()
+        thread.join()
+        raise RuntimeError("database is locked")
+
+
+def test_task_done_survives_a_broken_store():
+    import torch
+    from comfy.cli_args import args
+    if not torch.cuda.is_available():
+        args.cpu = True
+    from execution import PromptQueue
+
+    class Server:
+        def queue_updated(self):
+            pass
+
+    queue = PromptQueue(Server())
+    store = BrokenStore(queue)
+    queue.set_history_store(store)
+    queue.put(make_entry("a", 100)["prompt"] + ({},))
+    _, item_id = queue.get()
+    queue.task_done(item_id, {"outputs": {}}, status=None, process_item=lambda p: p[:5])
+    assert store.mutex_free
+    assert isinstance(queue.history_store, MemoryHistoryStore) and queue.history_store is not store
+    assert queue.get_history(prompt_id="a")["a"]["prompt"][1] == "a"
+    assert queue.get_current_queue()[0] == []
@@ -237,3 +237,30 @@ def test_duration_consistency(video_components):
     manual_duration = float(components.images.shape[0] / components.frame_rate)
 
     assert duration == pytest.approx(manual_duration)
+
+
+def test_streamed_video_from_components(sample_audio):
+    """A video of streamed frames is saved one chunk at a time and materialized by get_components()"""
+    from comfy_api.latest import Types
+
+    frames = torch.rand(10, 16, 16, 3)
+    reads = []
+
+    def chunks():
+        for i in range(0, 10, 4):
+            reads.append(i)
+            yield frames[i:i+4]
+
+    video = VideoFromComponents(VideoComponents(images=Types.ImageStream(chunks, frames.shape), audio=sample_audio, frame_rate=Fraction(10)))
+    assert video.get_dimensions() == (16, 16)
+    assert video.get_frame_count() == 10
+    assert video.get_duration() == pytest.approx(1.0)
+    assert reads == []
+
+    buffer = io.BytesIO()
+    video.save_to(buffer, format=Types.VideoContainer.MP4)
+    assert reads == [0, 4, 8]
+    buffer.seek(0)
+    assert VideoFromFile(buffer).get_frame_count() == 10
+
+    assert torch.equal(video.get_components().images, frames)
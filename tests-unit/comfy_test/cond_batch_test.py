@@ -0,0 +1,102 @@
+import os
+import time
+import uuid
+
+import pytest
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.conds
+import comfy.model_management
+import comfy.samplers
+
+
+class FakePatcher:
+    def prepare_state(self, timestep):
+        pass
+
+    def apply_hooks(self, hooks):
+        return {}
+
+
+class FakeModel:
+    def __init__(self, memory_per_item=1):
+        self.current_patcher = FakePatcher()
+        self.memory_per_item = memory_per_item
+        self.batches = []
+
+    def memory_required(self, input_shape, cond_shapes={}):
+        return self.memory_per_item * input_shape[0]
+
+    def apply_model(self, x, t, c_crossattn=None, transformer_options=None, **kwargs):
+        self.batches.append(x.shape[0])
+        return x * c_crossattn.mean(dim=(1, 2)).view(-1, 1, 1, 1) + t.view(-1, 1, 1, 1)
+
+
+def make_cond(value, **kwargs):
+    return dict({"model_conds": {"c_crossattn": comfy.conds.CONDCrossAttn(torch.full((1, 4, 8), float(value)))}, "uuid": uuid.uuid4()}, **kwargs)
+
+
+def make_conds():
+    positive = [make_cond(1), make_cond(2, area=(4, 4, 0, 0), strength=0.5), make_cond(3, timestep_end=0.5)]
+    negative = [make_cond(-1)]
+    return [positive, negative]
+
+
+@pytest.fixture(autouse=True)
+def free_memory(monkeypatch):
+    monkeypatch.setattr(comfy.model_management, "get_free_memory", lambda *args, **kwargs: 100)
+
+
+def run(model, conds, model_options, steps=4):
+    x = torch.randn((1, 4, 8, 8), generator=torch.Generator().manual_seed(0))
+    return [comfy.samplers.calc_cond_batch(model, conds, x, torch.tensor([1.0 - i / steps]), model_options) for i in range(steps)]
+
+
+def test_plan_is_reused_across_steps():
+    conds = make_conds()
+    planner = comfy.samplers.CondBatchPlanner()
+    model = FakeModel()
+    out = run(model, conds, {"cond_batch_planner": planner}, steps=6)
+    reference_model = FakeModel()
+    reference = run(reference_model, conds, {}, steps=6)
+    for a, b in zip(out, reference):
+        torch.testing.assert_close(a, b)
+    assert model.batches == reference_model.batches
+    # timestep_end makes the third cond apply only in the last steps
+    assert planner.planned == 2 and planner.calls == 6 and planner.overhead > 0
+
+
+def test_plans_again_when_memory_is_short(monkeypatch):
+    conds = make_conds()
+    planner = comfy.samplers.CondBatchPlanner()
+    model = FakeModel(memory_per_item=20)
+    run(model, conds, {"cond_batch_planner": planner}, steps=2)
+    assert planner.planned == 1 and max(model.batches) == 3
+
+    monkeypatch.setattr(comfy.model_management, "get_free_memory", lambda *args, **kwargs: 40)
+    model.batches = []
+    run(model, conds, {"cond_batch_planner": planner}, steps=2)
+    assert planner.planned == 3 and max(model.batches) == 1  # Limited by memory, planned every step
+
+
+def test_new_conds_are_planned():
+    planner = comfy.samplers.CondBatchPlanner()
+    model = FakeModel()
+    run(model, make_conds(), {"cond_batch_planner": planner}, steps=1)
+    run(model, make_conds(), {"cond_batch_planner": planner}, steps=1)
+    assert planner.planned == 2
+
+
+@pytest.mark.skipif(not os.environ.get("COND_BATCH_BENCHMARK"), reason="set COND_BATCH_BENCHMARK=1 to run")
+def test_benchmark():
+    conds = [[make_cond(i, area=(4, 4, i % 4, i // 4 % 4)) for i in range(16)], [make_cond(-1)]]
+    for label, model_options in [("replanned", {}), ("planned once", {"cond_batch_planner": comfy.samplers.CondBatchPlanner()})]:
+        model = FakeModel()
+        run(model, conds, model_options, steps=2)
+        start = time.perf_counter()
+        run(model, conds, model_options, steps=100)
+        print("{:13s} {:7.3f} ms per step".format(label, (time.perf_counter() - start) * 10))  # noqa: T201
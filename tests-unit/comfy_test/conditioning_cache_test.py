@@ -0,0 +1,124 @@
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import pytest
+
+import comfy.conditioning_cache
+import comfy.model_patcher
+import comfy.sd
+
+
+class FakeTextEncoder(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.linear = torch.nn.Linear(4, 4)
+        self.options = {}
+        self.encodes = 0
+
+    def reset_clip_options(self):
+        self.options = {}
+
+    def set_clip_options(self, options):
+        self.options.update(options)
+
+    def encode_token_weights(self, tokens):
+        self.encodes += 1
+        x = torch.tensor([[float(t) for t, _ in tokens["l"][0]]]).repeat(4, 1).T.unsqueeze(0)
+        x = self.linear(x) * (1 + self.options.get("layer", 0))
+        return x, x.mean(dim=1), {"attention_mask": torch.ones(1, x.shape[1])}
+
+
+def make_clip():
+    clip = comfy.sd.CLIP(no_init=True)
+    clip.cond_stage_model = FakeTextEncoder()
+    clip.patcher = comfy.model_patcher.ModelPatcher(clip.cond_stage_model, torch.device("cpu"), torch.device("cpu"))
+    clip.tokenizer = None
+    clip.layer_idx = None
+    clip.tokenizer_options = {}
+    clip.use_clip_schedule = False
+    clip.apply_hooks_to_conds = None
+    return clip
+
+
+def tokens(*ids):
+    return {"l": [[(i, 1.0) for i in ids]]}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = comfy.conditioning_cache.ConditioningCache(max_size=1024 * 1024)
+    monkeypatch.setattr(comfy.conditioning_cache, "conditioning_cache", cache)
+    return cache
+
+
+def test_same_tokens_skip_the_encoder(cache):
+    clip = make_clip()
+    first = clip.encode_from_tokens(tokens(1, 2, 3), return_dict=True)
+    second = clip.clone().encode_from_tokens(tokens(1, 2, 3), return_dict=True)
+    assert clip.cond_stage_model.encodes == 1
+    assert torch.equal(first["cond"], second["cond"]) and torch.equal(first["attention_mask"], second["attention_mask"])
+    second["extra"] = 1  # Returned dicts are not the cached ones
+    assert "extra" not in clip.encode_from_tokens(tokens(1, 2, 3), return_dict=True)
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    clip.encode_from_tokens(tokens(1, 2, 4))
+    layer = clip.clone()
+    layer.clip_layer(-2)
+    layer.encode_from_tokens(tokens(1, 2, 3))
+    clip.encode_from_tokens(tokens(1, 2, 3), return_pooled="unprojected")
+    assert clip.cond_stage_model.encodes == 4
+
+
+def test_patches_and_hooks(cache):
+    clip = make_clip()
+    clip.encode_from_tokens(tokens(1))
+    patched = clip.clone()
+    lora = {"linear.weight": (torch.ones(4, 4),)}
+    patched.add_patches(lora, 0.5)
+    patched.encode_from_tokens(tokens(1))
+    patched.clone().encode_from_tokens(tokens(1))
+    assert clip.cond_stage_model.encodes == 2
+    other = clip.clone()
+    other.add_patches(lora, 1.0)
+    other.encode_from_tokens(tokens(1))
+    assert clip.cond_stage_model.encodes == 3
+    assert comfy.conditioning_cache.cache_key(patched, tokens(1))[1] is False
+
+    hooked = clip.clone()
+    hooked.patcher.forced_hooks = object()
+    assert comfy.conditioning_cache.cache_key(hooked, tokens(1)) is None
+
+
+def test_size_limit():
+    cache = comfy.conditioning_cache.ConditioningCache(max_size=1000)
+    for i in range(4):
+        cache.put(("k{}".format(i), False), (torch.zeros(100),))
+    assert list(cache.entries) == ["k2", "k3"] and cache.size == 800
+    cache.put(("big", False), (torch.zeros(1000),))
+    assert "big" not in cache.entries
+
+
+def test_persisted_across_instances(tmp_path):
+    output = (torch.randn(1, 3, 4), torch.randn(1, 4), {"attention_mask": torch.ones(1, 3), "flag": True})
+    cache = comfy.conditioning_cache.ConditioningCache(max_size=1024 * 1024, directory=str(tmp_path), max_disk_size=1024 * 1024)
+    cache.put(("a" * 64, True), output)
+    cache.put(("b" * 64, False), output)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    loaded = comfy.conditioning_cache.ConditioningCache(max_size=1024 * 1024, directory=str(tmp_path), max_disk_size=1024 * 1024).get(("a" * 64, True))
+    assert torch.equal(loaded[0], output[0]) and torch.equal(loaded[1], output[1])
+    assert loaded[2]["flag"] is True and torch.equal(loaded[2]["attention_mask"], output[2]["attention_mask"])
+
+
+def test_file_source_is_persistent(tmp_path):
+    path = tmp_path / "te.safetensors"
+    path.write_bytes(b"x")
+    clip = make_clip()
+    comfy.conditioning_cache.set_source(clip, [str(path)], {"dtype": torch.float16})
+    key = comfy.conditioning_cache.cache_key(clip, tokens(1))
+    assert key[1] is True
+    assert comfy.conditioning_cache.cache_key(clip.clone(), tokens(1)) == key
+    assert comfy.conditioning_cache.cache_key(make_clip(), tokens(1))[0] != key[0]
@@ -0,0 +1,113 @@
+import os
+import random
+
+import pytest
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.eviction
+import comfy.model_management
+import comfy.model_patcher
+
+GB = 1024 ** 3
+
+
+def test_cost_aware_keeps_expensive_models():
+    # A big model that's slow to load used with a rotation of small ones that don't all fit next to it.
+    models = {"unet": (6 * GB, 10.0), "clip": (2 * GB, 0.5), "vae": (2 * GB, 0.5), "upscale": (2 * GB, 0.5)}
+    trace = ["clip", "unet", "vae", "upscale"] * 20
+    lru = comfy.eviction.simulate(comfy.eviction.LRUPolicy(), trace, models, 10 * GB)
+    cost_lru = comfy.eviction.simulate(comfy.eviction.CostAwareLRUPolicy(), trace, models, 10 * GB)
+    assert lru["loads"] == len(trace)  # LRU always evicts the model needed next
+    assert cost_lru["load_seconds"] < lru["load_seconds"] / 5
+    assert cost_lru["requests"] == lru["requests"] == len(trace)
+
+
+def test_recently_used_models_stay_loaded():
+    models = {name: (GB, 1.0) for name in "abc"}
+    stats = comfy.eviction.simulate(comfy.eviction.CostAwareLRUPolicy(), ["a", "b", "a", "c", "a", "b", "a", "c"], models, 2 * GB)
+    assert stats["unloads"] == 3  # Always b or c, never a
+
+
+def test_legacy_order():
+    usage = comfy.eviction.ModelUsage()
+    policy = comfy.eviction.LegacyPolicy()
+    candidates = [
+        comfy.eviction.EvictionCandidate(usage, 4, 0, 4, 3),
+        comfy.eviction.EvictionCandidate(usage, 2, 2, 4, 3),
+        comfy.eviction.EvictionCandidate(usage, 2, 0, 2, 3),
+        comfy.eviction.EvictionCandidate(usage, 8, 0, 8, 2),
+    ]
+    assert sorted(range(4), key=lambda i: policy.key(candidates[i], 0)) == [1, 3, 2, 0]
+
+
+def test_reload_cost_is_measured():
+    usage = comfy.eviction.ModelUsage()
+    assert usage.reload_cost(comfy.eviction.DEFAULT_BANDWIDTH) == 1.0
+    usage.record_load(GB, 2.0)
+    usage.record_load(1024, 5.0)  # Too small to be measured
+    assert usage.reload_cost(GB // 2) == 1.0
+    assert usage.loads == 2
+
+
+def make_patcher(size):
+    return comfy.model_patcher.ModelPatcher(torch.nn.Sequential(torch.nn.Linear(size, size)), torch.device("cpu"), torch.device("cpu"))
+
+
+def test_free_memory_uses_policy(monkeypatch):
+    comfy.model_management.unload_all_models()
+    old, recent = make_patcher(64), make_patcher(64)
+    comfy.model_management.load_models_gpu([old])
+    comfy.model_management.load_models_gpu([recent])
+    assert comfy.model_management.get_model_usage(recent).last_used > comfy.model_management.get_model_usage(old).last_used
+
+    free = iter([0, 1e30])  # Enough after one model is unloaded
+    monkeypatch.setattr(comfy.model_management, "get_free_memory", lambda *args, **kwargs: next(free))
+    monkeypatch.setattr(comfy.model_management, "eviction_policy", comfy.eviction.LRUPolicy())
+    before = dict(comfy.model_management.model_churn)
+    unloaded = comfy.model_management.free_memory(1e20, torch.device("cpu"))
+    assert [m.model for m in unloaded] == [old]
+    assert comfy.model_management.model_churn["unloads"] == before["unloads"] + 1
+    assert comfy.model_management.get_model_usage(old).unloads == 1
+    assert comfy.model_management.get_model_usage(old.clone()) is comfy.model_management.get_model_usage(old)
+
+    stats = comfy.model_management.eviction_stats()
+    assert stats["eviction_policy"] == "lru"
+    assert stats["loaded_models"] == 1
+    monkeypatch.undo()
+    comfy.model_management.unload_all_models()
+
+
+def make_trace(rng):
+    """Workflows made of a text encoder, a diffusion model, some extra models and a VAE, run with Zipf-like popularity."""
+    models = {}
+    for prefix, count, low, high in [("unet", 5, 5, 12), ("te", 4, 1, 9), ("vae", 3, 0.1, 0.4), ("extra", 6, 0.2, 2.5)]:
+        for i in range(count):
+            size = rng.uniform(low, high)
+            models["{}{}".format(prefix, i)] = (size * GB, size * rng.uniform(0.3, 1.2))  # Patched weights load slower
+    names = {prefix: [n for n in models if n.startswith(prefix)] for prefix in ("unet", "te", "vae", "extra")}
+    workflows = []
+    for _ in range(8):
+        extra = rng.sample(names["extra"], rng.randint(0, 2))
+        workflows.append([rng.choice(names["te"]), rng.choice(names["unet"])] + extra + [rng.choice(names["vae"])])
+    trace = []
+    for _ in range(400):
+        trace += rng.choices(workflows, weights=[1 / (i + 1) for i in range(len(workflows))])[0] * rng.randint(1, 3)
+    return models, trace
+
+
+@pytest.mark.skipif(not os.environ.get("EVICTION_SIMULATION"), reason="set EVICTION_SIMULATION=1 to run")
+def test_simulate_policies():
+    for capacity in (12, 16, 24):
+        totals = {name: [0, 0.0] for name in comfy.eviction.POLICIES}
+        for seed in range(10):
+            models, trace = make_trace(random.Random(seed))
+            for name, policy in comfy.eviction.POLICIES.items():
+                stats = comfy.eviction.simulate(policy(), trace, models, capacity * GB)
+                totals[name][0] += stats["loads"]
+                totals[name][1] += stats["load_seconds"]
+        for name, (loads, seconds) in totals.items():
+            print("{:2d} GB {:8s} loads {:6d} load time {:8.0f} s".format(capacity, name, loads, seconds))  # noqa: T201
@@ -0,0 +1,119 @@
+import pytest
+import safetensors
+import safetensors.torch
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.sd
+import comfy.utils
+from comfy.ldm.models.autoencoder import AutoencoderKL
+
+
+def bytes_read(sd):
+    return next(v for v in sd.data.values() if isinstance(v, comfy.utils.LazyTensor)).source.bytes_read
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    sd = {
+        "model.diffusion_model.a.weight": torch.randn(32, 16),
+        "model.diffusion_model.b.weight": torch.randn(16, dtype=torch.float16),
+        "first_stage_model.decoder.weight": torch.randn(8, 8),
+        "cond_stage_model.transformer.weight": torch.randn(4, 4),
+    }
+    path = str(tmp_path / "checkpoint.safetensors")
+    safetensors.torch.save_file(sd, path)
+    return path, sd
+
+
+def test_only_reads_accessed_tensors(checkpoint):
+    path, expected = checkpoint
+    sd = comfy.utils.load_torch_file(path, lazy=True)
+    assert isinstance(sd, comfy.utils.LazyStateDict)
+    with safetensors.safe_open(path, framework="pt") as f:
+        assert list(sd.keys()) == list(f.keys())
+
+    assert sd.peek("model.diffusion_model.a.weight").shape == (32, 16)
+    assert sd.peek("model.diffusion_model.b.weight").dtype == torch.float16
+    assert comfy.utils.calculate_parameters(sd, "model.diffusion_model.") == 32 * 16 + 16
+    assert comfy.utils.weight_dtype(sd, "model.diffusion_model.") == torch.float32
+    assert bytes_read(sd) == 0
+
+    assert torch.equal(sd["first_stage_model.decoder.weight"], expected["first_stage_model.decoder.weight"])
+    assert bytes_read(sd) == 8 * 8 * 4
+    sd["first_stage_model.decoder.weight"]
+    assert bytes_read(sd) == 8 * 8 * 4
+
+
+def test_renames_and_splits_dont_read(checkpoint):
+    path, expected = checkpoint
+    sd = comfy.utils.load_torch_file(path, lazy=True)
+    unet = comfy.utils.state_dict_prefix_replace(sd, {"model.diffusion_model.": ""}, filter_keys=True)
+    assert isinstance(unet, comfy.utils.LazyStateDict)
+    assert sorted(unet.keys()) == ["a.weight", "b.weight"]
+    assert "model.diffusion_model.a.weight" not in sd
+
+    comfy.utils.state_dict_prefix_replace(sd, {"cond_stage_model.": "clip_l."})
+    comfy.utils.state_dict_key_replace(sd, {"first_stage_model.decoder.weight": "vae.weight"})
+    copy = sd.copy()
+    del copy["vae.weight"]
+    assert sorted(sd.keys()) == ["clip_l.transformer.weight", "vae.weight"]
+    assert bytes_read(sd) == 0
+
+    assert torch.equal(unet.pop("a.weight"), expected["model.diffusion_model.a.weight"])
+    assert unet.pop("missing", None) is None
+    assert bytes_read(sd) == 32 * 16 * 4
+
+
+@pytest.mark.parametrize("disable_mmap", [False, True])
+def test_bulk_load(checkpoint, monkeypatch, disable_mmap):
+    path, expected = checkpoint
+    monkeypatch.setattr(comfy.utils, "DISABLE_MMAP", disable_mmap)
+    sd = comfy.utils.load_torch_file(path, lazy=True)
+    sd.load([k for k in sd.keys() if k.startswith("model.")])
+    assert not isinstance(sd.peek("model.diffusion_model.a.weight"), comfy.utils.LazyTensor)
+    assert isinstance(sd.peek("first_stage_model.decoder.weight"), comfy.utils.LazyTensor)
+    for k in expected:
+        assert torch.equal(sd[k], expected[k])
+
+
+def test_vae_from_checkpoint_reads_only_vae(tmp_path):
+    ddconfig = {'double_z': True, 'z_channels': 4, 'resolution': 256, 'in_channels': 3, 'out_ch': 3, 'ch': 128, 'ch_mult': [1, 2, 4, 4], 'num_res_blocks': 2, 'attn_resolutions': [], 'dropout': 0.0}
+    with torch.device("meta"):
+        vae_keys = AutoencoderKL(ddconfig=ddconfig, embed_dim=4).state_dict()
+    sd = {"first_stage_model." + k: torch.zeros(v.shape, dtype=torch.float16) for k, v in vae_keys.items()}
+    vae_bytes = sum(v.numel() * 2 for v in sd.values())
+    for i in range(4):
+        sd["model.diffusion_model.block{}.weight".format(i)] = torch.zeros(4 * 1024 * 1024, dtype=torch.float16)
+    sd["cond_stage_model.transformer.weight"] = torch.zeros(1024 * 1024, dtype=torch.float16)
+    path = str(tmp_path / "checkpoint.safetensors")
+    safetensors.torch.save_file(sd, path)
+    del sd
+
+    sd = comfy.utils.load_torch_file(path, lazy=True)
+    vae_sd = comfy.utils.state_dict_prefix_replace(sd, {"first_stage_model.": ""}, filter_keys=True)
+    comfy.sd.VAE(sd=vae_sd)
+    assert bytes_read(sd) == vae_bytes
+
+
+def test_convert_old_quants_matches_eager(tmp_path):
+    sd = {
+        "net.scaled_fp8": torch.zeros(2, dtype=torch.float8_e4m3fn),
+        "net.layer.weight": torch.randn(64, 64).to(torch.float8_e4m3fn),
+        "net.layer.scale_weight": torch.tensor(0.5),
+        "net.layer.scale_input": torch.tensor(1.0),
+        "vae.weight": torch.randn(1024, 1024),
+    }
+    path = str(tmp_path / "scaled.safetensors")
+    safetensors.torch.save_file(sd, path)
+
+    eager, _ = comfy.utils.convert_old_quants(comfy.utils.load_torch_file(path), "net.", metadata={})
+    lazy, _ = comfy.utils.convert_old_quants(comfy.utils.load_torch_file(path, lazy=True), "net.", metadata={})
+    assert isinstance(lazy, comfy.utils.LazyStateDict)
+    assert isinstance(lazy.peek("vae.weight"), comfy.utils.LazyTensor)
+    assert list(lazy.keys()) == list(eager.keys())
+    for k in eager:
+        assert torch.equal(lazy[k].reshape(-1).view(torch.uint8), eager[k].reshape(-1).view(torch.uint8))
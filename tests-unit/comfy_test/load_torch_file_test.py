@@ -0,0 +1,93 @@
+import os
+import time
+
+import pytest
+import safetensors
+import safetensors.torch
+import torch
+
+import comfy.utils
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    sd = {
+        "model.weight": torch.randn(64, 33),
+        "model.bias": torch.randn(33, dtype=torch.float16),
+        "vae.big": torch.randn(3 * 1024 * 1024 // 4 + 5),
+        "steps": torch.tensor(7, dtype=torch.int64),
+        "mask": torch.rand(10) > 0.5,
+        "empty": torch.zeros(0, 4, dtype=torch.bfloat16),
+        "fp8": torch.randn(16).to(torch.float8_e4m3fn),
+    }
+    path = str(tmp_path / "model.safetensors")
+    safetensors.torch.save_file(sd, path, metadata={"format": "pt"})
+    return path, sd
+
+
+def assert_same_state_dict(a, b):
+    assert list(a.keys()) == list(b.keys())
+    for k in a:
+        assert a[k].dtype == b[k].dtype
+        assert a[k].shape == b[k].shape
+        assert torch.equal(a[k].view(torch.uint8) if a[k].dtype == torch.float8_e4m3fn else a[k], b[k].view(torch.uint8) if b[k].dtype == torch.float8_e4m3fn else b[k])
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_parallel_load_matches_safe_open(checkpoint, monkeypatch, threads):
+    path, _ = checkpoint
+    monkeypatch.setattr(comfy.utils, "LOAD_CHUNK_SIZE", 1024 * 1024)
+    sd, metadata = comfy.utils.load_safetensors_parallel(path, threads=threads)
+    with safetensors.safe_open(path, framework="pt") as f:
+        expected = {k: f.get_tensor(k) for k in f.keys()}
+        assert metadata == f.metadata()
+    assert_same_state_dict(sd, expected)
+
+
+def test_load_torch_file_without_mmap(checkpoint, monkeypatch):
+    path, _ = checkpoint
+    expected, expected_metadata = comfy.utils.load_torch_file(path, return_metadata=True)
+    monkeypatch.setattr(comfy.utils, "DISABLE_MMAP", True)
+    monkeypatch.setattr(comfy.utils, "LOAD_THREADS", 4)
+    calls = []
+    original = comfy.utils.load_safetensors_parallel
+    monkeypatch.setattr(comfy.utils, "load_safetensors_parallel", lambda *args: calls.append(args) or original(*args))
+    sd, metadata = comfy.utils.load_torch_file(path, return_metadata=True)
+    assert len(calls) == 1
+    assert metadata == expected_metadata
+    assert_same_state_dict(sd, expected)
+
+
+def test_invalid_files_use_regular_loader(tmp_path, checkpoint):
+    path, _ = checkpoint
+    truncated = str(tmp_path / "truncated.safetensors")
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(truncated, "wb") as f:
+        f.write(data[:-100])
+    assert comfy.utils.load_safetensors_parallel(truncated) is None
+
+    garbage = str(tmp_path / "garbage.safetensors")
+    with open(garbage, "wb") as f:
+        f.write(b"\x10\x00\x00\x00\x00\x00\x00\x00not json at all!")
+    assert comfy.utils.load_safetensors_parallel(garbage) is None
+
+
+@pytest.mark.skipif(not os.environ.get("LOAD_BENCHMARK"), reason="set LOAD_BENCHMARK=1 to run")
+def test_benchmark_parallel_load(tmp_path):
+    size_mb = int(os.environ.get("LOAD_BENCHMARK_MB", "1024"))
+    sd = {f"layer.{i}.weight": torch.randn(1024, 1024) for i in range(size_mb // 4)}
+    path = str(tmp_path / "big.safetensors")
+    safetensors.torch.save_file(sd, path)
+    del sd
+
+    def regular():
+        with safetensors.safe_open(path, framework="pt", device="cpu") as f:
+            return {k: f.get_tensor(k).to(device="cpu", copy=True) for k in f.keys()}
+
+    results = {}
+    for name, load in [("mmap + copy (--disable-mmap before)", regular), ("parallel, 1 thread", lambda: comfy.utils.load_safetensors_parallel(path, threads=1)), ("parallel, 8 threads", lambda: comfy.utils.load_safetensors_parallel(path, threads=8))]:
+        start = time.perf_counter()
+        load()
+        results[name] = time.perf_counter() - start
+        print(f"{name}: {results[name]:.2f} s, {size_mb / results[name]:.0f} MB/s")  # noqa: T201
@@ -0,0 +1,88 @@
+import pytest
+import safetensors.torch
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.model_detection
+import comfy.model_detection_cache
+import comfy.ops
+from comfy.ldm.modules.diffusionmodules.openaimodel import UNetModel
+
+SD15_CONFIG = {
+    'use_checkpoint': False, 'image_size': 32, 'out_channels': 4, 'use_spatial_transformer': True, 'legacy': False,
+    'adm_in_channels': None, 'in_channels': 4, 'model_channels': 320, 'num_res_blocks': [2, 2, 2, 2],
+    'transformer_depth': [1, 1, 1, 1, 1, 1, 0, 0], 'channel_mult': [1, 2, 4, 4], 'transformer_depth_middle': 1,
+    'use_linear_in_transformer': False, 'context_dim': 768, 'num_heads': 8,
+    'transformer_depth_output': [1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0], 'use_temporal_attention': False, 'use_temporal_resblock': False,
+}
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = comfy.model_detection_cache.DetectionCache(str(tmp_path / "cache" / "model_detection.json"))
+    monkeypatch.setattr(comfy.model_detection_cache, "detection_cache", cache)
+    return cache
+
+
+@pytest.fixture(scope="module")
+def sd15():
+    with torch.device("meta"):
+        unet = UNetModel(**SD15_CONFIG, operations=comfy.ops.disable_weight_init)
+    return {"model.diffusion_model." + k: v for k, v in unet.state_dict().items()}
+
+
+def count_detections(monkeypatch):
+    calls = []
+    original = comfy.model_detection.detect_unet_config
+    monkeypatch.setattr(comfy.model_detection, "detect_unet_config", lambda *args, **kwargs: calls.append(args) or original(*args, **kwargs))
+    return calls
+
+
+def test_cached_result_matches_detection(cache, sd15, monkeypatch):
+    calls = count_detections(monkeypatch)
+    first = comfy.model_detection.model_config_from_unet(sd15, "model.diffusion_model.")
+    second = comfy.model_detection.model_config_from_unet(dict(sd15), "model.diffusion_model.")
+    assert len(calls) == 1
+    assert type(first).__name__ == type(second).__name__ == "SD15"
+    assert first.unet_config == second.unet_config
+    assert second.unet_config is not first.unet_config
+
+    reloaded = comfy.model_detection_cache.DetectionCache(cache.path)
+    monkeypatch.setattr(comfy.model_detection_cache, "detection_cache", reloaded)
+    third = comfy.model_detection.model_config_from_unet(sd15, "model.diffusion_model.")
+    assert len(calls) == 1
+    assert reloaded.hits == 1
+    assert third.unet_config == first.unet_config
+
+
+def test_different_shapes_are_detected_again(cache, sd15, monkeypatch):
+    calls = count_detections(monkeypatch)
+    comfy.model_detection.model_config_from_unet(sd15, "model.diffusion_model.")
+    sd = dict(sd15)
+    sd["model.diffusion_model.input_blocks.0.0.weight"] = torch.empty((320, 9, 3, 3), device="meta")
+    inpaint = comfy.model_detection.model_config_from_unet(sd, "model.diffusion_model.")
+    assert len(calls) == 2
+    assert inpaint.unet_config["in_channels"] == 9
+
+
+def test_values_round_trip():
+    value = {"a": (1, 2, [3, (4,)]), "dtype": torch.float32, "none": None, "nested": {"x": 1.5, "y": "s"}}
+    encoded = comfy.model_detection_cache.encode_value(value)
+    assert comfy.model_detection_cache.decode_value(encoded) == value
+    with pytest.raises(TypeError):
+        comfy.model_detection_cache.encode_value({"a": object()})
+
+
+def test_warm(cache, tmp_path, monkeypatch):
+    sd = {"model.diffusion_model.unknown.weight": torch.zeros(4, 4), "first_stage_model.decoder.weight": torch.zeros(2)}
+    path = str(tmp_path / "model.safetensors")
+    safetensors.torch.save_file(sd, path)
+    assert comfy.model_detection_cache.warm([path], [path, str(tmp_path / "missing.safetensors")]) == 2
+    assert len(cache.entries) == 2  # Checkpoints and diffusion models are prepared differently
+
+    calls = count_detections(monkeypatch)
+    comfy.model_detection_cache.warm([path], [path])
+    assert calls == []
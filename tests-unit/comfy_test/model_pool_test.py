@@ -0,0 +1,171 @@
+import gc
+import os
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.model_management
+import comfy.model_patcher
+import comfy.model_pool
+import comfy.sd
+
+MB = 1024 * 1024
+
+
+class FakeModel:
+    def __init__(self, size):
+        self.size = size
+
+    def get_ram_usage(self):
+        return self.size
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(comfy.model_pool.psutil, "virtual_memory", lambda: SimpleNamespace(available=64 * 1024 ** 3))
+    return comfy.model_pool.ModelPool(max_size=100 * MB, ram_headroom=4.0)
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for i in range(4):
+        path = tmp_path / "model{}.safetensors".format(i)
+        path.write_bytes(b"x")
+        paths.append(str(path))
+    return paths
+
+
+def load_counter(size=40 * MB):
+    loads = []
+
+    def load():
+        loads.append(1)
+        return (FakeModel(size), None)
+    return loads, load
+
+
+def test_reuses_loaded_models(pool, files):
+    loads, load = load_counter()
+    a = pool.load("checkpoint", [files[0]], {"dtype": torch.float16}, load)
+    b = pool.load("checkpoint", [files[0]], {"dtype": torch.float16}, load)
+    assert len(loads) == 1
+    assert b[1] is None
+    assert a[0] is not b[0] and a[0].size == b[0].size  # Copies of the same pooled model
+
+    pool.load("checkpoint", [files[0]], {"dtype": torch.float8_e4m3fn}, load)
+    pool.load("clip", [files[0]], {"dtype": torch.float16}, load)
+    assert len(loads) == 3
+
+    os.utime(files[0], ns=(0, 0))
+    pool.load("checkpoint", [files[0]], {"dtype": torch.float16}, load)
+    assert len(loads) == 4
+
+
+def test_disabled_pool_always_loads(files):
+    pool = comfy.model_pool.ModelPool(max_size=0)
+    loads, load = load_counter()
+    pool.load("checkpoint", [files[0]], {}, load)
+    pool.load("checkpoint", [files[0]], {}, load)
+    assert len(loads) == 2
+    assert pool.entries == {}
+
+
+def test_only_idle_models_are_evicted(pool, files):
+    loads, load = load_counter()
+    in_use = [pool.load("checkpoint", [f], {}, load) for f in files[:3]]
+    assert len(pool.entries) == 3  # 120MB in total but all in use
+    assert pool.idle_size() == 0
+
+    del in_use[0]
+    gc.collect()
+    pool.trim()
+    assert len(pool.entries) == 3
+
+    in_use.clear()
+    gc.collect()
+    pool.trim()
+    assert len(pool.entries) == 2
+    assert pool.idle_size() == 80 * MB
+
+    pool.load("checkpoint", [files[1]], {}, load)  # Most recently used now
+    gc.collect()
+    pool.load("checkpoint", [files[3]], {}, load)
+    gc.collect()
+    pool.trim()
+    assert sorted(k[1][0][0] for k in pool.entries) == sorted(os.path.realpath(f) for f in [files[1], files[3]])
+
+
+def test_low_ram_evicts_idle_models(pool, files, monkeypatch):
+    loads, load = load_counter()
+    pool.load("checkpoint", [files[0]], {}, load)
+    in_use = pool.load("checkpoint", [files[1]], {}, load)  # noqa: F841
+    gc.collect()
+    monkeypatch.setattr(comfy.model_pool.psutil, "virtual_memory", lambda: SimpleNamespace(available=1024 ** 3))
+    pool.trim()
+    assert [k[1][0][0] for k in pool.entries] == [os.path.realpath(files[1])]
+
+
+def test_model_patchers_are_cloned(pool, files):
+    def load():
+        return (comfy.model_patcher.ModelPatcher(torch.nn.Linear(4, 4), torch.device("cpu"), torch.device("cpu")),)
+
+    (a,) = pool.load("diffusion_model", [files[0]], {}, load)
+    a.add_patches({"weight": (torch.ones(4, 4),)})
+    (b,) = pool.load("diffusion_model", [files[0]], {}, load)
+    assert b.model is a.model
+    assert b.patches == {}
+
+
+def test_models_are_pooled_per_load_device(pool, files, monkeypatch):
+    loads, load = load_counter()
+    pool.load("checkpoint", [files[0]], {}, load)
+    monkeypatch.setattr(comfy.model_management, "get_torch_device", lambda: torch.device("cuda", 1))
+    pool.load("checkpoint", [files[0]], {}, load)
+    pool.load("checkpoint", [files[0]], {}, load)
+    assert len(loads) == 2
+
+
+def test_clones_of_clones_keep_models_in_use(pool, files):
+    def load_model():
+        return (comfy.model_patcher.ModelPatcher(torch.nn.Linear(4, 4), torch.device("cpu"), torch.device("cpu")),)
+
+    def load_clip():
+        clip = comfy.sd.CLIP(no_init=True)
+        clip.cond_stage_model = torch.nn.Linear(4, 4)
+        clip.patcher = comfy.model_patcher.ModelPatcher(clip.cond_stage_model, torch.device("cpu"), torch.device("cpu"))
+        clip.tokenizer = None
+        clip.layer_idx = None
+        clip.tokenizer_options = {}
+        clip.use_clip_schedule = False
+        clip.apply_hooks_to_conds = None
+        return (clip,)
+
+    (model,) = pool.load("diffusion_model", [files[0]], {}, load_model)
+    (clip,) = pool.load("clip", [files[1]], {}, load_clip)
+    lora_model, lora_clip = model.clone(), clip.clone()
+    del model, clip
+    gc.collect()
+    assert pool.idle_size() == 0
+
+    del lora_model, lora_clip
+    gc.collect()
+    assert pool.idle_size() == sum(e.size for e in pool.entries.values()) > 0
+
+
+def test_copies_sharing_the_patcher_are_idle_when_dropped(pool, files):
+    class FakeVAE(FakeModel):
+        def __init__(self, size):
+            super().__init__(size)
+            self.patcher = object()
+
+    (vae,) = pool.load("vae", [files[0]], {}, lambda: (FakeVAE(40 * MB),))
+    assert pool.idle_size() == 0
+    del vae
+    gc.collect()
+    assert pool.idle_size() == 40 * MB
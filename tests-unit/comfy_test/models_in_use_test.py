@@ -0,0 +1,90 @@
+import threading
+import time
+
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.model_management
+import comfy.model_patcher
+
+
+def make_patcher():
+    return comfy.model_patcher.ModelPatcher(torch.nn.Sequential(torch.nn.Linear(8, 8)), torch.device("cpu"), torch.device("cpu"))
+
+
+def no_free_memory(dev=None, torch_free_too=False):
+    return (0, 0) if torch_free_too else 0
+
+
+def in_thread(func):
+    thread = threading.Thread(target=func, daemon=True)
+    thread.start()
+    return thread
+
+
+class OtherWorker:
+    """Uses models on another thread, like a second prompt worker sampling with them."""
+    def __init__(self, models):
+        self.using = threading.Event()
+        self.done = threading.Event()
+
+        def run():
+            comfy.model_management.use_models(models)
+            self.using.set()
+            self.done.wait()
+            comfy.model_management.release_models(models)
+        self.thread = in_thread(run)
+        self.using.wait()
+
+    def release(self):
+        self.done.set()
+        self.thread.join()
+
+
+def test_models_used_by_other_threads_are_not_unloaded(monkeypatch):
+    comfy.model_management.unload_all_models()
+    model = make_patcher()
+    comfy.model_management.load_models_gpu([model])
+    worker = OtherWorker([model])
+
+    monkeypatch.setattr(comfy.model_management, "get_free_memory", no_free_memory)
+    assert comfy.model_management.free_memory(1e30, torch.device("cpu")) == []
+    comfy.model_management.unload_all_models()
+    assert model in [m.model for m in comfy.model_management.current_loaded_models]
+
+    worker.release()
+    assert [m.model for m in comfy.model_management.free_memory(1e30, torch.device("cpu"))] == [model]
+
+
+def test_own_models_can_be_unloaded(monkeypatch):
+    comfy.model_management.unload_all_models()
+    model = make_patcher()
+    comfy.model_management.load_models_gpu([model])
+    comfy.model_management.use_models([model])
+    try:
+        monkeypatch.setattr(comfy.model_management, "get_free_memory", no_free_memory)
+        assert [m.model for m in comfy.model_management.free_memory(1e30, torch.device("cpu"))] == [model]
+    finally:
+        comfy.model_management.release_models([model])
+
+
+def test_clone_waits_for_the_model_in_use():
+    comfy.model_management.unload_all_models()
+    model = make_patcher()
+    comfy.model_management.load_models_gpu([model])
+    worker = OtherWorker([model])
+
+    clone = model.clone()
+    clone.add_patches({"0.weight": (torch.ones(8, 8),)}, 1.0)
+    loaded = threading.Event()
+    loader = in_thread(lambda: comfy.model_management.load_models_gpu([clone]) or loaded.set())
+    time.sleep(0.2)
+    assert not loaded.is_set()
+
+    worker.release()
+    loader.join(timeout=5)
+    assert loaded.is_set()
+    comfy.model_management.unload_all_models()
@@ -0,0 +1,195 @@
+import itertools
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+import torch
+
+import comfy.utils
+
+
+def reference_tiled_scale(samples, function, tile, overlap, upscale_amount, out_channels, downscale=False, index_formulas=None):
+    """The tile loop tiled_scale_multidim used to run: one tile at a time with a mask built per tile."""
+    dims = len(tile)
+    if not isinstance(overlap, (tuple, list)):
+        overlap = [overlap] * dims
+    get_scale = (lambda d, v: v / upscale_amount) if downscale else (lambda d, v: v * upscale_amount)
+    get_pos = get_scale
+    if index_formulas is not None:
+        get_pos = lambda d, v: index_formulas(v)
+    output = torch.empty([samples.shape[0], out_channels] + [round(get_scale(d, samples.shape[d + 2])) for d in range(dims)])
+    for b in range(samples.shape[0]):
+        s = samples[b:b+1]
+        out = torch.zeros([1] + list(output.shape[1:]))
+        out_div = torch.zeros([1] + list(output.shape[1:]))
+        positions = [range(0, s.shape[d+2] - overlap[d], tile[d] - overlap[d]) if s.shape[d+2] > tile[d] else [0] for d in range(dims)]
+        for it in itertools.product(*positions):
+            s_in = s
+            upscaled = []
+            for d in range(dims):
+                pos = max(0, min(s.shape[d + 2] - overlap[d], it[d]))
+                s_in = s_in.narrow(d + 2, pos, min(tile[d], s.shape[d + 2] - pos))
+                upscaled.append(round(get_pos(d, pos)))
+            ps = function(s_in)
+            mask = torch.ones_like(ps)
+            for d in range(2, dims + 2):
+                feather = round(get_scale(d - 2, overlap[d - 2]))
+                if feather >= mask.shape[d]:
+                    continue
+                for t in range(feather):
+                    a = (t + 1) / feather
+                    mask.narrow(d, t, 1).mul_(a)
+                    mask.narrow(d, mask.shape[d] - 1 - t, 1).mul_(a)
+            o = out
+            o_d = out_div
+            for d in range(dims):
+                o = o.narrow(d + 2, upscaled[d], mask.shape[d + 2])
+                o_d = o_d.narrow(d + 2, upscaled[d], mask.shape[d + 2])
+            o.add_(ps * mask)
+            o_d.add_(mask)
+        output[b:b+1] = out / out_div
+    return output
+
+
+def upscale_fn(dims, scale):
+    def fn(a):
+        out = a
+        for d in range(dims):
+            out = out.repeat_interleave(scale, dim=d + 2)
+        return torch.sin(out * 3.0) + out
+    return fn
+
+
+class Counter:
+    def __init__(self):
+        self.steps = 0
+
+    def update(self, n):
+        self.steps += n
+
+
+@pytest.mark.parametrize("shape,tile,overlap", [
+    ((2, 3, 37), (16,), 4),
+    ((2, 3, 37, 50), (16, 24), 4),
+    ((1, 3, 9, 20, 17), (4, 8, 8), (1, 2, 2)),
+])
+@pytest.mark.parametrize("max_batch", [1, 3, 64])
+def test_upscale_matches_reference(shape, tile, overlap, max_batch):
+    samples = torch.randn(shape, generator=torch.Generator().manual_seed(0))
+    dims = len(tile)
+    fn = upscale_fn(dims, 2)
+    pbar = Counter()
+    out = comfy.utils.tiled_scale_multidim(samples, fn, tile=tile, overlap=overlap, upscale_amount=2, out_channels=3, pbar=pbar, max_batch=max_batch)
+    ref = reference_tiled_scale(samples, fn, tile, overlap, 2, 3)
+    torch.testing.assert_close(out, ref)
+    positions = 1
+    for d in range(dims):
+        o = overlap[d] if isinstance(overlap, tuple) else overlap
+        positions *= len(range(0, shape[d + 2] - o, tile[d] - o))
+    assert pbar.steps == shape[0] * positions
+
+
+def test_downscale_and_index_formula_match_reference():
+    samples = torch.randn((3, 4, 40, 33), generator=torch.Generator().manual_seed(1))
+    fn = lambda a: torch.nn.functional.avg_pool2d(a, 4) * 2.0
+    out = comfy.utils.tiled_scale_multidim(samples, fn, tile=(16, 16), overlap=8, upscale_amount=4, out_channels=4, downscale=True, max_batch=5)
+    torch.testing.assert_close(out, reference_tiled_scale(samples, fn, (16, 16), 8, 4, 4, downscale=True))
+
+    samples = torch.randn((1, 2, 13), generator=torch.Generator().manual_seed(2))
+    fn = lambda a: upscale_fn(1, 2)(a)[:, :, 1:]  # Output tiles one shorter, placed by the formula
+    out = comfy.utils.tiled_scale_multidim(samples, fn, tile=(6,), overlap=2, upscale_amount=2, out_channels=2, index_formulas=lambda v: max(0, 2 * v - 1), max_batch=4)
+    ref = reference_tiled_scale(samples, fn, (6,), 2, 2, 2, index_formulas=lambda v: max(0, 2 * v - 1))
+    torch.testing.assert_close(out, ref, equal_nan=True)  # The last values aren't covered by any tile
+
+
+def test_single_tile_batches():
+    samples = torch.randn((5, 3, 8, 8))
+    sizes = []
+    fn = lambda a: sizes.append(a.shape[0]) or a * 2
+    out = comfy.utils.tiled_scale(samples, fn, tile_x=8, tile_y=8, upscale_amount=1, max_batch=2)
+    assert sizes == [2, 2, 1]
+    torch.testing.assert_close(out, samples * 2)
+
+
+def test_batches_tiles_of_the_same_shape():
+    samples = torch.randn((2, 3, 30, 30))
+    sizes = []
+    fn = lambda a: sizes.append(tuple(a.shape)) or a
+    comfy.utils.tiled_scale(samples, fn, tile_x=16, tile_y=16, overlap=4, upscale_amount=1, max_batch=8)
+    assert sum(s[0] for s in sizes) == 2 * 9
+    assert all(s[0] <= 8 for s in sizes)
+    assert len(sizes) < 2 * 9
+
+
+def test_halves_batch_on_oom():
+    samples = torch.randn((1, 3, 40, 40))
+    sizes = []
+
+    def fn(a):
+        sizes.append(a.shape[0])
+        if a.shape[0] > 2:
+            raise torch.cuda.OutOfMemoryError()
+        return a
+
+    out = comfy.utils.tiled_scale(samples, fn, tile_x=16, tile_y=16, overlap=4, upscale_amount=1, max_batch=8)
+    torch.testing.assert_close(out, samples)
+    assert sizes[:2] == [8, 4] and max(sizes[2:]) <= 2
+
+
+def test_blend_mask_is_cached():
+    a = comfy.utils.tile_blend_mask((8, 6), (2, 2), torch.device("cpu"), torch.float32)
+    assert a is comfy.utils.tile_blend_mask((8, 6), (2, 2), torch.device("cpu"), torch.float32)
+    assert a.shape == (1, 1, 8, 6)
+    torch.testing.assert_close(a[0, 0, :, 3], torch.tensor([0.5, 1, 1, 1, 1, 1, 1, 0.5]))
+
+
+BENCHMARK_SHAPE = (2, 4, 256, 256)
+
+
+def benchmark_fn(a):
+    return torch.nn.functional.interpolate(a, scale_factor=8, mode="nearest")[:, :3]
+
+
+def run(implementation, max_batch=1):
+    samples = torch.randn(BENCHMARK_SHAPE, generator=torch.Generator().manual_seed(0))
+    start = time.perf_counter()
+    if implementation == "reference":
+        reference_tiled_scale(samples, benchmark_fn, (32, 32), 8, 8, 3)
+    else:
+        comfy.utils.tiled_scale(samples, benchmark_fn, tile_x=32, tile_y=32, overlap=8, upscale_amount=8, out_channels=3, max_batch=max_batch)
+    return time.perf_counter() - start
+
+
+# ru_maxrss is inherited from the parent process, VmHWM starts over in the new one.
+PEAK_MEMORY_SCRIPT = """
+import importlib.util, sys
+sys.path.insert(0, {root!r})
+spec = importlib.util.spec_from_file_location("tiled_scale_test", {path!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+import torch
+def peak():
+    return int([l for l in open("/proc/self/status") if l.startswith("VmHWM")][0].split()[1])
+baseline = peak()
+with torch.inference_mode():
+    module.run({implementation!r}, {max_batch})
+print(peak() - baseline)
+"""
+
+
+def peak_memory(implementation, max_batch=1):
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    script = PEAK_MEMORY_SCRIPT.format(root=root, path=os.path.abspath(__file__), implementation=implementation, max_batch=max_batch)
+    out = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True, cwd=root)
+    return int(out.stdout.split()[-1]) / 1024  # MB
+
+
+@pytest.mark.skipif(not os.environ.get("TILED_SCALE_BENCHMARK") or not os.path.exists("/proc/self/status"), reason="set TILED_SCALE_BENCHMARK=1 to run, needs Linux")
+def test_benchmark():
+    with torch.inference_mode():
+        for implementation, max_batch in [("reference", 1), ("tiled_scale", 1), ("tiled_scale", 8)]:
+            run(implementation, max_batch)
+            seconds = min(run(implementation, max_batch) for _ in range(3))
+            print("{:12s} max_batch {} {:7.3f} s peak memory +{:6.1f} MB".format(implementation, max_batch, seconds, peak_memory(implementation, max_batch)))  # noqa: T201
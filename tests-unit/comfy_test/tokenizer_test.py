@@ -0,0 +1,169 @@
+import os
+import random
+import time
+
+import pytest
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.sd1_clip
+import comfy.text_encoders.sd3_clip
+
+PROMPTS = [
+    "a photo of a cat",
+    "(masterpiece:1.2), best quality, a (red:0.8) car on a ((wet)) street at night\nneon lights",
+    "a \\(bracketed\\) word, embedding:missing and more text",
+    "",
+    "a photo of a cat, a photo of a dog",
+]
+
+
+def unmemoized(tokenizer):
+    tokenizer.token_cache_size = 0
+    tokenizer.batch_tokenize = False
+    return tokenizer
+
+
+@pytest.fixture(scope="module", params=["clip_l", "t5xxl"])
+def tokenizers(request, tmp_path_factory):
+    embeddings = tmp_path_factory.mktemp("embeddings")
+    (embeddings / "sub").mkdir()
+    torch.save({"string_to_param": {"*": torch.ones(2, 768)}}, embeddings / "sub" / "style.pt")
+    if request.param == "clip_l":
+        make = lambda: comfy.sd1_clip.SDTokenizer(embedding_directory=str(embeddings))
+    else:
+        make = lambda: comfy.text_encoders.sd3_clip.T5XXLTokenizer(embedding_directory=str(embeddings))
+    return make(), unmemoized(make())
+
+
+def plain(tokens):
+    return [[(t.tolist() if torch.is_tensor(t) else t, *rest) for t, *rest in batch] for batch in tokens]
+
+
+def test_matches_unmemoized_tokenization(tokenizers):
+    tokenizer, reference = tokenizers
+    for _ in range(2):
+        for prompt in PROMPTS + ["embedding:style, a painting"]:
+            assert plain(tokenizer.tokenize_with_weights(prompt, return_word_ids=True)) == plain(reference.tokenize_with_weights(prompt, return_word_ids=True))
+    assert len(tokenizer.token_cache) > 0 and len(reference.token_cache) == 0
+
+
+def test_warm_tokenizes_in_one_call(tokenizers):
+    tokenizer = tokenizers[0]
+    tokenizer.token_cache.clear()
+    calls = []
+    original = tokenizer.tokenizer
+
+    class Recorder:
+        def __call__(self, text):
+            calls.append(text)
+            return original(text)
+
+    tokenizer.tokenizer = Recorder()
+    try:
+        tokenizer.warm(PROMPTS)
+        tokenized = [tokenizer.tokenize_with_weights(p) for p in PROMPTS]
+    finally:
+        tokenizer.tokenizer = original
+    assert len(calls) == 1 and isinstance(calls[0], list)
+    assert tokenized == [tokenizers[1].tokenize_with_weights(p) for p in PROMPTS]
+
+
+def test_cache_size_limit(tokenizers):
+    tokenizer = tokenizers[0]
+    tokenizer.token_cache_size = 3
+    try:
+        tokenizer.tokenize_words(["a", "b", "c", "d"])
+        tokenizer.tokenize_words(["b"])
+        assert list(tokenizer.token_cache) == ["c", "d", "b"]
+    finally:
+        tokenizer.token_cache_size = comfy.sd1_clip.TOKEN_CACHE_SIZE
+
+
+def test_prompts_naming_missing_embeddings_are_not_memoized(tmp_path, caplog):
+    tokenizer = comfy.sd1_clip.SDTokenizer(embedding_directory=str(tmp_path))
+    assert all(isinstance(t, int) for t, *_ in tokenizer.tokenize_with_weights("a cat embedding:foo")[0])
+    assert "embedding:foo does not exist" in caplog.text
+
+    caplog.clear()
+    tokenizer.tokenize_with_weights("a cat embedding:foo")
+    assert "embedding:foo does not exist" in caplog.text
+
+    torch.save({"string_to_param": {"*": torch.ones(1, 768)}}, tmp_path / "foo.pt")
+    tokens = tokenizer.tokenize_with_weights("a cat embedding:foo")[0]
+    assert any(torch.is_tensor(t) for t, *_ in tokens)
+    assert plain([tokens]) == plain(comfy.sd1_clip.SDTokenizer(embedding_directory=str(tmp_path)).tokenize_with_weights("a cat embedding:foo"))
+
+
+def test_embedding_index(tmp_path, monkeypatch):
+    (tmp_path / "sub").mkdir()
+    torch.save({"string_to_param": {"*": torch.ones(1, 768)}}, tmp_path / "sub" / "a.pt")
+    torch.save({"string_to_param": {"*": torch.zeros(1, 768)}}, tmp_path / "sub" / "a.bin")
+    index = comfy.sd1_clip.EmbeddingIndex([str(tmp_path)])
+    assert index.find("a") == str(tmp_path / "sub" / "a.pt")
+    assert index.find("sub/a") == index.find("a.pt") == str(tmp_path / "sub" / "a.pt")
+    assert index.find("a.bin") == str(tmp_path / "sub" / "a.bin")
+
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(comfy.sd1_clip.os, "walk", lambda *args, **kwargs: walks.append(args) or walk(*args, **kwargs))
+    assert index.find("a") is not None and walks == []
+    for _ in range(3):
+        assert index.find("../a") is None and walks == []  # Nothing changed on disk
+    torch.save({"string_to_param": {"*": torch.ones(1, 768)}}, tmp_path / "b.safetensors.pt")
+    assert index.find("b.safetensors") == str(tmp_path / "b.safetensors.pt") and len(walks) == 1
+    (tmp_path / "sub" / "nested").mkdir()
+    assert index.find("c") is None and len(walks) == 2
+    torch.save({"string_to_param": {"*": torch.ones(1, 768)}}, tmp_path / "sub" / "nested" / "c.pt")
+    assert index.find("c") == str(tmp_path / "sub" / "nested" / "c.pt") and len(walks) == 3
+
+    missing = comfy.sd1_clip.EmbeddingIndex([str(tmp_path / "later")])
+    assert missing.find("a") is None and missing.find("a") is None
+    (tmp_path / "later").mkdir()
+    torch.save({"string_to_param": {"*": torch.ones(1, 768)}}, tmp_path / "later" / "a.pt")
+    assert missing.find("a") == str(tmp_path / "later" / "a.pt")
+
+    embed = comfy.sd1_clip.load_embed("a", str(tmp_path), 768)
+    assert embed is comfy.sd1_clip.load_embed("a", [str(tmp_path)], 768)
+
+
+def make_captions(count, seed=0):
+    rng = random.Random(seed)
+    words = ["cat", "dog", "portrait", "landscape", "red", "blue", "city", "forest", "night", "sunny", "detailed", "photo",
+             "painting", "woman", "man", "sitting", "standing", "on", "a", "the", "with", "in", "of", "bright", "dark"]
+    captions = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(2, 6)):
+            phrase = " ".join(rng.choices(words, k=rng.randint(1, 5)))
+            if rng.random() < 0.3:
+                phrase = "({}:{:.1f})".format(phrase, rng.uniform(0.5, 1.5))
+            parts.append(phrase)
+        captions.append(", ".join(parts))
+    return captions
+
+
+@pytest.mark.skipif(not os.environ.get("TOKENIZER_BENCHMARK"), reason="set TOKENIZER_BENCHMARK=1 to run")
+def test_benchmark():
+    captions = make_captions(2000)
+    for name, make in [("clip_l", comfy.sd1_clip.SDTokenizer), ("t5xxl", comfy.text_encoders.sd3_clip.T5XXLTokenizer)]:
+        reference = unmemoized(make())
+        tokenizer = make()
+        start = time.perf_counter()
+        expected = [reference.tokenize_with_weights(c) for c in captions]
+        unmemoized_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tokenizer.warm(captions)
+        batched = [tokenizer.tokenize_with_weights(c) for c in captions]
+        batched_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        memoized = [tokenizer.tokenize_with_weights(c) for c in captions]
+        memoized_seconds = time.perf_counter() - start
+        assert expected == batched == memoized
+        for label, seconds in [("unmemoized", unmemoized_seconds), ("batched", batched_seconds), ("memoized", memoized_seconds)]:
+            print("{:7s} {:10s} {:8.0f} captions/s".format(name, label, len(captions) / seconds))  # noqa: T201
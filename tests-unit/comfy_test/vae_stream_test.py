@@ -0,0 +1,63 @@
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.sd
+import comfy.utils
+
+
+def fake_decode(a):
+    """Causal video decoder: 4x frames except for the first latent frame, 8x pixels."""
+    out = a[:, :3].repeat_interleave(4, dim=2)[:, :, 3:]
+    out = out.repeat_interleave(8, dim=3).repeat_interleave(8, dim=4)
+    return torch.sin(out) * 0.5 + 0.5
+
+
+def make_vae():
+    vae = comfy.sd.VAE.__new__(comfy.sd.VAE)
+    vae.first_stage_model = torch.nn.Identity()
+    vae.latent_dim = 3
+    vae.upscale_ratio = (lambda a: max(0, a * 4 - 3), 8, 8)
+    vae.upscale_index_formula = (4, 8, 8)
+    vae.output_channels = 3
+    vae.decode = lambda samples: fake_decode(samples).movedim(1, -1)
+    return vae
+
+
+def test_video_matches_tiled_decode():
+    vae = make_vae()
+    samples = torch.randn((2, 4, 21, 3, 5), generator=torch.Generator().manual_seed(0))
+    chunks = list(vae.decode_stream(samples, tile_t=8, overlap_t=2))
+    assert all(c.shape[0] <= 8 * 4 for c in chunks)
+    out = torch.cat(chunks)
+    assert out.shape == vae.decoded_shape(samples) == (2 * 81, 24, 40, 3)
+
+    ref = comfy.utils.tiled_scale_multidim(samples, fake_decode, tile=(8, 64, 64), overlap=(2, 1, 1), upscale_amount=vae.upscale_ratio, out_channels=3, index_formulas=vae.upscale_index_formula)
+    torch.testing.assert_close(out, ref.movedim(1, -1).reshape(-1, 24, 40, 3))
+
+
+def test_stream_yields_finished_frames_early():
+    samples = torch.randn((1, 2, 30))
+    calls = []
+
+    def fn(a):
+        calls.append(a.shape[2])
+        return a * 2
+
+    stream = comfy.utils.tiled_scale_stream(samples, fn, tile=10, overlap=2, upscale_amount=1)
+    first = next(stream)
+    assert len(calls) == 1 and first.shape[2] == 8
+    rest = list(stream)
+    torch.testing.assert_close(torch.cat([first] + rest, dim=2), samples * 2)
+
+
+def test_image_latents_stream_by_batch():
+    vae = make_vae()
+    vae.latent_dim = 2
+    vae.upscale_ratio = 8
+    vae.decode = lambda samples: torch.zeros((samples.shape[0], samples.shape[2] * 8, samples.shape[3] * 8, 3))
+    samples = torch.zeros((5, 4, 2, 3))
+    assert [c.shape[0] for c in vae.decode_stream(samples, tile_t=2)] == [2, 2, 1]
+    assert vae.decoded_shape(samples) == (5, 16, 24, 3)
@@ -0,0 +1,138 @@
+"""
+Unit tests and a micro-benchmark for CacheKeySetInputSignature on large synthetic DAGs.
+"""
+import asyncio
+import time
+
+import pytest
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import nodes
+from comfy_execution import caching
+from comfy_execution.caching import CacheKeySetInputSignature
+from comfy_execution.graph import DynamicPrompt
+
+
+class SyntheticNode:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("INT",)}, "optional": {"a": ("*",), "b": ("*",)}}
+
+
+class SyntheticNonIdempotentNode(SyntheticNode):
+    NOT_IDEMPOTENT = True
+
+
+class NeverChanged:
+    async def get(self, node_id):
+        return False
+
+
+@pytest.fixture(autouse=True)
+def synthetic_nodes(monkeypatch):
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "SyntheticNode", SyntheticNode)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "SyntheticNonIdempotentNode", SyntheticNonIdempotentNode)
+    monkeypatch.setattr(caching, "NODE_CLASS_CONTAINS_UNIQUE_ID", {})
+
+
+def make_dag(num_nodes, fan_in=2, class_type="SyntheticNode"):
+    """Layered DAG where every node links to the fan_in nodes before it."""
+    prompt = {}
+    for i in range(num_nodes):
+        inputs = {"value": i}
+        for j, name in enumerate(["a", "b"][:fan_in]):
+            if i - j - 1 >= 0:
+                inputs[name] = [str(i - j - 1), 0]
+        prompt[str(i)] = {"class_type": class_type, "inputs": inputs}
+    return prompt
+
+
+def compute_keys(prompt):
+    dynprompt = DynamicPrompt(prompt)
+    key_set = CacheKeySetInputSignature(dynprompt, prompt.keys(), NeverChanged())
+    asyncio.run(key_set.add_keys(prompt.keys()))
+    return key_set
+
+
+class TestCacheKeySetInputSignature:
+    def test_identical_graphs_have_identical_keys(self):
+        a = compute_keys(make_dag(50))
+        b = compute_keys(make_dag(50))
+        for node_id in a.all_node_ids():
+            assert a.get_data_key(node_id) == b.get_data_key(node_id)
+
+    def test_change_only_affects_descendants(self):
+        prompt = make_dag(50)
+        before = compute_keys(prompt)
+        prompt["40"]["inputs"]["value"] = -1
+        after = compute_keys(prompt)
+        for i in range(50):
+            node_id = str(i)
+            if i < 40:
+                assert before.get_data_key(node_id) == after.get_data_key(node_id)
+            else:
+                assert before.get_data_key(node_id) != after.get_data_key(node_id)
+
+    def test_link_socket_is_part_of_key(self):
+        prompt = make_dag(3)
+        before = compute_keys(prompt)
+        prompt["2"]["inputs"]["a"] = ["1", 1]
+        after = compute_keys(prompt)
+        assert before.get_data_key("2") != after.get_data_key("2")
+
+    def test_non_idempotent_nodes_are_distinct(self):
+        prompt = {
+            "1": {"class_type": "SyntheticNonIdempotentNode", "inputs": {"value": 0}},
+            "2": {"class_type": "SyntheticNonIdempotentNode", "inputs": {"value": 0}},
+        }
+        key_set = compute_keys(prompt)
+        assert key_set.get_data_key("1") != key_set.get_data_key("2")
+
+    def test_cycle_does_not_hang(self):
+        prompt = {
+            "1": {"class_type": "SyntheticNode", "inputs": {"value": 0, "a": ["2", 0]}},
+            "2": {"class_type": "SyntheticNode", "inputs": {"value": 0, "a": ["1", 0]}},
+        }
+        key_set = compute_keys(prompt)
+        assert key_set.get_data_key("1") is not None
+
+    def test_unchanged_nodes_are_not_hashed_again(self, monkeypatch):
+        monkeypatch.setattr(caching, "_signature_digests", caching.collections.OrderedDict())
+        prompt = make_dag(50)
+        before = compute_keys(prompt)
+        hashed = []
+        compute = CacheKeySetInputSignature.compute_signature_digest
+        monkeypatch.setattr(CacheKeySetInputSignature, "compute_signature_digest", lambda self, signature: hashed.append(signature) or compute(self, signature))
+        prompt["40"]["inputs"]["value"] = -1
+        after = compute_keys(prompt)
+        assert len(hashed) == 10
+        assert all(before.get_data_key(str(i)) == after.get_data_key(str(i)) for i in range(40))
+
+    def test_memo_tells_equal_numbers_of_different_types_apart(self, monkeypatch):
+        monkeypatch.setattr(caching, "_signature_digests", caching.collections.OrderedDict())
+        keys = []
+        for value in [1, 1.0, True]:
+            prompt = make_dag(1)
+            prompt["0"]["inputs"]["value"] = value
+            keys.append(compute_keys(prompt).get_data_key("0"))
+        assert len(set(keys)) == 3
+
+    def test_deep_chain_does_not_recurse(self):
+        key_set = compute_keys(make_dag(5000, fan_in=1))
+        assert len(key_set.all_node_ids()) == 5000
+
+
+@pytest.mark.parametrize("num_nodes", [1500, 3000])
+def test_benchmark_large_dag(num_nodes):
+    prompt = make_dag(num_nodes)
+    start = time.perf_counter()
+    key_set = compute_keys(prompt)
+    elapsed = time.perf_counter() - start
+    assert len(key_set.all_node_ids()) == num_nodes
+    print(f"\ncache keys for {num_nodes} nodes: {elapsed * 1000:.1f} ms")  # noqa: T201
+    # Linear in the graph size; the old ancestry walk was quadratic and took seconds here.
+    assert elapsed < 5.0
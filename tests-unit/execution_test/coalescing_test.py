@@ -0,0 +1,231 @@
+"""
+Unit tests for coalescing compatible queued prompts into one batched execution.
+"""
+import json
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.sample
+import folder_paths
+import latent_preview
+import nodes
+from comfy_execution import coalescing
+from comfy_execution.coalescing import CoalescedBatchSplit, batch_conditioning, coalesce_key, merge_prompts
+from execution import CacheType, PromptExecutor, PromptQueue
+
+
+def make_prompt(seed=1, text="a cat", sampler_name="euler", steps=4):
+    return {
+        "4": {"class_type": "CoalesceTestLoader", "inputs": {}},
+        "5": {"class_type": "EmptyLatentImage", "inputs": {"width": 32, "height": 32, "batch_size": 2}},
+        "6": {"class_type": "CLIPTextEncode", "inputs": {"text": text, "clip": ["4", 1]}},
+        "7": {"class_type": "CLIPTextEncode", "inputs": {"text": "blurry", "clip": ["4", 1]}},
+        "3": {"class_type": "KSampler", "inputs": {
+            "seed": seed, "steps": steps, "cfg": 7.0, "sampler_name": sampler_name, "scheduler": "normal",
+            "denoise": 1.0, "model": ["4", 0], "positive": ["6", 0], "negative": ["7", 0], "latent_image": ["5", 0]}},
+        "8": {"class_type": "VAEDecode", "inputs": {"samples": ["3", 0], "vae": ["4", 2]}},
+        "9": {"class_type": "SaveImage", "inputs": {"filename_prefix": "coalesce", "images": ["8", 0]}},
+    }
+
+
+def make_item(prompt_id, prompt, client_id=None):
+    extra_data = {"extra_pnginfo": {"workflow": {"id": prompt_id}}}
+    if client_id is not None:
+        extra_data["client_id"] = client_id
+    return (0, prompt_id, prompt, extra_data, ["9"], {})
+
+
+class FakeClip:
+    def tokenize(self, text):
+        return text
+
+    def encode_from_tokens_scheduled(self, text):
+        generator = torch.manual_seed(sum(text.encode()))
+        length = 77 * (1 + len(text) // 20)
+        return [[torch.randn(1, length, 8, generator=generator), {"pooled_output": torch.randn(1, 8, generator=generator)}]]
+
+
+class FakeVAE:
+    def decode(self, samples):
+        return torch.sigmoid(samples[:, :3]).movedim(1, -1)
+
+
+class CoalesceTestLoader:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {}}
+
+    RETURN_TYPES = ("MODEL", "CLIP", "VAE")
+    FUNCTION = "load"
+
+    def load(self):
+        return (object(), FakeClip(), FakeVAE())
+
+
+def fake_sample(model, noise, steps, cfg, sampler_name, scheduler, positive, negative, latent_image, **kwargs):
+    # Every batch element only depends on its own noise and conditioning, like a real sampler.
+    cond = positive[0][0].mean(dim=(1, 2)) - negative[0][0].mean(dim=(1, 2)) + positive[0][1]["pooled_output"].mean(dim=1)
+    return latent_image + noise + cond[:, None, None, None]
+
+
+class FakeServer:
+    client_id = None
+    last_node_id = None
+    sockets_metadata = {}
+
+    def send_sync(self, event, data, sid=None):
+        pass
+
+    def queue_updated(self):
+        pass
+
+
+@pytest.fixture
+def fake_models(monkeypatch, tmp_path):
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "CoalesceTestLoader", CoalesceTestLoader)
+    for name, cls in coalescing.NODE_CLASS_MAPPINGS.items():
+        monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, name, cls)
+    monkeypatch.setattr(comfy.sample, "sample", fake_sample)
+    monkeypatch.setattr(comfy.sample, "fix_empty_latent_channels", lambda model, latent: latent)
+    monkeypatch.setattr(latent_preview, "prepare_callback", lambda model, steps: None)
+    original_output = folder_paths.get_output_directory()
+    folder_paths.set_output_directory(str(tmp_path))
+    yield tmp_path
+    folder_paths.set_output_directory(original_output)
+
+
+def run(prompt, prompt_id, extra_data, outputs):
+    executor = PromptExecutor(FakeServer(), cache_type=CacheType.CLASSIC, cache_args={"lru": 0, "ram": 0})
+    executor.execute(prompt, prompt_id, extra_data, outputs)
+    assert executor.success, executor.status_messages
+    return executor
+
+
+def load_saved(directory, history_result):
+    out = []
+    for image in history_result["outputs"]["9"]["images"]:
+        with Image.open(directory / image["filename"]) as img:
+            out.append((np.array(img), json.loads(img.info["prompt"])))
+    return out
+
+
+class TestCoalesceKey:
+    def test_seed_and_text_may_differ(self):
+        assert coalesce_key(make_item("a", make_prompt(1, "a cat"))) == coalesce_key(make_item("b", make_prompt(2, "a dog")))
+
+    def test_client_may_differ(self):
+        assert coalesce_key(make_item("a", make_prompt(), "x")) == coalesce_key(make_item("b", make_prompt(), "y"))
+
+    def test_other_widgets_must_match(self):
+        assert coalesce_key(make_item("a", make_prompt(steps=4))) != coalesce_key(make_item("b", make_prompt(steps=5)))
+
+    def test_stochastic_samplers_are_not_coalesced(self):
+        assert coalesce_key(make_item("a", make_prompt(sampler_name="euler_ancestral"))) is None
+
+
+class TestMergePrompts:
+    def test_merged_graph(self):
+        items = [make_item("a", make_prompt(1, "a cat")), make_item("b", make_prompt(2, "a dog"))]
+        merged = merge_prompts(items, items[0][3])
+        prompt = merged.prompt
+
+        assert prompt["3"]["class_type"] == "CoalescedKSampler"
+        assert prompt["3"]["inputs"]["seed_0"] == 1
+        assert prompt["3"]["inputs"]["seed_1"] == 2
+        assert prompt["3"]["inputs"]["positive_1"] == ["6@1", 0]
+        assert prompt["3"]["inputs"]["negative_1"] == ["7", 0]
+        assert prompt["6@1"]["inputs"]["text"] == "a dog"
+        assert "7@1" not in prompt and "8@1" not in prompt
+        assert sorted(merged.outputs) == ["9", "9@1"]
+        assert prompt["9@1"]["inputs"]["images"][0] != prompt["9"]["inputs"]["images"][0]
+
+    def test_output_on_batched_node_is_not_merged(self):
+        items = [make_item("a", make_prompt(1)), make_item("b", make_prompt(2))]
+        for item in items:
+            item[2]["8"]["class_type"] = "VAEDecode"
+            item[4][:] = ["8"]
+        assert merge_prompts(items, items[0][3]) is None
+
+
+class TestBatchConditioning:
+    def test_different_lengths_are_repeated(self):
+        a = [[torch.randn(1, 77, 8), {"pooled_output": torch.randn(1, 8)}]]
+        b = [[torch.randn(1, 154, 8), {"pooled_output": torch.randn(1, 8)}]]
+        cond, options = batch_conditioning([a, b], 2)[0]
+        assert cond.shape == (4, 154, 8)
+        assert torch.equal(cond[1, 77:], a[0][0][0])
+        assert torch.equal(cond[3], b[0][0][0])
+        assert torch.equal(options["pooled_output"][2], b[0][1]["pooled_output"][0])
+
+    def test_different_options_fail(self):
+        a = [[torch.randn(1, 77, 8), {"strength": 1.0}]]
+        b = [[torch.randn(1, 77, 8), {"strength": 0.5}]]
+        with pytest.raises(ValueError):
+            batch_conditioning([a, b], 1)
+
+
+def test_batch_split():
+    latent = {"samples": torch.arange(6.0).reshape(6, 1, 1, 1), "batch_index": [0, 1, 0, 1, 0, 1]}
+    out = CoalescedBatchSplit().split(latent, 1, 3)[0]
+    assert out["samples"].flatten().tolist() == [2.0, 3.0]
+    assert out["batch_index"] == [0, 1]
+
+
+def test_coalesced_execution_matches_individual_runs(fake_models):
+    items = [
+        make_item("a", make_prompt(1, "a cat")),
+        make_item("b", make_prompt(2, "a dog with a long description of its fur")),
+        make_item("c", make_prompt(3, "a cat")),
+    ]
+    individual = []
+    for item in items:
+        executor = run(item[2], item[1], item[3], item[4])
+        individual.append(load_saved(fake_models, executor.history_result))
+
+    merged = merge_prompts(items, items[0][3])
+    executor = run(merged.prompt, "a", merged.extra_data, merged.outputs)
+    for i, item in enumerate(items):
+        history_result = coalescing.split_history_result(executor.history_result, merged.member_outputs[i], i)
+        saved = load_saved(fake_models, history_result)
+        assert len(saved) == 2
+        for (image, prompt), (expected_image, expected_prompt) in zip(saved, individual[i]):
+            assert np.abs(image.astype(int) - expected_image.astype(int)).max() <= 1
+            # Saved metadata is the member's own prompt, not the merged one.
+            assert prompt == expected_prompt == item[2]
+
+
+class TestQueue:
+    def test_keys_are_computed_once(self):
+        queue = PromptQueue(FakeServer())
+        for i, text in enumerate(["a cat", "a dog", "a bird"]):
+            queue.put(make_item(str(i), make_prompt(i, text)))
+        calls = []
+
+        def key_function(item):
+            calls.append(item[1])
+            return coalesce_key(item)
+
+        item, _ = queue.get()
+        assert queue.get_coalesced(item, 0, key_function) == []
+        taken = queue.get_coalesced(item, 1, key_function)
+        assert [t[1] for t, _ in taken] == ["1"]
+        assert queue.get_coalesced(item, 1, key_function)[0][0][1] == "2"
+        assert sorted(calls) == ["0", "0", "0", "1", "2"]  # The leader's key isn't memoized
+
+    def test_targeted_interrupt_is_recorded(self):
+        queue = PromptQueue(FakeServer())
+        queue.put(make_item("a", make_prompt(1)))
+        queue.put(make_item("b", make_prompt(2)))
+        item, item_id = queue.get()
+        queue.get_coalesced(item, 1, coalesce_key)
+        assert queue.interrupt_running("b") is not None
+        assert queue.interrupt_running("c") is None
+        assert queue.take_interrupted(["a", "b"]) == {"b"}
+        assert queue.take_interrupted(["a", "b"]) == set()
@@ -0,0 +1,135 @@
+"""
+Unit tests for the on-disk output cache tier (comfy_execution.caching.DiskCache).
+"""
+import os
+from typing import NamedTuple
+
+import pytest
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import folder_paths
+from comfy_execution.caching import DiskCache, Unhashable, stable_cache_key, to_hashable
+from comfy_execution.graph import DynamicPrompt
+
+
+class Entry(NamedTuple):
+    ui: dict
+    outputs: list
+
+
+class FakeCache:
+    """Minimal stand-in for the RAM cache tier keyed directly by node signature."""
+    def __init__(self, keys):
+        self.keys = keys
+        self.cache = {}
+
+    def _get_data_key(self, node_id):
+        return self.keys.get(node_id)
+
+    def get(self, node_id):
+        return self.cache.get(node_id)
+
+    def set(self, node_id, value):
+        self.cache[node_id] = value
+
+
+def make_disk_cache(directory, keys, max_size=1024**3):
+    return DiskCache(FakeCache(keys), str(directory), max_size, entry_type=Entry)
+
+
+def flush(cache):
+    cache.writer.shutdown(wait=True)
+
+
+class TestStableCacheKey:
+    def test_same_signature_same_key(self):
+        a = to_hashable(["KSampler", False, ("seed", 5), ("cfg", 7.0)])
+        b = to_hashable(["KSampler", False, ("seed", 5), ("cfg", 7.0)])
+        assert stable_cache_key(a) == stable_cache_key(b)
+
+    def test_different_signature_different_key(self):
+        a = to_hashable(["KSampler", False, ("seed", 5)])
+        b = to_hashable(["KSampler", False, ("seed", 6)])
+        assert stable_cache_key(a) != stable_cache_key(b)
+
+    @pytest.mark.parametrize("value", [float("NaN"), Unhashable()])
+    def test_unstable_signature_has_no_key(self, value):
+        assert stable_cache_key(to_hashable(["Node", value])) is None
+
+
+class TestDiskCache:
+    def test_roundtrip_across_instances(self, tmp_path):
+        key = to_hashable(["CLIPTextEncode", False, ("text", "a cat")])
+        cond = torch.randn(1, 77, 16)
+        pooled = torch.randn(1, 16)
+        value = Entry(ui=None, outputs=[[[cond, {"pooled_output": pooled}]]])
+
+        cache = make_disk_cache(tmp_path, {"1": key})
+        cache.set("1", value)
+        flush(cache)
+
+        restarted = make_disk_cache(tmp_path, {"5": key})
+        loaded = restarted.get("5")
+        assert loaded is not None
+        loaded_cond, loaded_extra = loaded.outputs[0][0]
+        assert torch.equal(loaded_cond, cond)
+        assert torch.equal(loaded_extra["pooled_output"], pooled)
+        # A disk hit is promoted into the RAM tier.
+        assert restarted.cache.get("5") is loaded
+
+    def test_outputs_without_tensors_are_not_persisted(self, tmp_path):
+        key = to_hashable(["PrimitiveInt", False, ("value", 3)])
+        cache = make_disk_cache(tmp_path, {"1": key})
+        cache.set("1", Entry(ui=None, outputs=[[3]]))
+        flush(cache)
+        assert os.listdir(tmp_path) == []
+
+    def test_unsupported_objects_are_not_persisted(self, tmp_path):
+        key = to_hashable(["CheckpointLoader", False, ("ckpt_name", "a.safetensors")])
+        cache = make_disk_cache(tmp_path, {"1": key})
+        cache.set("1", Entry(ui=None, outputs=[[torch.zeros(1), object()]]))
+        flush(cache)
+        assert os.listdir(tmp_path) == []
+
+    def test_size_bounded_eviction(self, tmp_path):
+        keys = {str(i): to_hashable(["VAEEncode", False, ("i", i)]) for i in range(4)}
+        tensor = torch.zeros(64, 1024)
+        entry_size = tensor.numel() * tensor.element_size()
+        cache = make_disk_cache(tmp_path, keys, max_size=int(entry_size * 2.5))
+        for node_id in keys:
+            cache.set(node_id, Entry(ui=None, outputs=[[tensor.clone()]]))
+        flush(cache)
+
+        assert len(os.listdir(tmp_path)) == 2
+        assert cache.total_size <= cache.max_size
+        cache.cache.cache.clear()
+        assert cache.get("0") is None
+        assert cache.get("3") is not None
+
+    def test_replaced_model_files_are_not_loaded(self, tmp_path, monkeypatch):
+        models = tmp_path / "models"
+        models.mkdir()
+        (models / "a.safetensors").write_bytes(b"a")
+        monkeypatch.setitem(folder_paths.folder_names_and_paths, "disk_cache_test", ([str(models)], {".safetensors"}))
+        prompt = DynamicPrompt({
+            "1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "a.safetensors"}},
+            "2": {"class_type": "VAEDecode", "inputs": {"samples": ["1", 2], "vae": ["1", 2]}},
+        })
+        key = to_hashable(["VAEDecode", False, ("samples", "a.safetensors")])
+
+        def restart():
+            cache = make_disk_cache(tmp_path / "cache", {"2": key})
+            cache.dynprompt = prompt
+            return cache
+
+        cache = restart()
+        cache.set("2", Entry(ui=None, outputs=[[torch.ones(2)]]))
+        flush(cache)
+        assert restart().get("2") is not None
+
+        (models / "a.safetensors").write_bytes(b"replaced")
+        assert restart().get("2") is None
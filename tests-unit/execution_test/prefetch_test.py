@@ -0,0 +1,104 @@
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.model_pool
+import folder_paths
+from comfy_execution import prefetch
+from execution import PromptQueue, freeze_queue_item
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def models(tmp_path, monkeypatch):
+    for folder_name in ("checkpoints", "loras", "vae"):
+        (tmp_path / folder_name).mkdir()
+        monkeypatch.setitem(folder_paths.folder_names_and_paths, folder_name, ([str(tmp_path / folder_name)], {".safetensors"}))
+    for name, size in [("checkpoints/a.safetensors", 3 * MB), ("checkpoints/b.safetensors", MB), ("loras/l.safetensors", MB), ("vae/v.safetensors", MB)]:
+        (tmp_path / name).write_bytes(b"x" * size)
+    return tmp_path
+
+
+def make_prompt(checkpoint):
+    return {
+        "1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": checkpoint}},
+        "2": {"class_type": "LoraLoader", "inputs": {"model": ["1", 0], "clip": ["1", 1], "lora_name": "l.safetensors"}},
+        "3": {"class_type": "VAELoader", "inputs": {"vae_name": "pixel_space"}},
+        "4": {"class_type": "VAELoader", "inputs": {"vae_name": ["5", 0]}},
+        "6": {"class_type": "KSampler", "inputs": {"seed": 1}},
+    }
+
+
+def test_prompt_files(models):
+    prompt = freeze_queue_item((0, "id", make_prompt("a.safetensors"), {}, []))[2]
+    assert prefetch.prompt_files(prompt) == [str(models / "checkpoints" / "a.safetensors"), str(models / "loras" / "l.safetensors")]
+    assert prefetch.prompt_files(prompt, {"2"}) == [str(models / "loras" / "l.safetensors")]
+    assert prefetch.prompt_files(make_prompt("missing.safetensors")) == [str(models / "loras" / "l.safetensors")]
+
+
+def wait_for(prefetcher, count):
+    for _ in range(500):
+        with prefetcher.condition:
+            if len(prefetcher.pending) == 0 and len(prefetcher.recent) >= count:
+                return
+        time.sleep(0.01)
+    raise TimeoutError()
+
+
+def test_reads_files_within_budget(models, monkeypatch):
+    monkeypatch.setattr(prefetch.psutil, "virtual_memory", lambda: SimpleNamespace(available=4.5 * MB))
+    prefetcher = prefetch.Prefetcher(ram_headroom=0)
+    paths = [str(models / "checkpoints" / "a.safetensors"), str(models / "checkpoints" / "b.safetensors"), str(models / "loras" / "l.safetensors")]
+    prefetcher.prefetch(paths)
+    wait_for(prefetcher, 2)
+    time.sleep(0.05)
+    assert prefetcher.bytes_read == 4 * MB  # The lora doesn't fit anymore
+    assert [r[0] for r in prefetcher.recent] == [os.path.realpath(p) for p in paths[:2]]
+
+    monkeypatch.setattr(prefetch.psutil, "virtual_memory", lambda: SimpleNamespace(available=64 * MB))
+    prefetcher.prefetch(paths)
+    wait_for(prefetcher, 3)
+    assert prefetcher.bytes_read == 5 * MB  # Only the lora, the others were read recently
+
+
+class FakeVAE:
+    pass
+
+
+def test_skips_pooled_files(models, monkeypatch):
+    path = str(models / "vae" / "v.safetensors")
+    pool = comfy.model_pool.ModelPool(max_size=64 * MB)
+    monkeypatch.setattr(comfy.model_pool, "model_pool", pool)
+    vae = pool.load("vae", [path], {}, lambda: (FakeVAE(),))  # noqa: F841
+    prefetcher = prefetch.Prefetcher(ram_headroom=0)
+    assert prefetcher._prefetch_file(path, 64 * MB) == 0
+    assert prefetcher.bytes_read == 0
+
+
+def test_plan_covers_upcoming_prompts(models, monkeypatch):
+    planned = []
+    monkeypatch.setattr(prefetch.prefetcher, "prefetch", planned.append)
+    prefetch.prefetch_prompts(make_prompt("a.safetensors"), ["1"], [make_prompt("b.safetensors"), make_prompt("a.safetensors")])
+    assert planned == [[str(models / "loras" / "l.safetensors"), str(models / "checkpoints" / "b.safetensors")]]
+
+
+class FakeServer:
+    def queue_updated(self):
+        pass
+
+
+def test_queue_peek():
+    queue = PromptQueue(FakeServer())
+    for i in range(3):
+        queue.put((i, "prompt-{}".format(i), make_prompt("a.safetensors"), {}, []))
+    assert [item[1] for item in queue.peek(2)] == ["prompt-0", "prompt-1"]
+    queue.get()
+    assert [item[1] for item in queue.peek(5)] == ["prompt-1", "prompt-2"]
@@ -0,0 +1,133 @@
+"""
+Unit tests and a benchmark for PromptQueue snapshots of frozen queue items.
+"""
+import copy
+import json
+import time
+
+import pytest
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+from comfy_execution.utils import unfreeze
+from execution import PromptQueue
+
+
+class FakeServer:
+    def queue_updated(self):
+        pass
+
+
+def make_prompt(i, num_nodes=20):
+    return {
+        str(n): {"class_type": "KSampler", "inputs": {"seed": i, "steps": 20, "model": [str(n - 1), 0], "text": "x" * 64}}
+        for n in range(num_nodes)
+    }
+
+
+def make_item(i):
+    return (i, f"prompt-{i}", make_prompt(i), {"client_id": f"client-{i % 8}", "extra_pnginfo": {"workflow": {"nodes": list(range(20))}}}, ["0"], {})
+
+
+def fill_queue(count):
+    queue = PromptQueue(FakeServer())
+    for i in range(count):
+        queue.put(make_item(i))
+    return queue
+
+
+class TestFrozenQueueItems:
+    def test_queued_items_are_read_only(self):
+        queue = fill_queue(2)
+        _, queued = queue.get_current_queue()
+        with pytest.raises(TypeError):
+            queued[0][2]["0"]["inputs"]["seed"] = 5
+        with pytest.raises(TypeError):
+            queued[0][4].append("1")
+        extra_data = queued[0][3].copy()
+        extra_data["client_id"] = "other"
+        assert queued[0][3]["client_id"] != "other"
+
+    def test_get_shares_the_item(self):
+        queue = fill_queue(2)
+        item, item_id = queue.get()
+        running, _ = queue.get_current_queue()
+        assert running[0] is item
+        assert queue.get_current_queue()[1] is queue.get_current_queue()[1]
+
+    def test_copies_are_mutable(self):
+        queue = fill_queue(1)
+        item, _ = queue.get()
+        prompt = copy.deepcopy(item[2])
+        prompt["0"]["inputs"]["seed"] = 5
+        prompt["0"]["inputs"]["model"].append(1)
+        assert item[2]["0"]["inputs"]["seed"] == 0 and len(item[2]["0"]["inputs"]["model"]) == 2
+        extra_data = copy.copy(item[3])
+        extra_data["client_id"] = "other"
+        assert type(prompt) is dict and type(prompt["0"]["inputs"]["model"]) is list
+
+    def test_unfrozen_items_are_mutable_copies(self):
+        queue = fill_queue(1)
+        item, _ = queue.get()
+        prompt, extra_data = unfreeze(item[2]), unfreeze(item[3])
+        prompt["0"]["inputs"]["seed"] = 5
+        extra_data["extra_pnginfo"]["workflow"]["x"] = 1
+        assert item[2]["0"]["inputs"]["seed"] == 0 and "x" not in item[3]["extra_pnginfo"]["workflow"]
+        assert prompt == {**make_prompt(0), "0": {**make_prompt(0)["0"], "inputs": {**make_prompt(0)["0"]["inputs"], "seed": 5}}}
+
+    def test_items_serialize_like_the_original(self):
+        queue = fill_queue(1)
+        _, queued = queue.get_current_queue()
+        assert json.loads(json.dumps(queued[0])) == json.loads(json.dumps(make_item(0)))
+
+    def test_history_keeps_running_snapshot(self):
+        queue = fill_queue(1)
+        item, item_id = queue.get()
+        queue.task_done(item_id, {"outputs": {}}, status=None, process_item=lambda p: p[:5])
+        history = queue.get_history(prompt_id=item[1])
+        assert history[item[1]]["prompt"][2] is item[2]
+
+
+def test_flags_apply_to_every_worker():
+    queue = PromptQueue(FakeServer())
+    queue.register_worker(0)
+    queue.register_worker(1)
+    queue.set_flag("unload_models", True)
+    assert queue.get_flags(worker_id=0) == {"unload_models": True}
+    assert queue.get_flags(worker_id=0) == {}
+    assert queue.get_flags(reset=False, worker_id=1) == {"unload_models": True}
+    assert queue.get_flags(worker_id=1) == {"unload_models": True}
+
+
+def test_benchmark_queue_snapshots():
+    count = 10000
+    queue = fill_queue(count)
+    queue.get_current_queue()
+
+    polls = 200
+    start = time.perf_counter()
+    for _ in range(polls):
+        running, queued = queue.get_current_queue()
+    poll_time = (time.perf_counter() - start) / polls
+    assert len(queued) == count
+
+    # Dequeueing keeps the cached order, so polling between dequeues stays cheap too.
+    start = time.perf_counter()
+    for _ in range(polls):
+        queue.get()
+        queue.get_current_queue()
+    dequeue_poll_time = (time.perf_counter() - start) / polls
+
+    # Before items were frozen, every poll deep copied the queue.
+    items = [make_item(i) for i in range(count)]
+    start = time.perf_counter()
+    copy.deepcopy(items)
+    deepcopy_time = time.perf_counter() - start
+
+    print(f"\n{count} queued prompts: poll {poll_time * 1000:.3f} ms, dequeue + poll {dequeue_poll_time * 1000:.3f} ms, "  # noqa: T201
+          f"deep copy of the queue (old poll) {deepcopy_time * 1000:.1f} ms")
+    assert poll_time < deepcopy_time / 10
+    assert dequeue_poll_time < deepcopy_time / 10
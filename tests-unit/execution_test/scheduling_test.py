@@ -0,0 +1,120 @@
+"""
+Unit tests for fair-share scheduling of the prompt queue (comfy_execution.scheduling).
+"""
+import time
+
+import pytest
+
+from comfy_execution.scheduling import FairShareQueue
+
+
+def make_item(number, prompt_id, client_id=None, priority=None):
+    extra_data = {}
+    if client_id is not None:
+        extra_data["client_id"] = client_id
+    if priority is not None:
+        extra_data["priority"] = priority
+    return (number, prompt_id, {}, extra_data, [], {})
+
+
+def drain(queue):
+    out = []
+    while (item := queue.pop()) is not None:
+        out.append(item[1])
+    return out
+
+
+class TestFairShareQueue:
+    def test_single_client_runs_in_number_order(self):
+        queue = FairShareQueue()
+        for number in [3, 1, 2, 0]:
+            queue.put(make_item(number, str(number), client_id="a"))
+        assert drain(queue) == ["0", "1", "2", "3"]
+
+    def test_busy_client_does_not_starve_others(self):
+        queue = FairShareQueue()
+        for i in range(500):
+            queue.put(make_item(i, f"a{i}", client_id="a"))
+        queue.put(make_item(500, "b0", client_id="b"))
+        queue.put(make_item(501, "b1", client_id="b"))
+        order = drain(queue)
+        assert order.index("b0") <= 1
+        assert order.index("b1") <= 3
+
+    def test_priority_class_weights(self):
+        queue = FairShareQueue()
+        for i in range(40):
+            queue.put(make_item(i, f"low{i}", client_id="a", priority="low"))
+            queue.put(make_item(i, f"high{i}", client_id="a", priority="high"))
+        first = drain(queue)[:20]
+        high = sum(1 for prompt_id in first if prompt_id.startswith("high"))
+        assert high == 16  # 4:1 share
+
+    def test_unknown_priority_uses_default(self):
+        queue = FairShareQueue()
+        queue.put(make_item(0, "x", priority="urgent!"))
+        queue.put(make_item(1, "y", priority="normal"))
+        assert drain(queue) == ["x", "y"]
+
+    def test_unhashable_extra_data_is_rejected_before_queueing(self):
+        queue = FairShareQueue()
+        queue.put(make_item(0, "a", client_id="a"))
+        with pytest.raises(TypeError):
+            queue.put(make_item(1, "b", client_id=["b"]))
+        assert len(queue) == 1 and "b" not in queue.ids
+        queue.put(make_item(2, "c", priority=["high"]))
+        assert drain(queue) == ["a", "c"]
+        assert len(queue) == 0
+
+    def test_front_items_run_first(self):
+        queue = FairShareQueue()
+        queue.put(make_item(0, "a", client_id="a"))
+        queue.put(make_item(1, "b", client_id="b", priority="high"))
+        queue.put(make_item(-2, "front", client_id="c", priority="low"))
+        assert drain(queue)[0] == "front"
+
+    def test_remove_by_prompt_id(self):
+        queue = FairShareQueue()
+        for i in range(10):
+            queue.put(make_item(i, str(i), client_id=str(i % 2)))
+        assert queue.remove("0")
+        assert queue.remove("5")
+        assert not queue.remove("5")
+        assert len(queue) == 8
+        order = drain(queue)
+        assert sorted(order, key=int) == ["1", "2", "3", "4", "6", "7", "8", "9"]
+
+    def test_ordered_matches_pop_order(self):
+        queue = FairShareQueue()
+        for i in range(60):
+            queue.put(make_item(i, str(i), client_id=str(i % 3), priority=["low", "normal", "high"][i % 4 % 3]))
+        queue.remove("7")
+        queue.pop()
+        expected = [item[1] for item in queue.ordered()]
+        assert drain(queue) == expected
+
+    def test_refilled_flow_keeps_its_place(self):
+        queue = FairShareQueue()
+        for i in range(4):
+            queue.put(make_item(i, f"a{i}", client_id="a"))
+        queue.put(make_item(4, "b0", client_id="b"))
+        assert queue.pop()[1] == "a0"
+        assert queue.pop()[1] == "b0"
+        # b drained; re-queueing must not let it jump ahead of a's share.
+        queue.put(make_item(5, "b1", client_id="b"))
+        assert drain(queue) == ["a1", "b1", "a2", "a3"]
+
+
+def test_benchmark_delete_by_id():
+    queue = FairShareQueue()
+    count = 20000
+    for i in range(count):
+        queue.put(make_item(i, str(i), client_id=str(i % 16)))
+    start = time.perf_counter()
+    for i in range(0, count, 2):
+        queue.remove(str(i))
+    elapsed = time.perf_counter() - start
+    print(f"\nremoved {count // 2} of {count} queued prompts: {elapsed * 1000:.1f} ms")  # noqa: T201
+    assert len(queue) == count // 2
+    # The old linear scan plus heapify per delete was quadratic and took tens of seconds here.
+    assert elapsed < 1.0
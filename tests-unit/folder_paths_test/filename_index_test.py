@@ -0,0 +1,92 @@
+import os
+import shutil
+import time
+
+import pytest
+
+import folder_paths
+from utils.filename_index import FilenameIndex
+
+
+def touch(*parts):
+    path = os.path.join(*parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("x")
+
+
+@pytest.fixture(params=["inotify", "poll"])
+def index(request):
+    index = FilenameIndex(request.param, poll_interval=0.05)
+    if request.param == "inotify" and index.inotify is None:
+        pytest.skip("inotify is not available")
+    yield index
+    index.close()
+
+
+def listing(index, root):
+    """Waits for a polled index to settle, inotify indexes are up to date immediately."""
+    if index.inotify is not None:
+        return sorted(index.get_files(root)[1])
+    time.sleep(0.2)
+    return sorted(index.get_files(root)[1])
+
+
+def test_matches_recursive_search(tmp_path, index):
+    root = str(tmp_path)
+    touch(root, "a.safetensors")
+    touch(root, "sub", "b.ckpt")
+    touch(root, "sub", "deeper", "c.txt")
+    touch(root, ".git", "objects", "d")
+    assert sorted(index.get_files(root)[1]) == sorted(folder_paths.recursive_search(root, excluded_dir_names=[".git"])[0])
+
+
+def test_applies_deltas(tmp_path, index):
+    root = str(tmp_path)
+    touch(root, "a.safetensors")
+    version = index.get_files(root)[0]
+
+    touch(root, "new", "nested", "b.safetensors")
+    assert listing(index, root) == ["a.safetensors", os.path.join("new", "nested", "b.safetensors")]
+    assert index.get_files(root)[0] != version
+
+    os.rename(os.path.join(root, "new"), os.path.join(root, "moved"))
+    assert listing(index, root) == ["a.safetensors", os.path.join("moved", "nested", "b.safetensors")]
+
+    os.remove(os.path.join(root, "a.safetensors"))
+    shutil.rmtree(os.path.join(root, "moved", "nested"))
+    assert listing(index, root) == []
+
+    version = index.get_files(root)[0]
+    assert index.get_files(root)[0] == version
+
+
+def test_root_removed_and_recreated(tmp_path, index):
+    root = str(tmp_path / "models")
+    assert index.get_files(root) is None
+    touch(root, "a.pt")
+    assert sorted(index.get_files(root)[1]) == ["a.pt"]
+
+    shutil.rmtree(root)
+    if index.inotify is None:
+        time.sleep(0.2)
+    assert index.get_files(root) is None
+    touch(root, "b.pt")
+    assert sorted(index.get_files(root)[1]) == ["b.pt"]
+
+
+def test_get_filename_list_uses_index(tmp_path, index, monkeypatch):
+    root = str(tmp_path)
+    touch(root, "a.safetensors")
+    touch(root, "notes.txt")
+    monkeypatch.setitem(folder_paths.folder_names_and_paths, "index_test", ([root, str(tmp_path / "missing")], {".safetensors"}))
+    monkeypatch.setattr(folder_paths, "filename_index", index)
+
+    assert folder_paths.get_filename_list("index_test") == ["a.safetensors"]
+    first = folder_paths.indexed_filename_list_("index_test")
+    assert folder_paths.indexed_filename_list_("index_test") is first
+
+    touch(root, "sub", "b.safetensors")
+    if index.inotify is None:
+        time.sleep(0.2)
+    assert folder_paths.get_filename_list("index_test") == ["a.safetensors", os.path.join("sub", "b.safetensors")]
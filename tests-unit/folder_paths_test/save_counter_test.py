@@ -0,0 +1,130 @@
+import os
+import random
+import threading
+import time
+
+import pytest
+
+import folder_paths
+
+
+def legacy_counter(full_output_folder, filename):
+    """How get_save_image_path picked the counter before it was cached."""
+    def map_filename(name):
+        prefix_len = len(filename)
+        prefix = name[:prefix_len + 1]
+        try:
+            digits = int(name[prefix_len + 1:].split('_')[0])
+        except:
+            digits = 0
+        return digits, prefix
+
+    try:
+        return max(filter(lambda a: os.path.normcase(a[1][:-1]) == os.path.normcase(filename) and a[1][-1] == "_", map(map_filename, os.listdir(full_output_folder))))[0] + 1
+    except ValueError:
+        return 1
+
+
+@pytest.fixture
+def output_dir(tmp_path):
+    folder_paths.save_counter_cache.clear()
+    yield str(tmp_path)
+    folder_paths.save_counter_cache.clear()
+
+
+def save(output_dir, prefix, batch=1, ext="png"):
+    full_output_folder, filename, counter, _, _ = folder_paths.get_save_image_path(prefix, output_dir, count=batch)
+    assert counter >= legacy_counter(full_output_folder, filename)
+    for i in range(batch):
+        with open(os.path.join(full_output_folder, f"{filename}_{counter + i:05}_.{ext}"), "x") as f:
+            f.write("x")
+    return counter
+
+
+def test_counter_matches_listing(output_dir):
+    assert save(output_dir, "ComfyUI") == 1
+    assert save(output_dir, "ComfyUI", batch=4) == 2
+    assert save(output_dir, "ComfyUI") == 6
+    assert save(output_dir, "ComfyUI_temp") == 1
+    assert save(output_dir, "sub/dir/ComfyUI", batch=2) == 1
+    assert save(output_dir, "sub/dir/ComfyUI") == 3
+    assert save(output_dir, "ComfyUI", ext="webp") == 7
+    assert save(output_dir, "ComfyUI", ext="latent") == 8
+    assert save(output_dir, "ComfyUI") == 9
+
+
+def test_counter_follows_external_changes(output_dir):
+    assert save(output_dir, "img", batch=3) == 1
+    assert save(output_dir, "img") == 4
+
+    # Another process saving with the same prefix.
+    for counter in (5, 6):
+        open(os.path.join(output_dir, f"img_{counter:05}_.png"), "w").close()
+    assert save(output_dir, "img") == 7
+
+    # The outputs being cleaned up, counters handed out before are not reused.
+    for name in os.listdir(output_dir):
+        os.remove(os.path.join(output_dir, name))
+    assert save(output_dir, "img") == 8
+
+    # A save that has not written its file yet.
+    assert folder_paths.get_save_image_path("img", output_dir)[2] == 9
+    assert save(output_dir, "img") == 10
+    folder_paths.save_counter_cache.clear()
+    assert save(output_dir, "img") == 11
+
+
+def test_concurrent_saves_get_distinct_counters(output_dir):
+    saved = []
+    errors = []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(20):
+            batch = rng.randint(1, 3)
+            full_output_folder, filename, counter, _, _ = folder_paths.get_save_image_path("ComfyUI", output_dir, count=batch)
+            time.sleep(rng.random() * 0.002)
+            for i in range(batch):
+                try:
+                    with open(os.path.join(full_output_folder, f"{filename}_{counter + i:05}_.png"), "x") as f:
+                        f.write("x")
+                except FileExistsError as e:
+                    errors.append(e)
+                saved.append(counter + i)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(saved) == len(os.listdir(output_dir)) == len(set(saved))
+
+
+def test_skips_listing_once_warm(output_dir, monkeypatch):
+    save(output_dir, "ComfyUI")
+    save(output_dir, "ComfyUI")
+    monkeypatch.setattr(os, "listdir", lambda path: pytest.fail("listed the output folder"))
+    for expected in range(3, 10):
+        full_output_folder, filename, counter, _, _ = folder_paths.get_save_image_path("ComfyUI", output_dir)
+        assert counter == expected
+        open(os.path.join(full_output_folder, f"{filename}_{counter:05}_.png"), "w").close()
+
+
+@pytest.mark.skipif(not os.environ.get("SAVE_COUNTER_BENCHMARK"), reason="set SAVE_COUNTER_BENCHMARK=1 to run")
+def test_benchmark_large_output_folder(output_dir):
+    for counter in range(1, 200001):
+        open(os.path.join(output_dir, f"ComfyUI_{counter:05}_.png"), "w").close()
+
+    start = time.perf_counter()
+    legacy_counter(output_dir, "ComfyUI")
+    legacy = time.perf_counter() - start
+
+    folder_paths.get_save_image_path("ComfyUI", output_dir)
+    start = time.perf_counter()
+    for _ in range(100):
+        counter = folder_paths.get_save_image_path("ComfyUI", output_dir)[2]
+        open(os.path.join(output_dir, f"ComfyUI_{counter:05}_.png"), "w").close()
+    cached = (time.perf_counter() - start) / 100
+    print(f"legacy {legacy * 1000:.1f} ms, cached {cached * 1000:.3f} ms per save")  # noqa: T201
+    assert cached < legacy
@@ -0,0 +1,175 @@
+"""Tests for the /object_info node info cache"""
+
+import gzip
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import folder_paths
+import app.node_info_cache
+from app.node_info_cache import NodeInfoCache
+
+pytestmark = pytest.mark.asyncio  # Apply asyncio mark to all tests
+
+
+class StaticNode:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("INT", {"default": 1})}}
+
+
+class ModelNode:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"model": (folder_paths.get_filename_list("info_cache_test"),)}}
+
+
+class InputFileNode:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"file": (sorted(os.listdir(folder_paths.get_input_directory())),)}}
+
+
+class InternalNode(StaticNode):
+    INTERNAL = True
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    models = tmp_path / "models"
+    inputs = tmp_path / "input"
+    models.mkdir()
+    inputs.mkdir()
+    (models / "a.safetensors").write_text("x")
+    monkeypatch.setitem(folder_paths.folder_names_and_paths, "info_cache_test", ([str(models)], {".safetensors"}))
+    monkeypatch.setattr(folder_paths, "input_directory", str(inputs))
+
+    mappings = {"StaticNode": StaticNode, "ModelNode": ModelNode, "InputFileNode": InputFileNode, "InternalNode": InternalNode}
+    built = []
+
+    def build(name):
+        built.append(name)
+        return {"name": name, "input": mappings[name].INPUT_TYPES()}
+
+    cache = NodeInfoCache(build, mappings, {"StaticNode": "Static"})
+    return cache, built, mappings, models, inputs
+
+
+def get_all(cache):
+    with folder_paths.cache_helper:
+        return cache.get_all()
+
+
+async def test_response_matches_uncached_output(setup):
+    cache, built, mappings, models, inputs = setup
+    response = get_all(cache)
+    expected = {name: {"name": name, "input": mappings[name].INPUT_TYPES()} for name in ["StaticNode", "ModelNode", "InputFileNode"]}
+    assert json.loads(response.body) == json.loads(json.dumps(expected))
+    assert gzip.decompress(response.gzip_body) == response.body
+    assert sorted(built) == ["InputFileNode", "ModelNode", "StaticNode"]
+
+
+async def test_only_changed_nodes_are_rebuilt(setup):
+    cache, built, mappings, models, inputs = setup
+    first = get_all(cache)
+    built.clear()
+    assert get_all(cache) is first
+    assert built == []
+
+    (models / "b.safetensors").write_text("x")
+    second = get_all(cache)
+    assert built == ["ModelNode"]
+    assert second.etag != first.etag
+    assert json.loads(second.body)["ModelNode"]["input"]["required"]["model"][0] == ["a.safetensors", "b.safetensors"]
+
+    built.clear()
+    (models / "notes.txt").write_text("x")  # Filtered out, the list doesn't change
+    assert get_all(cache).etag == second.etag
+    assert built == []
+
+    (inputs / "image.png").write_text("x")
+    third = get_all(cache)
+    assert built == ["InputFileNode"]
+    assert json.loads(third.body)["InputFileNode"]["input"]["required"]["file"][0] == ["image.png"]
+
+
+async def test_replaced_node_class_is_rebuilt(setup):
+    cache, built, mappings, models, inputs = setup
+    get_all(cache)
+    built.clear()
+
+    class ReloadedNode(StaticNode):
+        pass
+
+    mappings["StaticNode"] = ReloadedNode
+    get_all(cache)
+    assert built == ["StaticNode"]
+
+    built.clear()
+    cache.display_name_mappings["StaticNode"] = "Renamed"
+    cache.get("StaticNode")
+    assert built == ["StaticNode"]
+
+    built.clear()
+    del mappings["InputFileNode"]
+    assert "InputFileNode" not in json.loads(get_all(cache).body)
+    assert built == []
+
+
+async def test_failing_node_is_skipped(setup):
+    cache, built, mappings, models, inputs = setup
+
+    class BrokenNode:
+        @classmethod
+        def INPUT_TYPES(cls):
+            raise RuntimeError("broken")
+
+    mappings["BrokenNode"] = BrokenNode
+    assert "BrokenNode" not in json.loads(get_all(cache).body)
+    assert "BrokenNode" not in cache.entries
+
+
+class NestedInputNode:
+    @classmethod
+    def INPUT_TYPES(cls):
+        root = os.path.join(folder_paths.get_input_directory(), "3d")
+        return {"required": {"file": (sorted(os.path.relpath(os.path.join(r, f), root) for r, _, files in os.walk(root) for f in files),)}}
+
+
+class FolderPathsNode:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"model": (sorted(x for path in folder_paths.get_folder_paths("info_cache_test") for x in os.listdir(path)),)}}
+
+
+class CustomNode(StaticNode):
+    RELATIVE_PYTHON_MODULE = "custom_nodes.example"
+
+
+async def test_untracked_nodes_are_revalidated(setup, monkeypatch):
+    cache, built, mappings, models, inputs = setup
+    clock = [0.0]
+    monkeypatch.setattr(app.node_info_cache, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    (inputs / "3d" / "sub").mkdir(parents=True)
+    mappings.update({"NestedInputNode": NestedInputNode, "FolderPathsNode": FolderPathsNode, "CustomNode": CustomNode})
+    first = get_all(cache)
+    built.clear()
+
+    (models / "diffusers").mkdir()  # Seen through the folder mtime
+    assert json.loads(get_all(cache).body)["FolderPathsNode"]["input"]["required"]["model"][0] == ["a.safetensors", "diffusers"]
+    assert built == ["FolderPathsNode"]
+
+    built.clear()
+    clock[0] += app.node_info_cache.UNTRACKED_TTL
+    second = get_all(cache)
+    assert sorted(built) == ["CustomNode", "FolderPathsNode", "InputFileNode", "NestedInputNode"]
+    assert get_all(cache) is second  # Rebuilt with the same info
+
+    (inputs / "3d" / "sub" / "mesh.glb").write_text("x")
+    assert json.loads(get_all(cache).body)["NestedInputNode"]["input"]["required"]["file"][0] == []
+    clock[0] += app.node_info_cache.UNTRACKED_TTL
+    third = get_all(cache)
+    assert json.loads(third.body)["NestedInputNode"]["input"]["required"]["file"][0] == [os.path.join("sub", "mesh.glb")]
+    assert third.etag != first.etag
@@ -0,0 +1,108 @@
+"""Tests for preview encoding off the event loop"""
+
+import asyncio
+import time
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app import preview_encoder
+from app.preview_encoder import PreviewEncoder, choose_preview_format, encode_preview
+
+pytestmark = pytest.mark.asyncio  # Apply asyncio mark to all tests
+
+
+def make_image(color=(255, 0, 0), size=(64, 32)):
+    return Image.new("RGB", size, color)
+
+
+@pytest.mark.parametrize("image_type,pil_format", [("JPEG", "JPEG"), ("PNG", "PNG"), ("WEBP", "WEBP")])
+async def test_encode_compressed_formats(image_type, pil_format):
+    data, metadata = encode_preview(image_type, make_image(), 16)
+    decoded = Image.open(BytesIO(data))
+    assert decoded.format == pil_format
+    assert decoded.size == (16, 8)
+    assert metadata["image_type"] == f"image/{pil_format.lower()}"
+
+
+async def test_encode_raw_rgb8():
+    data, metadata = encode_preview("RAW", make_image((1, 2, 3)), None)
+    assert metadata == {"image_type": "image/x-raw-rgb8", "width": 64, "height": 32}
+    assert len(data) == 64 * 32 * 3
+    assert data[:3] == bytes((1, 2, 3))
+
+
+async def test_choose_preview_format():
+    assert choose_preview_format("PNG", None, with_metadata=False, supports_raw=False) == "PNG"
+    assert choose_preview_format("GIF", None, with_metadata=False, supports_raw=False) == "JPEG"
+    # WebP needs the mimetype in the metadata message to be displayed.
+    assert choose_preview_format("JPEG", "webp", with_metadata=True, supports_raw=False) == "WEBP"
+    assert choose_preview_format("JPEG", "webp", with_metadata=False, supports_raw=False) == "JPEG"
+    assert choose_preview_format("PNG", "raw", with_metadata=True, supports_raw=True) == "RAW"
+    assert choose_preview_format("PNG", "raw", with_metadata=True, supports_raw=False) == "PNG"
+
+
+async def test_only_latest_pending_frame_is_encoded():
+    sent = []
+
+    async def send(sid, image_type, data, metadata):
+        sent.append((sid, metadata["frame"]))
+
+    encoder = PreviewEncoder(send)
+    for frame in range(10):
+        encoder.submit("client", "JPEG", make_image(), None, {"node_id": "3", "frame": frame})
+        encoder.submit("client", "JPEG", make_image(), None, {"node_id": "4", "frame": frame})
+    while encoder.tasks:
+        await asyncio.sleep(0.01)
+
+    # Frames queued before the encoder got to run collapse into the latest one of each node.
+    assert sent == [("client", 9), ("client", 9)]
+    assert encoder.dropped == 18
+
+    sent.clear()
+    encoder.submit("client", "JPEG", make_image(), None, {"node_id": "3", "frame": 10})
+    await asyncio.sleep(0)  # Start encoding frame 10
+    for frame in range(11, 20):
+        encoder.submit("client", "JPEG", make_image(), None, {"node_id": "3", "frame": frame})
+    while encoder.tasks:
+        await asyncio.sleep(0.01)
+    assert sent == [("client", 10), ("client", 19)]
+
+
+async def test_rate_limit_per_client():
+    sent = []
+
+    async def send(sid, image_type, data, metadata):
+        sent.append((sid, time.monotonic()))
+
+    encoder = PreviewEncoder(send, rate=20)
+    for _ in range(3):
+        encoder.submit("slow", "JPEG", make_image(), None)
+        encoder.submit("other", "JPEG", make_image(), None)
+        while encoder.tasks:
+            await asyncio.sleep(0.005)
+
+    times = [t for sid, t in sent if sid == "slow"]
+    assert len(times) == 3
+    assert all(b - a >= 0.045 for a, b in zip(times, times[1:]))
+
+
+async def test_encoding_does_not_block_event_loop(monkeypatch):
+    def slow_encode(image_type, image, max_size):
+        time.sleep(0.2)
+        return b"data", {"image_type": "image/jpeg"}
+
+    monkeypatch.setattr(preview_encoder, "encode_preview", slow_encode)
+    done = asyncio.Event()
+
+    async def send(sid, image_type, data, metadata):
+        done.set()
+
+    encoder = PreviewEncoder(send)
+    encoder.submit(None, "JPEG", make_image(), None)
+    ticks = 0
+    while not done.is_set():
+        ticks += 1
+        await asyncio.sleep(0.01)
+    assert ticks > 5
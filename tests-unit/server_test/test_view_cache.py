@@ -0,0 +1,139 @@
+"""Tests for the /view derivative cache"""
+
+import asyncio
+import os
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app import view_cache
+from app.view_cache import DerivativeCache, DerivativeSpec, derivative_key, etag_matches, get_derivative_spec, render_derivative
+
+pytestmark = pytest.mark.asyncio  # Apply asyncio mark to all tests
+
+
+@pytest.fixture
+def image_file(tmp_path):
+    path = tmp_path / "image.png"
+    img = Image.new("RGBA", (400, 200), (10, 20, 30, 128))
+    img.putpixel((5, 5), (255, 0, 0, 0))
+    img.save(path)
+    return str(path)
+
+
+def legacy_view(file, query):
+    """What /view returned before derivatives were cached."""
+    with Image.open(file) as img:
+        if 'preview' in query:
+            preview_info = query['preview'].split(';')
+            image_format = preview_info[0]
+            if image_format not in ['webp', 'jpeg'] or 'a' in query.get('channel', ''):
+                image_format = 'webp'
+            quality = 90
+            if preview_info[-1].isdigit():
+                quality = int(preview_info[-1])
+            buffer = BytesIO()
+            if image_format in ['jpeg'] or query.get('channel', '') == 'rgb':
+                img = img.convert("RGB")
+            img.save(buffer, format=image_format, quality=quality)
+            return buffer.getvalue()
+        if query.get('channel') == 'rgb':
+            r, g, b, a = img.split()
+            buffer = BytesIO()
+            Image.merge('RGB', (r, g, b)).save(buffer, format='PNG')
+            return buffer.getvalue()
+        _, _, _, a = img.split()
+        alpha_img = Image.new('RGBA', img.size)
+        alpha_img.putalpha(a)
+        buffer = BytesIO()
+        alpha_img.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+
+@pytest.mark.parametrize("query", [
+    {"preview": "webp;50"},
+    {"preview": "jpeg;80"},
+    {"preview": "png"},
+    {"preview": "jpeg", "channel": "rgba"},
+    {"preview": "webp", "channel": "rgb"},
+    {"channel": "rgb"},
+    {"channel": "a"},
+])
+async def test_derivatives_match_legacy_view(image_file, query):
+    spec = get_derivative_spec(query, "png")
+    assert render_derivative(image_file, spec) == legacy_view(image_file, query)
+
+
+async def test_spec_parsing():
+    assert get_derivative_spec({}, "png") is None
+    assert get_derivative_spec({"channel": "rgba"}, "png") is None
+    assert get_derivative_spec({"preview": "jpeg;70"}, "png") == DerivativeSpec("preview_rgb", "jpeg", 70, None, None)
+    assert get_derivative_spec({"width": "256"}, "jpeg") == DerivativeSpec("resize", "jpeg", 90, 256, None)
+    assert get_derivative_spec({"height": "64"}, None).format == "png"
+    for bad in ["0", "-5", "abc"]:
+        with pytest.raises(ValueError):
+            get_derivative_spec({"width": bad}, "png")
+
+
+async def test_resize_fits_box_without_upscaling(image_file):
+    data = render_derivative(image_file, get_derivative_spec({"width": "100", "height": "100"}, "png"))
+    assert Image.open(BytesIO(data)).size == (100, 50)
+    data = render_derivative(image_file, get_derivative_spec({"preview": "webp", "width": "1000"}, "png"))
+    assert Image.open(BytesIO(data)).size == (400, 200)
+
+
+async def test_key_changes_with_source_and_parameters(image_file):
+    spec = get_derivative_spec({"width": "100"}, "png")
+    key = derivative_key(image_file, os.stat(image_file), spec)
+    assert key == derivative_key(image_file, os.stat(image_file), spec)
+    assert key != derivative_key(image_file, os.stat(image_file), spec._replace(width=101))
+    os.utime(image_file, ns=(0, 12345))
+    assert key != derivative_key(image_file, os.stat(image_file), spec)
+
+
+async def test_cache_hits_and_shares_renders(tmp_path, image_file, monkeypatch):
+    renders = []
+    original = view_cache.render_derivative
+
+    def counting_render(file, spec):
+        renders.append(spec)
+        return original(file, spec)
+
+    monkeypatch.setattr(view_cache, "render_derivative", counting_render)
+    cache = DerivativeCache(str(tmp_path / "cache"), 10 * 1024 * 1024)
+    spec = get_derivative_spec({"preview": "webp", "width": "64"}, "png")
+    key = derivative_key(image_file, os.stat(image_file), spec)
+
+    results = await asyncio.gather(*[cache.get_or_render(image_file, key, spec) for _ in range(20)])
+    assert len(renders) == 1
+    assert all(r == results[0] for r in results)
+
+    assert await cache.get_or_render(image_file, key, spec) == results[0]
+    assert len(renders) == 1
+    assert cache.hits == 1
+
+    # Entries on disk are picked up again after a restart.
+    restarted = DerivativeCache(str(tmp_path / "cache"), 10 * 1024 * 1024)
+    assert restarted.get(key, "webp") is not None
+
+
+async def test_lru_eviction(tmp_path):
+    cache = DerivativeCache(str(tmp_path / "cache"), 250)
+    for key in ["a", "b", "c"]:
+        cache.put(key, "png", b"x" * 100)
+    assert cache.get("a", "png") is None
+    cache.get("b", "png")
+    cache.put("d", "png", b"x" * 100)
+    assert cache.get("c", "png") is None
+    assert cache.get("b", "png") is not None
+    assert sorted(os.listdir(tmp_path / "cache")) == ["b.png", "d.png"]
+    assert cache.total_bytes == 200
+
+
+async def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"x", W/"abc"', '"abc"')
+    assert etag_matches('*', '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
@@ -0,0 +1,127 @@
+"""Tests for the per-socket websocket outboxes"""
+
+import asyncio
+import json
+
+import pytest
+
+from app import websocket_sender
+from app.websocket_sender import SocketSender, get_coalesce_key
+from protocol import BinaryEventTypes
+
+pytestmark = pytest.mark.asyncio  # Apply asyncio mark to all tests
+
+
+class FakeWebSocket:
+    def __init__(self, blocked=False):
+        self.sent = []
+        self.closed_with = None
+        self.unblocked = asyncio.Event()
+        if not blocked:
+            self.unblocked.set()
+
+    async def send_str(self, data):
+        await self.unblocked.wait()
+        self.sent.append(json.loads(data))
+
+    async def send_bytes(self, data):
+        await self.unblocked.wait()
+        self.sent.append(bytes(data))
+
+    async def close(self, code=None, message=b""):
+        self.closed_with = code
+
+
+def encode(event, data):
+    return json.dumps({"type": event, "data": data}), get_coalesce_key(event, data)
+
+
+async def drain(sender):
+    for _ in range(100):
+        await asyncio.sleep(0)
+        if len(sender) == 0:
+            await asyncio.sleep(0)
+            return
+
+
+async def test_messages_are_sent_in_order():
+    ws = FakeWebSocket()
+    sender = SocketSender(ws)
+    sender.put(*encode("executing", {"node": "1"}))
+    sender.put(b"\x00\x00\x00\x03text")
+    sender.put(*encode("executed", {"node": "1"}))
+    await drain(sender)
+    assert ws.sent == [{"type": "executing", "data": {"node": "1"}}, b"\x00\x00\x00\x03text", {"type": "executed", "data": {"node": "1"}}]
+    await sender.close()
+
+
+async def test_slow_socket_does_not_delay_others():
+    slow, fast = FakeWebSocket(blocked=True), FakeWebSocket()
+    senders = [SocketSender(slow), SocketSender(fast)]
+    for i in range(50):
+        message, key = encode("executing", {"node": str(i)})
+        for sender in senders:
+            sender.put(message, key)
+    await drain(senders[1])
+    assert len(fast.sent) == 50
+    assert slow.sent == []
+
+    slow.unblocked.set()
+    await drain(senders[0])
+    assert slow.sent == fast.sent
+    for sender in senders:
+        await sender.close()
+
+
+async def test_progress_is_coalesced_while_client_lags():
+    ws = FakeWebSocket(blocked=True)
+    sender = SocketSender(ws)
+    for value in range(20):
+        sender.put(*encode("progress", {"value": value, "max": 20, "prompt_id": "p", "node": "3"}))
+        sender.put(*encode("progress", {"value": value, "max": 20, "prompt_id": "p", "node": "4"}))
+    sender.put(*encode("executed", {"node": "3"}))
+    await asyncio.sleep(0)
+
+    assert len(sender) <= 4
+    ws.unblocked.set()
+    await drain(sender)
+    # Whatever was in flight, then only the latest progress of each node and the executed event.
+    assert ws.sent[-3:] == [
+        {"type": "progress", "data": {"value": 19, "max": 20, "prompt_id": "p", "node": "3"}},
+        {"type": "progress", "data": {"value": 19, "max": 20, "prompt_id": "p", "node": "4"}},
+        {"type": "executed", "data": {"node": "3"}},
+    ]
+    await sender.close()
+
+
+async def test_droppable_messages_are_dropped_when_full(monkeypatch):
+    monkeypatch.setattr(websocket_sender, "MAX_PENDING_MESSAGES", 4)
+    ws = FakeWebSocket(blocked=True)
+    sender = SocketSender(ws)
+    for i in range(6):
+        assert sender.put(*encode("executing", {"node": str(i)}))
+    assert not sender.put(*encode("progress", {"value": 1, "max": 2, "prompt_id": "p", "node": "1"}))
+    assert not sender.put(b"preview", (BinaryEventTypes.PREVIEW_IMAGE,))
+    assert sender.dropped == 2
+    assert len(sender) == 6
+    await sender.close()
+
+
+async def test_client_is_disconnected_when_hard_limit_is_reached(monkeypatch):
+    monkeypatch.setattr(websocket_sender, "MAX_PENDING_MESSAGES_HARD", 8)
+    ws = FakeWebSocket(blocked=True)
+    sender = SocketSender(ws)
+    await asyncio.sleep(0)
+    results = [sender.put(*encode("executing", {"node": str(i)})) for i in range(10)]
+    assert results == [True] * 8 + [False] * 2
+    ws.unblocked.set()
+    await asyncio.wait_for(sender.task, timeout=1)
+    assert ws.closed_with is not None
+    assert len(ws.sent) <= 1
+
+
+async def test_connect_status_is_never_replaced():
+    assert get_coalesce_key("status", {"status": {}, "sid": "abc"}) is None
+    assert get_coalesce_key("status", {"status": {}}) == ("status",)
+    assert get_coalesce_key("executing", {"node": None}) is None
+    assert get_coalesce_key(BinaryEventTypes.TEXT, b"text") is None
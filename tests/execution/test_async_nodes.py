@@ -17,7 +17,9 @@ class TestAsyncNodes:
         (True, 0),
         (True, 100),
     ])
-    def _server(self, args_pytest, request):
+    def _server(self, args_pytest, request, tmp_path_factory):
+        # A fresh database so the history of other test runs stays out
+        database = tmp_path_factory.mktemp("database") / "comfyui.db"
         pargs = [
             'python','main.py',
             '--output-directory', args_pytest["output_dir"],
@@ -25,6 +27,7 @@ class TestAsyncNodes:
             '--port', str(args_pytest["port"]),
             '--extra-model-paths-config', 'tests/execution/extra_model_paths.yaml',
             '--cpu',
+            '--database-url', f'sqlite:///{database}',
         ]
         use_lru, lru_size = request.param
         if use_lru:
@@ -66,10 +66,12 @@ class ComfyClient:
         ws.connect("ws://{}/ws?clientId={}".format(self.server_address, self.client_id))
         self.ws = ws
 
-    def queue_prompt(self, prompt, partial_execution_targets=None):
+    def queue_prompt(self, prompt, partial_execution_targets=None, extra_data=None):
         p = {"prompt": prompt, "client_id": self.client_id}
         if partial_execution_targets is not None:
             p["partial_execution_targets"] = partial_execution_targets
+        if extra_data is not None:
+            p["extra_data"] = extra_data
         data = json.dumps(p).encode('utf-8')
         req =  urllib.request.Request("http://{}/prompt".format(self.server_address), data=data)
         return json.loads(urllib.request.urlopen(req).read())
@@ -133,13 +135,13 @@ class ComfyClient:
     def set_test_name(self, name):
         self.test_name = name
 
-    def run(self, graph, partial_execution_targets=None):
+    def run(self, graph, partial_execution_targets=None, extra_data=None):
         prompt = graph.finalize()
         for node in graph.nodes.values():
             if node.class_type == 'SaveImage':
                 node.inputs['filename_prefix'] = self.test_name
 
-        prompt_id = self.queue_prompt(prompt, partial_execution_targets)['prompt_id']
+        prompt_id = self.queue_prompt(prompt, partial_execution_targets, extra_data)['prompt_id']
         result = RunResult(prompt_id)
         while True:
             out = self.ws.recv()
@@ -188,14 +190,16 @@ class TestExecution:
         { "extra_args" : ["--cache-lru", 100], "should_cache_results" : True },
         { "extra_args" : ["--cache-none"], "should_cache_results" : False },
     ])
-    def server(self, args_pytest, request):
-        # Start server
+    def server(self, args_pytest, request, tmp_path_factory):
+        # Start server, with a fresh database so the history starts out empty
+        database = tmp_path_factory.mktemp("database") / "comfyui.db"
         pargs = [
             'python','main.py',
             '--output-directory', args_pytest["output_dir"],
             '--listen', args_pytest["listen"],
             '--port', str(args_pytest["port"]),
             '--extra-model-paths-config', 'tests/execution/extra_model_paths.yaml',
+            '--database-url', f'sqlite:///{database}',
             '--cpu',
         ]
         pargs += [ str(param) for param in request.param["extra_args"] ]
@@ -850,6 +854,35 @@ class TestExecution:
         result = client.get_all_history(offset=100)
         assert len(result) == 0, "Large offset should return no items"
 
+    def test_nodes_can_edit_hidden_inputs(self, client: ComfyClient, builder: GraphBuilder):
+        g = builder
+        node = g.node("TestEditHiddenInputs", value=1)
+        result = client.run(g, extra_data={"extra_pnginfo": {"workflow": {"nodes": []}}})
+        assert result.get_output(node) == {"value": [2], "workflow": [{"nodes": [], "edited": True}]}
+
+        # The queued prompt kept in the history isn't affected.
+        history = client.get_history(result.get_prompt_id())[result.get_prompt_id()]
+        assert history["prompt"][2][node.id]["inputs"]["value"] == 1
+        assert "edited" not in history["prompt"][3]["extra_pnginfo"]["workflow"]
+
+    def test_invalid_client_id_and_priority_are_rejected(self, client: ComfyClient, builder: GraphBuilder):
+        g = builder
+        image = g.node("StubImage", content="BLACK", height=32, width=32, batch_size=1)
+        g.node("PreviewImage", images=image.out(0))
+        for extra in ({"client_id": ["x"]}, {"priority": ["high"]}, {"priority": "urgent"}):
+            data = json.dumps({"prompt": g.finalize(), **extra}).encode("utf-8")
+            req = urllib.request.Request("http://{}/prompt".format(client.server_address), data=data)
+            with pytest.raises(urllib.error.HTTPError) as e:
+                urllib.request.urlopen(req)
+            assert e.value.code == 400
+        run_warmup(client, prefix="after_invalid_extra_data")
+
+    def test_invalid_history_cursor_is_rejected(self, client: ComfyClient):
+        """Test a cursor that isn't a number is a client error"""
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen("http://{}/history?cursor=abc".format(client.server_address))
+        assert e.value.code == 400
+
     def test_offset_at_exact_history_length_returns_empty(
         self, client: ComfyClient, builder: GraphBuilder
     ):
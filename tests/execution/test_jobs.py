@@ -1,5 +1,7 @@
 """Unit tests for comfy_execution/jobs.py"""
 
+import pytest
+
 from comfy_execution.jobs import (
     JobStatus,
     is_previewable,
@@ -7,6 +9,8 @@ from comfy_execution.jobs import (
     normalize_history_item,
     get_outputs_summary,
     apply_sorting,
+    encode_job_cursor,
+    decode_job_cursor,
 )
 
 
@@ -236,6 +240,30 @@ class TestApplySorting:
         result = apply_sorting(jobs, 'execution_duration', 'asc')
         assert result[0]['id'] == 'b'  # None treated as 0, comes first
 
+    def test_ties_broken_by_id(self):
+        """Jobs with the same sort value are ordered by id so cursors are stable."""
+        jobs = [
+            {'id': 'b', 'create_time': 100},
+            {'id': 'c', 'create_time': 100},
+            {'id': 'a', 'create_time': 100},
+        ]
+        assert [j['id'] for j in apply_sorting(jobs, 'created_at', 'asc')] == ['a', 'b', 'c']
+        assert [j['id'] for j in apply_sorting(jobs, 'created_at', 'desc')] == ['c', 'b', 'a']
+
+
+class TestJobCursor:
+    """Unit tests for encode_job_cursor() and decode_job_cursor()"""
+
+    def test_round_trip(self):
+        job = {'id': 'prompt-1', 'create_time': 1234, 'execution_start_time': 10, 'execution_end_time': 25}
+        assert decode_job_cursor(encode_job_cursor(job, 'created_at')) == (1234, 'prompt-1')
+        assert decode_job_cursor(encode_job_cursor(job, 'execution_duration')) == (15, 'prompt-1')
+
+    def test_invalid_cursor(self):
+        for cursor in ['', 'not-a-cursor', encode_job_cursor({'id': 1, 'create_time': 0}, 'created_at')]:
+            with pytest.raises(ValueError):
+                decode_job_cursor(cursor)
+
 
 class TestNormalizeQueueItem:
     """Unit tests for normalize_queue_item()"""
@@ -265,6 +293,18 @@ class TestNormalizeQueueItem:
         assert job['outputs_count'] == 0
         assert job['workflow_id'] == 'workflow-abc'
 
+    def test_queue_position_and_priority_class(self):
+        """Pending jobs report their priority class and estimated queue position."""
+        item = (10, 'prompt-123', {}, {'priority': 'high'}, [])
+        job = normalize_queue_item(item, JobStatus.PENDING, queue_position=3)
+
+        assert job['priority_class'] == 'high'
+        assert job['queue_position'] == 3
+
+        running = normalize_queue_item((10, 'prompt-123', {}, {}, []), JobStatus.IN_PROGRESS)
+        assert running['priority_class'] == 'normal'
+        assert 'queue_position' not in running
+
 
 class TestNormalizeHistoryItem:
     """Unit tests for normalize_history_item()"""
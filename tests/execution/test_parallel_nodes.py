@@ -0,0 +1,109 @@
+import pytest
+import time
+import torch
+import subprocess
+
+from pytest import fixture
+from comfy_execution.graph_utils import GraphBuilder
+from tests.execution.test_execution import ComfyClient, run_warmup
+
+
+@pytest.mark.execution
+class TestParallelNodes:
+    @fixture(scope="class", autouse=True, params=[0, 4])
+    def _server(self, args_pytest, request, tmp_path_factory):
+        # A fresh database so the history of other test runs stays out
+        database = tmp_path_factory.mktemp("database") / "comfyui.db"
+        pargs = [
+            'python','main.py',
+            '--output-directory', args_pytest["output_dir"],
+            '--listen', args_pytest["listen"],
+            '--port', str(args_pytest["port"]),
+            '--extra-model-paths-config', 'tests/execution/extra_model_paths.yaml',
+            '--cpu',
+            '--database-url', f'sqlite:///{database}',
+            '--parallel-cpu-nodes', str(request.param),
+        ]
+        p = subprocess.Popen(pargs)
+        yield request.param
+        p.kill()
+        torch.cuda.empty_cache()
+
+    @fixture(scope="class", autouse=True)
+    def shared_client(self, args_pytest, _server):
+        client = ComfyClient()
+        n_tries = 5
+        for i in range(n_tries):
+            time.sleep(4)
+            try:
+                client.connect(listen=args_pytest["listen"], port=args_pytest["port"])
+            except ConnectionRefusedError:
+                # Retrying...
+                pass
+            else:
+                break
+        yield client
+        del client
+        torch.cuda.empty_cache()
+
+    @fixture
+    def client(self, shared_client, request):
+        shared_client.set_test_name(f"parallel_nodes[{request.node.name}]")
+        yield shared_client
+
+    @fixture
+    def builder(self, request):
+        yield GraphBuilder(prefix=request.node.name)
+
+    def test_thread_safe_nodes_overlap(self, client: ComfyClient, builder: GraphBuilder, _server, skip_timing_checks):
+        run_warmup(client)
+
+        g = builder
+        image = g.node("StubImage", content="WHITE", height=64, width=64, batch_size=1)
+        sleep1 = g.node("TestThreadSafeSleep", value=image.out(0), seconds=0.4)
+        sleep2 = g.node("TestThreadSafeSleep", value=image.out(0), seconds=0.5)
+        sleep3 = g.node("TestThreadSafeSleep", value=image.out(0), seconds=0.6)
+        output1 = g.node("PreviewImage", images=sleep1.out(0))
+        output2 = g.node("PreviewImage", images=sleep2.out(0))
+        output3 = g.node("PreviewImage", images=sleep3.out(0))
+
+        start_time = time.time()
+        result = client.run(g)
+        elapsed_time = time.time() - start_time
+
+        if not skip_timing_checks:
+            if _server > 0:
+                assert elapsed_time < 1.2, f"Parallel execution took {elapsed_time}s, expected < 1.2s"
+            else:
+                assert elapsed_time >= 1.5, f"Serial execution took {elapsed_time}s, expected >= 1.5s"
+
+        for output in [output1, output2, output3]:
+            assert result.did_run(output)
+            assert len(result.get_images(output)) == 1
+
+    def test_thread_safe_node_feeds_serial_node(self, client: ComfyClient, builder: GraphBuilder):
+        g = builder
+        image1 = g.node("StubImage", content="WHITE", height=64, width=64, batch_size=1)
+        image2 = g.node("StubImage", content="BLACK", height=64, width=64, batch_size=1)
+        mask = g.node("StubMask", value=0.5, height=64, width=64, batch_size=1)
+        sleep = g.node("TestThreadSafeSleep", value=image1.out(0), seconds=0.1)
+        mix = g.node("TestLazyMixImages", image1=sleep.out(0), image2=image2.out(0), mask=mask.out(0))
+        output = g.node("SaveImage", images=mix.out(0))
+
+        result = client.run(g)
+        assert result.did_run(sleep)
+        images = result.get_images(output)
+        assert len(images) == 1
+
+    def test_thread_safe_node_error(self, client: ComfyClient, builder: GraphBuilder):
+        g = builder
+        image = g.node("StubImage", content="WHITE", height=64, width=64, batch_size=1)
+        error_node = g.node("TestThreadSafeSleep", value=image.out(0), seconds=0.1, fail=True)
+        g.node("PreviewImage", images=error_node.out(0))
+
+        try:
+            client.run(g)
+            assert False, "Should have raised an error"
+        except Exception as e:
+            assert 'prompt_id' in e.args[0], f"Did not get proper error message: {e}"
+            assert e.args[0]['node_id'] == error_node.id, "Error should be from the thread safe node"
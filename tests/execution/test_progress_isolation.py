@@ -84,9 +84,11 @@ class TestProgressIsolation:
     """Test suite for verifying progress update isolation between clients."""
 
     @pytest.fixture(scope="class", autouse=True)
-    def _server(self, args_pytest):
+    def _server(self, args_pytest, tmp_path_factory):
         """Start the ComfyUI server for testing."""
         import subprocess
+        # A fresh database so the history of other test runs stays out
+        database = tmp_path_factory.mktemp("database") / "comfyui.db"
         pargs = [
             'python', 'main.py',
             '--output-directory', args_pytest["output_dir"],
@@ -94,6 +96,7 @@ class TestProgressIsolation:
             '--port', str(args_pytest["port"]),
             '--extra-model-paths-config', 'tests/execution/extra_model_paths.yaml',
             '--cpu',
+            '--database-url', f'sqlite:///{database}',
         ]
         p = subprocess.Popen(pargs)
         yield
@@ -0,0 +1,99 @@
+import json
+import pytest
+import time
+import torch
+import subprocess
+import urllib.request
+
+from pytest import fixture
+from comfy_execution.graph_utils import GraphBuilder
+from tests.execution.test_execution import ComfyClient, run_warmup
+
+
+@pytest.mark.execution
+class TestPromptWorkers:
+    @fixture(scope="class", autouse=True)
+    def _server(self, args_pytest, tmp_path_factory):
+        # A fresh database so the history of other test runs stays out
+        database = tmp_path_factory.mktemp("database") / "comfyui.db"
+        pargs = [
+            'python','main.py',
+            '--output-directory', args_pytest["output_dir"],
+            '--listen', args_pytest["listen"],
+            '--port', str(args_pytest["port"]),
+            '--extra-model-paths-config', 'tests/execution/extra_model_paths.yaml',
+            '--cpu',
+            '--database-url', f'sqlite:///{database}',
+            '--prompt-workers', '2',
+        ]
+        p = subprocess.Popen(pargs)
+        yield
+        p.kill()
+        torch.cuda.empty_cache()
+
+    @fixture(scope="class", autouse=True)
+    def shared_client(self, args_pytest, _server):
+        client = ComfyClient()
+        n_tries = 5
+        for i in range(n_tries):
+            time.sleep(4)
+            try:
+                client.connect(listen=args_pytest["listen"], port=args_pytest["port"])
+            except ConnectionRefusedError:
+                # Retrying...
+                pass
+            else:
+                break
+        yield client
+        del client
+        torch.cuda.empty_cache()
+
+    @fixture
+    def client(self, shared_client, request):
+        shared_client.set_test_name(f"prompt_workers[{request.node.name}]")
+        yield shared_client
+
+    def sleep_prompt(self, prefix, seconds):
+        g = GraphBuilder(prefix=prefix)
+        image = g.node("StubImage", content="BLACK", height=64, width=64, batch_size=1)
+        sleep = g.node("TestSleep", value=image.out(0), seconds=seconds)
+        g.node("PreviewImage", images=sleep.out(0))
+        return g.finalize()
+
+    def wait_for_history(self, client: ComfyClient, prompt_ids, timeout=30.0):
+        start = time.time()
+        while time.time() - start < timeout:
+            history = {prompt_id: client.get_history(prompt_id).get(prompt_id) for prompt_id in prompt_ids}
+            if all(h is not None for h in history.values()):
+                return history
+            time.sleep(0.05)
+        raise TimeoutError("Prompts did not finish in time")
+
+    def interrupt(self, client: ComfyClient, prompt_id):
+        data = json.dumps({"prompt_id": prompt_id}).encode('utf-8')
+        req = urllib.request.Request("http://{}/interrupt".format(client.server_address), data=data)
+        urllib.request.urlopen(req).read()
+
+    def test_prompts_run_concurrently(self, client: ComfyClient, skip_timing_checks):
+        run_warmup(client)
+
+        start_time = time.time()
+        prompt_a = client.queue_prompt(self.sleep_prompt("a", 1.0))['prompt_id']
+        prompt_b = client.queue_prompt(self.sleep_prompt("b", 1.0))['prompt_id']
+        history = self.wait_for_history(client, [prompt_a, prompt_b])
+        elapsed_time = time.time() - start_time
+
+        for h in history.values():
+            assert h['status']['status_str'] == 'success'
+        if not skip_timing_checks:
+            assert elapsed_time < 1.8, f"Two workers took {elapsed_time}s, expected < 1.8s"
+
+    def test_targeted_interrupt_only_stops_one_worker(self, client: ComfyClient):
+        prompt_a = client.queue_prompt(self.sleep_prompt("interrupt_a", 3.0))['prompt_id']
+        prompt_b = client.queue_prompt(self.sleep_prompt("interrupt_b", 1.0))['prompt_id']
+        time.sleep(0.5)
+        self.interrupt(client, prompt_a)
+        history = self.wait_for_history(client, [prompt_a, prompt_b])
+
+        assert history[prompt_a]['status']['status_str'] == 'error'
+        assert history[prompt_b]['status']['status_str'] == 'success'
@@ -20,8 +20,10 @@ class TestPublicAPI:
     """Test suite for public ComfyAPI and ComfyAPISync methods."""
 
     @fixture(scope="class", autouse=True)
-    def _server(self, args_pytest):
+    def _server(self, args_pytest, tmp_path_factory):
         """Start ComfyUI server for testing."""
+        # A fresh database so the history of other test runs stays out
+        database = tmp_path_factory.mktemp("database") / "comfyui.db"
         pargs = [
             'python', 'main.py',
             '--output-directory', args_pytest["output_dir"],
@@ -29,6 +31,7 @@ class TestPublicAPI:
             '--port', str(args_pytest["port"]),
             '--extra-model-paths-config', 'tests/execution/extra_model_paths.yaml',
             '--cpu',
+            '--database-url', f'sqlite:///{database}',
         ]
         p = subprocess.Popen(pargs)
         yield
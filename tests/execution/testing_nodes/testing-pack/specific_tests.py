@@ -422,6 +422,30 @@ class TestSleep(ComfyNodeABC):
             await asyncio.sleep(0.01)
         return (value,)
 
+class TestThreadSafeSleep(ComfyNodeABC):
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "value": (IO.ANY, {}),
+                "seconds": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 9999.0, "step": 0.01, "tooltip": "The amount of seconds to block for."}),
+            },
+            "optional": {
+                "fail": ("BOOLEAN", {"default": False}),
+            },
+        }
+    RETURN_TYPES = (IO.ANY,)
+    FUNCTION = "sleep"
+    THREAD_SAFE = True
+
+    CATEGORY = "_for_testing"
+
+    def sleep(self, value, seconds, fail=False):
+        time.sleep(seconds)
+        if fail:
+            raise RuntimeError("Intentional error on a worker thread")
+        return (value,)
+
 class TestParallelSleep(ComfyNodeABC):
     @classmethod
     def INPUT_TYPES(cls):
@@ -482,6 +506,30 @@ class TestOutputNodeWithSocketOutput:
         result = image * value
         return (result,)
 
+class TestEditHiddenInputs:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "value": ("INT", {"default": 1}),
+            },
+            "hidden": {
+                "prompt": "PROMPT",
+                "extra_pnginfo": "EXTRA_PNGINFO",
+                "unique_id": "UNIQUE_ID",
+            },
+        }
+    RETURN_TYPES = ()
+    FUNCTION = "edit"
+    CATEGORY = "_for_testing"
+    OUTPUT_NODE = True
+
+    def edit(self, value, prompt, extra_pnginfo, unique_id):
+        # Like seed nodes that write the seed they picked back into the saved metadata.
+        prompt[unique_id]["inputs"]["value"] = value + 1
+        extra_pnginfo["workflow"]["edited"] = True
+        return {"ui": {"value": [prompt[unique_id]["inputs"]["value"]], "workflow": [extra_pnginfo["workflow"]]}}
+
 TEST_NODE_CLASS_MAPPINGS = {
     "TestLazyMixImages": TestLazyMixImages,
     "TestVariadicAverage": TestVariadicAverage,
@@ -496,8 +544,10 @@ TEST_NODE_CLASS_MAPPINGS = {
     "TestMixedExpansionReturns": TestMixedExpansionReturns,
     "TestSamplingInExpansion": TestSamplingInExpansion,
     "TestSleep": TestSleep,
+    "TestThreadSafeSleep": TestThreadSafeSleep,
     "TestParallelSleep": TestParallelSleep,
     "TestOutputNodeWithSocketOutput": TestOutputNodeWithSocketOutput,
+    "TestEditHiddenInputs": TestEditHiddenInputs,
 }
 
 TEST_NODE_DISPLAY_NAME_MAPPINGS = {
@@ -514,6 +564,8 @@ TEST_NODE_DISPLAY_NAME_MAPPINGS = {
     "TestMixedExpansionReturns": "Mixed Expansion Returns",
     "TestSamplingInExpansion": "Sampling In Expansion",
     "TestSleep": "Test Sleep",
+    "TestThreadSafeSleep": "Test Thread Safe Sleep",
     "TestParallelSleep": "Test Parallel Sleep",
     "TestOutputNodeWithSocketOutput": "Test Output Node With Socket Output",
+    "TestEditHiddenInputs": "Test Edit Hidden Inputs",
 }
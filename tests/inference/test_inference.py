@@ -149,13 +149,15 @@ class TestInference:
     # Initialize server and client
     #
     @fixture(scope="class", autouse=True)
-    def _server(self, args_pytest):
-        # Start server
+    def _server(self, args_pytest, tmp_path_factory):
+        # Start server, with a fresh database so the history of other test runs stays out
+        database = tmp_path_factory.mktemp("database") / "comfyui.db"
         p = subprocess.Popen([
                 'python','main.py',
                 '--output-directory', args_pytest["output_dir"],
                 '--listen', args_pytest["listen"],
                 '--port', str(args_pytest["port"]),
+                '--database-url', f'sqlite:///{database}',
                 ])
         yield
         p.kill()
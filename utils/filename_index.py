@@ -0,0 +1,312 @@
+"""
+Live index of the files under model folders, used by folder_paths.get_filename_list when
+--filename-index is enabled.
+
+Without it every cache validation stats each known directory and every miss walks the whole
+tree again, which takes seconds on network filesystems with tens of thousands of files. The index
+keeps the file names of each directory in memory and only rescans directories that changed:
+
+- inotify (Linux): a watch per directory. Pending events are read whenever the index is queried,
+  so a file created before the query is always visible, without any background thread.
+- polling (anywhere else, or when inotify watches run out): a background thread compares
+  directory mtimes every POLL_INTERVAL seconds. Changes made by other machines on NFS are only
+  seen this way, inotify only reports local ones.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import struct
+import sys
+import threading
+from typing import Optional
+
+POLL_INTERVAL = 2.0
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Tree:
+    """The files under one root directory, as a set of names per directory."""
+
+    def __init__(self, root: str, excluded_dir_names: tuple[str, ...]):
+        self.root = root
+        self.excluded_dir_names = excluded_dir_names
+        self.files: dict[str, set[str]] = {}  # directory -> names of the non-directory entries
+        self.subdirs: dict[str, set[str]] = {}  # directory -> child directories
+        self.mtimes: dict[str, int] = {}
+        self.version = 0
+        self.valid = True
+        self.polled = False
+        self._listing = None
+
+    def scan(self) -> list[str]:
+        """Indexes the whole tree, returns the directories found."""
+        return self.refresh_dir(self.root)[0]
+
+    def refresh_dir(self, path: str) -> tuple[list[str], list[str]]:
+        """
+        Re-lists one directory. Returns (added, removed) directories; added ones are scanned
+        recursively, removed ones are dropped with everything under them.
+        """
+        added, removed = [], []
+        files, subdirs = set(), set()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if entry.name not in self.excluded_dir_names:
+                            subdirs.add(entry.path)
+                    else:
+                        files.add(entry.name)
+        except OSError:
+            if path == self.root:
+                self.valid = False
+            removed.extend(self._drop(path))
+            self.version += 1
+            self._listing = None
+            return added, removed
+
+        known = path in self.files
+        previous_subdirs = self.subdirs.get(path, set())
+        self.files[path] = files
+        self.subdirs[path] = subdirs
+        self.mtimes[path] = mtime
+        if not known:
+            added.append(path)
+        for child in previous_subdirs - subdirs:
+            removed.extend(self._drop(child))
+        for child in subdirs:
+            if child not in self.files:
+                child_added, child_removed = self.refresh_dir(child)
+                added.extend(child_added)
+                removed.extend(child_removed)
+        self.version += 1
+        self._listing = None
+        return added, removed
+
+    def _drop(self, path: str) -> list[str]:
+        if path not in self.files:
+            return []
+        removed = [path]
+        del self.files[path]
+        self.mtimes.pop(path, None)
+        for child in self.subdirs.pop(path, set()):
+            removed.extend(self._drop(child))
+        return removed
+
+    def listing(self) -> list[str]:
+        """Paths of all files relative to the root, like folder_paths.recursive_search."""
+        if self._listing is None:
+            # Every directory was found by joining names onto the root, so slicing gives the same
+            # result as os.path.relpath, much faster.
+            prefix = len(os.path.join(self.root, ""))
+            out = []
+            for directory, names in self.files.items():
+                if directory == self.root:
+                    out.extend(names)
+                else:
+                    relative = directory[prefix:]
+                    out.extend(os.path.join(relative, name) for name in names)
+            self._listing = out
+        return self._listing
+
+
+class _Inotify:
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths: dict[int, str] = {}  # watch descriptor -> directory
+        self.wds: dict[str, int] = {}
+
+    def add(self, path: str):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self.paths[wd] = path
+        self.wds[path] = wd
+
+    def remove(self, path: str):
+        wd = self.wds.pop(path, None)
+        if wd is not None:
+            self.paths.pop(wd, None)
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self) -> tuple[set[str], bool]:
+        """Returns the directories with pending events and whether the event queue overflowed."""
+        changed, overflow = set(), False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed, overflow
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                elif mask & IN_IGNORED:
+                    path = self.paths.pop(wd, None)
+                    if path is not None and self.wds.get(path) == wd:
+                        del self.wds[path]
+                elif wd in self.paths:
+                    changed.add(self.paths[wd])
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FilenameIndex:
+    def __init__(self, mode: str = "auto", excluded_dir_names: tuple[str, ...] = (".git",), poll_interval: float = POLL_INTERVAL):
+        """mode is auto (inotify if available, else polling), inotify or poll."""
+        self.excluded_dir_names = tuple(excluded_dir_names)
+        self.poll_interval = poll_interval
+        self.lock = threading.RLock()
+        self.trees: dict[str, _Tree] = {}
+        self.inotify: Optional[_Inotify] = None
+        self.poll_thread: Optional[threading.Thread] = None
+        self.closed = threading.Event()
+        if mode in ("auto", "inotify") and sys.platform.startswith("linux"):
+            try:
+                self.inotify = _Inotify()
+            except (OSError, AttributeError) as e:
+                logging.warning(f"inotify is unavailable, the filename index falls back to polling: {e}")
+
+    def get_files(self, root: str) -> Optional[tuple[tuple, list[str]]]:
+        """
+        Returns (version, files) for root, with file paths relative to it, or None if root
+        isn't a directory. version compares unequal whenever the listing changed.
+        """
+        with self.lock:
+            self._process_events()
+            tree = self.trees.get(root)
+            if tree is None or not tree.valid:
+                if not os.path.isdir(root):
+                    if tree is not None:
+                        self._forget(tree)
+                    return None
+                tree = self._index(root, previous=tree)
+            return (id(tree), tree.version), tree.listing()
+
+    def _index(self, root: str, previous: Optional[_Tree]) -> _Tree:
+        if previous is not None:
+            self._forget(previous)
+        tree = _Tree(root, self.excluded_dir_names)
+        if previous is not None:
+            tree.version = previous.version + 1
+        self.trees[root] = tree
+        self._watch_new(tree, tree.scan())
+        return tree
+
+    def _forget(self, tree: _Tree):
+        if self.inotify is not None:
+            for path in tree.files:
+                self.inotify.remove(path)
+        if self.trees.get(tree.root) is tree:
+            del self.trees[tree.root]
+
+    def _watch(self, tree: _Tree, directories: list[str]):
+        if tree.polled or self.inotify is None:
+            self._poll(tree)
+            return
+        for path in directories:
+            try:
+                self.inotify.add(path)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    logging.warning(f"Out of inotify watches, polling {tree.root} for changes instead. Raise fs.inotify.max_user_watches to avoid this.")
+                else:
+                    logging.warning(f"Could not watch {path}, polling {tree.root} for changes instead: {e}")
+                for watched in tree.files:
+                    self.inotify.remove(watched)
+                self._poll(tree)
+                return
+
+    def _watch_new(self, tree: _Tree, directories: list[str]):
+        # Files created between listing a directory and watching it produce no event, so each
+        # newly watched directory is listed once more.
+        while directories:
+            self._watch(tree, directories)
+            if tree.polled:
+                return
+            added = []
+            for path in directories:
+                if path in tree.files:
+                    new, removed = tree.refresh_dir(path)
+                    for directory in removed:
+                        self.inotify.remove(directory)
+                    added.extend(new)
+            directories = added
+
+    def _poll(self, tree: _Tree):
+        tree.polled = True
+        if self.poll_thread is None:
+            self.poll_thread = threading.Thread(target=self._poll_loop, daemon=True, name="filename-index-poll")
+            self.poll_thread.start()
+
+    def _process_events(self):
+        if self.inotify is None:
+            return
+        changed, overflow = self.inotify.read()
+        if overflow:
+            logging.debug("inotify queue overflowed, rescanning the filename index")
+            for tree in list(self.trees.values()):
+                tree.valid = False
+            return
+        for path in sorted(changed, key=len):
+            for tree in list(self.trees.values()):
+                if tree.polled or not (path == tree.root or path in tree.files):
+                    continue
+                added, removed = tree.refresh_dir(path)
+                for directory in removed:
+                    self.inotify.remove(directory)
+                self._watch_new(tree, added)
+
+    def _poll_loop(self):
+        while not self.closed.wait(self.poll_interval):
+            with self.lock:
+                snapshot = [(tree, list(tree.mtimes.items())) for tree in self.trees.values() if tree.polled]
+            for tree, mtimes in snapshot:
+                changed = []
+                for path, mtime in mtimes:
+                    try:
+                        if os.stat(path).st_mtime_ns != mtime:
+                            changed.append(path)
+                    except OSError:
+                        changed.append(path)
+                if not changed:
+                    continue
+                with self.lock:
+                    for path in changed:
+                        if path in tree.files:
+                            tree.refresh_dir(path)
+
+    def close(self):
+        self.closed.set()
+        with self.lock:
+            if self.inotify is not None:
+                self.inotify.close()
+                self.inotify = None
+            self.trees.clear()